@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import copy
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from utils.routines_utils import UtilsSet
+from utils.logger import Logger
+from utils.database_utils import ClickHouseConnector
+from utils.scheduler import QuotaAwareScheduler, TokenBucket
+from utils.metrics import MetricsRegistry
+from utils.wrappers import MainFlowWrapper, AsyncMainFlowWrapper
+
+
+#Creating utilitites set instance for script run
+utilities = UtilsSet()
+
+#Reading credentials and parameters from configs. Batch config contains list of jobs (counter/source/table), each job overrides api_credentials.json.
+ch_credentials = utilities.read_json_file("configs/ch_credentials.json")
+api_settings = utilities.read_json_file("configs/api_credentials.json")
+global_settings = utilities.read_json_file("configs/global_config.json")
+batch_settings = utilities.read_json_file("configs/batch_config.json")
+
+parser = argparse.ArgumentParser(description="Runs jobs of configs/batch_config.json: Logs API logs of several counters/sources loaded into ClickHouse tables.")
+parser.add_argument('--profile', action=argparse.BooleanOptionalAction, default=None, 
+                    help="profile stages of all the jobs (overrides profile key of configs/global_config.json)")
+arguments = parser.parse_args()
+if arguments.profile is not None:
+    global_settings['profile'] = arguments.profile
+
+#Reading queries and creating dictionary of queries to perform during program execution.
+queries = {}
+queries['metadata_query'] = utilities.read_sql_file("queries/query_metadata.sql")
+queries['tables_modification_query'] = utilities.read_sql_file("queries/query_tables_modification.sql")
+queries['log_table_create'] = utilities.read_sql_file("queries/create_log_table.sql")%ch_credentials
+
+#One connection (and SSH tunnel), one cache of table checks, one Logs API rate limiter and one registry of metrics for all the jobs of batch.
+batch_logger = Logger(global_settings.get('log_continuous_path'), None, global_settings.get('log_flush_interval_sec'))
+shared_ch = ClickHouseConnector(batch_logger, ch_credentials.get('login'), ch_credentials.get('password'), ch_credentials.get('host'), ch_credentials.get('port'),
+                                ch_credentials.get('db'), ch_credentials.get('table'), ch_credentials.get('logTable'), ch_credentials.get('ssh'), 
+                                pool_size=global_settings.get('ch_pool_size', 1), compress=global_settings.get('ch_compression'))
+if shared_ch.ch_client is None:
+    raise ConnectionError("Connection to database wasn't established. Please, check credentials and re-run the script.")
+checked_tables = {}
+rate_limiter = TokenBucket(min(global_settings.get('api_requests_per_sec', 1/MainFlowWrapper.DEFAULT_REQUEST_SLEEP), QuotaAwareScheduler.MAX_REQUESTS_PER_SEC))
+metrics = MetricsRegistry(global_settings.get('metrics_textfile_path'), global_settings.get('metrics_summary_path'))
+if global_settings.get('metrics_port'):
+    metrics.serve(global_settings.get('metrics_port'), global_settings.get('metrics_host'))
+
+
+def job_name(job):
+    """Function to name job of batch by its counter and source."""
+    return f"{job.get('counter', api_settings.get('counter'))}-{job.get('source', api_settings.get('source'))}"
+
+
+def job_settings(job):
+    """Function to build configs of one job: api_credentials.json values overridden by job values,
+    table of ch_credentials.json overridden by job's table and last run log path made unique for job."""
+    job_api_settings = api_settings.copy()
+    job_api_settings.update({key: value for key, value in job.items() if key != 'table'})
+    job_ch_credentials = ch_credentials.copy()
+    if job.get('table'):
+        job_ch_credentials['table'] = job.get('table')
+    job_global_settings = copy.deepcopy(global_settings)
+    last_run_path = global_settings.get('log_last_run_path')
+    if last_run_path:
+        root, dot, extension = last_run_path.rpartition('.')
+        job_global_settings['log_last_run_path'] = f"{root}-{job_name(job)}.{extension}" if dot else f"{last_run_path}-{job_name(job)}"
+    return job_ch_credentials, job_api_settings, job_global_settings
+
+
+def create_flow(job, wrapper_class=MainFlowWrapper):
+    """Function to create flow of job on shared connection."""
+    job_ch_credentials, job_api_settings, job_global_settings = job_settings(job)
+    return wrapper_class(job_ch_credentials, job_api_settings, job_global_settings, queries, utilities,
+                         ch=shared_ch, checked_tables=checked_tables, rate_limiter=rate_limiter, metrics=metrics)
+
+
+def report_failure(job, error):
+    """Function to print and log failure of job."""
+    print(f"Job {job_name(job)} failed: {error}")
+    batch_logger.add_to_log(MainFlowWrapper.DEFAULT_ERROR_CODE, f"/batch/{job_name(job)}",
+                            f"Job failed: {error}").write_to_disk_incremental()
+
+
+def run_job(job):
+    """Function to perform the same steps as main.py does, but on shared connection."""
+    main_flow = create_flow(job)
+    if main_flow.global_settings.get('incremental_sync'):
+        main_flow.run_incremental_sync()
+    elif main_flow.global_settings.get('auto_date_sharding'):
+        main_flow.run_date_shards()
+    else:
+        main_flow.check_log_evaluation()
+        main_flow.create_log_request()
+        main_flow.log_status_check()
+        main_flow.download_and_write_data()
+    main_flow.close_and_finish()
+    return True
+
+
+def run_counter_jobs(counter_jobs):
+    """Function to run jobs of one counter one by one, as they share Logs API requests queue of counter (which may be cleared by each job).
+    Returns list of names of failed jobs."""
+    failed = []
+    for job in counter_jobs:
+        try:
+            run_job(job)
+            print(f"Job {job_name(job)} finished successfully.")
+        except Exception as error:
+            report_failure(job, error)
+            failed.append(job_name(job))
+    return failed
+
+
+async def run_counter_jobs_async(counter_jobs, slots):
+    """Coroutine to run jobs of one counter one by one on event loop, when async_engine parameter of global_config is set.
+    Returns list of names of failed jobs."""
+    failed = []
+    for job in counter_jobs:
+        async with slots:
+            try:
+                #Flow creation checks tables, so it's performed in worker thread not to block event loop.
+                main_flow = await asyncio.to_thread(create_flow, job, AsyncMainFlowWrapper)
+                await main_flow.run_async()
+                print(f"Job {job_name(job)} finished successfully.")
+            except Exception as error:
+                report_failure(job, error)
+                failed.append(job_name(job))
+    return failed
+
+
+async def run_batch_async(groups, max_concurrent_jobs):
+    """Coroutine to run groups of jobs of all the counters concurrently on one event loop."""
+    slots = asyncio.Semaphore(max_concurrent_jobs)
+    return await asyncio.gather(*(run_counter_jobs_async(counter_jobs, slots) for counter_jobs in groups))
+
+
+#Let's group jobs by counter and run groups concurrently under global concurrency limit.
+jobs_by_counter = {}
+for job in batch_settings.get('jobs', []):
+    jobs_by_counter.setdefault(job.get('counter', api_settings.get('counter')), []).append(job)
+max_concurrent_jobs = max(1, batch_settings.get('max_concurrent_jobs', 1))
+failed_jobs = []
+try:
+    if global_settings.get('async_engine'):
+        for failed in asyncio.run(run_batch_async(list(jobs_by_counter.values()), max_concurrent_jobs)):
+            failed_jobs.extend(failed)
+    else:
+        with ThreadPoolExecutor(max_workers=max_concurrent_jobs) as pool:
+            for failed in pool.map(run_counter_jobs, jobs_by_counter.values()):
+                failed_jobs.extend(failed)
+finally:
+    shared_ch.close_connections()
+    batch_logger.close()
+    metrics.export()
+
+if failed_jobs:
+    print(f"Batch finished with failed jobs: {', '.join(failed_jobs)}")
+    sys.exit(1)
+print("Batch finished successfully.")
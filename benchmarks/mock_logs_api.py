@@ -0,0 +1,244 @@
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from .tsv_generator import LogsTsvGenerator
+
+
+class MockLogsApi:
+    """Local HTTP stand-in of Logs API endpoints used by api_methods.py: evaluate, list, create, status, part download, clean and cancel.
+    Parts are generated by LogsTsvGenerator once (on start) and served to every request, so generation doesn't load benchmarked process.
+
+    Arguments:
+        generator :inst of class LogsTsvGenerator - generator of parts data.
+        parts :int - amount of parts of each request. 1 by default.
+        preparation_sec :float - seconds after creation when request becomes processed. 0 by default.
+        max_days :int or None - the largest date range (days) evaluation allows. No limit if None.
+        error_rate :float - share of requests answered with 503 error. 0 by default.
+        rate_limit_rate :float - share of requests answered with 429 error (quota exceeded). 0 by default.
+        bandwidth_bytes_per_sec :int or None - throttling of part downloads. No throttling if None.
+        host :str - host to listen on. HOST by default.
+        port :int - port to listen on. 0 (any free port) by default.
+        seed :int - seed of error injection. 0 by default.
+
+    Constants:
+        HOST - str, default host.
+        URL_PREFIX - str, path prefix of Logs API endpoints with macro for counter.
+        CHUNK_SIZE - int, size of chunks of part downloads (and of throttling steps).
+
+    Properties:
+        base_url - str, URL to assign to AbstractRequest.BASE_URL of api_methods.py.
+        stats - dict, amount of responses by endpoint kind and status code, bytes of parts served.
+        requests - dict, created requests by request_id.
+
+    Methods:
+        start(self) - generates parts and starts server in a daemon thread. Returns self.
+        stop(self) - stops server. Returns self.
+    """
+
+    HOST = '127.0.0.1'
+    URL_PREFIX = '/management/v1/counter/%s/'
+    CHUNK_SIZE = 64*1024
+
+    def __init__(self, generator, parts=1, preparation_sec=0, max_days=None, error_rate=0.0, rate_limit_rate=0.0, bandwidth_bytes_per_sec=None,
+                 host=None, port=0, seed=0):
+        self.generator = generator
+        self.parts = parts
+        self.preparation_sec = preparation_sec
+        self.max_days = max_days
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.bandwidth_bytes_per_sec = bandwidth_bytes_per_sec
+        self.host = host or self.__class__.HOST
+        self.port = port
+        self.requests = {}
+        self.stats = {'bytes_served': 0}
+        self._random = random.Random(seed)
+        self._bodies = {}
+        self._next_request_id = 1
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}" + self.__class__.URL_PREFIX
+
+    def start(self):
+        """Method to generate parts and to start server."""
+        for part in range(self.parts):
+            self._bodies[part] = self.generator.part_bytes(part)
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Mock Logs API is listening on {self.base_url}. Parts: {self.parts}, {sum(len(body) for body in self._bodies.values())} bytes in total.")
+        return self
+
+    def stop(self):
+        """Method to stop server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        return self
+
+    def _count(self, kind, code):
+        with self._lock:
+            key = f"{kind}_{code}"
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def _injected_error(self):
+        """Method to decide if response should be an injected error. Returns code or None."""
+        with self._lock:
+            chance = self._random.random()
+        if chance < self.rate_limit_rate:
+            return 429
+        if chance < self.rate_limit_rate + self.error_rate:
+            return 503
+        return None
+
+    def _request_view(self, request_id):
+        """Method to build Logs API representation of request, with status depending on time since creation."""
+        request = self.requests[request_id]
+        view = {key: value for key, value in request.items() if key != 'created_at'}
+        if view['status'] == 'created' and time.monotonic() - request['created_at'] >= self.preparation_sec:
+            view['status'] = request['status'] = 'processed'
+        if view['status'] == 'processed':
+            view['parts'] = [{'part_number': part, 'size': len(self._bodies[part])} for part in range(self.parts)]
+            view['size'] = sum(len(body) for body in self._bodies.values())
+        return view
+
+    def _route(self, method, path, query):
+        """Method to handle request. Returns tuple (kind, code, body), body is dict or bytes of part."""
+        match = re.match(r'/management/v1/counter/(\d+)/(.*)$', path)
+        if match is None:
+            return 'unknown', 404, {'message': 'Not found'}
+        counter, rest = int(match.group(1)), match.group(2)
+        if rest == 'logrequests/evaluate':
+            days = (datetime.strptime(query['date2'][0], "%Y-%m-%d") - datetime.strptime(query['date1'][0], "%Y-%m-%d")).days + 1
+            max_days = self.max_days or 365
+            return 'evaluate', 200, {'log_request_evaluation': {'possible': days <= max_days, 'max_possible_day_quantity': max_days}}
+        if rest == 'logrequests' and method == 'GET':
+            with self._lock:
+                views = [self._request_view(request_id) for request_id, request in self.requests.items() if request['counter_id'] == counter]
+            return 'list', 200, {'requests': views}
+        if rest == 'logrequests' and method == 'POST':
+            with self._lock:
+                request_id = self._next_request_id
+                self._next_request_id += 1
+                self.requests[request_id] = {'request_id': request_id, 'counter_id': counter, 'source': query.get('source', [''])[0],
+                                             'date1': query.get('date1', [''])[0], 'date2': query.get('date2', [''])[0],
+                                             'fields': query.get('fields', [''])[0].split(','), 'attribution': query.get('attribution', ['LASTSIGN'])[0],
+                                             'status': 'created', 'created_at': time.monotonic()}
+                view = self._request_view(request_id)
+            return 'create', 200, {'log_request': view}
+        match = re.match(r'logrequest/(\d+)(?:/(clean|cancel)|/part/(\d+)/download)?$', rest)
+        if match is None:
+            return 'unknown', 404, {'message': 'Not found'}
+        request_id = int(match.group(1))
+        with self._lock:
+            if request_id not in self.requests:
+                return 'status', 404, {'message': 'Log request not found'}
+            view = self._request_view(request_id)
+            if match.group(2) == 'clean' and method == 'POST':
+                if view['status'] != 'processed':
+                    return 'clean', 400, {'message': 'Only processed request can be cleaned'}
+                self.requests[request_id]['status'] = 'cleaned_by_user'
+                return 'clean', 200, {'log_request': self._request_view(request_id)}
+            if match.group(2) == 'cancel' and method == 'POST':
+                if view['status'] != 'created':
+                    return 'cancel', 400, {'message': 'Only created request can be canceled'}
+                self.requests[request_id]['status'] = 'canceled'
+                return 'cancel', 200, {'log_request': self._request_view(request_id)}
+        if match.group(3) is not None:
+            part = int(match.group(3))
+            if view['status'] != 'processed' or part not in self._bodies:
+                return 'download', 400, {'message': 'Part is not available'}
+            return 'download', 200, self._bodies[part]
+        return 'status', 200, {'log_request': view}
+
+    def _handler(self):
+        """Method to build request handler class bound to this mock."""
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if self.command == 'POST' and int(self.headers.get('Content-Length') or 0) > 0:
+                    query.update(parse_qs(self.rfile.read(int(self.headers.get('Content-Length'))).decode('utf-8')))
+                code = mock._injected_error()
+                if code is not None:
+                    kind, body = 'injected', {'message': 'Injected error'}
+                else:
+                    kind, code, body = mock._route(self.command, url.path, query)
+                mock._count(kind, code)
+                if isinstance(body, bytes):
+                    self._send_part(body)
+                else:
+                    data = json.dumps(body).encode('utf-8')
+                    self.send_response(code)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+            def _send_part(self, body):
+                """Method to send part, gzipped if client accepts it, with throttling to bandwidth_bytes_per_sec."""
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/tab-separated-values')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body, compresslevel=1)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                started = time.monotonic()
+                for offset in range(0, len(body), MockLogsApi.CHUNK_SIZE):
+                    self.wfile.write(body[offset:offset + MockLogsApi.CHUNK_SIZE])
+                    if mock.bandwidth_bytes_per_sec:
+                        delay = (offset + MockLogsApi.CHUNK_SIZE)/mock.bandwidth_bytes_per_sec - (time.monotonic() - started)
+                        if delay > 0:
+                            time.sleep(delay)
+                with mock._lock:
+                    mock.stats['bytes_served'] += len(body)
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs local mock of Logs API (e.g. to benchmark connector in a separate process with run_benchmark.py --api-url).")
+    parser.add_argument('--fields', required=True, help="comma separated Logs API fields")
+    parser.add_argument('--source', default='visits')
+    parser.add_argument('--rows', type=int, default=LogsTsvGenerator.ROWS_PER_PART, help="rows in part")
+    parser.add_argument('--parts', type=int, default=1)
+    parser.add_argument('--preparation-sec', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--bandwidth-mbps', type=float, default=None, help="throttling of downloads, megabytes per second")
+    parser.add_argument('--port', type=int, default=8800)
+    arguments = parser.parse_args()
+    mock = MockLogsApi(LogsTsvGenerator(arguments.fields.split(','), arguments.source, arguments.rows), arguments.parts, arguments.preparation_sec,
+                       error_rate=arguments.error_rate, rate_limit_rate=arguments.rate_limit_rate,
+                       bandwidth_bytes_per_sec=arguments.bandwidth_mbps*1024*1024 if arguments.bandwidth_mbps else None, port=arguments.port).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import copy
+import functools
+import json
+import os
+import resource
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from utils.routines_utils import UtilsSet
+from utils.compression_utils import Compressor
+from utils.api_methods import AbstractRequest
+from utils.schema_registry import FieldTypeRegistry
+from utils.wrappers import MainFlowWrapper, AsyncMainFlowWrapper
+from .tsv_generator import LogsTsvGenerator
+from .mock_logs_api import MockLogsApi
+
+
+class RecordingSink:
+    """Stand-in of ClickHouseConnector for benchmarks without database: inserted data is consumed (and decompressed, as server would do) and counted,
+    DDL and other commands succeed without doing anything. Has the same methods MainFlowWrapper calls on its connector.
+
+    Arguments:
+        db :str - name of database.
+        table :str - name of data table.
+        table_columns :list of tuples (name, type) - columns of data table, returned as result of metadata query (to system.columns).
+
+    Properties:
+        rows - int, rows inserted to data table (header lines of TSV inserts aren't counted).
+        bytes - int, bytes of inserted data (decompressed).
+        inserts - int, amount of inserts to data table.
+        insert_seconds - float, total time of inserts (including reading of files and streams).
+    """
+
+    def __init__(self, db, table, table_columns):
+        self.db = db
+        self.table = table
+        self.logTable = None
+        self.table_columns = table_columns
+        self.rows = 0
+        self.bytes = 0
+        self.inserts = 0
+        self.insert_seconds = 0.0
+        self._lock = threading.Lock()
+        self._last = threading.local()
+
+    def _record(self, rows, size, started):
+        self._last.rows = rows
+        with self._lock:
+            self.rows += rows
+            self.bytes += size
+            self.inserts += 1
+            self.insert_seconds += time.monotonic() - started
+
+    def _consume(self, chunks, compression, started):
+        """Method to read all the chunks of TSV insert and to record them."""
+        if compression:
+            chunks = Compressor(compression).decompress_chunks(chunks)
+        lines, size = 0, 0
+        for chunk in chunks:
+            lines += chunk.count(b'\n')
+            size += len(chunk)
+        self._record(max(0, lines - 1), size, started)
+        return True
+
+    def insert_datafile(self, file, settings=None, compression=None, table=None, dedup_token=None):
+        started = time.monotonic()
+        with open(file, 'rb') as f:
+            return self._consume(iter(lambda: f.read(1024*1024), b''), compression, started)
+
+    def insert_stream(self, chunks, settings=None, compression=None, table=None, dedup_token=None, column_names=None):
+        return self._consume(chunks, compression, time.monotonic())
+
+    def insert_columns(self, columns, column_names, column_types, settings=None, table=None, dedup_token=None):
+        if table is not None and table == self.logTable:
+            return True
+        self._record(len(columns[0]) if columns else 0, 0, time.monotonic())
+        return True
+
+    def last_written_rows(self):
+        return getattr(self._last, 'rows', None)
+
+    def insert_data(self, table, data):
+        return True
+
+    def query_data(self, query, **kwargs):
+        if 'system.columns' not in query:
+            return [(self.table, '')] if 'system.tables' in query else []
+        return [('database', self.db, '', '', ''), ('table', self.table, '', '', '')] + [('column', self.table, '', name, column_type) for name, column_type in self.table_columns]
+
+    def create_table(self, query, table, **kwargs):
+        return True
+
+    def run_command(self, query, **kwargs):
+        return True
+
+    def create_staging_table(self, staging_table, table=None):
+        return True
+
+    def drop_table(self, table):
+        return True
+
+    def table_partitions(self, table):
+        return []
+
+    def table_deduplicates(self, table=None):
+        return True
+
+    def partition_versions(self, partitions, table=None):
+        return {partition: 0 for partition in partitions}
+
+    def full_table_name(self, table=None):
+        return f"{self.db}.{table or self.table}"
+
+    def close_connections(self):
+        return self
+
+
+class StageTimer:
+    """Timer of stages (methods) of flow. Methods of instance are replaced with wrappers, which accumulate time of outermost calls
+    (retries calling the method recursively aren't counted twice) of each stage in each thread.
+
+    Properties:
+        seconds - dict, total seconds by stage.
+        calls - dict, amount of outermost calls by stage.
+
+    Methods:
+        wrap(self, instance, stages) - wraps methods (names in stages) of instance, both usual and coroutine ones. Returns instance.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self._depth = threading.local()
+        self._lock = threading.Lock()
+
+    def _enter(self, stage):
+        depth = getattr(self._depth, stage, 0)
+        setattr(self._depth, stage, depth + 1)
+        return depth == 0
+
+    def _exit(self, stage, outermost, started):
+        setattr(self._depth, stage, getattr(self._depth, stage) - 1)
+        if outermost:
+            with self._lock:
+                self.seconds[stage] = self.seconds.get(stage, 0.0) + time.monotonic() - started
+                self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def wrap(self, instance, stages):
+        """Method to wrap stages of instance."""
+        for stage in stages:
+            method = getattr(instance, stage, None)
+            if method is None:
+                continue
+            setattr(instance, stage, self._async_wrapper(stage, method) if asyncio.iscoroutinefunction(method) else self._wrapper(stage, method))
+        return instance
+
+    def _wrapper(self, stage, method):
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            outermost, started = self._enter(stage), time.monotonic()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._exit(stage, outermost, started)
+        return timed
+
+    def _async_wrapper(self, stage, method):
+        @functools.wraps(method)
+        async def timed(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.seconds[stage] = self.seconds.get(stage, 0.0) + time.monotonic() - started
+                    self.calls[stage] = self.calls.get(stage, 0) + 1
+        return timed
+
+
+#Stages of MainFlowWrapper (and AsyncMainFlowWrapper) to time. Nested stages are timed inclusively.
+STAGES = ['check_log_evaluation', 'create_log_request', 'log_status_check', 'download_and_write_data', 'log_downloader', 'pipeline_download_and_load',
+          'direct_download_and_load', 'write_data_to_db', 'delete_log', 'write_log_to_db', 'close_and_finish',
+          'check_log_evaluation_async', 'create_log_request_async', 'log_status_check_async', 'download_and_write_data_async', 'log_downloader_async']
+
+
+def read_configs(arguments, work_dir):
+    """Function to read configs of project and to override them for benchmark run: local paths are moved to work_dir, state files
+    (sync state, checkpoint journal) and reuse of requests are switched off, so each run creates and loads new request."""
+    utilities = UtilsSet()
+    ch_credentials = utilities.read_json_file("configs/ch_credentials.json")
+    api_settings = utilities.read_json_file("configs/api_credentials.json")
+    global_settings = utilities.read_json_file("configs/global_config.json")
+    queries = {}
+    queries['metadata_query'] = utilities.read_sql_file("queries/query_metadata.sql")
+    queries['tables_modification_query'] = utilities.read_sql_file("queries/query_tables_modification.sql")
+    queries['log_table_create'] = utilities.read_sql_file("queries/create_log_table.sql")%ch_credentials
+    if arguments.fields:
+        api_settings['fields'] = arguments.fields
+    if arguments.source:
+        api_settings['source'] = arguments.source
+    api_settings.update({'token': 'benchmark', 'counter': str(LogsTsvGenerator.COUNTER_ID), 'date1': arguments.date, 'date2': arguments.date})
+    global_settings.update({'temporary_data_path': os.path.join(work_dir, 'data/'), 'log_continuous_path': os.path.join(work_dir, 'logs/logs.tsv'),
+                            'log_last_run_path': os.path.join(work_dir, 'logs/last_run.tsv'), 'incremental_sync': False, 'auto_date_sharding': False,
+                            'checkpoint_journal': False, 'status_check_expected_max_sec': 0, 'status_check_initial_sec': 0.2,
+                            'frequency_api_status_check_sec': 1, 'metrics_textfile_path': None, 'metrics_summary_path': os.path.join(work_dir, 'logs/metrics.json'),
+                            'metrics_port': None, 'reuse_prepared_requests': False, 'request_registry_path': os.path.join(work_dir, 'state/created_requests.json'),
+                            'schema_cache_path': os.path.join(work_dir, 'state/schema_cache.json')})
+    for option in ['load_mode', 'insert_format', 'data_compression', 'download_workers', 'ch_pool_size']:
+        if getattr(arguments, option) is not None:
+            global_settings[option] = getattr(arguments, option)
+    if arguments.engine is not None:
+        global_settings['async_engine'] = arguments.engine == 'async'
+    if arguments.profile:
+        #Profile report and cProfile dumps are written next to the last run log, so it's moved out of temporary directory.
+        global_settings.update({'profile': True, 'profile_cprofile': True, 'log_last_run_path': os.path.join(arguments.profile, 'last_run.log')})
+    if arguments.sink == 'record':
+        #There is no database, so nothing to check and nowhere to stage data.
+        global_settings.update({'run_db_table_test': False, 'run_log_table_test': False, 'staging_load': False})
+    return ch_credentials, api_settings, global_settings, queries, utilities
+
+
+def run_once(arguments, configs, mock, sink):
+    """Function to perform one run of flow (the same steps as main.py does). Returns dict of results."""
+    ch_credentials, api_settings, global_settings, queries, utilities = copy.deepcopy(configs[:4]) + (configs[4],)
+    timer = StageTimer()
+    bytes_before = mock.stats['bytes_served']
+    rows_before = sink.rows if sink is not None else 0
+    if arguments.tracemalloc:
+        tracemalloc.reset_peak()
+    started = time.monotonic()
+    wrapper_class = AsyncMainFlowWrapper if global_settings.get('async_engine') else MainFlowWrapper
+    main_flow = wrapper_class(ch_credentials, api_settings, global_settings, queries, utilities, ch=sink)
+    init_seconds = time.monotonic() - started
+    timer.wrap(main_flow, STAGES)
+    if global_settings.get('async_engine'):
+        asyncio.run(main_flow.run_async())
+    else:
+        main_flow.check_log_evaluation()
+        main_flow.create_log_request()
+        main_flow.log_status_check()
+        main_flow.download_and_write_data()
+        main_flow.close_and_finish()
+    seconds = time.monotonic() - started
+    served = mock.stats['bytes_served'] - bytes_before
+    rows = (sink.rows - rows_before) if sink is not None else arguments.parts*arguments.rows
+    result = {'seconds': round(seconds, 3), 'rows': rows, 'bytes_served': served, 'rows_per_sec': round(rows/seconds, 1),
+              'mb_per_sec': round(served/1024/1024/seconds, 3), 'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024, 1),
+              'stages': dict({'init': round(init_seconds, 3)}, **{stage: round(value, 3) for stage, value in timer.seconds.items()})}
+    if arguments.tracemalloc:
+        result['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1]/1024/1024, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of MainFlowWrapper against local mock of Logs API and recording sink (or ClickHouse of ch_credentials.json). "
+                                                 "Run from the root directory of project: python -m benchmarks.run_benchmark")
+    parser.add_argument('--fields', help="comma separated Logs API fields. Fields of api_credentials.json by default")
+    parser.add_argument('--source', help="source of Logs API. Source of api_credentials.json by default")
+    parser.add_argument('--date', default=time.strftime("%Y-%m-%d", time.localtime(time.time() - 86400)), help="date of request and data. Yesterday by default")
+    parser.add_argument('--parts', type=int, default=4, help="parts of each request")
+    parser.add_argument('--rows', type=int, default=LogsTsvGenerator.ROWS_PER_PART, help="rows in part")
+    parser.add_argument('--preparation-sec', type=float, default=0, help="preparation time of request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of API responses with 503 error")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="share of API responses with 429 error")
+    parser.add_argument('--bandwidth-mbps', type=float, default=None, help="throttling of part downloads, megabytes per second")
+    parser.add_argument('--api-url', help="URL of already running mock (python -m benchmarks.mock_logs_api), e.g. http://127.0.0.1:8800/management/v1/counter/%%s/")
+    parser.add_argument('--sink', choices=['record', 'clickhouse'], default='record', help="recording sink or ClickHouse of ch_credentials.json")
+    parser.add_argument('--engine', choices=['sync', 'async'], default=None, help="async_engine override")
+    parser.add_argument('--load-mode', dest='load_mode', choices=['sequential', 'pipeline', 'direct'], default=None, help="load_mode override")
+    parser.add_argument('--insert-format', dest='insert_format', choices=['tsv', 'columnar'], default=None, help="insert_format override")
+    parser.add_argument('--data-compression', dest='data_compression', default=None, help="data_compression override")
+    parser.add_argument('--download-workers', dest='download_workers', type=int, default=None, help="download_workers override")
+    parser.add_argument('--ch-pool-size', dest='ch_pool_size', type=int, default=None, help="ch_pool_size override")
+    parser.add_argument('--repeat', type=int, default=1, help="amount of runs")
+    parser.add_argument('--tracemalloc', action='store_true', help="trace Python allocations to report their peak (slows down run)")
+    parser.add_argument('--profile', metavar='DIR', help="profile stages (profile and profile_cprofile parameters of global_config) and write report and cProfile dumps to DIR")
+    parser.add_argument('--output', help="path of JSON file to write results to")
+    arguments = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='logs-api-benchmark-')
+    configs = read_configs(arguments, work_dir)
+    ch_credentials, api_settings, global_settings = configs[0], configs[1], configs[2]
+    fields = api_settings.get('fields').split(',')
+    generator = LogsTsvGenerator(fields, api_settings.get('source'), arguments.rows, arguments.date, arguments.date)
+    mock = MockLogsApi(generator, arguments.parts, arguments.preparation_sec, error_rate=arguments.error_rate, rate_limit_rate=arguments.rate_limit_rate,
+                       bandwidth_bytes_per_sec=arguments.bandwidth_mbps*1024*1024 if arguments.bandwidth_mbps else None)
+    sink = None
+    if arguments.sink == 'record':
+        registry = FieldTypeRegistry(api_settings.get('source'), global_settings.get('api_strict_db_table_cols_names'), api_settings.get('attribution'),
+                                     global_settings.get('field_types'), global_settings.get('column_mapping'))
+        sink = RecordingSink(ch_credentials.get('db'), ch_credentials.get('table'), [(registry.column_name(field), registry.column_type(field)) for field in fields])
+    if arguments.api_url:
+        AbstractRequest.BASE_URL = arguments.api_url
+    else:
+        mock.start()
+        AbstractRequest.BASE_URL = mock.base_url
+    if arguments.tracemalloc:
+        tracemalloc.start()
+
+    results = []
+    try:
+        for run in range(arguments.repeat):
+            result = run_once(arguments, configs, mock, sink)
+            results.append(result)
+            print(f"Run {run + 1}: {result['seconds']} sec, {result['rows']} rows ({result['rows_per_sec']} rows/s), {result['mb_per_sec']} MB/s from API, "
+                  f"peak RSS {result['peak_rss_mb']} MB. Stages: {result['stages']}")
+    finally:
+        mock.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = {'parameters': {key: value for key, value in vars(arguments).items() if key != 'output'},
+               'settings': {key: global_settings.get(key) for key in ['async_engine', 'load_mode', 'insert_format', 'data_compression', 'api_compression',
+                                                                     'download_workers', 'ch_pool_size', 'column_projection']},
+               'api_stats': mock.stats, 'runs': results,
+               'median_seconds': statistics.median(result['seconds'] for result in results),
+               'best_rows_per_sec': max(result['rows_per_sec'] for result in results)}
+    print(f"Median time: {summary['median_seconds']} sec. Best throughput: {summary['best_rows_per_sec']} rows/s. API responses: {mock.stats}")
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+        print(f"Results were written to {arguments.output}.")
+    return summary
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+from utils.schema_registry import FieldTypeRegistry
+
+
+class LogsTsvGenerator:
+    """Generator of synthetic TSVWithNames parts of Logs API for benchmarks. Values of each field are generated by its ClickHouse type from
+    FieldTypeRegistry: identifiers, dates within date range, URLs, categorical values from small vocabularies and arrays of 0-MAX_ARRAY_LENGTH
+    elements (goals, purchases, products etc.), escaped as Logs API escapes them. Parts are deterministic: the same seed and part give the same data.
+
+    Arguments:
+        fields :list of str - Logs API fields (ym:s:* or ym:pv:*), the same as fields parameter of api_credentials.json.
+        source :str - source of Logs API, 'visits' or 'hits'. 'visits' by default.
+        rows_per_part :int - rows in one part. ROWS_PER_PART by default.
+        date1 :str - start date of data ("%Y-%m-%d"). Yesterday by default.
+        date2 :str - end date of data ("%Y-%m-%d"). date1 by default.
+        counter_id :int - value of counterID field. COUNTER_ID by default.
+        seed :int - seed of random values. 0 by default.
+
+    Constants:
+        ROWS_PER_PART - int, default rows in one part.
+        COUNTER_ID - int, default counter.
+        MAX_ARRAY_LENGTH - int, max amount of elements of array fields.
+        CATEGORIES - int, amount of distinct values of LowCardinality fields.
+        ROWS_PER_CHUNK - int, rows in one bytes chunk of part_chunks.
+
+    Methods:
+        header(self) - returns header line (bytes) of part.
+        part_chunks(self, part) - generator of bytes chunks of part (header included).
+        part_bytes(self, part) - returns the whole part as bytes.
+        row(self, rnd, number) - returns list of TSV values of one row.
+    """
+
+    ROWS_PER_PART = 10000
+    COUNTER_ID = 111222333
+    MAX_ARRAY_LENGTH = 3
+    CATEGORIES = 20
+    ROWS_PER_CHUNK = 1000
+
+    def __init__(self, fields, source='visits', rows_per_part=None, date1=None, date2=None, counter_id=None, seed=0):
+        self.fields = list(fields)
+        self.source = source
+        self.rows_per_part = rows_per_part or self.__class__.ROWS_PER_PART
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        self.date1 = datetime.strptime(date1 or yesterday, "%Y-%m-%d")
+        self.date2 = datetime.strptime(date2 or date1 or yesterday, "%Y-%m-%d")
+        self.counter_id = counter_id or self.__class__.COUNTER_ID
+        self.seed = seed
+        registry = FieldTypeRegistry(source)
+        self._names = [registry.field_name(field).replace(FieldTypeRegistry.ATTRIBUTION_PLACEHOLDER, '') for field in self.fields]
+        self._values = [self._value_function(name, registry.column_type(field)) for name, field in zip(self._names, self.fields)]
+
+    def header(self):
+        """Method to build header line of part."""
+        return ('\t'.join(self.fields) + '\n').encode('utf-8')
+
+    def part_chunks(self, part):
+        """Generator of bytes chunks of part. Each chunk has ROWS_PER_CHUNK rows."""
+        rnd = random.Random(f"{self.seed}/{part}")
+        yield self.header()
+        lines = []
+        for number in range(self.rows_per_part):
+            lines.append('\t'.join(self.row(rnd, part*self.rows_per_part + number)))
+            if len(lines) >= self.__class__.ROWS_PER_CHUNK:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def part_bytes(self, part):
+        """Method to build the whole part."""
+        return b''.join(self.part_chunks(part))
+
+    def row(self, rnd, number):
+        """Method to build values of one row. number is index of row within all the parts, to make identifiers unique."""
+        moment = self.date1 + timedelta(seconds=rnd.randrange(int((self.date2 - self.date1).total_seconds()) + 86400))
+        return [value(rnd, number, moment) for value in self._values]
+
+    def _value_function(self, name, column_type):
+        """Method to choose function of values of field by its name and type."""
+        if column_type.startswith('Array('):
+            element = self._value_function(name, column_type[len('Array('):-1])
+            return lambda rnd, number, moment: self._array([element(rnd, number, moment) for i in range(rnd.randrange(self.__class__.MAX_ARRAY_LENGTH + 1))],
+                                                           column_type)
+        if name == 'counterID':
+            return lambda rnd, number, moment: str(self.counter_id)
+        if name in ('visitID', 'watchID'):
+            return lambda rnd, number, moment: str(number + 1)
+        if column_type == 'Date':
+            return lambda rnd, number, moment: moment.strftime("%Y-%m-%d")
+        if column_type == 'DateTime':
+            return lambda rnd, number, moment: moment.strftime("%Y-%m-%d %H:%M:%S")
+        if column_type.startswith(('UInt8', 'Int8')):
+            return lambda rnd, number, moment: str(rnd.randrange(2))
+        if column_type.startswith(('Int', 'UInt')):
+            bits = int(''.join(char for char in column_type if char.isdigit()) or 32)
+            return lambda rnd, number, moment: str(rnd.randrange(2**min(bits - 1, 62)))
+        if column_type.startswith('Float'):
+            return lambda rnd, number, moment: str(round(rnd.uniform(0, 10000), 2))
+        if column_type.startswith('LowCardinality'):
+            return lambda rnd, number, moment: f"{name}_{rnd.randrange(self.__class__.CATEGORIES)}"
+        if name.endswith(('URL', 'referer', 'Referer')):
+            return lambda rnd, number, moment: f"https://example.com/catalog/{rnd.randrange(1000)}/item-{rnd.randrange(100000)}?utm_source=source_{rnd.randrange(10)}"
+        return lambda rnd, number, moment: f"{name} {rnd.randrange(100000)}"
+
+    @staticmethod
+    def _array(values, column_type):
+        """Method to format array as Logs API does: [1,2] for numbers, ['a','b'] for strings and dates."""
+        if 'String' in column_type or 'Date' in column_type:
+            return '[' + ','.join("'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'" for value in values) + ']'
+        return '[' + ','.join(values) + ']'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates synthetic TSV part of Logs API.")
+    parser.add_argument('--fields', required=True, help="comma separated Logs API fields")
+    parser.add_argument('--source', default='visits')
+    parser.add_argument('--rows', type=int, default=LogsTsvGenerator.ROWS_PER_PART, help="rows in part")
+    parser.add_argument('--part', type=int, default=0, help="number of part (seed of its data)")
+    parser.add_argument('--output', required=True, help="path of file to write part to")
+    arguments = parser.parse_args()
+    generator = LogsTsvGenerator(arguments.fields.split(','), arguments.source, arguments.rows)
+    with open(arguments.output, 'wb') as f:
+        for chunk in generator.part_chunks(arguments.part):
+            f.write(chunk)
+    print(f"Part {arguments.part} ({arguments.rows} rows) was written to {arguments.output}.")
@@ -1,6 +1,8 @@
+import argparse
 from utils.routines_utils import UtilsSet
 from utils.api_methods import *
-from utils.wrappers import MainFlowWrapper
+from utils.wrappers import MainFlowWrapper, AsyncMainFlowWrapper
+import asyncio
 
 
 #Creating utilitites set instance for script run
@@ -11,26 +13,40 @@ ch_credentials = utilities.read_json_file("configs/ch_credentials.json")
 api_settings = utilities.read_json_file("configs/api_credentials.json")
 global_settings = utilities.read_json_file("configs/global_config.json")
 
+parser = argparse.ArgumentParser(description="Loads Logs API log of configs/api_credentials.json into ClickHouse table of configs/ch_credentials.json.")
+parser.add_argument('--profile', action=argparse.BooleanOptionalAction, default=None, 
+                    help="profile stages of the run (overrides profile key of configs/global_config.json)")
+arguments = parser.parse_args()
+if arguments.profile is not None:
+    global_settings['profile'] = arguments.profile
+
 #Reading queries and creating dictionary of queries to perform during program execution. 
 queries = {}
-queries['db_query'] = utilities.read_sql_file("queries/query_database.sql")
-queries['table_query'] = utilities.read_sql_file("queries/query_table.sql")
-queries['columns_query'] = utilities.read_sql_file("queries/query_columns.sql")
-queries['log_table_query'] = utilities.read_sql_file("queries/query_log_table.sql")
-queries['log_table_query_columns'] = utilities.read_sql_file("queries/query_log_table_columns.sql")
+queries['metadata_query'] = utilities.read_sql_file("queries/query_metadata.sql")
+queries['tables_modification_query'] = utilities.read_sql_file("queries/query_tables_modification.sql")
 queries['log_table_create'] = utilities.read_sql_file("queries/create_log_table.sql")%ch_credentials
 
-#Creating main_flow execution instance. It will establish CH(optionaly - with ssh tunnel) connection and perform db and tables checks if proper globa_config parameters are set. 
-main_flow = MainFlowWrapper(ch_credentials, api_settings, global_settings, queries, utilities)
-#Let's perform log evaluation request. 
-main_flow.check_log_evaluation()
-#Let's perform Logs API log creation request. 
-main_flow.create_log_request()
-#Let's perform log status recursional checks. 
-main_flow.log_status_check()
-#Let's download the Logs API log. 
-main_flow.log_downloader()
-#Let's load downloaded data to our CH instance. 
-main_flow.write_data_to_db()
-#Let's properly finish the script with log records. 
-main_flow.close_and_finish()
\ No newline at end of file
+if global_settings.get('async_engine'): 
+    #Let's perform the whole flow on event loop: all Logs API requests are asynchronous, date shards (if auto_date_sharding is set) are processed one by one. 
+    main_flow = AsyncMainFlowWrapper(ch_credentials, api_settings, global_settings, queries, utilities)
+    asyncio.run(main_flow.run_async())
+else: 
+    #Creating main_flow execution instance. It will establish CH(optionaly - with ssh tunnel) connection and perform db and tables checks if proper globa_config parameters are set. 
+    main_flow = MainFlowWrapper(ch_credentials, api_settings, global_settings, queries, utilities)
+    if global_settings.get('incremental_sync'): 
+        #Let's load only dates, which weren't loaded yet according to sync state. 
+        main_flow.run_incremental_sync()
+    elif global_settings.get('auto_date_sharding'): 
+        #Let's split date range into shards Logs API accepts and process them one by one. 
+        main_flow.run_date_shards()
+    else: 
+        #Let's perform log evaluation request. 
+        main_flow.check_log_evaluation()
+        #Let's perform Logs API log creation request. 
+        main_flow.create_log_request()
+        #Let's perform log status checks (frequent at first, then with growing intervals). 
+        main_flow.log_status_check()
+        #Let's download the Logs API log and load downloaded data to our CH instance (stage by stage or in pipeline, see load_mode in global_config). 
+        main_flow.download_and_write_data()
+    #Let's properly finish the script with log records. 
+    main_flow.close_and_finish()
\ No newline at end of file
@@ -1,4 +0,0 @@
-SELECT 
-	name
-FROM system.databases
-WHERE name = %(db)s;
\ No newline at end of file
@@ -1,4 +0,0 @@
-SELECT 
-	name 
-FROM system.tables
-WHERE database = %(db)s AND name = %(logTable)s; 
\ No newline at end of file
@@ -1,4 +0,0 @@
-SELECT 
-	name 
-FROM system.columns
-WHERE database = %(db)s AND table = %(logTable)s; 
\ No newline at end of file
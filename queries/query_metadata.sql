@@ -0,0 +1,21 @@
+SELECT 
+	kind, 
+	table_name, 
+	metadata_modification_time, 
+	column_name, 
+	column_type
+FROM 
+(
+	SELECT 'database' AS kind, name AS table_name, '' AS metadata_modification_time, '' AS column_name, '' AS column_type, toUInt64(0) AS position
+	FROM system.databases
+	WHERE name = %(db)s
+	UNION ALL
+	SELECT 'table' AS kind, name AS table_name, toString(metadata_modification_time) AS metadata_modification_time, '' AS column_name, '' AS column_type, toUInt64(0) AS position
+	FROM system.tables
+	WHERE database = %(db)s AND name IN (%(table)s, %(logTable)s)
+	UNION ALL
+	SELECT 'column' AS kind, table AS table_name, '' AS metadata_modification_time, name AS column_name, type AS column_type, toUInt64(position) AS position
+	FROM system.columns
+	WHERE database = %(db)s AND table IN (%(table)s, %(logTable)s)
+)
+ORDER BY kind, table_name, position;
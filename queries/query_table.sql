@@ -1,5 +0,0 @@
-SELECT 
-	name 
-FROM system.tables
-WHERE database = %(db)s and name = %(table)s;
-
@@ -0,0 +1,5 @@
+SELECT 
+	name, 
+	toString(metadata_modification_time)
+FROM system.tables
+WHERE database = %(db)s AND name IN (%(table)s, %(logTable)s);
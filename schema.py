@@ -0,0 +1,58 @@
+import argparse
+from utils.routines_utils import UtilsSet
+from utils.logger import Logger
+from utils.database_utils import ClickHouseConnector
+from utils.schema_registry import FieldTypeRegistry
+
+
+#Creating utilitites set instance for script run
+utilities = UtilsSet()
+
+#Reading credentials and parameters from configs.
+ch_credentials = utilities.read_json_file("configs/ch_credentials.json")
+api_settings = utilities.read_json_file("configs/api_credentials.json")
+global_settings = utilities.read_json_file("configs/global_config.json")
+
+parser = argparse.ArgumentParser(description="Generates DDL of data table for fields of configs/api_credentials.json: CREATE TABLE query or, "
+                                             "if table exists, ALTER TABLE queries to add missing columns.")
+parser.add_argument('--apply', action='store_true', help="perform generated queries in database (otherwise they are only printed)")
+parser.add_argument('--output', help="path of file to save generated queries to")
+arguments = parser.parse_args()
+
+#Let's build registry of field types and list of fields of API request.
+registry = FieldTypeRegistry(api_settings.get('source'), global_settings.get('api_strict_db_table_cols_names'), 
+                             api_settings.get('attribution'), global_settings.get('field_types'), global_settings.get('column_mapping'), 
+                             global_settings.get('replacing_data_table', False))
+api_fields = api_settings.get('fields').split(',')
+db, table = ch_credentials.get('db'), ch_credentials.get('table')
+
+ch = None
+existing_columns = []
+if arguments.apply:
+    logger = Logger(global_settings.get('log_continuous_path'), None)
+    ch = ClickHouseConnector(logger, ch_credentials.get('login'), ch_credentials.get('password'), ch_credentials.get('host'), ch_credentials.get('port'),
+                             db, table, None, ch_credentials.get('ssh'))
+    if ch.ch_client is None:
+        raise ConnectionError("Connection to database wasn't established. Please, check credentials and re-run the script.")
+    metadata = ch.query_data(utilities.read_sql_file("queries/query_metadata.sql"), parameters={'db': db, 'table': table, 'logTable': ''}) or []
+    existing_columns = [column for kind, table_name, modified, column, column_type in metadata if kind == 'column' and table_name == table]
+
+#Let's create table if it doesn't exist, otherwise add missing columns to it.
+if existing_columns:
+    statements = registry.migrate_table_queries(db, table, api_fields, existing_columns)
+else:
+    statements = [registry.create_table_query(db, table, api_fields)]
+print('\n\n'.join(statements) if statements else f"Table {table} already has columns of all the fields.")
+
+if arguments.output and statements:
+    utilities.write_stream_to_file([(';\n\n'.join(statement.rstrip(';') for statement in statements) + ';\n').encode('utf-8')], arguments.output)
+    print(f"Queries were saved to {arguments.output}.")
+
+if ch is not None:
+    try:
+        for statement in statements:
+            if not ch.run_command(statement):
+                raise RuntimeError(f"Query wasn't performed: {statement}")
+        print(f"Table {table} of database {db} is up to date with fields of API request.")
+    finally:
+        ch.close_connections()
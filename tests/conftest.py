@@ -0,0 +1,125 @@
+import copy
+import os
+import runpy
+import sys
+import pytest
+
+#Let's make utils package importable, when tests are run by pytest from any directory.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.routines_utils import UtilsSet
+from utils.api_methods import AbstractRequest
+from utils.schema_registry import FieldTypeRegistry
+from utils import database_utils, wrappers
+from utils.wrappers import MainFlowWrapper
+from benchmarks.tsv_generator import LogsTsvGenerator
+from benchmarks.mock_logs_api import MockLogsApi
+from benchmarks.run_benchmark import RecordingSink
+
+FIELDS = 'ym:s:visitID,ym:s:counterID,ym:s:date,ym:s:dateTime,ym:s:clientID,ym:s:startURL,ym:s:pageViews,ym:s:goalsID'
+DATE = '2025-04-11'
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """Factory of started mock of Logs API (benchmarks/mock_logs_api.py), base URL of requests is switched to it.
+    Arguments of factory: parts, rows in part and keyword arguments of MockLogsApi. Mocks are stopped after test."""
+    mocks = []
+
+    def start(parts=2, rows=20, date1=DATE, date2=DATE, **kwargs):
+        mock = MockLogsApi(LogsTsvGenerator(FIELDS.split(','), 'visits', rows, date1, date2), parts, **kwargs)
+        mock.start()
+        mocks.append(mock)
+        monkeypatch.setattr(AbstractRequest, 'BASE_URL', mock.base_url)
+        return mock
+
+    yield start
+    for mock in mocks:
+        mock.stop()
+
+
+@pytest.fixture
+def flow_configs(tmp_path):
+    """Configs of project (as main.py reads them) with local paths moved to tmp_path, checks of database switched off
+    and fast polling of Logs API. Returns tuple (ch_credentials, api_settings, global_settings, queries, utilities)."""
+    utilities = UtilsSet()
+    ch_credentials = utilities.read_json_file(os.path.join(ROOT, "configs/ch_credentials.json"))
+    api_settings = utilities.read_json_file(os.path.join(ROOT, "configs/api_credentials.json"))
+    global_settings = utilities.read_json_file(os.path.join(ROOT, "configs/global_config.json"))
+    queries = {'metadata_query': utilities.read_sql_file(os.path.join(ROOT, "queries/query_metadata.sql")),
+               'tables_modification_query': utilities.read_sql_file(os.path.join(ROOT, "queries/query_tables_modification.sql")),
+               'log_table_create': utilities.read_sql_file(os.path.join(ROOT, "queries/create_log_table.sql"))%ch_credentials}
+    api_settings.update({'token': 'test', 'counter': str(LogsTsvGenerator.COUNTER_ID), 'fields': FIELDS, 'source': 'visits', 'date1': DATE, 'date2': DATE})
+    global_settings.update({'temporary_data_path': str(tmp_path/'data')+'/', 'log_continuous_path': str(tmp_path/'logs/logs.tsv'),
+                            'log_last_run_path': str(tmp_path/'logs/last_run.tsv'), 'incremental_sync': False, 'auto_date_sharding': False,
+                            'sync_state_path': str(tmp_path/'state/sync_state.json'), 'checkpoint_journal': False,
+                            'checkpoint_path': str(tmp_path/'state/checkpoint.json'), 'status_check_expected_max_sec': 0,
+                            'status_check_initial_sec': 0.05, 'frequency_api_status_check_sec': 1, 'metrics_textfile_path': None,
+                            'metrics_summary_path': None, 'metrics_port': None, 'reuse_prepared_requests': False,
+                            'request_registry_path': str(tmp_path/'state/created_requests.json'), 'schema_cache_path': str(tmp_path/'state/schema_cache.json'),
+                            'run_db_table_test': False, 'run_log_table_test': False, 'staging_load': False, 'profile': False})
+    return ch_credentials, api_settings, global_settings, queries, utilities
+
+
+@pytest.fixture
+def make_flow(flow_configs, monkeypatch):
+    """Factory of flow wrapper on configs of flow_configs with RecordingSink instead of ClickHouse.
+    Keyword arguments of factory override global_settings, wrapper_class chooses MainFlowWrapper or AsyncMainFlowWrapper."""
+    monkeypatch.setattr(MainFlowWrapper, 'DEFAULT_REQUEST_SLEEP', 0.01)
+
+    def make(wrapper_class=MainFlowWrapper, sink=None, **settings):
+        ch_credentials, api_settings, global_settings, queries = copy.deepcopy(flow_configs[:4])
+        global_settings.update(settings)
+        if sink is None:
+            registry = FieldTypeRegistry('visits', global_settings.get('api_strict_db_table_cols_names'), api_settings.get('attribution'),
+                                         global_settings.get('field_types'), global_settings.get('column_mapping'))
+            sink = RecordingSink(ch_credentials.get('db'), ch_credentials.get('table'),
+                                 [(registry.column_name(field), registry.column_type(field)) for field in FIELDS.split(',')])
+        return wrapper_class(ch_credentials, api_settings, global_settings, queries, flow_configs[4], ch=sink)
+
+    return make
+
+
+@pytest.fixture
+def run_script(flow_configs, monkeypatch):
+    """Factory to run script of root directory (main.py or batch.py) as __main__ with configs of flow_configs and RecordingSink instead of ClickHouseConnector.
+    Arguments of factory: name of script, list of command line arguments, batch config (for batch.py) and keyword arguments overriding global_settings. 
+    Returns tuple (list of sinks created by script, exit code)."""
+    ch_credentials, api_settings, global_settings = flow_configs[:3]
+    monkeypatch.setattr(MainFlowWrapper, 'DEFAULT_REQUEST_SLEEP', 0.01)
+    monkeypatch.chdir(ROOT)
+
+    def run(script, arguments=(), batch_settings=None, **settings):
+        global_settings.update(settings)
+        configs = {'configs/ch_credentials.json': ch_credentials, 'configs/api_credentials.json': api_settings, 'configs/global_config.json': global_settings,
+                   'configs/batch_config.json': batch_settings}
+        sinks = []
+        def connector(*args, **kwargs):
+            sink = RecordingSink(ch_credentials.get('db'), ch_credentials.get('table'), [])
+            sink.ch_client = True
+            sinks.append(sink)
+            return sink
+        read_json_file = UtilsSet.read_json_file
+        monkeypatch.setattr(UtilsSet, 'read_json_file', lambda self, path: configs[path] if path in configs else read_json_file(self, path))
+        monkeypatch.setattr(database_utils, 'ClickHouseConnector', connector)
+        monkeypatch.setattr(wrappers, 'ClickHouseConnector', connector)
+        monkeypatch.setattr(sys, 'argv', [script, *arguments])
+        try:
+            runpy.run_path(os.path.join(ROOT, script), run_name='__main__')
+            code = 0
+        except SystemExit as error:
+            code = error.code
+        return sinks, code
+
+    return run
+
+
+def run_flow(flow):
+    """Function to perform the same steps of flow as main.py does."""
+    flow.check_log_evaluation()
+    flow.create_log_request()
+    flow.log_status_check()
+    flow.download_and_write_data()
+    flow.close_and_finish()
+    return flow
@@ -0,0 +1,126 @@
+import os
+import pytest
+import requests
+from conftest import run_flow, FIELDS, DATE
+from benchmarks.tsv_generator import LogsTsvGenerator
+from utils.api_methods import ApiSession, CreateLog, StatusLog, DownloadLogPart
+from utils.compression_utils import Compressor
+from utils.logger import Logger
+from utils.routines_utils import UtilsSet
+
+COUNTER = LogsTsvGenerator.COUNTER_ID
+PARAMS = {'date1': DATE, 'date2': DATE, 'fields': FIELDS, 'source': 'visits', 'attribution': None}
+
+
+def created_request_id():
+    return CreateLog(COUNTER, 'test', Logger(None), PARAMS).send_request().request_id
+
+
+def test_part_is_streamed_to_file(mock_api, tmp_path):
+    mock = mock_api(parts=2, rows=50)
+    download = DownloadLogPart(COUNTER, created_request_id(), 'test', Logger(None), chunk_size=128).send_request(1, str(tmp_path/'data/part_1.tsv'))
+    assert download.is_success
+    assert download.path == download.response_body == str(tmp_path/'data/part_1.tsv')
+    assert (tmp_path/'data/part_1.tsv').read_bytes() == mock._bodies[1]
+    assert download.bytes_written == len(mock._bodies[1])
+    assert os.listdir(tmp_path/'data') == ['part_1.tsv']
+
+
+def test_part_is_read_into_memory_without_path(mock_api):
+    mock = mock_api(parts=1, rows=10)
+    download = DownloadLogPart(COUNTER, created_request_id(), 'test', Logger(None)).send_request(0)
+    assert download.is_success and download.path is None
+    assert download.response_body == mock._bodies[0].decode('utf-8')
+
+
+def test_compressed_response_is_stored_compressed(mock_api, tmp_path):
+    mock = mock_api(parts=1, rows=30)
+    download = DownloadLogPart(COUNTER, created_request_id(), 'test', Logger(None), encoding='gzip',
+                               compressor=Compressor('gzip')).send_request(0, str(tmp_path/'part_0.tsv.gz'))
+    assert download.is_success and not download.encoding_fallback
+    assert b''.join(Compressor('gzip').decompress_chunks([(tmp_path/'part_0.tsv.gz').read_bytes()])) == mock._bodies[0]
+
+
+def test_failed_download_leaves_no_file(mock_api, tmp_path):
+    mock_api()
+    download = DownloadLogPart(COUNTER, 404, 'test', Logger(None)).send_request(0, str(tmp_path/'part_0.tsv'))
+    assert not download.is_success and download.response_code == 404
+    assert download.path is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_interrupted_stream_leaves_no_file(tmp_path):
+    def chunks():
+        yield b'first chunk\n'
+        raise requests.exceptions.ChunkedEncodingError("connection broken")
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        UtilsSet().write_stream_to_file(chunks(), str(tmp_path/'part_0.tsv'))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stream_replaces_existing_file_atomically(tmp_path):
+    (tmp_path/'part_0.tsv').write_bytes(b'old')
+    written = UtilsSet().write_stream_to_file(iter([b'new ', b'', b'content']), str(tmp_path/'part_0.tsv'))
+    assert written == len(b'new content')
+    assert (tmp_path/'part_0.tsv').read_bytes() == b'new content'
+    assert os.listdir(tmp_path) == ['part_0.tsv']
+
+
+def count_connections(mock):
+    """Function to count TCP connections accepted by mock. Returns list, which is extended on each connection."""
+    connections = []
+    process_request = mock._server.process_request
+    def counted_process_request(request, client_address):
+        connections.append(client_address)
+        return process_request(request, client_address)
+    mock._server.process_request = counted_process_request
+    return connections
+
+
+def test_session_keeps_connection_alive(mock_api):
+    mock = mock_api(parts=2)
+    connections = count_connections(mock)
+    session = ApiSession()
+    request_id = CreateLog(COUNTER, 'test', Logger(None), PARAMS, session=session).send_request().request_id
+    for _ in range(3):
+        assert StatusLog(COUNTER, request_id, 'test', Logger(None), session=session).send_request().is_success
+    for part in range(2):
+        assert DownloadLogPart(COUNTER, request_id, 'test', Logger(None), session=session).send_request(part).is_success
+    assert len(connections) == 1
+
+
+def test_requests_without_session_open_new_connections(mock_api):
+    mock = mock_api()
+    connections = count_connections(mock)
+    request_id = created_request_id()
+    StatusLog(COUNTER, request_id, 'test', Logger(None)).send_request()
+    assert len(connections) == 2
+
+
+def test_session_retries_only_idempotent_requests(mock_api):
+    mock = mock_api(error_rate=1.0)
+    session = ApiSession(retries=2, backoff_sec=0)
+    status = StatusLog(COUNTER, 1, 'test', Logger(None), session=session).send_request()
+    assert status.response_code == 503 and mock.stats['injected_503'] == 3
+    created = CreateLog(COUNTER, 'test', Logger(None), PARAMS, session=session).send_request()
+    assert not created.is_success and mock.stats['injected_503'] == 4
+
+
+def test_session_sets_default_timeout(monkeypatch):
+    sent = {}
+    def request(session, method, url, **kwargs):
+        sent.update(kwargs)
+    monkeypatch.setattr(requests.Session, 'request', request)
+    ApiSession(connect_timeout=1, read_timeout=2).request('GET', 'http://127.0.0.1/')
+    assert sent['timeout'] == (1, 2)
+    ApiSession().request('GET', 'http://127.0.0.1/', timeout=5)
+    assert sent['timeout'] == 5
+
+
+def test_flow_shares_session_between_requests(mock_api, make_flow):
+    mock = mock_api(parts=4)
+    connections = count_connections(mock)
+    flow = run_flow(make_flow(download_workers=2))
+    assert flow.ch.rows == 4*20
+    requests_sent = sum(count for key, count in mock.stats.items() if key != 'bytes_served')
+    assert requests_sent >= 7 and len(connections) <= 2
@@ -0,0 +1,73 @@
+import asyncio
+import aiohttp
+from conftest import FIELDS, DATE
+from benchmarks.tsv_generator import LogsTsvGenerator
+from utils.async_api_methods import (AsyncLogList, AsyncLogEvaluation, AsyncCreateLog, AsyncStatusLog, AsyncCleanProcessedLog, 
+                                     AsyncCleanPendingLog, AsyncDownloadLogPart)
+from utils.compression_utils import Compressor
+from utils.logger import Logger
+
+COUNTER = LogsTsvGenerator.COUNTER_ID
+PARAMS = {'date1': DATE, 'date2': DATE, 'fields': FIELDS, 'source': 'visits', 'attribution': None}
+
+
+def run(coroutine_function):
+    """Function to run coroutine function with aiohttp session on new event loop."""
+    async def with_session():
+        async with aiohttp.ClientSession() as session:
+            return await coroutine_function(session)
+    return asyncio.run(with_session())
+
+
+def test_evaluation_and_list(mock_api):
+    mock_api(max_days=3)
+    async def scenario(session):
+        possible = await AsyncLogEvaluation(COUNTER, 'test', Logger(None), PARAMS, session=session).send_request()
+        impossible = await AsyncLogEvaluation(COUNTER, 'test', Logger(None), dict(PARAMS, date2='2025-04-20'), session=session).send_request()
+        log_list = await AsyncLogList(COUNTER, 'test', Logger(None), session=session).send_request()
+        return possible, impossible, log_list
+    possible, impossible, log_list = run(scenario)
+    assert possible.is_success and possible.max_possible_day_quantity == 3
+    assert not impossible.is_success and impossible.max_possible_day_quantity == 3
+    assert log_list.is_success and log_list.response_body == []
+
+
+def test_create_status_download_and_clean(mock_api, tmp_path):
+    mock = mock_api(parts=2, rows=10)
+    async def scenario(session):
+        created = await AsyncCreateLog(COUNTER, 'test', Logger(None), PARAMS, session=session).send_request()
+        status = await AsyncStatusLog(COUNTER, created.request_id, 'test', Logger(None), session=session).send_request()
+        in_memory = await AsyncDownloadLogPart(COUNTER, created.request_id, 'test', Logger(None), session=session).send_request(0)
+        streamed = await AsyncDownloadLogPart(COUNTER, created.request_id, 'test', Logger(None), chunk_size=64, encoding='gzip', 
+                                              compressor=Compressor('gzip'), session=session).send_request(1, str(tmp_path/'part_1.tsv.gz'))
+        cleaned = await AsyncCleanProcessedLog(COUNTER, created.request_id, 'test', Logger(None), session=session).send_request()
+        return created, status, in_memory, streamed, cleaned
+    created, status, in_memory, streamed, cleaned = run(scenario)
+    assert created.is_success and created.request_id in mock.requests
+    assert status.is_success and status.parts == [0, 1]
+    assert in_memory.is_success and in_memory.response_body.count('\n') == 11
+    assert streamed.is_success and streamed.path == str(tmp_path/'part_1.tsv.gz') and streamed.bytes_written == (tmp_path/'part_1.tsv.gz').stat().st_size
+    content = b''.join(Compressor('gzip').decompress_chunks([(tmp_path/'part_1.tsv.gz').read_bytes()]))
+    assert content.count(b'\n') == 11 and content.startswith(FIELDS.replace(',', '\t').encode('utf-8'))
+    assert cleaned.is_success and mock.requests[created.request_id]['status'] == 'cleaned_by_user'
+
+
+def test_pending_request_is_canceled(mock_api):
+    mock = mock_api(preparation_sec=60)
+    async def scenario(session):
+        created = await AsyncCreateLog(COUNTER, 'test', Logger(None), PARAMS, session=session).send_request()
+        status = await AsyncStatusLog(COUNTER, created.request_id, 'test', Logger(None), session=session).send_request()
+        canceled = await AsyncCleanPendingLog(COUNTER, created.request_id, 'test', Logger(None), session=session).send_request()
+        return created, status, canceled
+    created, status, canceled = run(scenario)
+    assert not status.is_success and status.status == 'created'
+    assert canceled.is_success and mock.requests[created.request_id]['status'] == 'canceled'
+
+
+def test_failed_stream_leaves_no_file(mock_api, tmp_path):
+    mock_api()
+    async def scenario(session):
+        return await AsyncDownloadLogPart(COUNTER, 404, 'test', Logger(None), session=session).send_request(0, str(tmp_path/'part_0.tsv'))
+    download = run(scenario)
+    assert not download.is_success and download.response_code == 404
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,38 @@
+import os
+import pytest
+from conftest import FIELDS
+
+
+@pytest.fixture
+def run_batch(run_script):
+    """Factory to run batch.py with jobs of batch config. Returns the only sink (connection shared by jobs) and exit code of the script."""
+    def run(jobs, max_concurrent_jobs=2, **settings):
+        sinks, code = run_script('batch.py', batch_settings={'max_concurrent_jobs': max_concurrent_jobs, 'jobs': jobs}, **settings)
+        assert len(sinks) == 1
+        return sinks[0], code
+    return run
+
+
+def test_jobs_of_several_counters_share_connection(mock_api, run_batch, tmp_path):
+    mock = mock_api(parts=2)
+    sink, code = run_batch([{'counter': '111', 'table': 'visits_first', 'fields': FIELDS}, {'counter': '222', 'table': 'visits_second', 'fields': FIELDS}])
+    assert code == 0
+    assert sink.rows == 2*2*20
+    assert sorted(request['counter_id'] for request in mock.requests.values()) == [111, 222]
+    assert os.path.exists(tmp_path/'logs/last_run-111-visits.tsv') and os.path.exists(tmp_path/'logs/last_run-222-visits.tsv')
+
+
+def test_failed_job_doesnt_stop_other_jobs(mock_api, run_batch):
+    mock = mock_api(parts=1, max_days=1)
+    sink, code = run_batch([{'counter': '111', 'date2': '2025-04-12'}, {'counter': '222'}], clear_api_queue=False)
+    assert code == 1
+    assert sink.rows == 20
+    assert [request['counter_id'] for request in mock.requests.values()] == [222]
+
+
+def test_jobs_run_on_async_engine(mock_api, run_batch):
+    mock = mock_api(parts=2)
+    sink, code = run_batch([{'counter': '111'}, {'counter': '222'}, {'counter': '222', 'table': 'visits_copy'}], async_engine=True)
+    assert code == 0
+    assert sink.rows == 3*2*20
+    assert sorted(request['counter_id'] for request in mock.requests.values()) == [111, 222, 222]
@@ -0,0 +1,62 @@
+import gzip
+import pytest
+from utils import compression_utils
+from utils.compression_utils import Compressor
+
+
+DATA = b''.join(b'%d\t2024-01-01\thttps://example.com/?page=%d\n' % (i, i % 17) for i in range(5000))
+
+
+def available(codec):
+    """Marks codec test skipped, if optional package of codec isn't installed."""
+    module = {'lz4': compression_utils.lz4, 'zstd': compression_utils.zstandard}.get(codec, True)
+    return pytest.param(codec, marks=pytest.mark.skipif(module is None, reason=f"{codec} package isn't installed"))
+
+
+CODECS = [available(codec) for codec in Compressor.CODECS]
+
+
+def split(data, size):
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_round_trip_of_chunks(codec):
+    compressor = Compressor(codec)
+    compressed = list(compressor.compress_chunks(split(DATA, 1000)))
+    assert len(b''.join(compressed)) < len(DATA)
+    #Compressed stream is decompressed chunk by chunk, whatever chunks it's split into.
+    assert b''.join(compressor.decompress_chunks(split(b''.join(compressed), 77))) == DATA
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_round_trip_of_empty_data(codec):
+    compressor = Compressor(codec)
+    assert b''.join(compressor.decompress_chunks(compressor.compress_chunks([b'', b'']))) == b''
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_levels(codec):
+    compressor = Compressor(codec, level=1)
+    assert b''.join(compressor.decompress_chunks(compressor.compress_chunks([DATA]))) == DATA
+
+
+def test_gzip_is_readable_by_gzip_module():
+    assert gzip.decompress(b''.join(Compressor('gzip').compress_chunks(split(DATA, 4096)))) == DATA
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_extension(codec):
+    assert Compressor(codec).extension() == Compressor.EXTENSIONS[codec]
+
+
+def test_unsupported_codec():
+    with pytest.raises(ValueError):
+        Compressor('brotli')
+
+
+def test_missing_optional_package(monkeypatch):
+    monkeypatch.setattr(compression_utils, 'zstandard', None)
+    with pytest.raises(ValueError, match='zstandard'):
+        Compressor('zstd')
+    assert Compressor('gzip').codec == 'gzip'
@@ -0,0 +1,119 @@
+import threading
+import time
+from utils.database_utils import ClickHouseConnector
+from utils.logger import Logger
+
+
+class FakeClient:
+    """Stand-in of clickhouse_connect client, which records statements and fails if it's used by two threads at once."""
+
+    def __init__(self):
+        self.statements = []
+        self.parameters = []
+        self.rows = [(1,)]
+        self.busy = threading.Lock()
+
+    def _use(self, statement):
+        assert self.busy.acquire(blocking=False), "client is used by two threads at once"
+        try:
+            time.sleep(0.05)
+            self.statements.append(statement)
+        finally:
+            self.busy.release()
+
+    def query(self, query, **kwargs):
+        self.parameters.append(kwargs.get('parameters'))
+        self._use(query)
+        return type('QueryResult', (), {'result_rows': self.rows})()
+
+    def command(self, query, **kwargs):
+        self.parameters.append(kwargs.get('parameters'))
+        self._use(query)
+
+    def insert(self, table, data, **kwargs):
+        self._use(f"INSERT INTO {table}")
+
+    def raw_insert(self, table, column_names=None, insert_block=None, settings=None, **kwargs):
+        self.parameters.append(settings)
+        rows = sum(chunk.count(b'\n') for chunk in insert_block)
+        self._use(f"INSERT INTO {table}")
+        return type('QuerySummary', (), {'written_rows': rows})()
+
+    def close(self):
+        pass
+
+
+def connector(monkeypatch, pool_size=1, clients=None):
+    clients = clients if clients is not None else [FakeClient() for _ in range(pool_size)]
+    made = iter(clients)
+    monkeypatch.setattr(ClickHouseConnector, '_establish_ch_connection', lambda self: next(made, None))
+    return ClickHouseConnector(Logger(None), 'default', '', 'localhost', None, 'db', 'visits', pool_size=pool_size), clients
+
+
+def test_queries_and_commands_borrow_client_from_pool(monkeypatch):
+    ch, clients = connector(monkeypatch)
+    results = []
+    def borrow_for_insert():
+        with ch.client() as client:
+            client.insert('visits', [])
+    threads = [threading.Thread(target=borrow_for_insert)] + [threading.Thread(target=lambda: results.append(ch.query_data("SELECT 1"))) for _ in range(2)] \
+        + [threading.Thread(target=lambda: results.append(ch.run_command("OPTIMIZE TABLE t"))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(map(str, results)) == ['True', 'True', '[(1,)]', '[(1,)]']
+    assert len(clients[0].statements) == 5
+    assert ch.clients.qsize() == 1
+
+
+def test_pool_clients_are_used_concurrently(monkeypatch):
+    ch, clients = connector(monkeypatch, pool_size=3)
+    threads = [threading.Thread(target=ch.query_data, args=("SELECT 1",)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(len(client.statements) for client in clients) != [0, 0, 6]
+    assert sum(len(client.statements) for client in clients) == 6
+
+
+def test_no_connection_fails_without_waiting(monkeypatch):
+    ch, _ = connector(monkeypatch, clients=[])
+    assert ch.query_data("SELECT 1") is None
+    assert ch.run_command("OPTIMIZE TABLE t") is False
+    assert ch.insert_data('visits', []) is False
+
+
+def test_statements_of_partition_replacement(monkeypatch):
+    ch, clients = connector(monkeypatch)
+    assert ch.backfill_partition('visits_staging', '202504', 'Date', '2025-04-11', '2025-04-12')
+    assert ch.replace_partition('visits_staging', '202504')
+    clients[0].rows = [('202504', 7)]
+    assert ch.partition_versions(['202504']) == {'202504': 7}
+    statements, parameters = clients[0].statements, clients[0].parameters
+    assert statements[0] == "INSERT INTO `db`.`visits_staging` SELECT * FROM `db`.`visits` WHERE _partition_id = %(partition)s AND NOT (`Date` BETWEEN %(date1)s AND %(date2)s)"
+    assert parameters[0] == {'partition': '202504', 'date1': '2025-04-11', 'date2': '2025-04-12'}
+    assert statements[1] == "ALTER TABLE `db`.`visits` REPLACE PARTITION ID %(partition)s FROM `db`.`visits_staging`"
+    assert parameters[1] == {'partition': '202504'}
+    assert "max(max_block_number) FROM system.parts" in statements[2] and "partition_id IN %(partitions)s" in statements[2]
+    assert parameters[2] == {'db': 'db', 'table': 'visits', 'partitions': ['202504']}
+
+
+def test_stream_inserts_pass_settings_and_count_rows_per_thread(monkeypatch):
+    ch, clients = connector(monkeypatch, pool_size=2)
+    written = {}
+    def insert(rows):
+        assert ch.insert_stream(iter([b'row\n'*rows]), {'max_insert_block_size': 1000}, dedup_token=f"token-{rows}")
+        written[rows] = ch.last_written_rows()
+    threads = [threading.Thread(target=insert, args=(rows,)) for rows in (3, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert written == {3: 3, 5: 5}
+    settings = [parameters for client in clients for parameters in client.parameters]
+    assert sorted(settings, key=lambda settings: settings['insert_deduplication_token']) == [
+        {'max_insert_block_size': 1000, 'insert_deduplicate': 1, 'insert_deduplication_token': 'token-3'}, 
+        {'max_insert_block_size': 1000, 'insert_deduplicate': 1, 'insert_deduplication_token': 'token-5'}]
+    assert ch.last_written_rows() is None
@@ -0,0 +1,74 @@
+import threading
+from datetime import datetime
+from utils.logger import Logger, LogRecord
+
+
+def test_records_are_typed_and_formatted(tmp_path):
+    logger = Logger(str(tmp_path/'logs.tsv'), None, 0)
+    logger.add_to_log(200, '/evaluate', 'Evaluation sucess: True').add_to_log(None, '/download', 'Part 0 failed')
+    records = logger.records
+    assert [(record.response, record.endpoint, record.description) for record in records] == [(200, '/evaluate', 'Evaluation sucess: True'),
+                                                                                              (None, '/download', 'Part 0 failed')]
+    assert all(isinstance(record, LogRecord) and isinstance(record.datetime, datetime) and record.datetime.microsecond == 0 for record in records)
+    assert logger.log.splitlines()[0] == f"{records[0].datetime.strftime(Logger.DATETIME_FORMAT)}\t200\t/evaluate\tEvaluation sucess: True"
+
+
+def test_lines_are_flushed_by_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(Logger, 'FLUSH_LINES', 3)
+    logger = Logger(str(tmp_path/'logs/logs.tsv'), None, 3600)
+    for number in range(2):
+        logger.add_to_log(200, '/status', f"Check {number}").write_to_disk_incremental()
+    assert not (tmp_path/'logs/logs.tsv').exists()
+    logger.add_to_log(200, '/status', "Check 2").write_to_disk_incremental()
+    assert (tmp_path/'logs/logs.tsv').read_text().count('\n') == 3
+    logger.add_to_log(200, '/status', "Check 3").write_to_disk_incremental()
+    assert (tmp_path/'logs/logs.tsv').read_text().count('\n') == 3
+    logger.close()
+    assert (tmp_path/'logs/logs.tsv').read_text().count('\n') == 4
+
+
+def test_zero_interval_flushes_every_write(tmp_path):
+    logger = Logger(str(tmp_path/'logs.tsv'), None, 0)
+    logger.add_to_log(200, '/status', "Check").write_to_disk_incremental()
+    assert (tmp_path/'logs.tsv').read_text().endswith("\t200\t/status\tCheck\n")
+
+
+def test_last_run_log_contains_only_this_run(tmp_path):
+    (tmp_path/'logs.tsv').write_text("previous run\n")
+    logger = Logger(str(tmp_path/'logs.tsv'), str(tmp_path/'last_run.tsv'), 3600)
+    logger.add_to_log(200, '/create', "Created").add_to_log(500, '/download', "Failed")
+    logger.write_to_disk_last_run()
+    assert (tmp_path/'last_run.tsv').read_text() == logger.log
+    assert (tmp_path/'logs.tsv').read_text() == "previous run\n" + logger.log
+
+
+def test_columns_of_log_table():
+    logger = Logger(None)
+    logger.add_to_log(200, '/create', "Created").add_to_log('Error', '/download', "Failed")
+    dates, responses, endpoints, descriptions = logger.columns()
+    assert len(dates) == 2 and all(isinstance(date, datetime) for date in dates)
+    assert responses == [200, Logger.UNKNOWN_RESPONSE]
+    assert endpoints == ['/create', '/download'] and descriptions == ['Created', 'Failed']
+
+
+def test_lines_of_threads_arent_mixed(tmp_path):
+    logger = Logger(str(tmp_path/'logs.tsv'), None, 0)
+    def write(thread):
+        for number in range(200):
+            logger.add_to_log(200, f"/thread/{thread}", f"Line {number}").write_to_disk_incremental()
+    threads = [threading.Thread(target=write, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.close()
+    lines = (tmp_path/'logs.tsv').read_text().splitlines()
+    assert len(lines) == 4*200 and len(logger.records) == 4*200
+    assert all(len(line.split('\t')) == 4 for line in lines)
+
+
+def test_unwritable_log_doesnt_fail(tmp_path):
+    (tmp_path/'blocker').write_text('')
+    logger = Logger(str(tmp_path/'blocker/logs.tsv'), str(tmp_path/'blocker/last_run.tsv'), 0)
+    logger.add_to_log(200, '/create', "Created").write_to_disk_incremental().write_to_disk_last_run().close()
+    assert len(logger.records) == 1
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import os
+import pytest
+import requests
+from conftest import run_flow
+from utils.metrics import MetricsRegistry, stage_metrics
+
+
+def test_scrape_endpoint_is_local_by_default():
+    metrics = MetricsRegistry().serve(0)
+    try:
+        host, port = metrics._server.server_address
+        assert host == '127.0.0.1'
+        assert requests.get(f"http://127.0.0.1:{port}/metrics").status_code == 200
+    finally:
+        metrics.stop()
+
+
+def test_scrape_endpoint_host_is_configurable():
+    metrics = MetricsRegistry().serve(0, '0.0.0.0')
+    try:
+        assert metrics._server.server_address[0] == '0.0.0.0'
+    finally:
+        metrics.stop()
+
+
+def test_render_of_counters_gauges_and_histograms():
+    metrics = MetricsRegistry()
+    metrics.inc('inserts_total', result='success').inc('inserts_total', 2, result='success').inc('inserts_total', result='failure')
+    metrics.set('run_success', 1)
+    metrics.observe('insert_seconds', 0.07).observe('insert_seconds', 3).observe('insert_seconds', 5000)
+    lines = metrics.render().splitlines()
+    assert '# TYPE logs_api_inserts_total counter' in lines
+    assert 'logs_api_inserts_total{result="success"} 3' in lines and 'logs_api_inserts_total{result="failure"} 1' in lines
+    assert 'logs_api_run_success 1' in lines
+    assert 'logs_api_insert_seconds_bucket{le="0.05"} 0' in lines and 'logs_api_insert_seconds_bucket{le="0.1"} 1' in lines
+    assert 'logs_api_insert_seconds_bucket{le="5"} 2' in lines and 'logs_api_insert_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'logs_api_insert_seconds_sum 5003.07' in lines and 'logs_api_insert_seconds_count 3' in lines
+    assert not any(line.startswith('logs_api_stage_seconds') for line in lines)
+
+
+def test_labels_are_escaped_and_added_by_view():
+    metrics = MetricsRegistry()
+    metrics.labeled(counter='123', source='vis"its').inc('status_checks_total', status='processed')
+    assert 'logs_api_status_checks_total{counter="123",source="vis\\"its",status="processed"} 1' in metrics.render().splitlines()
+
+
+def test_summary_and_export(tmp_path):
+    metrics = MetricsRegistry(str(tmp_path/'metrics/logs_api.prom'), str(tmp_path/'metrics/summary.json'))
+    metrics.observe('stage_seconds', 1, stage='load').observe('stage_seconds', 3, stage='load').inc('stage_runs_total', stage='load', result='success')
+    metrics.export()
+    assert (tmp_path/'metrics/logs_api.prom').read_text() == metrics.render()
+    summary = json.loads((tmp_path/'metrics/summary.json').read_text())
+    assert summary['metrics']['stage_seconds'] == [{'labels': {'stage': 'load'}, 'value': {'count': 2, 'sum': 2*2, 'avg': 2, 'max': 3}}]
+    assert summary['metrics']['stage_runs_total'] == [{'labels': {'result': 'success', 'stage': 'load'}, 'value': 1}]
+    assert sorted(os.listdir(tmp_path/'metrics')) == ['logs_api.prom', 'summary.json']
+
+
+def test_unwritable_export_doesnt_fail(tmp_path):
+    (tmp_path/'blocker').write_text('')
+    MetricsRegistry(str(tmp_path/'blocker/logs_api.prom')).inc('inserts_total').export()
+
+
+class Stages:
+    def __init__(self):
+        self.metrics = MetricsRegistry()
+
+    @stage_metrics('load')
+    def load(self, retry=False):
+        if retry:
+            return self.load()
+        return self
+
+    @stage_metrics('download')
+    def fail(self):
+        raise OSError("disk is full")
+
+    @stage_metrics('status_wait')
+    async def wait(self):
+        return self
+
+
+def test_stage_metrics_counts_outermost_calls():
+    stages = Stages()
+    stages.load(retry=True)
+    with pytest.raises(OSError):
+        stages.fail()
+    asyncio.run(stages.wait())
+    runs = {item['labels']['stage']: item['labels']['result'] for item in stages.metrics.summary()['metrics']['stage_runs_total']}
+    assert runs == {'load': 'success', 'download': 'failure', 'status_wait': 'success'}
+    assert [item['value']['count'] for item in stages.metrics.summary()['metrics']['stage_seconds']] == [1, 1, 1]
+
+
+def test_flow_records_stages_and_parts(mock_api, make_flow, tmp_path):
+    mock_api(parts=2)
+    flow = run_flow(make_flow(metrics_textfile_path=str(tmp_path/'logs_api.prom'), metrics_summary_path=str(tmp_path/'summary.json')))
+    lines = (tmp_path/'logs_api.prom').read_text().splitlines()
+    table = f"{flow.ch_credentials['db']}.{flow.ch_credentials['table']}"
+    labels = f'counter="{flow.counterId}",result="success",source="visits",table="{table}"'
+    assert f'logs_api_part_download_attempts_total{{{labels}}} 2' in lines
+    assert f'logs_api_inserts_total{{{labels}}} 2' in lines
+    assert f'logs_api_run_success{{counter="{flow.counterId}",source="visits",table="{table}"}} 1' in lines
+    stages = {item['labels']['stage'] for item in json.loads((tmp_path/'summary.json').read_text())['metrics']['stage_runs_total']}
+    assert {'evaluation', 'create', 'status_wait', 'download', 'load'} <= stages
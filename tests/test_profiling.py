@@ -0,0 +1,89 @@
+import asyncio
+import json
+import os
+import pstats
+import pytest
+from conftest import run_flow
+from utils.profiling import StageProfiler
+
+
+class Stages:
+    def load(self, retry=False):
+        if retry:
+            return self.load()
+        return self.insert()
+
+    def insert(self):
+        return [bytes(1024) for _ in range(1000)]
+
+    def fail(self):
+        raise OSError("disk is full")
+
+    async def wait(self):
+        await asyncio.sleep(0)
+        return self
+
+
+def test_spans_of_nested_and_retried_stages(tmp_path):
+    profiler = StageProfiler(str(tmp_path/'last_run.log'))
+    stages = profiler.wrap(Stages(), ['load', 'insert', 'fail', 'wait', 'absent'])
+    stages.load(retry=True)
+    with pytest.raises(OSError):
+        stages.fail()
+    asyncio.run(stages.wait())
+    spans = [(span['stage'], span['parent'], span['failed']) for span in profiler.spans]
+    assert spans == [('insert', 'load', False), ('load', None, False), ('fail', None, True), ('wait', None, False)]
+    assert profiler.report()['totals']['load']['calls'] == 1
+    assert all(span['seconds'] >= 0 and span['cpu_seconds'] >= 0 for span in profiler.spans)
+
+
+def test_cprofile_dumps_outermost_stages(tmp_path):
+    profiler = StageProfiler(str(tmp_path/'logs/last_run.log'), cprofile=True)
+    stages = profiler.wrap(Stages(), ['load', 'insert'])
+    stages.load()
+    stages.load()
+    dumps = {span['stage']: span.get('cprofile_path') for span in profiler.spans}
+    assert dumps['insert'] is None
+    assert dumps['load'] == str(tmp_path/'logs/last_run_profile-load-2.prof')
+    assert sorted(os.listdir(tmp_path/'logs')) == ['last_run_profile-load-1.prof', 'last_run_profile-load-2.prof']
+    functions = {function for _, _, function in pstats.Stats(dumps['load']).stats}
+    assert 'insert' in functions
+
+
+def test_tracemalloc_reports_top_allocations(tmp_path):
+    profiler = StageProfiler(str(tmp_path/'last_run.log'), tracemalloc_top=3)
+    profiler.wrap(Stages(), ['insert']).insert()
+    span = profiler.spans[0]
+    assert len(span['top_allocations']) == 3
+    assert 'test_profiling.py' in span['top_allocations'][0]
+    assert span['peak_traced_mb'] >= span['traced_mb'] > 0
+
+
+def test_report_is_written_next_to_last_run_log(tmp_path):
+    profiler = StageProfiler(str(tmp_path/'logs/last_run.tsv'))
+    profiler.wrap(Stages(), ['load']).load()
+    profiler.write_report()
+    report = json.loads((tmp_path/'logs/last_run_profile.json').read_text())
+    assert report['totals']['load']['calls'] == 1 and len(report['spans']) == 1
+
+
+def test_flow_stages_are_profiled(mock_api, make_flow, tmp_path):
+    mock_api(parts=2)
+    run_flow(make_flow(profile=True))
+    report = json.loads((tmp_path/'logs/last_run_profile.json').read_text())
+    assert {'check_log_evaluation', 'create_log_request', 'log_status_check', 'log_downloader', 'write_data_to_db'} <= set(report['totals'])
+
+
+@pytest.mark.parametrize('arguments, profiled', [([], False), (['--profile'], True)])
+def test_profile_flag_of_main_script(mock_api, run_script, tmp_path, arguments, profiled):
+    mock_api(parts=1)
+    sinks, code = run_script('main.py', arguments, profile=False)
+    assert code == 0 and sinks[0].rows == 20
+    assert os.path.exists(tmp_path/'logs/last_run_profile.json') == profiled
+
+
+def test_no_profile_flag_overrides_config(mock_api, run_script, tmp_path):
+    mock_api(parts=1)
+    sinks, code = run_script('main.py', ['--no-profile'], profile=True)
+    assert code == 0 and sinks[0].rows == 20
+    assert not os.path.exists(tmp_path/'logs/last_run_profile.json')
@@ -0,0 +1,146 @@
+import asyncio
+import pytest
+from utils import scheduler
+from utils.scheduler import TokenBucket, QuotaAwareScheduler
+
+
+class FakeClock:
+    """Monotonic clock, which moves only when sleep is called."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(scheduler.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_token_bucket_allows_burst_of_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for i in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_token_bucket_refills_with_rate(clock):
+    bucket = TokenBucket(rate=10)
+    for i in range(10):
+        bucket.acquire()
+    clock.now += 0.35
+    for i in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert sum(clock.sleeps) == pytest.approx(0.05)
+
+
+def test_token_bucket_capacity_is_at_least_one(clock):
+    bucket = TokenBucket(rate=0.5)
+    assert bucket.capacity == 1
+    bucket.acquire()
+    bucket.acquire()
+    assert sum(clock.sleeps) == pytest.approx(2)
+
+
+def test_token_bucket_async_waits_for_token():
+    bucket = TokenBucket(rate=50, capacity=1)
+
+    async def take_two():
+        await bucket.acquire_async()
+        started = scheduler.time.monotonic()
+        await bucket.acquire_async()
+        return scheduler.time.monotonic() - started
+
+    assert asyncio.run(take_two()) >= 0.015
+
+
+def test_scheduler_clamps_to_quotas():
+    quota = QuotaAwareScheduler(workers=10, requests_per_sec=100, retries=0)
+    assert quota.workers == QuotaAwareScheduler.MAX_PARALLEL_REQUESTS
+    assert quota.requests_per_sec == QuotaAwareScheduler.MAX_REQUESTS_PER_SEC
+    assert quota.retries == 1
+
+
+def test_scheduler_retries_failed_items(clock):
+    attempts = {}
+
+    def task(item):
+        attempts[item] = attempts.get(item, 0) + 1
+        if item == 'flaky' and attempts[item] < 2:
+            raise OSError('connection reset')
+        return None if item == 'broken' else item.upper()
+
+    quota = QuotaAwareScheduler(workers=2, requests_per_sec=30, retries=3, backoff_sec=0.01)
+    results, failed = quota.run(['ok', 'flaky', 'broken'], task)
+    assert results == {'ok': 'OK', 'flaky': 'FLAKY'}
+    assert failed == ['broken']
+    assert attempts == {'ok': 1, 'flaky': 2, 'broken': 3}
+
+
+def test_scheduler_runs_coroutines():
+    async def task(item):
+        return None if item == 2 else item*10
+
+    quota = QuotaAwareScheduler(workers=3, requests_per_sec=30, retries=2, backoff_sec=0.001)
+    results, failed = asyncio.run(quota.run_async([1, 2, 3], task))
+    assert results == {1: 10, 3: 30}
+    assert failed == [2]
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(scheduler.PollingSchedule, 'JITTER', 0)
+
+
+def test_polling_backoff_grows_up_to_max(clock, no_jitter):
+    schedule = scheduler.PollingSchedule(initial_sec=2, max_sec=10, factor=2)
+    assert [schedule.next_delay() for i in range(5)] == [2, 4, 8, 10, 10]
+    assert schedule.polls == 5
+
+
+def test_polling_starts_at_expected_time(clock, no_jitter):
+    schedule = scheduler.PollingSchedule(initial_sec=2, max_sec=30, factor=2, expected_sec=20)
+    assert [schedule.next_delay() for i in range(3)] == [20, 2, 4]
+    schedule = scheduler.PollingSchedule(initial_sec=2, max_sec=30, factor=2, expected_sec=1)
+    assert schedule.next_delay() == 2
+
+
+def test_polling_stops_at_timeout(clock, no_jitter):
+    schedule = scheduler.PollingSchedule(initial_sec=2, max_sec=30, factor=2, timeout_sec=7)
+    assert schedule.wait() and schedule.wait()
+    #The last interval is cut by time left till timeout.
+    assert schedule.wait()
+    assert clock.sleeps == [2, 4, 1]
+    assert not schedule.wait()
+    assert schedule.elapsed == pytest.approx(7)
+
+
+def test_polling_jitter_is_bounded(clock):
+    schedule = scheduler.PollingSchedule(initial_sec=10, max_sec=10)
+    delays = [schedule.next_delay() for i in range(50)]
+    assert all(10*(1 - schedule.JITTER) <= delay <= 10*(1 + schedule.JITTER) for delay in delays)
+
+
+def test_polling_wait_async(no_jitter):
+    schedule = scheduler.PollingSchedule(initial_sec=0.01, max_sec=0.01, timeout_sec=0.05)
+
+    async def polls():
+        while await schedule.wait_async():
+            pass
+        return schedule.polls
+
+    assert 1 <= asyncio.run(polls()) <= 6
@@ -0,0 +1,55 @@
+import pytest
+from utils.schema_registry import FieldTypeRegistry
+
+
+VISIT_FIELDS = ['ym:s:visitID', 'ym:s:counterID', 'ym:s:date', 'ym:s:clientID', 'ym:s:startURL', 'ym:s:goalsID']
+
+
+def test_create_table_is_merge_tree_by_default():
+    query = FieldTypeRegistry('visits').create_table_query('db', 't', VISIT_FIELDS)
+    assert query == ("CREATE TABLE IF NOT EXISTS `db`.`t`\n(\n"
+                     "\t`visitID` UInt64 CODEC(ZSTD(1)),\n"
+                     "\t`counterID` UInt32 CODEC(T64, ZSTD(1)),\n"
+                     "\t`date` Date CODEC(Delta, ZSTD(1)),\n"
+                     "\t`clientID` UInt64 CODEC(ZSTD(1)),\n"
+                     "\t`startURL` String CODEC(ZSTD(1)),\n"
+                     "\t`goalsID` Array(UInt32) CODEC(ZSTD(1))\n"
+                     ") ENGINE = MergeTree()\n"
+                     "PARTITION BY toYYYYMM(`date`)\n"
+                     "ORDER BY (`counterID`, `date`, `clientID`, `visitID`)\n"
+                     "SETTINGS non_replicated_deduplication_window = 1000;")
+
+
+def test_partial_sorting_key_stays_merge_tree():
+    query = FieldTypeRegistry('visits').create_table_query('db', 't', ['ym:s:date', 'ym:s:startURL'])
+    assert 'ENGINE = MergeTree()\n' in query
+    assert 'ORDER BY (`date`)\n' in query
+    query = FieldTypeRegistry('visits').create_table_query('db', 't', ['ym:s:startURL'])
+    assert 'ENGINE = MergeTree()\n' in query
+    assert 'PARTITION BY' not in query
+    assert 'ORDER BY tuple()\n' in query
+
+
+def test_replacing_engine_needs_unique_id():
+    query = FieldTypeRegistry('hits', strict_names=True, replacing=True).create_table_query('db', 't', ['ym:pv:date', 'ym:pv:watchID'])
+    assert 'ENGINE = ReplacingMergeTree()\n' in query
+    assert 'ORDER BY (`ym:pv:date`, `ym:pv:watchID`)\n' in query
+    with pytest.raises(ValueError, match='visitID'):
+        FieldTypeRegistry('visits', replacing=True).create_table_query('db', 't', ['ym:s:date', 'ym:s:startURL'])
+
+
+def test_column_names_and_types():
+    registry = FieldTypeRegistry('visits', attribution='LAST', overrides={'ym:s:goalsPrice': 'Array(Decimal(18, 2))'}, 
+                                 column_names={'ym:s:visitID': 'visit_id'})
+    assert registry.column_name('ym:s:visitID') == 'visit_id'
+    assert registry.column_name('ym:s:<attribution>TrafficSource') == 'lastTrafficSource'
+    assert registry.column_type('ym:s:<attribution>TrafficSource') == 'LowCardinality(String)'
+    assert registry.column_type('ym:s:goalsPrice') == 'Array(Decimal(18, 2))'
+    assert registry.column_type('ym:s:purchaseRevenue') == 'Array(Float64)'
+    assert registry.column_type('ym:s:unknownField') == 'String'
+
+
+def test_migrate_table_adds_missing_columns_in_order():
+    queries = FieldTypeRegistry('visits').migrate_table_queries('db', 't', ['ym:s:visitID', 'ym:s:date', 'ym:s:bounce'], ['date'])
+    assert queries == ["ALTER TABLE `db`.`t` ADD COLUMN IF NOT EXISTS `visitID` UInt64 CODEC(ZSTD(1)) FIRST",
+                       "ALTER TABLE `db`.`t` ADD COLUMN IF NOT EXISTS `bounce` UInt8 CODEC(T64, ZSTD(1)) AFTER `date`"]
@@ -0,0 +1,170 @@
+import json
+import multiprocessing
+import pytest
+from utils.state_utils import fcntl
+from utils.state_utils import JsonStateFile, SyncStateStore, CheckpointJournal, SchemaCache, RequestRegistry
+
+
+def test_missing_ranges_of_empty_state(tmp_path):
+    store = SyncStateStore(str(tmp_path / 'sync_state.json'))
+    assert store.missing_ranges('1/visits/t', '2024-01-01', '2024-01-05') == [('2024-01-01', '2024-01-05')]
+
+
+def test_missing_ranges_around_loaded_dates(tmp_path):
+    store = SyncStateStore(str(tmp_path / 'sync_state.json'))
+    key = SyncStateStore.sync_key(1, 'visits', 't')
+    store.mark_loaded(key, '2024-01-03', '2024-01-04').mark_loaded(key, '2024-01-07', '2024-01-07')
+    assert store.missing_ranges(key, '2024-01-01', '2024-01-09') == [('2024-01-01', '2024-01-02'), ('2024-01-05', '2024-01-06'), 
+                                                                       ('2024-01-08', '2024-01-09')]
+    assert store.missing_ranges(key, '2024-01-03', '2024-01-04') == []
+
+
+def test_missing_ranges_cross_month_and_year(tmp_path):
+    store = SyncStateStore(str(tmp_path / 'sync_state.json'))
+    key = SyncStateStore.sync_key(1, 'hits', 't')
+    store.mark_loaded(key, '2024-01-01', '2024-01-01')
+    assert store.missing_ranges(key, '2023-12-30', '2024-01-02') == [('2023-12-30', '2023-12-31'), ('2024-01-02', '2024-01-02')]
+    assert store.missing_ranges(key, '2024-02-28', '2024-03-01') == [('2024-02-28', '2024-03-01')]
+
+
+def test_loaded_dates_are_persisted_per_key(tmp_path):
+    path = str(tmp_path / 'state' / 'sync_state.json')
+    SyncStateStore(path).mark_loaded('a', '2024-01-02', '2024-01-03').mark_loaded('a', '2024-01-01', '2024-01-02')
+    SyncStateStore(path).mark_loaded('b', '2024-05-01', '2024-05-01')
+    with open(path) as f: 
+        assert json.load(f) == {'a': ['2024-01-01', '2024-01-02', '2024-01-03'], 'b': ['2024-05-01']}
+    assert SyncStateStore(path).loaded_dates('a') == {'2024-01-01', '2024-01-02', '2024-01-03'}
+    assert SyncStateStore(path).missing_ranges('b', '2024-01-01', '2024-01-01') == [('2024-01-01', '2024-01-01')]
+
+
+def journal_with_entry(tmp_path):
+    journal = CheckpointJournal(str(tmp_path / 'checkpoint.json'))
+    key = CheckpointJournal.checkpoint_key(SyncStateStore.sync_key(1, 'visits', 't'), '2024-01-01', '2024-01-02')
+    return journal.start(key, 77, {'date1': '2024-01-01', 'date2': '2024-01-02'}), key
+
+
+def test_journal_records_downloads_and_inserts(tmp_path):
+    journal, key = journal_with_entry(tmp_path)
+    part = tmp_path / 'part_0.tsv'
+    part.write_bytes(b'a\tb\n1\t2\n')
+    journal.record_download(key, 0, str(part)).record_insert(key, 0).record_insert(key, 0).record_insert(key, 1)
+    entry = journal.entry(key)
+    assert entry['request_id'] == 77
+    assert entry['params'] == {'date1': '2024-01-01', 'date2': '2024-01-02'}
+    assert entry['inserted'] == [0, 1]
+    assert journal.inserted_parts(key) == {0, 1}
+    assert journal.downloaded_file(key, 0) == str(part)
+    assert journal.downloaded_file(key, 1) is None
+
+
+def test_journal_rejects_changed_or_missing_file(tmp_path):
+    journal, key = journal_with_entry(tmp_path)
+    part = tmp_path / 'part_0.tsv'
+    part.write_bytes(b'a\tb\n1\t2\n')
+    journal.record_download(key, 0, str(part))
+    part.write_bytes(b'a\tb\n1\t3\n')
+    assert journal.downloaded_file(key, 0) is None
+    part.unlink()
+    assert journal.downloaded_file(key, 0) is None
+
+
+def test_journal_survives_restart_and_finishes(tmp_path):
+    journal, key = journal_with_entry(tmp_path)
+    journal.record_insert(key, 2)
+    restarted = CheckpointJournal(journal.path)
+    assert restarted.inserted_parts(key) == {2}
+    restarted.finish(key)
+    assert restarted.entry(key) is None
+    assert restarted.inserted_parts(key) == set()
+    #Updates of finished (or unknown) entry are ignored.
+    restarted.record_insert(key, 3)
+    assert restarted.read() == {}
+
+
+def test_unwritable_state_file_is_skipped(tmp_path):
+    #Parent of state file is regular file, so it can't be created even by root.
+    (tmp_path / 'blocker').write_text('')
+    state = JsonStateFile(str(tmp_path / 'blocker' / 'state.json'))
+    assert state.read() == {}
+    assert state.update(lambda data: data.setdefault('key', 1)) == 1
+    assert state.read() == {}
+
+
+def _increment(path, times):
+    state = JsonStateFile(path)
+    for _ in range(times):
+        state.update(lambda data: data.update({'counter': data.get('counter', 0) + 1}))
+
+
+@pytest.mark.skipif(fcntl is None, reason="state files are locked between processes only on POSIX")
+def test_updates_are_locked_between_processes(tmp_path):
+    path = str(tmp_path / 'state.json')
+    processes = [multiprocessing.Process(target=_increment, args=(path, 25)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert JsonStateFile(path).read() == {'counter': 100}
+
+
+def test_schema_cache_is_off_after_failed_write(tmp_path, monkeypatch):
+    cache = SchemaCache(str(tmp_path / 'schema_cache.json'), 3600)
+    key = SchemaCache.table_key('db', 't')
+    cache.store(key, '2024-01-01 00:00:00', [('a', 'UInt64')])
+    assert cache.fresh_entry(key)['columns'] == [['a', 'UInt64']]
+    def fail(chunks, path):
+        raise PermissionError(path)
+    monkeypatch.setattr(cache.utils, 'write_stream_to_file', fail)
+    #Entry of changed table stays in the file, it mustn't be used.
+    cache.invalidate(key)
+    assert cache.write_failed
+    assert cache.fresh_entry(key) is None
+
+
+def test_registry_leases_request_to_one_live_run(tmp_path):
+    registry = RequestRegistry(str(tmp_path / 'created_requests.json'))
+    first, second = RequestRegistry.run_id(), RequestRegistry.run_id()
+    registry.add(1, 10, {'date1': '2024-01-01'}, first)
+    assert registry.leased(1, second) == {10} and registry.leased(1, first) == set()
+    assert not registry.acquire(1, 10, second)
+    assert registry.release(1, 10, first)
+    assert registry.acquire(1, 10, second)
+    assert registry.owned(1) == {10}
+
+
+def test_registry_keeps_request_until_last_run_releases_it(tmp_path):
+    registry = RequestRegistry(str(tmp_path / 'created_requests.json'))
+    first, second = RequestRegistry.run_id(), RequestRegistry.run_id()
+    assert registry.acquire(1, 20, first)
+    registry.release_run(first)
+    assert registry.acquire(1, 20, second)
+    registry.update(lambda state: state['1']['20']['leases'].update({first: RequestRegistry._lease()}))
+    assert not registry.release(1, 20, second)
+    assert registry.release(1, 20, first)
+    assert registry.owned(1) == set()
+
+
+def test_registry_drops_leases_of_dead_runs(tmp_path, monkeypatch):
+    registry = RequestRegistry(str(tmp_path / 'created_requests.json'))
+    process = multiprocessing.Process(target=int)
+    process.start()
+    process.join()
+    registry.add(1, 30, {}, 'dead')
+    registry.update(lambda state: state['1']['30']['leases']['dead'].update({'pid': process.pid}))
+    registry.add(1, 31, {}, 'remote')
+    registry.update(lambda state: state['1']['31']['leases']['remote'].update({'host': 'other-host', 'acquired_at': 0}))
+    registry.add(1, 32, {}, 'remote_live')
+    registry.update(lambda state: state['1']['32']['leases']['remote_live'].update({'host': 'other-host'}))
+    assert registry.leased(1) == {32}
+    assert registry.acquire(1, 30, 'new') and registry.acquire(1, 31, 'new') and not registry.acquire(1, 32, 'new')
+
+
+def test_registry_prunes_requests_absent_in_queue(tmp_path):
+    registry = RequestRegistry(str(tmp_path / 'created_requests.json'))
+    for request_id in (1, 2, 3):
+        registry.add(7, request_id, {}, 'run')
+    registry.acquire(8, 4, 'run')
+    registry.prune(7, [2])
+    registry.remove(7, 2)
+    assert registry.owned(7) == set()
+    assert set(registry.read()) == {'7', '8'} and registry.read()['8']['4']['created'] is False
@@ -0,0 +1,83 @@
+from datetime import date, datetime
+from decimal import Decimal
+from utils.tsv_parser import TsvColumnParser
+
+
+COLUMNS = [('ym:s:visitID', 'UInt64'), ('ym:s:date', 'Date'), ('ym:s:startURL', 'String'), ('ym:s:goalsID', 'Array(UInt32)')]
+
+
+def chunks_of(text, size=7):
+    """Splits text into small bytes chunks, so lines are broken between chunks."""
+    data = text.encode('utf-8')
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+
+def test_unescape_tsv_sequences():
+    assert TsvColumnParser.unescape('plain') == 'plain'
+    assert TsvColumnParser.unescape('a\\tb\\nc') == 'a\tb\nc'
+    assert TsvColumnParser.unescape('back\\\\slash') == 'back\\slash'
+    assert TsvColumnParser.unescape("quote\\'s") == "quote's"
+    assert TsvColumnParser.unescape('\\\\t') == '\\t'
+
+
+def test_scalar_converters():
+    assert TsvColumnParser.converter('UInt64')('42') == 42
+    assert TsvColumnParser.converter('Float64')('1.5') == 1.5
+    assert TsvColumnParser.converter('Decimal(18, 2)')('1.10') == Decimal('1.10')
+    assert TsvColumnParser.converter('Date')('2024-01-31') == date(2024, 1, 31)
+    assert TsvColumnParser.converter('DateTime')('2024-01-31 10:20:30') == datetime(2024, 1, 31, 10, 20, 30)
+    assert TsvColumnParser.converter('Bool')('1') is True
+    assert TsvColumnParser.converter('LowCardinality(String)')('a\\tb') == 'a\tb'
+    assert TsvColumnParser.converter('Nullable(Int32)')('\\N') is None
+    assert TsvColumnParser.converter('Nullable(Int32)')('-3') == -3
+
+
+def test_array_literals():
+    assert TsvColumnParser.converter('Array(UInt32)')('[]') == []
+    assert TsvColumnParser.converter('Array(UInt32)')('[1,2,3]') == [1, 2, 3]
+    assert TsvColumnParser.converter('Array(Date)')("['2024-01-01','2024-01-02']") == [date(2024, 1, 1), date(2024, 1, 2)]
+    assert TsvColumnParser.converter('Array(Array(Int8))')('[[1],[2,3]]') == [[1], [2, 3]]
+
+
+def test_array_of_strings_is_unescaped_once():
+    #Quote, backslash and tab inside of array element are escaped by the literal and then by TSV.
+    field = "['a\\\\\\'b','c\\\\\\\\d','e\\\\tf']"
+    assert TsvColumnParser.converter('Array(String)')(field) == ["a'b", 'c\\d', 'e\tf']
+
+
+def test_bind_header_by_positions():
+    parser = TsvColumnParser(COLUMNS[:2]).bind_header(['a', 'b', 'c'])
+    assert parser.column_names == ['ym:s:visitID', 'ym:s:date']
+    assert parser.column_types == ['UInt64', 'Date']
+    assert parser._indices == [0, 1]
+
+
+def test_bind_header_by_names_and_mapping():
+    parser = TsvColumnParser(COLUMNS, strict_names=True).bind_header(['ym:s:startURL', 'ym:s:unknown', 'ym:s:visitID'])
+    assert parser.column_names == ['ym:s:startURL', 'ym:s:visitID']
+    assert parser._indices == [0, 2]
+    parser = TsvColumnParser(COLUMNS, column_mapping={'url': 'ym:s:startURL'}).bind_header(['url', 'ym:s:visitID', 'other'])
+    assert parser.column_names == ['ym:s:startURL', 'ym:s:visitID']
+    assert parser._indices == [0, 1]
+
+
+def test_batches_parse_rows_and_report_bad_ones():
+    text = 'ym:s:visitID\tym:s:date\tym:s:startURL\tym:s:goalsID\n' \
+           '1\t2024-01-01\thttps://a.b/?q=1\\t2\t[1,2]\n' \
+           'oops\t2024-01-01\tx\t[]\n' \
+           '2\t2024-01-02\ty\n' \
+           '3\t2024-01-03\tz\t[]\n'
+    parser = TsvColumnParser(COLUMNS, strict_names=True, batch_rows=1)
+    batches = list(parser.batches(chunks_of(text)))
+    assert batches == [[[1], [date(2024, 1, 1)], ['https://a.b/?q=1\t2'], [[1, 2]]], [[3], [date(2024, 1, 3)], ['z'], [[]]]]
+    assert parser.rows == 2
+    assert [line for line, reason in parser.bad_rows] == [3, 4]
+
+
+def test_project_drops_unbound_fields():
+    text = 'ym:s:startURL\tym:s:unknown\tym:s:visitID\nx\t-\t1\ny\t-\t2\nbroken\n'
+    parser = TsvColumnParser(COLUMNS, strict_names=True)
+    projected = b''.join(parser.project(chunks_of(text)))
+    assert projected == b'ym:s:startURL\tym:s:visitID\nx\t1\ny\t2\n'
+    assert parser.rows == 2
+    assert parser.bad_rows == [(4, 'Expected 3 fields, got 1.')]
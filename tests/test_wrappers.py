@@ -0,0 +1,577 @@
+import asyncio
+import itertools
+import os
+import pytest
+import requests
+import threading
+import time
+from conftest import run_flow, FIELDS, DATE
+from benchmarks.tsv_generator import LogsTsvGenerator
+from benchmarks.run_benchmark import RecordingSink
+from utils import wrappers, flow_sharding
+from utils.wrappers import MainFlowWrapper, AsyncMainFlowWrapper
+from utils.state_utils import RequestRegistry
+from utils.scheduler import QuotaAwareScheduler
+from utils.routines_utils import FlowException
+
+
+def test_registry_not_built_without_reuse_or_own_scope(mock_api, make_flow, tmp_path):
+    mock_api()
+    flow = run_flow(make_flow(clear_api_queue_scope='all', reuse_prepared_requests=False))
+    assert flow.request_registry is None
+    assert flow.ch.rows == 2*20
+    assert not os.path.exists(tmp_path/'state/created_requests.json')
+
+
+def test_registry_of_own_scope_is_released(mock_api, make_flow, tmp_path):
+    mock_api()
+    flow = run_flow(make_flow(clear_api_queue_scope='own'))
+    assert isinstance(flow.request_registry, RequestRegistry)
+    assert flow.ch.rows == 2*20
+    assert flow.request_registry.read().get('requests', {}) == {}
+
+
+def test_unwritable_state_file_doesnt_stop_load(mock_api, make_flow, tmp_path):
+    mock_api()
+    #Parent of state file is regular file, so directory can't be created even by root.
+    (tmp_path/'blocker').write_text('')
+    flow = run_flow(make_flow(clear_api_queue_scope='own', request_registry_path=str(tmp_path/'blocker/created_requests.json')))
+    assert flow.ch.rows == 2*20
+
+
+
+def test_default_scope_keeps_foreign_requests(mock_api, make_flow):
+    mock = mock_api()
+    #Request of another tool sharing the counter.
+    requests.post(mock.base_url % LogsTsvGenerator.COUNTER_ID + 'logrequests', params={'date1': DATE, 'date2': DATE, 'fields': FIELDS, 'source': 'visits'})
+    flow = run_flow(make_flow(clear_api_queue=True, clear_created_logs_request=True))
+    assert flow.queue_scope == 'own'
+    assert flow.ch.rows == 2*20
+    assert flow.clear_api_queue() is None
+    statuses = {request_id: request['status'] for request_id, request in mock.requests.items()}
+    assert statuses[min(statuses)] == 'processed'
+    assert statuses[max(statuses)] == 'cleaned_by_user'
+
+
+def test_unwritable_schema_cache_doesnt_stop_load(mock_api, make_flow, tmp_path):
+    mock_api()
+    (tmp_path/'blocker').write_text('')
+    flow = run_flow(make_flow(run_db_table_test=True, schema_cache_ttl_sec=3600, schema_cache_path=str(tmp_path/'blocker/schema_cache.json')))
+    assert flow.schema_cache.write_failed
+    assert flow.ch.rows == 2*20
+
+
+class TokenSink(RecordingSink):
+    """Recording sink, which also remembers insert_deduplication_token of each insert of data file."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.tokens = []
+
+    def insert_datafile(self, file, settings=None, compression=None, table=None, dedup_token=None):
+        self.tokens.append(dedup_token)
+        return super().insert_datafile(file, settings, compression, table, dedup_token)
+
+
+def test_dedup_tokens_dont_depend_on_request(mock_api, make_flow):
+    mock_api()
+    first = make_flow(insert_deduplication=True)
+    sink = TokenSink(first.ch.db, first.ch.table, first.ch.table_columns)
+    first = run_flow(make_flow(sink=sink, insert_deduplication=True))
+    second = run_flow(make_flow(sink=sink, insert_deduplication=True))
+    assert first.request_id != second.request_id
+    assert len(sink.tokens) == 4 and None not in sink.tokens
+    assert sorted(sink.tokens[:2]) == sorted(sink.tokens[2:])
+    assert len(set(sink.tokens)) == 2
+
+
+def test_async_engine_plans_shards_without_blocking_evaluation(mock_api, make_flow, monkeypatch):
+    mock = mock_api(max_days=1)
+    def blocking_evaluation(*args, **kwargs):
+        raise AssertionError("blocking LogEvaluation is used by async engine")
+    monkeypatch.setattr(wrappers, 'LogEvaluation', blocking_evaluation)
+    monkeypatch.setattr(flow_sharding, 'LogEvaluation', blocking_evaluation)
+    flow = make_flow(AsyncMainFlowWrapper, async_engine=True, auto_date_sharding=True)
+    flow.params['date2'] = '2025-04-13'
+    asyncio.run(flow.run_async())
+    assert mock.stats.get('evaluate_200', 0) >= 4
+    assert sorted((request['date1'], request['date2']) for request in mock.requests.values()) == [('2025-04-11', '2025-04-11'), ('2025-04-12', '2025-04-12'), 
+                                                                                                 ('2025-04-13', '2025-04-13')]
+    assert flow.ch.rows == 3*2*20
+
+
+def test_processed_requests_are_downloaded_concurrently(mock_api, make_flow, monkeypatch):
+    mock_api(parts=1, max_days=1)
+    active, overlaps, lock = set(), [], threading.Lock()
+    download_part = MainFlowWrapper._download_part
+    def slow_download_part(flow, part):
+        with lock:
+            active.add(flow.request_id)
+            overlaps.append(len(active))
+        time.sleep(0.3)
+        try:
+            return download_part(flow, part)
+        finally:
+            with lock:
+                active.discard(flow.request_id)
+    monkeypatch.setattr(MainFlowWrapper, '_download_part', slow_download_part)
+    flow = make_flow(auto_date_sharding=True, max_requests_in_flight=3)
+    flow.params['date2'] = '2025-04-13'
+    flow.run_date_shards()
+    flow.close_and_finish()
+    assert max(overlaps) == 3
+    assert flow.ch.rows == 3*20
+    assert flow.ch.inserts == 3
+
+
+def test_failed_concurrent_download_cleans_other_requests(mock_api, make_flow, monkeypatch):
+    mock = mock_api(parts=1, max_days=1)
+    download_part = MainFlowWrapper._download_part
+    def failing_download_part(flow, part):
+        if flow.params.get('date1') == '2025-04-12':
+            return None
+        time.sleep(0.2)
+        return download_part(flow, part)
+    monkeypatch.setattr(MainFlowWrapper, '_download_part', failing_download_part)
+    flow = make_flow(auto_date_sharding=True, max_requests_in_flight=3, data_loss_tolerance_perc=0)
+    flow.params['date2'] = '2025-04-13'
+    with pytest.raises(FlowException):
+        flow.run_date_shards()
+    assert {request['status'] for request in mock.requests.values()} == {'cleaned_by_user'}
+
+
+class StagingSink(RecordingSink):
+    """Recording sink with partitions: staged rows are counted (lost_rows of them are lost), partition commands are recorded, 
+    versions of partitions of target table are taken from the list (the last one is repeated). Created and dropped tables 
+    and tables of inserts are recorded too."""
+
+    def __init__(self, *args, versions=None, lost_rows=0):
+        super().__init__(*args)
+        self.commands = []
+        self.versions = list(versions or [{'202504': 1}])
+        self.lost_rows = lost_rows
+        self.tables = []
+        self.insert_tables = set()
+
+    def query_data(self, query, **kwargs):
+        if query.startswith('SELECT count()'):
+            return [(self.rows - self.lost_rows,)]
+        return super().query_data(query, **kwargs)
+
+    def insert_datafile(self, file, settings=None, compression=None, table=None, dedup_token=None):
+        self.insert_tables.add(table)
+        return super().insert_datafile(file, settings, compression, table, dedup_token)
+
+    def create_staging_table(self, staging_table, table=None):
+        self.tables.append(('create', staging_table))
+        return True
+
+    def drop_table(self, table):
+        self.tables.append(('drop', table))
+        return True
+
+    def table_partitions(self, table):
+        return ['202504']
+
+    def partition_versions(self, partitions, table=None):
+        return self.versions.pop(0) if len(self.versions) > 1 else self.versions[0]
+
+    def backfill_partition(self, staging_table, partition_id, date_column, date1, date2, table=None):
+        self.commands.append(('backfill', partition_id))
+        return True
+
+    def replace_partition(self, staging_table, partition_id, table=None):
+        self.commands.append(('replace', partition_id))
+        return True
+
+
+def staging_flow(make_flow, versions=None, lost_rows=0, **settings):
+    flow = make_flow(staging_load=True, staging_date_column='Date')
+    sink = StagingSink(flow.ch.db, flow.ch.table, flow.ch.table_columns, versions=versions, lost_rows=lost_rows)
+    return make_flow(sink=sink, **dict({'staging_load': True, 'staging_date_column': 'Date'}, **settings))
+
+
+def test_staging_replaces_partition(mock_api, make_flow):
+    mock_api()
+    flow = run_flow(staging_flow(make_flow))
+    assert flow.ch.commands == [('backfill', '202504'), ('replace', '202504')]
+    assert MainFlowWrapper.STAGING_PARTITIONS == {}
+
+
+def test_staging_refuses_partition_written_by_another_writer(mock_api, make_flow):
+    mock_api()
+    flow = staging_flow(make_flow, versions=[{'202504': 1}, {'202504': 2}])
+    with pytest.raises(FlowException, match='written by another writer'):
+        run_flow(flow)
+    assert ('replace', '202504') not in flow.ch.commands
+    assert MainFlowWrapper.STAGING_PARTITIONS == {}
+
+
+def test_staging_refuses_partition_replaced_by_another_job(mock_api, make_flow, monkeypatch):
+    mock_api()
+    flow = staging_flow(make_flow)
+    monkeypatch.setitem(MainFlowWrapper.STAGING_PARTITIONS, (flow.ch.full_table_name(), '202504'), 'visits_staging_1_hits')
+    with pytest.raises(FlowException, match='being replaced by another job'):
+        run_flow(flow)
+    assert flow.ch.commands == []
+
+
+def test_staging_table_takes_inserts_and_is_dropped(mock_api, make_flow):
+    mock_api()
+    flow = run_flow(staging_flow(make_flow))
+    assert flow.ch.insert_tables == {flow.staging_table}
+    assert flow.ch.tables == [('create', flow.staging_table), ('drop', flow.staging_table)]
+    assert flow.load_table == flow.ch_credentials['table']
+
+
+def test_staging_table_failed_validation_keeps_target_table(mock_api, make_flow):
+    mock_api()
+    flow = staging_flow(make_flow, lost_rows=5, absolute_db_format_errors_tolerance=4, bad_data_tolerance_perc=0)
+    with pytest.raises(FlowException, match="didn't pass validation"):
+        run_flow(flow)
+    assert flow.ch.commands == []
+    assert flow.ch.tables[-1] == ('drop', flow.staging_table)
+
+
+def test_staging_table_validation_tolerates_bad_rows(mock_api, make_flow):
+    mock_api()
+    flow = run_flow(staging_flow(make_flow, lost_rows=4, absolute_db_format_errors_tolerance=4, bad_data_tolerance_perc=0))
+    assert flow.ch.commands == [('backfill', '202504'), ('replace', '202504')]
+
+
+def test_staging_load_needs_date_column(mock_api, make_flow):
+    mock = mock_api()
+    flow = staging_flow(make_flow, staging_date_column=None, api_strict_db_table_cols_names=False, column_projection=False)
+    with pytest.raises(FlowException, match='staging_date_column'):
+        run_flow(flow)
+    assert flow.ch.tables == [] and flow.ch.rows == 0
+    assert 'download_200' not in mock.stats
+
+
+def test_parts_are_downloaded_concurrently_within_quota(mock_api, make_flow, monkeypatch):
+    mock_api(parts=5)
+    active, overlaps, lock = set(), [], threading.Lock()
+    download_part = MainFlowWrapper._download_part
+    def slow_download_part(flow, part):
+        with lock:
+            active.add(part)
+            overlaps.append(len(active))
+        time.sleep(0.2)
+        try:
+            return download_part(flow, part)
+        finally:
+            with lock:
+                active.discard(part)
+    monkeypatch.setattr(MainFlowWrapper, '_download_part', slow_download_part)
+    flow = run_flow(make_flow(download_workers=10))
+    assert max(overlaps) == QuotaAwareScheduler.MAX_PARALLEL_REQUESTS
+    assert flow.ch.rows == 5*20
+
+
+def test_failed_parts_are_retried_by_scheduler(mock_api, make_flow, monkeypatch):
+    mock = mock_api(parts=3)
+    attempts, lock = {}, threading.Lock()
+    download_part = MainFlowWrapper._download_part
+    def flaky_download_part(flow, part):
+        with lock:
+            attempts[part] = attempts.get(part, 0) + 1
+            first = attempts[part] == 1
+        if first:
+            raise OSError("connection reset")
+        return download_part(flow, part)
+    monkeypatch.setattr(MainFlowWrapper, '_download_part', flaky_download_part)
+    flow = run_flow(make_flow(download_workers=3, data_loss_tolerance_perc=0))
+    assert attempts == {0: 2, 1: 2, 2: 2}
+    assert mock.stats['download_200'] == 3
+    assert flow.ch.rows == 3*20
+
+
+class SlowSink(RecordingSink):
+    """Recording sink with slow inserts of data files, which remembers when each insert started. Inserts fail if fail is set."""
+
+    def __init__(self, *args, insert_sec=0.2, fail=False):
+        super().__init__(*args)
+        self.insert_sec = insert_sec
+        self.fail = fail
+        self.insert_starts = []
+
+    def insert_datafile(self, file, settings=None, compression=None, table=None, dedup_token=None):
+        self.insert_starts.append(time.monotonic())
+        time.sleep(self.insert_sec)
+        if self.fail:
+            return False
+        return super().insert_datafile(file, settings, compression, table, dedup_token)
+
+
+def pipeline_flow(make_flow, monkeypatch, **sink_kwargs):
+    """Function to create pipeline flow with SlowSink. Returns flow and dict of download end times (by part) and max amount of parts on disk."""
+    flow = make_flow(load_mode='pipeline')
+    sink = SlowSink(flow.ch.db, flow.ch.table, flow.ch.table_columns, **sink_kwargs)
+    flow = make_flow(sink=sink, load_mode='pipeline', pipeline_max_parts_on_disk=1, ch_pool_size=1, delete_temp_data=True)
+    downloaded, on_disk, lock = {}, [0], threading.Lock()
+    download_part = MainFlowWrapper._download_part
+    def watched_download_part(flow, part):
+        full_file = download_part(flow, part)
+        with lock:
+            downloaded[part] = time.monotonic()
+            on_disk[0] = max(on_disk[0], len([name for name in os.listdir(flow.global_settings['temporary_data_path']) if name.endswith('.tsv')]))
+        return full_file
+    monkeypatch.setattr(MainFlowWrapper, '_download_part', watched_download_part)
+    return flow, downloaded, on_disk
+
+
+def test_pipeline_loads_parts_while_others_are_downloaded(mock_api, make_flow, monkeypatch):
+    mock_api(parts=4)
+    flow, downloaded, on_disk = pipeline_flow(make_flow, monkeypatch)
+    run_flow(flow)
+    assert flow.ch.rows == 4*20 and flow.ch.inserts == 4
+    assert min(flow.ch.insert_starts) < max(downloaded.values())
+    #Backpressure: not more than pipeline_max_parts_on_disk parts are downloaded, but not loaded yet.
+    assert on_disk[0] == 1
+    assert os.listdir(flow.global_settings['temporary_data_path']) == []
+
+
+def test_pipeline_failed_load_stops_flow(mock_api, make_flow, monkeypatch):
+    mock_api(parts=2)
+    flow, downloaded, on_disk = pipeline_flow(make_flow, monkeypatch, insert_sec=0, fail=True)
+    with pytest.raises(FlowException):
+        run_flow(flow)
+    assert flow.ch.rows == 0
+    assert len(flow.ch.insert_starts) == 2*MainFlowWrapper.DEFAULT_API_QUERY_RETRIES
+
+
+class BrokenStreamSink(RecordingSink):
+    """Recording sink, first streamed insert of each part of which fails after the first chunk was sent."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.stream_attempts = 0
+        self._failed = set()
+
+    def insert_stream(self, chunks, settings=None, compression=None, table=None, dedup_token=None, column_names=None):
+        with self._lock:
+            self.stream_attempts += 1
+        first = next(iter(chunks))
+        if first not in self._failed:
+            self._failed.add(first)
+            return False
+        return self._consume(itertools.chain([first], chunks), compression, time.monotonic())
+
+
+def direct_flow(make_flow, sink_class=RecordingSink, **settings):
+    flow = make_flow(load_mode='direct')
+    sink = sink_class(flow.ch.db, flow.ch.table, flow.ch.table_columns)
+    return make_flow(sink=sink, load_mode='direct', **settings)
+
+
+def test_direct_load_doesnt_touch_disk(mock_api, make_flow):
+    mock = mock_api(parts=3)
+    flow = run_flow(direct_flow(make_flow))
+    assert flow.ch.rows == 3*20 and flow.ch.inserts == 3
+    assert mock.stats['download_200'] == 3
+    assert not os.path.exists(flow.global_settings['temporary_data_path']) or os.listdir(flow.global_settings['temporary_data_path']) == []
+
+
+def test_direct_load_doesnt_retry_partially_inserted_part(mock_api, make_flow):
+    mock_api(parts=2)
+    flow = direct_flow(make_flow, BrokenStreamSink, data_loss_tolerance_perc=0)
+    with pytest.raises(FlowException):
+        run_flow(flow)
+    assert flow.partial_parts == {0, 1}
+    assert flow.ch.stream_attempts == 2 and flow.ch.rows == 0
+
+
+def test_direct_load_retries_deduplicated_part(mock_api, make_flow):
+    mock_api(parts=2)
+    flow = run_flow(direct_flow(make_flow, BrokenStreamSink, insert_deduplication=True, data_loss_tolerance_perc=0))
+    assert flow.partial_parts == set()
+    assert flow.ch.stream_attempts == 4 and flow.ch.rows == 2*20
+
+
+def test_date_range_is_split_by_evaluation(mock_api, make_flow):
+    mock_api(max_days=3)
+    flow = make_flow(auto_date_sharding=True)
+    flow.params.update({'date1': '2025-04-11', 'date2': '2025-04-18'})
+    assert flow.plan_date_shards() == [('2025-04-11', '2025-04-13'), ('2025-04-14', '2025-04-16'), ('2025-04-17', '2025-04-18')]
+    flow.params.update({'date1': '2025-04-11', 'date2': '2025-04-13'})
+    assert flow.plan_date_shards() == [('2025-04-11', '2025-04-13')]
+
+
+def test_shards_are_loaded_one_by_one(mock_api, make_flow):
+    mock = mock_api(parts=1, max_days=2)
+    flow = make_flow(auto_date_sharding=True, max_requests_in_flight=1)
+    flow.params['date2'] = '2025-04-15'
+    flow.run_date_shards()
+    flow.close_and_finish()
+    assert [(request['date1'], request['date2']) for request in mock.requests.values()] == [('2025-04-11', '2025-04-12'), ('2025-04-13', '2025-04-14'), 
+                                                                                          ('2025-04-15', '2025-04-15')]
+    assert flow.ch.rows == 3*20
+
+
+class ConcurrentSink(RecordingSink):
+    """Recording sink with slow inserts of data files, which remembers the largest amount of concurrent inserts and settings of inserts."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.active = 0
+        self.max_active = 0
+        self.settings = []
+
+    def insert_datafile(self, file, settings=None, compression=None, table=None, dedup_token=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.settings.append(settings)
+        time.sleep(0.2)
+        with self._lock:
+            self.active -= 1
+        return super().insert_datafile(file, settings, compression, table, dedup_token)
+
+
+def test_files_are_inserted_by_pool_of_clients(mock_api, make_flow):
+    mock_api(parts=5)
+    flow = make_flow()
+    sink = ConcurrentSink(flow.ch.db, flow.ch.table, flow.ch.table_columns)
+    flow = run_flow(make_flow(sink=sink, ch_pool_size=3, ch_insert_settings={'max_insert_block_size': 1000}))
+    assert sink.max_active == 3
+    assert sink.rows == 5*20 and sink.inserts == 5
+    assert all(settings['max_insert_block_size'] == 1000 for settings in sink.settings)
+
+
+class ProjectionSink(RecordingSink):
+    """Recording sink, which keeps column names and data of streamed inserts."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.column_names = []
+        self.data = []
+
+    def insert_stream(self, chunks, settings=None, compression=None, table=None, dedup_token=None, column_names=None):
+        data = b''.join(chunks)
+        self.column_names.append(column_names)
+        self.data.append(data)
+        return super().insert_stream(iter([data]), settings, compression, table, dedup_token, column_names)
+
+
+@pytest.mark.parametrize('load_mode', ['sequential', 'direct'])
+def test_projection_loads_only_columns_of_table(mock_api, make_flow, load_mode):
+    mock = mock_api(parts=1)
+    sink = ProjectionSink('db', 'visits', [('visit_id', 'UInt64'), ('date', 'Date'), ('clientID', 'UInt64')])
+    flow = run_flow(make_flow(sink=sink, load_mode=load_mode, column_projection=True, insert_format='tsv', api_strict_db_table_cols_names=False, 
+                              column_mapping={'ym:s:visitID': 'visit_id'}))
+    assert sink.column_names == [['visit_id', 'date', 'clientID']]
+    lines = sink.data[0].decode('utf-8').splitlines()
+    source = mock._bodies[0].decode('utf-8').splitlines()
+    header = source[0].split('\t')
+    assert lines[0] == 'visit_id\tdate\tclientID'
+    assert len(lines) == len(source) == 21
+    expected = [header.index(field) for field in ('ym:s:visitID', 'ym:s:date', 'ym:s:clientID')]
+    assert lines[1:] == ['\t'.join(line.split('\t')[index] for index in expected) for line in source[1:]]
+    assert flow.ch.rows == 20
+
+
+def test_projection_without_common_columns_fails_load(mock_api, make_flow):
+    mock_api(parts=1)
+    sink = ProjectionSink('db', 'visits', [('other', 'String')])
+    with pytest.raises(FlowException):
+        run_flow(make_flow(sink=sink, column_projection=True, insert_format='tsv', api_strict_db_table_cols_names=False))
+    assert sink.column_names == [] and sink.rows == 0
+
+
+def test_prepared_request_with_same_params_is_reused(mock_api, make_flow):
+    mock = mock_api(parts=2)
+    #Request of crashed or duplicated run.
+    requests.post(mock.base_url % LogsTsvGenerator.COUNTER_ID + 'logrequests', params={'date1': DATE, 'date2': DATE, 'fields': FIELDS, 'source': 'visits'})
+    flow = run_flow(make_flow(reuse_prepared_requests=True, clear_created_logs_request=True))
+    assert flow.request_id == 1
+    assert mock.stats['create_200'] == 1
+    assert flow.ch.rows == 2*20
+    #Request wasn't created by this tool, so it's kept in queue with own clear_api_queue_scope, but isn't leased anymore.
+    assert mock.requests[1]['status'] == 'processed'
+    assert flow.request_registry.leased(flow.counterId) == set()
+
+
+def test_request_used_by_another_run_isnt_reused(mock_api, make_flow):
+    mock = mock_api(parts=2)
+    requests.post(mock.base_url % LogsTsvGenerator.COUNTER_ID + 'logrequests', params={'date1': DATE, 'date2': DATE, 'fields': FIELDS, 'source': 'visits'})
+    flow = make_flow(reuse_prepared_requests=True, clear_created_logs_request=True)
+    other_run = RequestRegistry.run_id()
+    assert flow.request_registry.acquire(flow.counterId, 1, other_run)
+    run_flow(flow)
+    assert flow.request_id == 2
+    assert mock.stats['create_200'] == 2
+    assert flow.ch.rows == 2*20
+    assert [request['status'] for request in mock.requests.values()] == ['processed', 'cleaned_by_user']
+    assert flow.request_registry.leased(flow.counterId) == {1}
+
+
+def test_request_of_another_params_isnt_reused(mock_api, make_flow):
+    mock = mock_api(parts=1)
+    requests.post(mock.base_url % LogsTsvGenerator.COUNTER_ID + 'logrequests', params={'date1': DATE, 'date2': DATE, 'fields': 'ym:s:visitID', 'source': 'visits'})
+    flow = run_flow(make_flow(reuse_prepared_requests=True))
+    assert flow.request_id == 2
+
+
+class MetadataSink(RecordingSink):
+    """Recording sink with metadata of data table and log table (modified at modified time), which counts full metadata queries 
+    and queries of modification times."""
+
+    def __init__(self, *args, log_table='extractor_log'):
+        super().__init__(*args)
+        self.log_table = log_table
+        self.modified = '2025-04-01 00:00:00'
+        self.queries = {'metadata': 0, 'modification': 0}
+
+    def query_data(self, query, **kwargs):
+        if 'system.columns' in query:
+            self.queries['metadata'] += 1
+            return [('database', self.db, '', '', '')] + [('table', table, self.modified, '', '') for table in (self.table, self.log_table)] \
+                + [('column', self.table, '', name, column_type) for name, column_type in self.table_columns] \
+                + [('column', self.log_table, '', name, 'String') for name in ('datetime', 'response', 'endpoint', 'description')]
+        if 'system.tables' in query:
+            self.queries['modification'] += 1
+            return [(self.table, self.modified), (self.log_table, self.modified)]
+        return super().query_data(query, **kwargs)
+
+
+def cached_flow(make_flow, sink=None, **settings):
+    flow = make_flow()
+    sink = sink or MetadataSink(flow.ch.db, flow.ch.table, flow.ch.table_columns)
+    return make_flow(sink=sink, **dict({'run_db_table_test': True, 'schema_cache_ttl_sec': 3600}, **settings))
+
+
+def test_schema_cache_replaces_metadata_query_of_next_runs(mock_api, make_flow):
+    mock_api(parts=1)
+    first = run_flow(cached_flow(make_flow))
+    assert first.ch.queries == {'metadata': 1, 'modification': 0}
+    second = run_flow(cached_flow(make_flow, first.ch))
+    assert first.ch.queries == {'metadata': 1, 'modification': 1}
+    assert second.table_columns == first.table_columns
+    assert second.ch.rows == 2*20
+
+
+def test_schema_cache_of_modified_table_is_queried_again(mock_api, make_flow):
+    mock_api(parts=1)
+    first = run_flow(cached_flow(make_flow))
+    first.ch.modified = '2025-04-02 00:00:00'
+    run_flow(cached_flow(make_flow, first.ch))
+    assert first.ch.queries == {'metadata': 2, 'modification': 1}
+    run_flow(cached_flow(make_flow, first.ch))
+    assert first.ch.queries == {'metadata': 2, 'modification': 2}
+
+
+def test_expired_schema_cache_is_queried_again(mock_api, make_flow):
+    mock_api(parts=1)
+    first = run_flow(cached_flow(make_flow))
+    first.schema_cache.update(lambda state: [entry.update({'cached_at': 0}) for entry in state.values()])
+    run_flow(cached_flow(make_flow, first.ch))
+    assert first.ch.queries == {'metadata': 2, 'modification': 0}
+
+
+def test_schema_cache_is_off_without_ttl(mock_api, make_flow, tmp_path):
+    mock_api(parts=1)
+    first = run_flow(cached_flow(make_flow, schema_cache_ttl_sec=0))
+    run_flow(cached_flow(make_flow, first.ch, schema_cache_ttl_sec=0))
+    assert first.schema_cache is None
+    assert first.ch.queries == {'metadata': 2, 'modification': 0}
+    assert not os.path.exists(tmp_path/'state/schema_cache.json')
@@ -1,4 +1,51 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .routines_utils import UtilsSet
+
+
+class ApiSession(requests.Session):
+    """Pooled HTTP session to share between all the Logs API requests of one run. Keeps connections to Logs API host alive, 
+    so status checks and part downloads don't perform TCP and TLS handshakes on every request. 
+    Connection errors and temporary server errors of idempotent requests are retried by urllib3 with exponential backoff. 
+
+    Arguments: 
+        pool_size :int - maximum amount of kept alive connections to one host. Should be not less than amount of concurrent requests. 
+        retries :int - amount of retries of connection errors and RETRY_STATUS_CODES responses. 
+        backoff_sec :float - backoff factor of retries. 
+        connect_timeout :float - seconds to wait for connection. 
+        read_timeout :float - seconds to wait for response data (between chunks of streamed response). 
+
+    Constants: 
+        POOL_SIZE - int, default pool size. 
+        CONNECT_TIMEOUT - float, default connection timeout, seconds. 
+        READ_TIMEOUT - float, default read timeout, seconds. 
+        RETRY_STATUS_CODES - list of int, response codes to retry. 
+
+    Properties: 
+        timeout - tuple (connect_timeout, read_timeout), used by requests which don't set timeout explicitly. 
+    """
+
+    POOL_SIZE = 10
+    CONNECT_TIMEOUT = 10
+    READ_TIMEOUT = 300
+    RETRY_STATUS_CODES = [502, 503, 504]
+
+    def __init__(self, pool_size=None, retries=3, backoff_sec=0.5, connect_timeout=None, read_timeout=None):
+        super().__init__()
+        pool_size = pool_size if pool_size else self.__class__.POOL_SIZE
+        self.timeout = (connect_timeout if connect_timeout else self.__class__.CONNECT_TIMEOUT, 
+                        read_timeout if read_timeout else self.__class__.READ_TIMEOUT)
+        #Not idempotent requests (POST) aren't retried by urllib3, raise_on_status=False returns the last response to parse it as usual. 
+        retry = Retry(total=retries, backoff_factor=backoff_sec, status_forcelist=self.__class__.RETRY_STATUS_CODES, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """Sends request with default timeout, if timeout isn't set."""
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
 
 
 class AbstractRequest:
@@ -9,6 +56,7 @@ class AbstractRequest:
         token :str, - OAuth token fro authorisation in Logs API. 
         log_writer :inst of class Logger - to log operation. 
         params :dict of parameters of api_credentials. 
+        session :inst of class ApiSession (or requests.Session), None - session to send request with. Module-level requests.request (new connection) is used if None. 
 
     Constants: 
         BASE_URL - base URL of Yandex Metrica's Logs API endpoint with ternary macro for counterId: 'https://api-metrika.yandex.net/management/v1/counter/%s' . 
@@ -28,10 +76,12 @@ class AbstractRequest:
         response_code - response code to our request from Metrica's Logs API server. 
         response_body - body (dict or string, None by default) from Logs API server. 
         log - instance of Logger class. Aggregation.
+        session - session to send requests with. Aggregation. 
 
     Methods: 
         __init__(self, counterId, token, params=None) - initialization of instance of class. 
         send_request(self) - to send request to Logs API. Also calls parse_response, deep_parse_response, is_success_logic, log_it methods. Returns self. 
+        http_request(self, **kwargs) - sends HTTP request with session (if set) and returns response. 
         parse_response(self, response) - method that shallowly parses response. Choses either text or json content. 
         deep_parse_response(self) - method that parses meaningful content and stores it as response_body. 
         is_success_logic(self) - method that checks whether we can consider request as successfull or not. 
@@ -45,7 +95,7 @@ class AbstractRequest:
     SUCCESS_CODE = 200
     ERROR_MESSAGE_KEY = 'message'
 
-    def __init__(self, counterId, token, log_writer=None, params=None):
+    def __init__(self, counterId, token, log_writer=None, params=None, session=None):
         self.counterId = counterId
         self.headers =  { 'Authorization': __class__.OAuth%token}
         self.params = params
@@ -55,9 +105,15 @@ class AbstractRequest:
         self.response_code = None 
         self.response_body = None
         self.log = log_writer
+        self.session = session
     
+    def http_request(self, **kwargs): 
+        """Sends HTTP request of instance with session (keeping connection alive) or without it."""
+        sender = self.session if self.session is not None else requests
+        return sender.request(self.method, self.url, headers=self.headers, params=self.params, **kwargs)
+
     def send_request(self):
-        self.raw_response = requests.request(self.method, self.url, headers=self.headers, params=self.params)
+        self.raw_response = self.http_request()
         self.parse_response(self.raw_response)
         self.deep_parse_response()
         self.is_success_logic()
@@ -98,14 +154,24 @@ class AbstractRequest:
 class LogList(AbstractRequest): 
     """Child singleton class inherited from AbstractRequest class to perform request to get
     List of log requests. Read more: https://yandex.com/dev/metrika/en/logs/openapi/getLogRequests 
+
+    Constants: 
+        REUSABLE_STATUSES - list of str, statuses of requests which can be reused, in order of preference. 
+        DEFAULT_ATTRIBUTION - str, attribution Logs API uses if request has no attribution parameter. 
+
+    Methods: 
+        matching_requests(requests, params) - static, returns list of requests (dicts) of requests with the same source, dates, fields (in the same order) 
+                        and attribution as params have and with one of REUSABLE_STATUSES. Processed requests go first. 
     """
 
     SPECIFIC_URL = 'logrequests'
     MAX_REQUESTS_QUEUE = 10
     SUCCESS_RESPONSE_KEY  = 'requests'
+    REUSABLE_STATUSES = ['processed', 'created']
+    DEFAULT_ATTRIBUTION = 'LASTSIGN'
 
-    def __init__(self, counterId, token, log_writer = None, params=None):
-        super().__init__(counterId, token, log_writer, params)
+    def __init__(self, counterId, token, log_writer = None, params=None, session=None):
+        super().__init__(counterId, token, log_writer, params, session)
 
     def deep_parse_response(self):
         """Extracting JSON content from response"""
@@ -117,24 +183,43 @@ class LogList(AbstractRequest):
     def is_success_logic(self):
         self.is_success = self.response_code == self.__class__.SUCCESS_CODE and len(self.response_body) < self.__class__.MAX_REQUESTS_QUEUE
         return self
+
+    @staticmethod
+    def matching_requests(requests, params): 
+        """Method to find request with the same parameters in list of requests (response_body). Order of fields matters, 
+        as data is inserted to database by order of columns."""
+        fields = [field.strip() for field in params.get('fields', '').split(',')]
+        attribution = params.get('attribution') or LogList.DEFAULT_ATTRIBUTION
+        matches = [request for request in requests or [] if request.get('status') in LogList.REUSABLE_STATUSES 
+                   and request.get('source') == params.get('source') and request.get('date1') == params.get('date1') 
+                   and request.get('date2') == params.get('date2') and list(request.get('fields') or []) == fields 
+                   and (request.get('attribution') or LogList.DEFAULT_ATTRIBUTION) == attribution]
+        matches.sort(key=lambda request: LogList.REUSABLE_STATUSES.index(request.get('status')))
+        return matches
     
 
 class LogEvaluation(AbstractRequest):
     """Singleton class to check if it's possible to create viable Logs API data request with parameters
     from api_credentials.json config file. Read more: https://yandex.com/dev/metrika/en/logs/openapi/evaluate 
+
+    Properties: 
+        max_possible_day_quantity - int or None, the largest amount of days request with the same parameters can be created for. 
     """
 
     SPECIFIC_URL = 'logrequests/evaluate'
     SUCCESS_RESPONSE_KEY  = 'log_request_evaluation'
     SUCCESS_CONDITION_KEY = 'possible'
+    MAX_DAYS_KEY = 'max_possible_day_quantity'
 
-    def __init__(self, counterId, token, log_writer=None, params=None):
-        super().__init__(counterId, token, log_writer, params)
+    def __init__(self, counterId, token, log_writer=None, params=None, session=None):
+        super().__init__(counterId, token, log_writer, params, session)
+        self.max_possible_day_quantity = None
 
     def deep_parse_response(self):
         super().deep_parse_response()
         if self.response_code == self.__class__.SUCCESS_CODE: 
             self.response_body = self.response_body.get(self.__class__.SUCCESS_RESPONSE_KEY)
+            self.max_possible_day_quantity = self.response_body.get(self.__class__.MAX_DAYS_KEY)
         return self
 
     def is_success_logic(self):
@@ -152,8 +237,8 @@ class CreateLog(AbstractRequest):
     SUCCESS_RESPONSE_KEY  = 'log_request'
     SUCCESS_CONDITION_KEY = 'request_id'
 
-    def __init__(self, counterId, token, log_writer=None, params=None):
-        super().__init__(counterId, token, log_writer, params)
+    def __init__(self, counterId, token, log_writer=None, params=None, session=None):
+        super().__init__(counterId, token, log_writer, params, session)
         self.request_id = None
 
     def deep_parse_response(self):
@@ -178,8 +263,8 @@ class CleanProcessedLog(AbstractRequest):
     SUCCESS_CONDITION_KEY = 'request_id'
     SUCCESS_STATUS_KEY = 'status'
 
-    def __init__(self, counterId, request_id,  token, log_writer=None, params=None):
-        super().__init__(counterId, token, log_writer, params)
+    def __init__(self, counterId, request_id,  token, log_writer=None, params=None, session=None):
+        super().__init__(counterId, token, log_writer, params, session)
         self.url = self.__class__.BASE_URL%counterId + self.__class__.SPECIFIC_URL%request_id
         self.request_id = request_id
         self.cleared_request_id = None
@@ -204,8 +289,8 @@ class CleanPendingLog(CleanProcessedLog):
 
     SPECIFIC_URL = "logrequest/%s/cancel"
 
-    def __init__(self, counterId, request_id, token, log_writer=None, params=None):
-        super().__init__(counterId, request_id, token, log_writer, params)
+    def __init__(self, counterId, request_id, token, log_writer=None, params=None, session=None):
+        super().__init__(counterId, request_id, token, log_writer, params, session)
 
 
 class StatusLog(CleanProcessedLog): 
@@ -218,8 +303,8 @@ class StatusLog(CleanProcessedLog):
     SUCCESS_STATUS_TO_DOWDNLOAD = "processed"
     PART_INDEX_KEY = "part_number"
 
-    def __init__(self, counterId, request_id, token, log_writer=None, params=None):
-        super().__init__(counterId, request_id, token, log_writer, params)
+    def __init__(self, counterId, request_id, token, log_writer=None, params=None, session=None):
+        super().__init__(counterId, request_id, token, log_writer, params, session)
         del self.cleared_request_id
         self.parts = []
         self.parts_amount = 0
@@ -247,25 +332,164 @@ class StatusLog(CleanProcessedLog):
 
 class DownloadLogPart(AbstractRequest):
     """Request to download part of prepared Logs API data. Singltone child of AbstractRequest parent. 
-    Read more: https://yandex.com/dev/metrika/en/logs/openapi/download"""
+    Read more: https://yandex.com/dev/metrika/en/logs/openapi/download
+
+    Part can be downloaded either into memory (response_body is a TSV string) or streamed straight to disk: 
+    body is iterated by chunks of chunk_size bytes into a temporary file, which is atomically renamed to the target path 
+    when the download is complete. In the latter case the body never exists as a Python string, so peak memory 
+    is bounded by the chunk size, and response_body contains the path of the written file. 
+
+    If encoding is set, compressed response is requested from Logs API. In case the compressed response is bad 
+    (either it can't be decoded or the request fails), warning is logged and the part is requested once again without compression. 
+    If compressor is set, streamed file is stored compressed with its codec. 
+
+    Constants: 
+        CHUNK_SIZE - int, default size (bytes) of chunks to stream response body with. 
+        ENCODING - str, Accept-Encoding header value to request compressed response. 
+        IDENTITY_ENCODING - str, Accept-Encoding header value to request not compressed response. 
+        NO_FALLBACK_CODES - list of int, response codes which don't mean broken compression (e.g. quota exceeded). 
+
+    Properties: 
+        chunk_size - int, size of chunks (bytes) to stream response body with. 
+        path - str or None, path of the file with the last successfully streamed part. 
+        bytes_written - int, bytes written to disk (or streamed further) during the last streamed download. 
+        stream - opened response with not consumed body, see open_stream method. None by default. 
+        encoding - str or None, Accept-Encoding header value. None means not compressed response. 
+        compressor - inst of class Compressor or None, to store streamed file compressed. More in compression_utils.py module. 
+        encoding_fallback - bool, True if compressed response was bad and compression was switched off. 
+    """
 
     SPECIFIC_URL = 'logrequest/%s/part/'
     VARIABLE_PART_URL = '%s/download'
-    # ENCODING = "gzip" ##Metrika's Logs API simply doesn't work properly right now. So, endure, midgets. Endure. 
-    # Those who endure then win! 
+    CHUNK_SIZE = 1024*1024
+    ENCODING = "gzip" #Metrika's Logs API used to break gzip responses, so there is automatic fallback to plain TSV. Endure, midgets. Endure. 
+    IDENTITY_ENCODING = "identity"
+    NO_FALLBACK_CODES = [429]
     
-    def __init__(self, counterId, request_id, token, log_writer=None, params=None):
-        super().__init__(counterId, token, log_writer, params)
+    def __init__(self, counterId, request_id, token, log_writer=None, params=None, chunk_size=None, encoding=None, compressor=None, session=None):
+        super().__init__(counterId, token, log_writer, params, session)
         self.url_const = self.url%request_id
-        # self.headers['Accept-Encoding'] = self.__class__.ENCODING #Endure the inability of Metrika's team 
-        #to fix data compression properly. Unfortunately, it will stay like this till fixes. 
+        self.chunk_size = chunk_size if chunk_size else self.__class__.CHUNK_SIZE
+        self.path = None
+        self.bytes_written = 0
+        self.stream = None
+        self.utils = UtilsSet()
+        self.encoding = encoding
+        self.compressor = compressor
+        self.encoding_fallback = False
+        #requests asks for gzip by default, so not compressed response has to be asked explicitly. 
+        self.headers['Accept-Encoding'] = self.encoding if self.encoding else self.__class__.IDENTITY_ENCODING
+
+    def send_request(self, part, path=None):
+        """Downloads part. If path is set - streams it to the file at path, otherwise reads it into response_body. 
+        Falls back to not compressed response if compressed one is bad."""
+        self.url = self.url_const + self.__class__.VARIABLE_PART_URL%part
+        try: 
+            self._download(path)
+        except requests.exceptions.ContentDecodingError: 
+            if not self.encoding: 
+                raise
+            self.response_code = None
+            self.is_success = False
+        if not self.is_success and self.encoding and self.response_code not in self.__class__.NO_FALLBACK_CODES: 
+            self.fallback_to_identity_encoding()
+            self._download(path)
+        return self
+
+    def _download(self, path): 
+        if path is None: 
+            super().send_request()
+        else: 
+            self.stream_to_file(path)
+
+    def fallback_to_identity_encoding(self): 
+        """Switches off compressed responses for this instance and logs warning."""
+        print(f"Warning: {self.encoding} response of {self.url} is bad (response code: {self.response_code}). Falling back to not compressed response.")
+        if self.log is not None: 
+            classmethod = f"Class: {self.__class__.__name__}. Method: {self.fallback_to_identity_encoding.__name__}"
+            endpoint = self.url.removeprefix(__class__.BASE_URL)
+            self.log.add_to_log(response=self.response_code, endpoint=endpoint, 
+                                description=f"Warning: bad {self.encoding} response, fallback to plain TSV.").write_to_disk_incremental(classmethod)
+        self.encoding = None
+        self.encoding_fallback = True
+        self.headers['Accept-Encoding'] = self.__class__.IDENTITY_ENCODING
+        return self
+
+    def stream_to_file(self, path):
+        """Streams response body chunk by chunk to temporary file and then atomically renames it to path. 
+        Raises OSError if file cannot be written."""
+        self.path = None
+        self.bytes_written = 0
+        with self.http_request(stream=True) as response: 
+            self.raw_response = response
+            self.response_code = response.status_code
+            if self.response_code == self.__class__.SUCCESS_CODE: 
+                chunks = response.iter_content(chunk_size=self.chunk_size)
+                if self.compressor is not None: 
+                    chunks = self.compressor.compress_chunks(chunks)
+                self.bytes_written = self.utils.write_stream_to_file(chunks, path)
+                self.path = path
+                self.response_body = path
+            else: 
+                self.parse_response(response)
+                self.deep_parse_response()
+        self.is_success_logic()
+        self.log_it()
+        return self
 
-    def send_request(self, part):
+    def open_stream(self, part):
+        """Sends request for part with streamed body, but doesn't read the body. If request is successfull, 
+        body can be then consumed chunk by chunk with iter_chunks method (e.g. to pipe it right to database insert). 
+        Stream should be closed with close_stream method afterwards."""
         self.url = self.url_const + self.__class__.VARIABLE_PART_URL%part
-        super().send_request()
+        self.stream = None
+        self.bytes_written = 0
+        response = self.http_request(stream=True)
+        self.raw_response = response
+        self.response_code = response.status_code
+        if self.response_code == self.__class__.SUCCESS_CODE: 
+            self.stream = response
+        else: 
+            self.parse_response(response)
+            self.deep_parse_response()
+            response.close()
+        self.is_success_logic()
+        self.log_it()
+        if not self.is_success and self.encoding and self.response_code not in self.__class__.NO_FALLBACK_CODES: 
+            self.fallback_to_identity_encoding()
+            return self.open_stream(part)
+        return self
+
+    def iter_chunks(self): 
+        """Generator of (decoded) body chunks of stream opened by open_stream method. Counts streamed bytes in bytes_written. 
+        If compressed response can't be decoded, switches compression off for further requests and re-raises the error."""
+        try: 
+            for chunk in self.stream.iter_content(chunk_size=self.chunk_size): 
+                if chunk: 
+                    self.bytes_written += len(chunk)
+                    yield chunk
+        except requests.exceptions.ContentDecodingError: 
+            if self.encoding: 
+                self.fallback_to_identity_encoding()
+            raise
+
+    def close_stream(self): 
+        """Closes stream opened by open_stream method."""
+        if self.stream is not None: 
+            self.stream.close()
+            self.stream = None
+        return self
+
+    def parse_response(self, response):
+        """Part body is TSV, so there is no need to try to parse it as JSON in case of success."""
+        if response.status_code == self.__class__.SUCCESS_CODE: 
+            self.response_code = response.status_code
+            self.response_body = response.text
+            return self
+        return super().parse_response(response)
 
     def log_it(self):
         pass
 
     def is_success_logic(self):
-        self.is_success = self.response_code == self.__class__.SUCCESS_CODE
\ No newline at end of file
+        self.is_success = self.response_code == self.__class__.SUCCESS_CODE
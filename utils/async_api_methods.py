@@ -0,0 +1,194 @@
+import asyncio
+import json
+import queue
+import aiohttp
+from .api_methods import *
+
+
+class AsyncResponse:
+    """Read response of aiohttp with the same interface as requests' response has, so parsing methods of AbstractRequest
+    children can be reused as they are.
+
+    Arguments:
+        status_code :int - response code.
+        text :str - response body.
+
+    Methods:
+        json(self) - parses body as JSON. Raises ValueError if body isn't JSON.
+    """
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncRequestMixin:
+    """Mixin to turn request classes of api_methods.py module into asyncio-native ones. Mixed in before request class,
+    replaces blocking send_request with the coroutine and keeps parse_response, deep_parse_response, is_success_logic
+    and log_it methods of request class as they are.
+
+    Session is required and is expected to be an aiohttp.ClientSession. Session's timeouts and connection limits are used.
+
+    Methods:
+        http_params(self) - returns parameters of request without None values (aiohttp doesn't skip them as requests does).
+        send_request(self) - coroutine to send request to Logs API. Also calls parse_response, deep_parse_response, is_success_logic, log_it methods. Returns self.
+    """
+
+    def http_params(self):
+        """Parameters of request without None values."""
+        if self.params is None:
+            return None
+        return {key: value for key, value in self.params.items() if value is not None}
+
+    async def send_request(self):
+        async with self.session.request(self.method, self.url, headers=self.headers, params=self.http_params()) as response:
+            self.raw_response = AsyncResponse(response.status, await response.text())
+        self.parse_response(self.raw_response)
+        self.deep_parse_response()
+        self.is_success_logic()
+        self.log_it()
+        return self
+
+
+class AsyncLogList(AsyncRequestMixin, LogList):
+    """Asyncio-native LogList. Read more: https://yandex.com/dev/metrika/en/logs/openapi/getLogRequests"""
+    pass
+
+
+class AsyncLogEvaluation(AsyncRequestMixin, LogEvaluation):
+    """Asyncio-native LogEvaluation. Read more: https://yandex.com/dev/metrika/en/logs/openapi/evaluate"""
+    pass
+
+
+class AsyncCreateLog(AsyncRequestMixin, CreateLog):
+    """Asyncio-native CreateLog. Read more: https://yandex.com/dev/metrika/en/logs/openapi/createLogRequest"""
+    pass
+
+
+class AsyncCleanProcessedLog(AsyncRequestMixin, CleanProcessedLog):
+    """Asyncio-native CleanProcessedLog. Read more: https://yandex.com/dev/metrika/en/logs/openapi/clean"""
+    pass
+
+
+class AsyncCleanPendingLog(AsyncRequestMixin, CleanPendingLog):
+    """Asyncio-native CleanPendingLog. Read more: https://yandex.com/dev/metrika/en/logs/openapi/cancel"""
+    pass
+
+
+class AsyncStatusLog(AsyncRequestMixin, StatusLog):
+    """Asyncio-native StatusLog. Read more: https://yandex.com/dev/metrika/en/logs/openapi/getLogRequest"""
+    pass
+
+
+class AsyncDownloadLogPart(AsyncRequestMixin, DownloadLogPart):
+    """Asyncio-native DownloadLogPart. Read more: https://yandex.com/dev/metrika/en/logs/openapi/download
+
+    Part is either read into response_body or streamed chunk by chunk to temporary file, which is atomically renamed to the target path
+    when the download is complete. Compressed response falls back to not compressed one the same way as in DownloadLogPart.
+    Response is decompressed by aiohttp, broken compressed body raises aiohttp.ClientPayloadError.
+
+    Methods:
+        send_request(self, part, path=None) - coroutine to download part into memory or to the file at path. Returns self.
+        stream_to_file(self, path) - coroutine to stream response body to file. Raises OSError if file cannot be written. Returns self.
+
+    Constants:
+        STREAM_QUEUE_SIZE - int, maximum amount of chunks waiting to be written to file by worker thread.
+    """
+
+    STREAM_QUEUE_SIZE = 16
+
+    async def send_request(self, part, path=None):
+        """Downloads part. If path is set - streams it to the file at path, otherwise reads it into response_body.
+        Falls back to not compressed response if compressed one is bad."""
+        self.url = self.url_const + self.__class__.VARIABLE_PART_URL%part
+        try:
+            await self._download(path)
+        except aiohttp.ClientPayloadError:
+            if not self.encoding:
+                raise
+            self.response_code = None
+            self.is_success = False
+        if not self.is_success and self.encoding and self.response_code not in self.__class__.NO_FALLBACK_CODES:
+            self.fallback_to_identity_encoding()
+            await self._download(path)
+        return self
+
+    @staticmethod
+    async def _put_chunk(chunks, chunk):
+        """Puts chunk to queue of writer thread. Waits in worker thread only if queue is full (writer is slower than network)."""
+        try:
+            chunks.put_nowait(chunk)
+        except queue.Full:
+            await asyncio.to_thread(chunks.put, chunk)
+
+    def _write_queued_chunks(self, chunks, path):
+        """Writes chunks from queue (compressed, if compressor is set) to file at path. Performed in worker thread.
+        Queue ends with None or with error of stream, which is raised to drop temporary file. Returns amount of bytes written."""
+        ended = [False]
+
+        def queued_chunks():
+            while True:
+                chunk = chunks.get()
+                if chunk is None or isinstance(chunk, BaseException):
+                    ended[0] = True
+                    if chunk is not None:
+                        raise OSError(f"Stream of {self.url} was interrupted: {chunk!r}")
+                    return
+                yield chunk
+
+        stream = queued_chunks()
+        if self.compressor is not None:
+            stream = self.compressor.compress_chunks(stream)
+        try:
+            return self.utils.write_stream_to_file(stream, path)
+        except BaseException:
+            #Let's drain the queue till its end, so coroutine streaming into it isn't blocked.
+            while not ended[0]:
+                chunk = chunks.get()
+                ended[0] = chunk is None or isinstance(chunk, BaseException)
+            raise
+
+    async def _download(self, path):
+        if path is None:
+            await super().send_request()
+        else:
+            await self.stream_to_file(path)
+
+    async def stream_to_file(self, path):
+        """Streams response body chunk by chunk to file at path with UtilsSet.write_stream_to_file (temporary file atomically renamed to path).
+        File is written in worker thread, fed by bounded queue of chunks, so disk writes (and compression) don't block event loop.
+        Raises OSError if file cannot be written."""
+        self.path = None
+        self.bytes_written = 0
+        async with self.session.request(self.method, self.url, headers=self.headers, params=self.http_params()) as response:
+            self.response_code = response.status
+            if self.response_code == self.__class__.SUCCESS_CODE:
+                chunks = queue.Queue(maxsize=self.__class__.STREAM_QUEUE_SIZE)
+                writer = asyncio.ensure_future(asyncio.to_thread(self._write_queued_chunks, chunks, path))
+                end = None
+                try:
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        #Writer stops only on error, which is raised below.
+                        if writer.done():
+                            break
+                        await self._put_chunk(chunks, chunk)
+                except BaseException as error:
+                    end = error
+                if not writer.done():
+                    await self._put_chunk(chunks, end)
+                if end is not None:
+                    #Let's wait for writer to remove temporary file before the error is raised (and part is retried).
+                    await asyncio.gather(writer, return_exceptions=True)
+                    raise end
+                self.bytes_written = await writer
+                self.path = path
+                self.response_body = path
+            else:
+                self.parse_response(AsyncResponse(response.status, await response.text()))
+                self.deep_parse_response()
+        self.is_success_logic()
+        self.log_it()
+        return self
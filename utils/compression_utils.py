@@ -0,0 +1,118 @@
+import zlib
+try:
+    import lz4.frame
+except ImportError:
+    #lz4 codec is optional: it's needed only if data_compression parameter of global_config is lz4.
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    #zstd codec is optional: it's needed only if data_compression parameter of global_config is zstd.
+    zstandard = None
+
+
+class Compressor:
+    """Streaming compressor/decompressor of bytes chunks. Used to store temporary data files compressed and
+    to send compressed inserts to ClickHouse over HTTP (codec name is used as Content-Encoding header value).
+
+    Arguments:
+        codec :str - one of CODECS: 'gzip', 'lz4' or 'zstd'.
+        level :int, None - compression level. Codec's default level is used if None.
+
+    Constants:
+        CODECS - tuple of str, supported codecs.
+        EXTENSIONS - dict, file extensions of supported codecs.
+        PACKAGES - dict, optional packages needed by codecs (gzip is provided by zlib of standard library).
+        GZIP_WBITS - int, wbits value for zlib to write and read gzip container.
+
+    Methods:
+        extension(self) - returns file extension for codec, e.g. '.zst'.
+        compressobj(self) - returns new streaming compressor object of codec with zlib-like compress/flush interface.
+        decompressobj(self) - returns new streaming decompressor object of codec with zlib-like decompress interface.
+        compress_chunks(self, chunks) - generator of compressed chunks of iterable of bytes chunks.
+        decompress_chunks(self, chunks) - generator of decompressed chunks of iterable of compressed bytes chunks.
+    """
+
+    CODECS = ('gzip', 'lz4', 'zstd')
+    EXTENSIONS = {'gzip': '.gz', 'lz4': '.lz4', 'zstd': '.zst'}
+    PACKAGES = {'lz4': 'lz4', 'zstd': 'zstandard'}
+    GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+    def __init__(self, codec, level=None):
+        if codec not in self.__class__.CODECS:
+            raise ValueError(f"Unsupported compression codec: {codec}. Supported ones: {self.__class__.CODECS}.")
+        if (codec == 'lz4' and lz4 is None) or (codec == 'zstd' and zstandard is None):
+            raise ValueError(f"Compression codec {codec} needs {self.__class__.PACKAGES[codec]} package. Please, install it or choose gzip.")
+        self.codec = codec
+        self.level = level
+
+    def extension(self):
+        """Method to get file extension of codec."""
+        return self.__class__.EXTENSIONS[self.codec]
+
+    def compressobj(self):
+        """Method to create streaming compressor object."""
+        if self.codec == 'gzip':
+            return zlib.compressobj(self.level if self.level is not None else 6, zlib.DEFLATED, self.__class__.GZIP_WBITS)
+        elif self.codec == 'lz4':
+            return _Lz4FrameCompressObj(self.level)
+        return zstandard.ZstdCompressor(level=self.level if self.level is not None else 3).compressobj()
+
+    def decompressobj(self):
+        """Method to create streaming decompressor object."""
+        if self.codec == 'gzip':
+            return zlib.decompressobj(self.__class__.GZIP_WBITS)
+        elif self.codec == 'lz4':
+            return _Lz4FrameDecompressObj()
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    def compress_chunks(self, chunks):
+        """Generator of compressed chunks. Output is a single valid frame (gzip member) of codec."""
+        compressor = self.compressobj()
+        for chunk in chunks:
+            if chunk:
+                compressed = compressor.compress(chunk)
+                if compressed:
+                    yield compressed
+        tail = compressor.flush()
+        if tail:
+            yield tail
+
+    def decompress_chunks(self, chunks):
+        """Generator of decompressed chunks."""
+        decompressor = self.decompressobj()
+        for chunk in chunks:
+            if chunk:
+                decompressed = decompressor.decompress(chunk)
+                if decompressed:
+                    yield decompressed
+        if self.codec == 'gzip':
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+
+
+class _Lz4FrameCompressObj:
+    """Adapter of lz4 frame compressor to zlib-like compress/flush interface."""
+
+    def __init__(self, level=None):
+        self._compressor = lz4.frame.LZ4FrameCompressor(compression_level=level if level is not None else 0)
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        compressed = self._header + self._compressor.compress(data)
+        self._header = b''
+        return compressed
+
+    def flush(self):
+        return self._header + self._compressor.flush()
+
+
+class _Lz4FrameDecompressObj:
+    """Adapter of lz4 frame decompressor to zlib-like decompress interface."""
+
+    def __init__(self):
+        self._decompressor = lz4.frame.LZ4FrameDecompressor()
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
@@ -1,6 +1,11 @@
+import queue
+import re
+import threading
+from contextlib import contextmanager
 import clickhouse_connect
 import clickhouse_connect.driver
 import clickhouse_connect.driver.tools
+from clickhouse_connect.driver.binding import quote_identifier
 import sshtunnel
 
 class ClickHouseConnector:
@@ -15,6 +20,8 @@ class ClickHouseConnector:
         host :str - IP or name of host with CH server. 
         port :int - TCP port number for CH server. 8123 for http by default and 8443 for https.
         db :str - name of database to connect. 
+        pool_size :int - amount of clients in pool. Inserts borrow clients from pool, so up to pool_size parts are inserted at once. 1 by default. 
+        compress :bool, str or None - compression of clickhouse-connect clients (True, False or codec name, e.g. 'lz4', 'zstd'). Default of clickhouse-connect if None. 
 
 
         remote_host :str - remote host name/ip address. 
@@ -30,6 +37,19 @@ class ClickHouseConnector:
         create_tunnel(self) - to establish connection with class' init arguments. Called in init by default. 
         tunnel_start(self) - to start the tunnel connection.
         tunnel_stop(self) - to stop the tunnel connection.
+        client(self) - context manager to borrow client from pool for the time of query, command or insert. Raises ConnectionError if there is no connection. 
+        full_table_name(self, table=None) - returns quoted name of table (table of connector, if None) with database. 
+        run_command(self, query, **kwargs) - performs DDL/DML command. Returns bool. 
+        create_staging_table(self, staging_table, table=None) - (re)creates empty staging table AS table. Returns bool. 
+        drop_table(self, table) - drops table if it exists. Returns bool. 
+        table_deduplicates(self, table=None) - returns True if insert_deduplication_token is taken into account for table (Replicated engine or non_replicated_deduplication_window > 0). 
+        table_partitions(self, table) - returns list of ids of active partitions of table or None. 
+        partition_versions(self, partitions, table=None) - returns dict of the latest block number of each of active partitions of table, changed by each insert into partition, or None. 
+        backfill_partition(self, staging_table, partition_id, date_column, date1, date2, table=None) - copies rows of partition of table outside of dates 
+                        since date1 till date2 to staging table, so partition can be replaced without loss of other dates. Returns bool. 
+        replace_partition(self, staging_table, partition_id, table=None) - atomically replaces partition of table with partition of staging table. Returns bool. 
+        insert_columns(self, columns, column_names, column_types, settings=None, table=None, dedup_token=None) - inserts typed columns in Native format. Returns bool. 
+        last_written_rows(self) - returns rows written by the last insert of current thread (from summary of ClickHouse response) or None. 
     
     """
 
@@ -43,6 +63,7 @@ class ClickHouseConnector:
     SSHEndpoint = 'SSH'
     ChQueryEndpoint = 'CH/query%s'
     ChCreateEndpoint = 'CH/create%s'
+    ChCommandEndpoint = 'CH/command%s'
 
     SSHBadDescription = "SSH connection not established. Check credentials and if ports are open."
     SSHSuccessDescription = "SSH connection successfully established."
@@ -55,13 +76,16 @@ class ClickHouseConnector:
     ChQueryBadDescription = "Query wasn't performed. Maybe user you logged with doesn't have permissions for that. Query: %s"
     ChQuerySuccessDescription = "Query was performed successfully. Query: %s"
 
+    ChCommandBadDescription = "Command wasn't performed. Maybe user you logged with doesn't have permissions for that. Query: %s"
+    ChCommandSuccessDescription = "Command was performed successfully. Query: %s"
+
     ChCreateTableBadDescription = "Table %s wasn't created. Maybe user you logged with doesn't have permission for that"
     ChCreateTableSuccessDescription = "Table %s was successfully created."
 
     ChInsertBadDescription = "Insert to ClickHouse wasn't performed. Maybe there are not enough rights, or bad/no data"
     ChInsertSuccessDescription = "Insert to ClickHouse was performed successfully."
 
-    def __init__(self, logger, login, password, host, port, db, table, logTable=None, ssh=None):
+    def __init__(self, logger, login, password, host, port, db, table, logTable=None, ssh=None, pool_size=1, compress=None):
         self.logger = logger
         self.login = login 
         self.password = password
@@ -73,9 +97,14 @@ class ClickHouseConnector:
         self.ssh = ssh 
         self.queries = 0
         self.creations = 0
+        self.commands = 0
+        self.pool_size = max(1, pool_size)
+        self.compress = compress
+        self.insert_summaries = threading.local()
         if self.ssh is not None and isinstance(self.ssh, dict) and self.ssh != {}:
             self.tunnel = self._establish_ssh_tunnel()
         self.ch_client = self._establish_ch_connection()
+        self.clients = self._establish_clients_pool()
                 
     def _establish_ssh_tunnel(self): 
         """Method to establish SSH tunnel, which will be then used for clickhouse connection.
@@ -167,8 +196,10 @@ class ClickHouseConnector:
                                    +ClickHouseConnector.SSHBadDescription).write_to_disk_incremental(classmethod)
         else: 
             try:
-                client = clickhouse_connect.get_client(host=self.host, port=self.port, username=self.login, password=self.password
-                                                       )
+                #No session id, as client is used by several threads at once (concurrent inserts) and sessions can't be shared. 
+                compression = {'compress': self.compress} if self.compress is not None else {}
+                client = clickhouse_connect.get_client(host=self.host, port=self.port, username=self.login, password=self.password, 
+                                                       autogenerate_session_id=False, **compression)
                 print("ClickHouse connection established.")
                 self.logger.add_to_log(response=ClickHouseConnector.SuccessCode, endpoint=ClickHouseConnector.ChEndpoint,
                                     description=ClickHouseConnector.ChSuccessDescription).write_to_disk_incremental(classmethod)
@@ -178,16 +209,50 @@ class ClickHouseConnector:
                                    description=ClickHouseConnector.ChBadDescription).write_to_disk_incremental(classmethod)
         return client
     
+    def _establish_clients_pool(self): 
+        """Method to create pool of clients for concurrent inserts. Main client is the first one in pool, the rest are created additionally. 
+        Pool is smaller than pool_size if some clients weren't created. 
+
+        Returns: 
+            clients :queue.Queue of clickhouse_connect clients. 
+        """
+        clients = queue.Queue()
+        if self.ch_client is None: 
+            return clients
+        clients.put(self.ch_client)
+        for number in range(self.pool_size - 1): 
+            client = self._establish_ch_connection()
+            if client is not None: 
+                clients.put(client)
+        return clients
+
+    @contextmanager
+    def client(self): 
+        """Context manager to borrow client from pool. Waits until some client is free. Queries, commands and inserts of all the threads 
+        borrow clients, so one client (and its session) is never used by two threads at once."""
+        if self.ch_client is None: 
+            raise ConnectionError(ClickHouseConnector.ChBadDescription)
+        client = self.clients.get()
+        try: 
+            yield client
+        finally: 
+            self.clients.put(client)
+
     def re_establish_connection(self):  
         """Method to re-establish connection to both ssh tunnel and clickhouse database."""
         if self.ssh is not None: 
             self.tunnel = self._establish_ssh_tunnel()
         self.ch_client = self._establish_ch_connection()
+        self.clients = self._establish_clients_pool()
 
     def close_connections(self):
         """Method that closes connections for both ssh tunnel and clickhouse instance."""
         classmethod = f"Class: {self.__class__.__name__}. Method: {self.close_connections.__name__}"
         if self.ch_client is not None: 
+            while not self.clients.empty(): 
+                client = self.clients.get()
+                if client is not self.ch_client: 
+                    client.close()
             self.ch_client.close()
             print("ClickHouse connection closed.")
             self.logger.add_to_log(response=ClickHouseConnector.CloseCode, endpoint=ClickHouseConnector.ChEndpoint,
@@ -205,7 +270,8 @@ class ClickHouseConnector:
         classmethod = f"Class: {self.__class__.__name__}. Method: {self.query_data.__name__}"
         result = None
         try: 
-            result = self.ch_client.query(query, **kwargs).result_rows
+            with self.client() as client: 
+                result = client.query(query, **kwargs).result_rows
             self.logger.add_to_log(response=ClickHouseConnector.SuccessCode, endpoint=ClickHouseConnector.ChQueryEndpoint%self.queries,
                                     description=ClickHouseConnector.ChQuerySuccessDescription%query).write_to_disk_incremental(classmethod)
         except: 
@@ -220,7 +286,8 @@ class ClickHouseConnector:
         table_name = table
         result = False
         try: 
-            self.ch_client.command(query, **kwargs).as_query_result()
+            with self.client() as client: 
+                client.command(query, **kwargs).as_query_result()
             result = True
             self.logger.add_to_log(response=ClickHouseConnector.SuccessCode, endpoint=ClickHouseConnector.ChCreateEndpoint%self.creations,
                                     description=ClickHouseConnector.ChCreateTableSuccessDescription%table_name).write_to_disk_incremental(classmethod)
@@ -231,11 +298,137 @@ class ClickHouseConnector:
                                     description=ClickHouseConnector.ChCreateTableBadDescription%table_name).write_to_disk_incremental(classmethod)
         return result
     
-    def insert_datafile(self, file, settings=None): 
-        """Method to insert data from local datafile to clickhouse table."""
+    @staticmethod
+    def dedup_settings(settings=None, dedup_token=None): 
+        """Method to add insert_deduplication_token to insert settings. Blocks inserted with the same token are deduplicated by ClickHouse, 
+        so retry of insert is idempotent. Works out of the box for Replicated*MergeTree tables, plain MergeTree tables need non_replicated_deduplication_window setting."""
+        if dedup_token is None: 
+            return settings
+        settings = dict(settings or {})
+        settings['insert_deduplicate'] = 1
+        settings['insert_deduplication_token'] = dedup_token
+        return settings
+
+    def insert_datafile(self, file, settings=None, compression=None, table=None, dedup_token=None): 
+        """Method to insert data from local datafile to clickhouse table (table of connector, if table isn't set). If compression (codec name) is set, file is expected to be 
+        compressed with it and is sent to ClickHouse as is, with the corresponding Content-Encoding. If dedup_token is set, repeated insert with the same token is deduplicated."""
+        result = False
+        try: 
+            with self.client() as client: 
+                summary = clickhouse_connect.driver.tools.insert_file(client, table or self.table, file, settings=ClickHouseConnector.dedup_settings(settings, dedup_token), 
+                                                                      database = self.db, fmt = ClickHouseConnector.FORMAT, compression=compression)
+            self._remember_summary(summary)
+            result = True
+        finally: 
+            return result
+
+    def insert_stream(self, chunks, settings=None, compression=None, table=None, dedup_token=None, column_names=None): 
+        """Method to insert data from iterable of bytes chunks (e.g. body of HTTP response) to clickhouse table (table of connector, if table isn't set) 
+        without writing it to local disk. If compression (codec name) is set, chunks are expected to be compressed with it. dedup_token is the same as in insert_datafile. 
+        If column_names are set, data is inserted into these columns only, the rest of columns get default values."""
+        result = False
+        try: 
+            full_table = self.full_table_name(table)
+            with self.client() as client: 
+                summary = client.raw_insert(full_table, column_names=column_names, insert_block=chunks, settings=ClickHouseConnector.dedup_settings(settings, dedup_token), 
+                                            fmt=ClickHouseConnector.FORMAT, compression=compression)
+            self._remember_summary(summary)
+            result = True
+        finally: 
+            return result
+
+    def _remember_summary(self, summary): 
+        """Method to keep rows written by insert of current thread (inserts of pool run in several threads at once)."""
+        self.insert_summaries.written_rows = getattr(summary, 'written_rows', None)
+        return self
+
+    def last_written_rows(self): 
+        """Method to get rows written by the last insert of current thread. None if ClickHouse didn't report them."""
+        return getattr(self.insert_summaries, 'written_rows', None)
+
+    def full_table_name(self, table=None): 
+        """Method to build quoted name of table with database."""
+        return f"{quote_identifier(self.db)}.{quote_identifier(table or self.table)}"
+
+    def run_command(self, query, **kwargs): 
+        """Method to perform DDL/DML command (which doesn't return rows) in database."""
+        self.commands += 1
+        classmethod = f"Class: {self.__class__.__name__}. Method: {self.run_command.__name__}"
+        result = False
+        try: 
+            with self.client() as client: 
+                client.command(query, **kwargs)
+            result = True
+            self.logger.add_to_log(response=ClickHouseConnector.SuccessCode, endpoint=ClickHouseConnector.ChCommandEndpoint%self.commands,
+                                    description=ClickHouseConnector.ChCommandSuccessDescription%query).write_to_disk_incremental(classmethod)
+        except: 
+            print(f"Command wasn't performed: {query}")
+            self.logger.add_to_log(response=ClickHouseConnector.BadCode, endpoint=ClickHouseConnector.ChCommandEndpoint%self.commands,
+                                    description=ClickHouseConnector.ChCommandBadDescription%query).write_to_disk_incremental(classmethod)
+        return result
+
+    def drop_table(self, table): 
+        """Method to drop table if it exists."""
+        return self.run_command(f"DROP TABLE IF EXISTS {self.full_table_name(table)}")
+
+    def create_staging_table(self, staging_table, table=None): 
+        """Method to (re)create empty staging table with the same structure, engine and partition key as table has."""
+        if not self.drop_table(staging_table): 
+            return False
+        return self.run_command(f"CREATE TABLE {self.full_table_name(staging_table)} AS {self.full_table_name(table)}")
+
+    def table_deduplicates(self, table=None): 
+        """Method to check, whether insert_deduplication_token is taken into account for table (table of connector, if table isn't set). 
+        It is so for Replicated*MergeTree engines and for tables with non_replicated_deduplication_window > 0. Returns bool or None if query failed."""
+        rows = self.query_data("SELECT engine, create_table_query FROM system.tables WHERE database = %(db)s AND name = %(table)s", 
+                               parameters={'db': self.db, 'table': table or self.table})
+        if not rows: 
+            return None
+        engine, create_query = rows[0][0], rows[0][1]
+        if str(engine).startswith('Replicated'): 
+            return True
+        window = re.search(r"non_replicated_deduplication_window\s*=\s*(\d+)", str(create_query))
+        return window is not None and int(window.group(1)) > 0
+
+    def table_partitions(self, table): 
+        """Method to get ids of active partitions of table. Returns list of str or None if query failed."""
+        rows = self.query_data("SELECT DISTINCT partition_id FROM system.parts WHERE database = %(db)s AND table = %(table)s AND active", 
+                               parameters={'db': self.db, 'table': table})
+        if rows is None: 
+            return None
+        return [row[0] for row in rows]
+
+    def partition_versions(self, partitions, table=None): 
+        """Method to get the latest block number of each of active partitions of table (table of connector, if table isn't set). Each insert into partition 
+        creates part with new block number, while merges and mutations keep it, so changed version means that partition was written. Returns dict or None if query failed."""
+        rows = self.query_data("SELECT partition_id, max(max_block_number) FROM system.parts WHERE database = %(db)s AND table = %(table)s AND active \
+AND partition_id IN %(partitions)s GROUP BY partition_id", parameters={'db': self.db, 'table': table or self.table, 'partitions': list(partitions)})
+        if rows is None: 
+            return None
+        return {partition: version for partition, version in rows}
+
+    def backfill_partition(self, staging_table, partition_id, date_column, date1, date2, table=None): 
+        """Method to copy rows of partition of table, which are outside of dates since date1 till date2, to staging table. 
+        After that partition of staging table contains the whole partition and can replace the one of table without loss of other dates. 
+        Rows inserted into partition of table after the copy are lost on replace, so nobody else should write to the partition till then 
+        (see partition_versions to find out writes)."""
+        query = f"INSERT INTO {self.full_table_name(staging_table)} SELECT * FROM {self.full_table_name(table)} \
+WHERE _partition_id = %(partition)s AND NOT ({quote_identifier(date_column)} BETWEEN %(date1)s AND %(date2)s)"
+        return self.run_command(query, parameters={'partition': partition_id, 'date1': date1, 'date2': date2})
+
+    def replace_partition(self, staging_table, partition_id, table=None): 
+        """Method to atomically replace partition of table with the same partition of staging table."""
+        query = f"ALTER TABLE {self.full_table_name(table)} REPLACE PARTITION ID %(partition)s FROM {self.full_table_name(staging_table)}"
+        return self.run_command(query, parameters={'partition': partition_id})
+
+    def insert_columns(self, columns, column_names, column_types, settings=None, table=None, dedup_token=None): 
+        """Method to insert already parsed typed columns (lists of values) to clickhouse table (table of connector, if table isn't set) in Native format, 
+        so ClickHouse doesn't parse text. column_types are names of ClickHouse types of columns, so table structure isn't queried. dedup_token is the same as in insert_datafile."""
         result = False
         try: 
-            clickhouse_connect.driver.tools.insert_file(self.ch_client,self.table, file, settings=settings, database = self.db, fmt = ClickHouseConnector.FORMAT)
+            with self.client() as client: 
+                client.insert(table or self.table, columns, column_names=column_names, database=self.db, column_type_names=column_types, 
+                              column_oriented=True, settings=ClickHouseConnector.dedup_settings(settings, dedup_token))
             result = True
         finally: 
             return result
@@ -244,7 +437,8 @@ class ClickHouseConnector:
         """Method to insert rows data to clickhouse table"""
         result = False 
         try: 
-            self.ch_client.insert(table, data, database=self.db)
+            with self.client() as client: 
+                client.insert(table, data, database=self.db)
             result = True
         finally: 
             return result 
\ No newline at end of file
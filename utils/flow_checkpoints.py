@@ -0,0 +1,115 @@
+import json
+import time
+from .api_methods import StatusLog
+from .state_utils import CheckpointJournal
+
+
+class CheckpointMixin: 
+    """Mixin of MainFlowWrapper (wrappers.py module) to resume crashed runs from checkpoint journal: Logs API request in progress is recorded 
+    with its downloaded and inserted parts, so the next run reattaches to the request, takes intact downloaded files and skips inserted parts. 
+    Works with properties of flow (checkpoints, sync_key, params, parts, file_parts, staging_load, request_registry, run_id), which are set by MainFlowWrapper. 
+    Nothing is recorded, if checkpoint_journal parameter of global_config is off (checkpoints is None). 
+
+    Constants: 
+        RESUME_OPERATION_DEFAULT_ENDPOINT - str, just to name endpoint for resume of Logs API request of checkpoint journal in log. 
+
+    Methods: 
+        resumable_request(self, params) - returns request_id of not finished request with the same params from checkpoint journal, if Logs API still has it. Otherwise None. 
+        finish_checkpoint(self) - deletes Logs API request and removes its checkpoint journal entry, when request is completely loaded (if checkpoint journal is on). Returns self. 
+    """
+
+    RESUME_OPERATION_DEFAULT_ENDPOINT = '/resume'
+
+    def _checkpoint_key(self, params=None): 
+        """Method to build key of request in checkpoint journal."""
+        params = params if params is not None else self.params
+        return CheckpointJournal.checkpoint_key(self.sync_key, params.get('date1'), params.get('date2'))
+
+    def _journal_entry(self, params): 
+        """Method to get checkpoint journal entry of not finished request for the same dates. Entry of request with other parameters is removed. Returns dict or None."""
+        if self.checkpoints is None: 
+            return None
+        key = self._checkpoint_key(params)
+        entry = self.checkpoints.entry(key)
+        if entry is not None and entry.get('params') != json.loads(json.dumps(params)): 
+            print(f"Request {entry.get('request_id')} of checkpoint journal had other parameters and won't be resumed.")
+            self.checkpoints.finish(key)
+            return None
+        return entry
+
+    def _reattach(self, params, entry, status_request): 
+        """Method to decide by status of journaled request if it can be resumed. Returns request_id or None."""
+        key = self._checkpoint_key(params)
+        if status_request.response_code == self.__class__.DEFAULT_SUCCESS_CODE and status_request.status not in self.__class__.BAD_STATUS_CODES: 
+            if self.request_registry is not None and not self.request_registry.acquire(self.counterId, entry.get('request_id'), self.run_id, params): 
+                print(f"Request {entry.get('request_id')} of checkpoint journal is used by another run and won't be resumed.")
+                return None
+            description = f"Request {entry.get('request_id')} for {params.get('date1')} - {params.get('date2')} was resumed from checkpoint journal. \
+Parts downloaded: {sorted(entry.get('downloaded', {}), key=int)}. Parts loaded into db: {sorted(entry.get('inserted', []))}."
+            self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE, endpoint=self.__class__.RESUME_OPERATION_DEFAULT_ENDPOINT, description=description).write_to_disk_incremental()
+            print(description)
+            return entry.get('request_id')
+        print(f"Request {entry.get('request_id')} of checkpoint journal cannot be resumed. Status: {status_request.status}. Response code: {status_request.response_code}.")
+        self.checkpoints.finish(key)
+        return None
+
+    def resumable_request(self, params): 
+        """Method to find not finished request with the same params in checkpoint journal and to check by StatusLog, that Logs API still has it. 
+        Returns request_id or None."""
+        entry = self._journal_entry(params)
+        if entry is None: 
+            return None
+        time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+        status_request = StatusLog(self.counterId, entry.get('request_id'), self.token, self.logger, session=self.api_session)
+        status_request.send_request()
+        return self._reattach(params, entry, status_request)
+
+    def _start_checkpoint(self, params, request_id): 
+        """Method to record created request in checkpoint journal."""
+        if self.checkpoints is not None: 
+            self.checkpoints.start(self._checkpoint_key(params), request_id, params)
+        return self
+
+    def _journaled_file(self, part): 
+        """Method to get intact file of part downloaded by crashed run from checkpoint journal. Returns path or None."""
+        if self.checkpoints is None: 
+            return None
+        full_file = self.checkpoints.downloaded_file(self._checkpoint_key(), part)
+        if full_file is not None: 
+            print(f"Part {part} was taken from checkpoint journal: {full_file}.")
+            self.file_parts[full_file] = part
+        return full_file
+
+    def _record_download(self, part, full_file): 
+        """Method to remember part of downloaded file and to record it in checkpoint journal. Returns path to the file."""
+        self.file_parts[full_file] = part
+        if self.checkpoints is not None: 
+            self.checkpoints.record_download(self._checkpoint_key(), part, full_file)
+        return full_file
+
+    def _record_insert(self, part): 
+        """Method to record part inserted to database in checkpoint journal."""
+        if self.checkpoints is not None and part is not None: 
+            self.checkpoints.record_insert(self._checkpoint_key(), part)
+        return self
+
+    def _skip_inserted_parts(self): 
+        """Method to exclude parts inserted to database by crashed run from parts to download. 
+        Staging table is re-created by each run, so with staging_load on all the parts are loaded again."""
+        if self.checkpoints is None or self.staging_load: 
+            return self
+        inserted = self.checkpoints.inserted_parts(self._checkpoint_key())
+        if inserted: 
+            self.parts = [part for part in self.parts if part not in inserted]
+            print(f"Parts {sorted(inserted)} were loaded into db by previous run and will be skipped.")
+        return self
+
+    def finish_checkpoint(self): 
+        """Method to delete completely loaded Logs API request and to remove its entry from checkpoint journal. 
+        Entry is removed after dates are marked as synced, so crash in between doesn't lead to loading of the same data twice."""
+        if self.checkpoints is None: 
+            return self
+        self.delete_log()
+        self.checkpoints.finish(self._checkpoint_key())
+        self.file_parts = {}
+        return self
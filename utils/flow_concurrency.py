@@ -0,0 +1,222 @@
+import copy
+import time
+from collections import deque
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+from .routines_utils import FlowException
+from .api_methods import LogList, CreateLog, StatusLog
+
+
+class ConcurrentRequestsMixin: 
+    """Mixin of MainFlowWrapper (wrappers.py module) to keep several Logs API requests (e.g. date shards) in preparation at once: requests in flight 
+    are polled together, processed ones are downloaded concurrently by flows of their own (shallow copies of flow) and loaded to database one by one. 
+    State of each request is kept by LogJob. Works with properties of flow (max_requests_in_flight, load_mode, status_timeout, profiler, files, file_parts), 
+    which are set by MainFlowWrapper. 
+
+    Methods: 
+        run_requests_concurrently(self, date_ranges) - keeps up to max_requests_in_flight Logs API requests in preparation at once, downloads processed ones concurrently 
+                        and loads them one by one. Returns self. 
+    """
+
+    def _activate_job(self, job): 
+        """Method to make job's Logs API request the current one, so download and load methods work with it."""
+        self.params = job.params
+        self.request_id = job.request_id
+        self.log_request = job.log_request
+        self.status_request = job.status_request
+        self.parts = job.status_request.parts
+        self.parts_amount = job.status_request.parts_amount
+        self.files = []
+        return self
+
+    def _abort_jobs(self, jobs, message): 
+        """Method to cancel or clean Logs API requests of jobs in flight (list of jobs is emptied), finish log and raise FlowException with message."""
+        for job in jobs: 
+            if job.request_id is not None: 
+                self.request_id = job.request_id
+                self.delete_log()
+        jobs.clear()
+        self.final_log_record()
+        self.logger.write_to_disk_last_run()
+        self.write_log_to_db()
+        raise FlowException(message)
+
+    def _queue_free_slots(self): 
+        """Method to get amount of free slots in Logs API requests queue of the counter."""
+        requests = self.request_list()
+        if requests is not None: 
+            return max(0, LogList.MAX_REQUESTS_QUEUE - len(requests))
+        return LogList.MAX_REQUESTS_QUEUE
+
+    def _job_flow(self, job): 
+        """Method to create flow of job's Logs API request to download its parts in worker thread: shallow copy of flow, which shares connections, 
+        sessions, logger, metrics and state files with it, but has its own request, parts and files. Returns flow."""
+        job_flow = copy.copy(self)
+        #Stages wrapped by profiler are bound to this flow, so they are wrapped again for the copy. 
+        for stage in self.__class__.PROFILED_STAGES: 
+            job_flow.__dict__.pop(stage, None)
+        if self.profiler is not None: 
+            self.profiler.wrap(job_flow, self.__class__.PROFILED_STAGES)
+        job_flow._activate_job(job)
+        job_flow.file_parts = {}
+        job_flow.partial_parts = set()
+        #Staging table is shared by jobs and is used by loads only, so download failure of job mustn't drop it. 
+        job_flow.load_table = self.ch_credentials.get('table')
+        return job_flow
+
+    def _load_job(self, job, job_flow): 
+        """Method to load parts of job downloaded by its flow (see _job_flow) to database: job becomes the current one and its files are 
+        loaded the same way as in SEQUENTIAL_LOAD_MODE. Returns self."""
+        self._activate_job(job)
+        self.parts = job_flow.parts
+        self.files = job_flow.files
+        self.file_parts.update(job_flow.file_parts)
+        self.prepare_staging()
+        self.write_data_to_db()
+        self.publish_staging()
+        self.mark_synced()
+        return self.finish_checkpoint()
+
+    def _load_downloaded_jobs(self, downloads, timeout): 
+        """Method to wait up to timeout seconds (or till the first download, if timeout is None) for downloads of jobs 
+        and to load downloaded jobs to database one by one. FlowException of download is raised. Returns amount of loaded jobs."""
+        done, _ = futures.wait(downloads, timeout=timeout, return_when=futures.FIRST_COMPLETED)
+        for download in done: 
+            job, job_flow = downloads.pop(download)
+            download.result()
+            self._load_job(job, job_flow)
+        return len(done)
+
+    def _abort_downloads(self, downloads, in_flight): 
+        """Method to stop concurrent processing of jobs after failure: waits for downloads started before, deletes their files and 
+        Logs API requests of jobs still in flight (the ones not deleted by _abort_jobs)."""
+        futures.wait(downloads)
+        for job, job_flow in downloads.values(): 
+            job_flow.delete_files()
+        downloads.clear()
+        for other_job in in_flight: 
+            self.request_id = other_job.request_id
+            self.delete_log()
+        return self
+
+    def run_requests_concurrently(self, date_ranges): 
+        """Method to keep up to max_requests_in_flight Logs API requests in preparation at once. All the requests in flight are polled 
+        together, and the ones processed first are downloaded and loaded to database first, while the rest are still being prepared 
+        on Logs API side. Any failed request cancels the rest of requests in flight and raises FlowException. As in log_status_check, 
+        status checks failed with non-200 response are retried DEFAULT_API_QUERY_RETRIES times per request, unreachable endpoint fails request at once.
+
+        In SEQUENTIAL_LOAD_MODE parts of processed requests are downloaded concurrently (each request by its own flow in worker thread, 
+        parts of all of them by download scheduler with shared rate limit) and downloaded requests are loaded to database one by one, 
+        while requests in flight are still polled. In other load modes requests are downloaded and loaded one by one, as their loads already 
+        go along with downloads.
+
+        Arguments: 
+            date_ranges - list of tuples of str (date1, date2), e.g. result of plan_date_shards method. 
+        """
+        max_in_flight = max(1, min(self.max_requests_in_flight, self._queue_free_slots()))
+        pending = deque(date_ranges)
+        in_flight = []
+        downloads = {}
+        processed = 0
+        schedule = None
+        download_pool = ThreadPoolExecutor(max_workers=max_in_flight) if self.load_mode == self.__class__.SEQUENTIAL_LOAD_MODE else None
+        try: 
+            while pending or in_flight or downloads: 
+                #Let's fill free slots with new requests: 
+                while pending and len(in_flight) < max_in_flight: 
+                    date1, date2 = pending[0]
+                    job = LogJob(self.params, date1, date2)
+                    job.request_id = self.resumable_request(job.params) or self.reusable_request(job.params)
+                    if job.request_id is None: 
+                        time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+                        job.log_request = CreateLog(self.counterId, self.token, self.logger, params=job.params, session=self.api_session)
+                        job.log_request.send_request()
+                        if job.log_request.is_success: 
+                            job.request_id = job.log_request.request_id
+                            self._register_request(job.params, job.request_id)
+                            self._start_checkpoint(job.params, job.request_id)
+                    if job.request_id is not None: 
+                        job.created_at = time.monotonic()
+                        pending.popleft()
+                        in_flight.append(job)
+                        #New request is polled frequently again. Timeout is checked per request.
+                        schedule = self.status_schedule()
+                        print(f"Log request with id: {job.request_id} for {date1} - {date2} is in flight. Requests in flight: {len(in_flight)}.")
+                    elif in_flight or downloads: 
+                        #Probably, quota of queue is exceeded. Let's wait till some request in flight or being downloaded is done. 
+                        break
+                    else: 
+                        self._abort_jobs(in_flight, f"Log creation request for {date1} - {date2} cannot be created for some reason. Please, try later.")
+
+                if not in_flight: 
+                    #Nothing to poll: let's load the next downloaded request.
+                    self._load_downloaded_jobs(downloads, None)
+                    continue
+                #Downloaded requests are loaded while waiting for the next status check. 
+                deadline = time.monotonic() + schedule.next_delay()
+                while downloads and time.monotonic() < deadline: 
+                    self._load_downloaded_jobs(downloads, deadline - time.monotonic())
+                time.sleep(max(0, deadline - time.monotonic()))
+                ready_jobs = []
+                for job in in_flight: 
+                    time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+                    job.status_request = StatusLog(self.counterId, job.request_id, self.token, self.logger, session=self.api_session)
+                    job.status_request.send_request()
+                    if job.status_request.is_success: 
+                        ready_jobs.append(job)
+                    elif job.status_request.response_code == self.__class__.DEFAULT_SUCCESS_CODE and job.status_request.status in self.__class__.BAD_STATUS_CODES: 
+                        self._abort_jobs(in_flight, f"Log {job.request_id} wasn't processed well for some reason. It had status: {job.status_request.status}.")
+                    elif job.status_request.response_code is None: 
+                        self._abort_jobs(in_flight, f"Endpoint of status query {job.status_request.url} is unreachable.")
+                    elif job.status_request.response_code != self.__class__.DEFAULT_SUCCESS_CODE: 
+                        job.failed_checks += 1
+                        if job.failed_checks > self.__class__.DEFAULT_API_QUERY_RETRIES: 
+                            self._abort_jobs(in_flight, f"Status checks of log {job.request_id} failed {job.failed_checks} times. Last response code: {job.status_request.response_code}.")
+                    elif time.monotonic() - job.created_at > self.status_timeout: 
+                        self._abort_jobs(in_flight, f"Log {job.request_id} wasn't cooked for timeout time: {self.status_timeout/60} mins.")
+
+                for job in ready_jobs: 
+                    in_flight.remove(job)
+                    processed += 1
+                    print(f"Log request {job.request_id} for {job.params.get('date1')} - {job.params.get('date2')} is processed. Parts to download: {job.status_request.parts_amount}. Requests done: {processed} of {len(date_ranges)}.")
+                    if download_pool is not None: 
+                        job_flow = self._job_flow(job)
+                        downloads[download_pool.submit(job_flow.log_downloader)] = (job, job_flow)
+                    else: 
+                        self._activate_job(job)
+                        self.download_and_write_data()
+        except FlowException: 
+            self._abort_downloads(downloads, in_flight)
+            raise
+        finally: 
+            if download_pool is not None: 
+                download_pool.shutdown(wait=True)
+        return self
+
+
+class LogJob: 
+    """Class to keep state of one Logs API request of several ones prepared at once by MainFlowWrapper.run_requests_concurrently. 
+
+    Arguments: 
+        params - dict, parameters of Logs API request to copy. 
+        date1 - str, start date of request. 
+        date2 - str, end date of request. 
+
+    Properties: 
+        params - :dict, parameters of Logs API request with job's dates. 
+        request_id - :int or None. Id of created Logs API request. 
+        log_request - :inst of class CreateLog or None. 
+        status_request - :inst of class StatusLog or None. The last status check of request. 
+        created_at - :float or None. Monotonic time of request creation, to check status timeout. 
+        failed_checks - :int. Amount of status checks of request failed with non-200 response, to abort job after DEFAULT_API_QUERY_RETRIES of them. 
+    """
+
+    def __init__(self, params, date1, date2): 
+        self.params = params.copy()
+        self.params['date1'] = date1
+        self.params['date2'] = date2
+        self.request_id = None
+        self.log_request = None
+        self.status_request = None
+        self.created_at = None
+        self.failed_checks = 0
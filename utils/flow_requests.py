@@ -0,0 +1,139 @@
+import time
+from .api_methods import LogList, CleanPendingLog, CleanProcessedLog
+
+
+class RequestQueueMixin: 
+    """Mixin of MainFlowWrapper (wrappers.py module) to manage Logs API queue of counter: cached list of requests, registry of requests created 
+    by this tool with leases of runs using them, clearing of queue and reuse of already prepared requests. Works with properties of flow 
+    (counterId, token, logger, api_session, request_registry, run_id, queue_scope, reuse_requests, listed_requests, listed_at), which are set by MainFlowWrapper. 
+
+    Constants: 
+        REUSE_OPERATION_DEFAULT_ENDPOINT - str, just to name endpoint for reuse of already existing Logs API request in log. 
+        OWN_QUEUE_SCOPE - str, value of clear_api_queue_scope parameter of global_config to delete only requests created by this tool (registry of requests). Default one, 
+                        so requests of other tools and people sharing the counter are never deleted. 
+        ALL_QUEUE_SCOPE - str, value of clear_api_queue_scope parameter of global_config to delete all the requests of Logs API queue of counter (behaviour of previous versions). 
+        REQUEST_LIST_CACHE_SEC - float, seconds list of Logs API requests (LogList) is reused for, unless request is created or deleted by this flow. 
+
+    Methods: 
+        request_list(self, refresh=False) - returns list of requests in Logs API queue of counter (cached for REQUEST_LIST_CACHE_SEC) or None. 
+        clear_api_queue(self) - deletes pending and processed requests created by this tool (or all of them, according to clear_api_queue_scope) in Logs API queue. Returns amount of deleted requests or None. 
+        reusable_request(self, params) - returns request_id of processed (or created) request with the same params in Logs API queue and records it in checkpoint journal, if reuse_prepared_requests is on. Otherwise None. 
+    """
+
+    REUSE_OPERATION_DEFAULT_ENDPOINT = '/reuse'
+    OWN_QUEUE_SCOPE = 'own'
+    ALL_QUEUE_SCOPE = 'all'
+    REQUEST_LIST_CACHE_SEC = 30
+
+    def _cache_request_list(self, log_list): 
+        """Method to cache requests of successful LogList response. Requests absent in Logs API queue are pruned from registry of requests."""
+        if log_list.response_code != self.__class__.DEFAULT_SUCCESS_CODE or log_list.response_body is None: 
+            return None
+        self.listed_requests = log_list.response_body
+        self.listed_at = time.monotonic()
+        if self.request_registry is not None: 
+            self.request_registry.prune(self.counterId, [request.get('request_id') for request in self.listed_requests])
+        return self.listed_requests
+
+    def _cached_request_list(self, refresh=False): 
+        """Method to get cached requests, if cache is fresh. Returns list or None."""
+        if refresh or self.listed_at is None or time.monotonic() - self.listed_at > self.__class__.REQUEST_LIST_CACHE_SEC: 
+            return None
+        return self.listed_requests
+
+    def request_list(self, refresh=False): 
+        """Method to get list of requests in Logs API queue of counter. LogList response is reused for REQUEST_LIST_CACHE_SEC, unless refresh is true. 
+        Returns list of dicts or None if list wasn't obtained."""
+        requests = self._cached_request_list(refresh)
+        if requests is not None: 
+            return requests
+        time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+        log_list = LogList(self.counterId, self.token, self.logger, session=self.api_session)
+        log_list.send_request()
+        return self._cache_request_list(log_list)
+
+    def _register_request(self, params, request_id): 
+        """Method to record request created by this flow in registry of requests (if registry is used)."""
+        if self.request_registry is not None: 
+            self.request_registry.add(self.counterId, request_id, params, self.run_id)
+        self.listed_at = None
+        return self
+
+    def _forget_request(self, request_id): 
+        """Method to remove deleted request from registry of requests (if registry is used)."""
+        if self.request_registry is not None: 
+            self.request_registry.remove(self.counterId, request_id)
+        self.listed_at = None
+        return self
+
+    def _release_request(self, request_id): 
+        """Method to release lease of request by this flow. Returns True if no other live run uses request, so it may be deleted. 
+        Without registry requests aren't leased, so True is returned."""
+        if self.request_registry is None: 
+            return True
+        return self.request_registry.release(self.counterId, request_id, self.run_id)
+
+    def _owned_request(self, request_id): 
+        """Method to check if request may be deleted: it was created by this tool or clear_api_queue_scope allows to delete any request."""
+        return self.queue_scope == self.__class__.ALL_QUEUE_SCOPE or request_id in self.request_registry.owned(self.counterId)
+
+    def _requests_to_clear(self, requests): 
+        """Method to select requests of Logs API queue to delete according to clear_api_queue_scope. Requests used by other live runs 
+        of the tool are never selected. Returns list of dicts."""
+        leased = self.request_registry.leased(self.counterId, self.run_id) if self.request_registry is not None else set()
+        selected = [request for request in requests if request.get('request_id') not in leased]
+        if len(selected) < len(requests): 
+            print(f"{len(requests) - len(selected)} requests in queue are used by other runs and will be kept.")
+        if self.queue_scope == self.__class__.ALL_QUEUE_SCOPE: 
+            return selected
+        owned = self.request_registry.owned(self.counterId)
+        foreign = [request for request in selected if request.get('request_id') not in owned]
+        if foreign: 
+            print(f"{len(foreign)} requests in queue weren't created by this tool and will be kept.")
+        return [request for request in selected if request.get('request_id') in owned]
+
+    def clear_api_queue(self): 
+        """Method to delete pending and processed requests in Logs API queue of counter: only ones created by this tool, 
+        or all of them if clear_api_queue_scope parameter of global_config is all. 
+        Returns amount of deleted requests or None if there was nothing to delete (or list of requests wasn't obtained)."""
+        requests = self.request_list(refresh=True)
+        requests = self._requests_to_clear(requests) if requests is not None else []
+        if len(requests) > 0: 
+            requests_deleted = 0
+            for request in requests:
+                time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+                request_status = request.get('status')
+                request_id = request.get('request_id')
+                if request_status == 'created':
+                    clear_old_request = CleanPendingLog(self.counterId, request_id, self.token, self.logger, session=self.api_session)
+                else:
+                    clear_old_request = CleanProcessedLog(self.counterId, request_id, self.token, self.logger, session=self.api_session)
+                clear_old_request.send_request()
+                if clear_old_request.is_success: 
+                    requests_deleted += 1
+                    self._forget_request(request_id)
+                del clear_old_request
+            print(f"Deleted {requests_deleted} requests in queue.")
+            return requests_deleted
+        return None
+
+    def _reuse(self, params, requests): 
+        """Method to reattach to the first of matching requests of Logs API queue, which isn't used by another live run. Returns request_id or None."""
+        for request in requests: 
+            if not self.request_registry.acquire(self.counterId, request.get('request_id'), self.run_id, params): 
+                print(f"Request {request.get('request_id')} has the same parameters, but it's used by another run and won't be reused.")
+                continue
+            description = f"Request {request.get('request_id')} for {params.get('date1')} - {params.get('date2')} with status {request.get('status')} \
+has the same parameters and was reused instead of creation of new request."
+            self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE, endpoint=self.__class__.REUSE_OPERATION_DEFAULT_ENDPOINT, description=description).write_to_disk_incremental()
+            print(description)
+            self._start_checkpoint(params, request.get('request_id'))
+            return request.get('request_id')
+        return None
+
+    def reusable_request(self, params): 
+        """Method to find processed (or at least created) request with the same params in Logs API queue of counter, e.g. request of crashed 
+        or duplicated run, to download it instead of creation and waiting for new request. Returns request_id or None."""
+        if not self.reuse_requests: 
+            return None
+        return self._reuse(params, LogList.matching_requests(self.request_list(), params))
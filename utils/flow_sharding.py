@@ -0,0 +1,69 @@
+from datetime import datetime
+from datetime import timedelta
+from .api_methods import LogEvaluation
+
+
+class DateShardingMixin: 
+    """Mixin of MainFlowWrapper (wrappers.py module) to load date range of any size: range is split into the largest sub-ranges (shards) Logs API accepts 
+    according to LogEvaluation, and each shard is processed by the flow as separate Logs API request. Works with properties of flow 
+    (params, max_requests_in_flight, counterId, token, logger, api_session), which are set by MainFlowWrapper. 
+
+    Constants: 
+        SHARDING_OPERATION_DEFAULT_ENDPOINT - str, just to name endpoint for splitting of date range into shards in log. 
+
+    Methods: 
+        plan_date_shards(self) - splits date range into the largest sub-ranges Logs API accepts, according to LogEvaluation. Returns list of (date1, date2) tuples. 
+        run_date_shards(self) - evaluates, creates, waits for, downloads and loads Logs API log for each date shard (concurrently, if max_requests_in_flight > 1). Returns self. 
+    """
+
+    SHARDING_OPERATION_DEFAULT_ENDPOINT = '/sharding'
+
+    def plan_date_shards(self): 
+        """Method to split date range of request into the largest sub-ranges Logs API accepts. Uses max_possible_day_quantity 
+        of LogEvaluation response. Clears Logs API queue (if clear_api_queue parameter of global_config allows) in case 
+        not even one day can be requested. Returns list of tuples of str (date1, date2)."""
+        evaluation = LogEvaluation(self.counterId, self.token, self.logger, self.params, session=self.api_session)
+        evaluation.send_request()
+        if not evaluation.is_success and not evaluation.max_possible_day_quantity and self.global_settings.get('clear_api_queue'): 
+            if self.clear_api_queue() is not None: 
+                evaluation.send_request()
+        if not evaluation.is_success and not evaluation.max_possible_day_quantity: 
+            self._raise_flow_failure(f"Request cannot be performed even for one day. Response code: {evaluation.response_code}. Please, reduce params amount.")
+        return self._split_date_range(evaluation)
+
+    def _split_date_range(self, evaluation): 
+        """Method to split date range of params into shards of max_possible_day_quantity days of evaluation (sync or async one). 
+        The whole range is one shard, if evaluation succeeded. Returns list of tuples of str (date1, date2)."""
+        date1, date2 = self.params.get('date1'), self.params.get('date2')
+        if evaluation.is_success: 
+            return [(date1, date2)]
+        max_days = evaluation.max_possible_day_quantity
+        shards = []
+        start = datetime.strptime(date1, "%Y-%m-%d").date()
+        end = datetime.strptime(date2, "%Y-%m-%d").date()
+        while start <= end: 
+            shard_end = min(start + timedelta(days = max_days - 1), end)
+            shards.append((start.strftime("%Y-%m-%d"), shard_end.strftime("%Y-%m-%d")))
+            start = shard_end + timedelta(days = 1)
+        description = f"Date range {date1} - {date2} was split into {len(shards)} shards of up to {max_days} days."
+        self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE, endpoint=self.__class__.SHARDING_OPERATION_DEFAULT_ENDPOINT, description=description).write_to_disk_incremental()
+        print(description)
+        return shards
+
+    def run_date_shards(self): 
+        """Method to download and load data for date range of any size: range is split by plan_date_shards method and 
+        each shard goes through evaluation, log creation, status checks, download and load to database one by one. 
+        If max_requests_in_flight parameter of global_config is more than 1, shards are prepared by Logs API concurrently."""
+        shards = self.plan_date_shards()
+        if self.max_requests_in_flight > 1 and len(shards) > 1: 
+            return self.run_requests_concurrently(shards)
+        for number, (date1, date2) in enumerate(shards): 
+            print(f"Shard {number+1} of {len(shards)}: since {date1} till {date2}.")
+            self.params['date1'] = date1
+            self.params['date2'] = date2
+            self.files = []
+            self.check_log_evaluation()
+            self.create_log_request()
+            self.log_status_check()
+            self.download_and_write_data()
+        return self
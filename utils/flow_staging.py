@@ -0,0 +1,143 @@
+import threading
+from .metrics import stage_metrics
+
+
+class StagingMixin: 
+    """Mixin of MainFlowWrapper (wrappers.py module) to load data through staging table: parts are inserted into staging table created AS the target table, 
+    which is validated by row count and then moved to the target table partition by partition with REPLACE PARTITION. Works with properties of flow 
+    (staging_load, staging_table, staging_date_column, load_table, loaded_rows, ch, ch_credentials, params), which are set by MainFlowWrapper. 
+    Nothing is done, if staging_load parameter of global_config is off. 
+
+    Constants: 
+        STAGING_PARTITIONS - dict, partitions of target tables being replaced by staging load of flows of this process: (table, partition id) -> staging table. 
+                        Guarded by STAGING_PARTITIONS_LOCK. Job which needs partition replaced by another job fails instead of losing its rows. 
+        STAGING_PARTITIONS_LOCK - threading.Lock, lock of STAGING_PARTITIONS. 
+
+    Methods: 
+        prepare_staging(self) - (re)creates staging table and switches inserts to it (if staging_load is on). Returns self. 
+        publish_staging(self) - validates staging table by row count, moves its partitions to the target table by REPLACE PARTITION and drops it (if staging_load is on). Returns self. 
+    """
+
+    STAGING_PARTITIONS_LOCK = threading.Lock()
+    STAGING_PARTITIONS = {}
+
+    def prepare_staging(self): 
+        """Method to (re)create staging table AS the target table and to switch inserts to it."""
+        if not self.staging_load: 
+            return self
+        if self.staging_date_column is None: 
+            self._raise_flow_failure("Staging load needs date column of data table to keep other dates of replaced partitions. Please, set staging_date_column parameter in global_config.json.")
+        if not self.ch.create_staging_table(self.staging_table, self.ch_credentials.get('table')): 
+            self._raise_flow_failure(f"Staging table {self.ch_credentials.get('db')}.{self.staging_table} wasn't created.")
+        self.load_table = self.staging_table
+        self.loaded_rows = 0
+        return self
+
+    def _file_rows(self, file): 
+        """Method to count data rows (without header) of downloaded file. Returns 0 if staging_load is off, as rows aren't validated then."""
+        if not self.staging_load: 
+            return 0
+        with open(file, "rb") as f: 
+            chunks = iter(lambda: f.read(self.chunk_size), b'')
+            if self.compressor is not None: 
+                chunks = self.compressor.decompress_chunks(chunks)
+            rows = sum(chunk.count(b'\n') for chunk in chunks)
+        return max(0, rows - 1)
+
+    def _drop_staging(self): 
+        """Method to drop staging table and to switch inserts back to the target table."""
+        self.load_table = self.ch_credentials.get('table')
+        self.ch.drop_table(self.staging_table)
+        return self
+
+    def _staged_rows_tolerated(self, staged_rows): 
+        """Method to check rows of staging table against rows of loaded parts and bad_data_tolerance_perc, absolute_db_format_errors_tolerance parameters of global_config."""
+        if staged_rows is None: 
+            return False
+        lost_rows = self.loaded_rows - staged_rows
+        return lost_rows <= self.global_settings.get('absolute_db_format_errors_tolerance', 0) \
+            or lost_rows <= self.loaded_rows*self.global_settings.get('bad_data_tolerance_perc', 0)/100
+
+    @stage_metrics('publish')
+    def publish_staging(self): 
+        """Method to validate staging table by row count and to move its partitions to the target table. Rows of other dates of affected partitions 
+        are copied to staging table first, then each partition is replaced atomically by REPLACE PARTITION, so readers never see half-loaded days. 
+
+        REPLACE PARTITION swaps the whole partition (e.g. month of toYYYYMM partition key), so rows inserted into it by anyone else after the copy would be lost. 
+        So publishing is refused (with FlowException, target table isn't changed), if partition is being replaced by another flow of this process 
+        (e.g. job of batch run) or if partition of the target table was written (see partition_versions of connector) while rows were copied. 
+        Writes of other processes between the last check and replace aren't detected: nobody else should write to the same partitions during staging load. 
+        Staging table is dropped in any case. Raises FlowException if validation or replacement fails."""
+        if not self.staging_load or self.load_table != self.staging_table: 
+            return self
+        table = self.ch_credentials.get('table')
+        endpoint = self.__class__.LOAD_TO_DB_OPERATION_DEFAULT_ENDPOINT
+        count = self.ch.query_data(f"SELECT count() FROM {self.ch.full_table_name(self.staging_table)}")
+        staged_rows = count[0][0] if count else None
+        description = f"Rows in staging table {self.staging_table}: {staged_rows}. Rows in loaded parts: {self.loaded_rows}."
+        if not self._staged_rows_tolerated(staged_rows): 
+            self.logger.add_to_log(response=self.__class__.DEFAULT_ERROR_CODE, endpoint=endpoint, description=description).write_to_disk_incremental()
+            self._drop_staging()
+            self._raise_flow_failure(f"Staging table didn't pass validation. {description}\n Staging table was dropped, table {table} wasn't changed.")
+        partitions = self.ch.table_partitions(self.staging_table)
+        if partitions is None: 
+            self._drop_staging()
+            self._raise_flow_failure(f"Partitions of staging table {self.staging_table} weren't obtained. Table {table} wasn't changed.")
+        busy = self._claim_partitions(partitions)
+        if busy: 
+            self._drop_staging()
+            self._raise_flow_failure(f"Partitions {busy} of table {table} are being replaced by another job. Table {table} wasn't changed. \
+                                     Please, load dates of the same partitions one by one.")
+        try: 
+            replaced = self._replace_partitions(partitions)
+        finally: 
+            self._release_partitions(partitions)
+        self._drop_staging()
+        description += f" Partitions replaced in table {table}: {replaced}."
+        self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE, endpoint=endpoint, description=description).write_to_disk_incremental()
+        print(description)
+        return self
+
+    def _replace_partitions(self, partitions): 
+        """Method to copy rows of other dates of partitions to staging table and to replace partitions of the target table. Replacement is refused, 
+        if the target table was written into the partitions while rows were copied. Raises FlowException on failure. Returns list of replaced partitions."""
+        table = self.ch_credentials.get('table')
+        versions = self.ch.partition_versions(partitions, table)
+        if versions is None: 
+            self._drop_staging()
+            self._raise_flow_failure(f"Versions of partitions {partitions} of table {table} weren't obtained. Table {table} wasn't changed.")
+        for partition in partitions: 
+            if not self.ch.backfill_partition(self.staging_table, partition, self.staging_date_column, self.params.get('date1'), self.params.get('date2'), table): 
+                self._drop_staging()
+                self._raise_flow_failure(f"Partition {partition} of table {table} wasn't copied to staging table. Table {table} wasn't changed.")
+        written = self.ch.partition_versions(partitions, table)
+        if written != versions: 
+            self._drop_staging()
+            self._raise_flow_failure(f"Partitions of table {table} were written by another writer during staging load (versions {versions} before copy, {written} after). \
+                                     Table {table} wasn't changed, rows of other writer would be lost by replace. Please, re-run the script when nobody else writes to these partitions.")
+        replaced = []
+        for partition in partitions: 
+            if not self.ch.replace_partition(self.staging_table, partition, table): 
+                self._drop_staging()
+                self._raise_flow_failure(f"Partition {partition} of table {table} wasn't replaced. Partitions replaced before: {replaced}. Please, re-run the script.")
+            replaced.append(partition)
+        return replaced
+
+    def _claim_partitions(self, partitions): 
+        """Method to mark partitions of the target table as being replaced by this flow. Nothing is claimed, if some of them are claimed by another flow. 
+        Returns list of partitions claimed by other flows (empty on success)."""
+        table = self.ch.full_table_name(self.ch_credentials.get('table'))
+        with self.__class__.STAGING_PARTITIONS_LOCK: 
+            busy = [partition for partition in partitions if self.__class__.STAGING_PARTITIONS.get((table, partition), self.staging_table) != self.staging_table]
+            if not busy: 
+                self.__class__.STAGING_PARTITIONS.update({(table, partition): self.staging_table for partition in partitions})
+        return busy
+
+    def _release_partitions(self, partitions): 
+        """Method to unmark partitions of the target table claimed by this flow."""
+        table = self.ch.full_table_name(self.ch_credentials.get('table'))
+        with self.__class__.STAGING_PARTITIONS_LOCK: 
+            for partition in partitions: 
+                if self.__class__.STAGING_PARTITIONS.get((table, partition)) == self.staging_table: 
+                    del self.__class__.STAGING_PARTITIONS[(table, partition)]
+        return self
@@ -1,93 +1,187 @@
 from  datetime import datetime
+from  collections import namedtuple
 from  .routines_utils import UtilsSet
+import atexit
+import threading
+import time
+import weakref
+
+
+#Typed record of log: datetime :datetime, response :int, endpoint :str, description :str. Fields are named as columns of log table.
+LogRecord = namedtuple('LogRecord', ['datetime', 'response', 'endpoint', 'description'])
+
 
 class Logger:
     """Creates a piece of log and then writes it to disk/db.
 
+    Log is kept as list of typed records (LogRecord), so nothing is re-parsed to write log to database. Continuous log-file is opened once and
+    lines are written to it by batches: pending lines are flushed when flush_interval_sec passed since the last flush or FLUSH_LINES lines are pending,
+    on write of last run log, on close and at exit of interpreter. Each flush is one write of whole lines, so several loggers may append to one file.
+
     Arguments: 
         path_continous :str - path for continuous (multi-run) log-file relatively to the current working directory.
         path_last_run :str - path to save last-time log. 
+        flush_interval_sec :float - max seconds between flushes of pending lines to continuous log. FLUSH_INTERVAL_SEC by default. 0 to flush on every write.
+
+    Constants:
+        FLUSH_INTERVAL_SEC - float, default max seconds between flushes.
+        FLUSH_LINES - int, amount of pending lines to flush regardless of time.
+        DATETIME_FORMAT - str, format of datetime in log lines.
+        LOG_TABLE_TYPES - list of str, ClickHouse types of columns of log table (see queries/create_log_table.sql).
+        UNKNOWN_RESPONSE - int, response code to write to database instead of not integer responses (e.g. None of failed request).
 
     Properties: 
-        log :str - end-to-end peace of log during current programm run. 
+        log :str - end-to-end peace of log during current programm run. Built from records on demand.
+        records :list of LogRecord - copy of records of current programm run.
+        _records :list of LogRecord - records of current programm run.
         _path :str - path to save continuous log. 
         _path_last :str - path to save last run log. 
-        _log_line :str - one line of the log. Usually, continuous log is written line by line. 
+        _pending :list of str - lines added to log, but not written to continuous log yet. 
+        _file :file object or None - handle of continuous log-file. Opened on the first flush.
+        _last_flush :float - monotonic time of the last flush.
+        _lock :threading.RLock - lock to add and write lines from several threads (e.g. download workers). 
         utils :inst of class UtilsSet - local utilities object to perform all the necessary operation. Composition. 
-    
+
     Methods: 
-        add_to_log(response :str, endpoint :str, description :str) - adds new line to the log variable. 
-        write_to_disk_incremental(self, classMethod: str) - performs writing operation of _log_line to the continuous log on local disk. 
-        write_to_disk_last_run(self) - writes out last run log to the local disk. 
+        add_to_log(response :str, endpoint :str, description :str) - adds new record to the log.
+        write_to_disk_incremental(self, classMethod: str) - writes pending lines to the continuous log on local disk, if flush is due.
+        flush(self, classMethod: str) - writes all the pending lines to the continuous log right away.
+        write_to_disk_last_run(self) - flushes continuous log and writes out last run log to the local disk.
+        columns(self) - returns records as list of columns (lists of values) in order of log table columns, to insert into database.
+        close(self) - flushes pending lines and closes continuous log-file.
+        close_all(cls) - class method, closes all the existing loggers. Registered to run at exit of interpreter.
     """
 
     TAB_SEP = '\t'
     EOL_SEP = '\n'
+    FLUSH_INTERVAL_SEC = 1.0
+    FLUSH_LINES = 1000
+    DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+    LOG_TABLE_TYPES = ['DateTime', 'Int32', 'String', 'String']
+    UNKNOWN_RESPONSE = 0
+
+    _instances = weakref.WeakSet()
 
-    def __init__(self, path_continous='logs/logs.tsv', path_last_run = None):
+    def __init__(self, path_continous='logs/logs.tsv', path_last_run = None, flush_interval_sec=None):
         self._path = path_continous
         self._path_last = path_last_run
-        self._log = ''
-        self._log_line = ''
+        self.flush_interval_sec = Logger.FLUSH_INTERVAL_SEC if flush_interval_sec is None else flush_interval_sec
+        self._records = []
+        self._pending = []
+        self._file = None
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()
         self.utils = UtilsSet()
+        Logger._instances.add(self)
 
     @property
     def log(self): 
+        #Lines are built from records only when the whole log is needed.
+        with self._lock: 
+            return ''.join(Logger._line(record) for record in self._records)
+
+    @property
+    def records(self):
         #Just getter
-        return self._log
+        with self._lock: 
+            return list(self._records)
 
     @property
     def path(self): 
         #Just getter
         return self._path
 
+    @staticmethod
+    def _line(record):
+        """Method to format record as tsv line of log-file."""
+        return record.datetime.strftime(Logger.DATETIME_FORMAT) + Logger.TAB_SEP + str(record.response) + Logger.TAB_SEP + record.endpoint \
+            + Logger.TAB_SEP + record.description + Logger.EOL_SEP
+
     def add_to_log(self, response=200, endpoint='', description=''):
-        """Method to add line to end-to-end log. Also assigns log line.
-        
+        """Method to add record to end-to-end log.
+
         Arguments: 
             response :int - response http code or special codes to signalize about some errrors.
             endpoint :str - url or special local endpoints. 
             description :str - text description of what happened.
-        
+
         Returns: 
             self (suitable for methods chaining). 
-            _log_line is a tsv row with datetime of the datetime type, int repsonse code, str endpoint and str description (text). The _log is the 
-            cummulative concatanation of _log_lines. 
+            Record is a LogRecord with datetime of the datetime type (seconds precision, as in log table), response code, str endpoint and str description (text).
+            Its tsv line is queued to be written to continuous log.
         """
-        full_response = Logger.TAB_SEP + str(response)
-        full_endpoint = Logger.TAB_SEP + endpoint 
-        full_description = Logger.TAB_SEP + description + Logger.EOL_SEP
-        date_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self._log_line = date_time + full_response + full_endpoint + full_description
-        self._log += self._log_line
+        record = LogRecord(datetime.now().replace(microsecond=0), response, endpoint, description)
+        with self._lock: 
+            self._records.append(record)
+            if self._path is not None: 
+                self._pending.append(Logger._line(record))
         return self 
-    
+
     def write_to_disk_incremental(self, classMethod = 'None'):
-        """Method to make incremental writes to local logfile.
-        
+        """Method to make incremental writes to local logfile. Pending lines are written only if flush is due (see flush_interval_sec and FLUSH_LINES),
+        so frequent calls cost almost nothing.
+
         Arguments: 
             self, works with instance's global variables. Uses _path variable. If it's none - incremental log won't be written. 
             classMethod :str , default None - name of class+method to print, where logger was called. 
-        
+
         Returns: 
             self (suitable for methods chaining)
         """
-        if self._path is not None: 
-            try: 
-                self.utils.write_to_file(self._log_line, self._path)
-            except(OSError, IOError): 
-                print(f"You probably don't have and access to {self._path} or to create this file even in working directory.")
-                print(f"Logline of {classMethod} job wasn't written to disk.")
-            self._log_line = ''
-        return self
-    
+        with self._lock: 
+            if self._pending and (len(self._pending) >= Logger.FLUSH_LINES or time.monotonic() - self._last_flush >= self.flush_interval_sec):
+                self.flush(classMethod)
+        return self 
+
+    def flush(self, classMethod = 'None'):
+        """Method to write all the pending lines to local logfile with one write. File is opened (and its folder is created) once."""
+        with self._lock: 
+            if self._path is not None and self._pending:
+                try: 
+                    if self._file is None:
+                        self.utils.write_to_file('', self._path)
+                        self._file = open(self._path, "a", encoding="utf-8", newline='\n')
+                    self._file.write(''.join(self._pending))
+                    self._file.flush()
+                except(OSError, IOError): 
+                    print(f"You probably don't have and access to {self._path} or to create this file even in working directory.")
+                    print(f"Loglines of {classMethod} job weren't written to disk.")
+            self._pending = []
+            self._last_flush = time.monotonic()
+        return self 
+
     def write_to_disk_last_run(self): 
-        """Method to write last run's log to disk
+        """Method to write last run's log to disk. Continuous log is flushed as well, as last run log is written at the end of run or on failure.
         """
+        self.flush()
         if self._path_last is not None and self._path_last and isinstance(self._path_last, str): 
             try: 
-                self.utils.rewrite_file(self._log, self._path_last)
+                self.utils.rewrite_file(self.log, self._path_last)
                 print(f"Full log of this run has been written.")
             except(OSError, IOError): 
                 print(f"You probably don't have an access to {self._path_last} or to create this file even in working directory.")
-        return self
\ No newline at end of file
+        return self 
+
+    def columns(self):
+        """Method to get records as columns in order of log table columns. Not integer responses are replaced with UNKNOWN_RESPONSE."""
+        records = self.records
+        responses = [record.response if isinstance(record.response, int) else Logger.UNKNOWN_RESPONSE for record in records]
+        return [[record.datetime for record in records], responses, [str(record.endpoint) for record in records], [str(record.description) for record in records]]
+
+    def close(self):
+        """Method to flush pending lines and to close continuous log-file. Logger may be used after close: file is reopened on the next flush."""
+        with self._lock: 
+            self.flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        return self 
+
+    @classmethod
+    def close_all(cls):
+        """Method to flush and close all the existing loggers, so no pending lines are lost at exit."""
+        for logger in list(cls._instances):
+            logger.close()
+
+
+atexit.register(Logger.close_all)
@@ -0,0 +1,303 @@
+import asyncio
+import atexit
+import contextvars
+import copy
+import functools
+import json
+import os
+import threading
+import time
+import weakref
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+#Stages being recorded in current thread or coroutine, so retries of stage performed by recursion are recorded once.
+_ACTIVE_STAGES = contextvars.ContextVar('active_stages', default=frozenset())
+
+
+class MetricsRegistry:
+    """Thread-safe registry of counters, gauges and histograms of flow stages. Metrics are exposed in Prometheus (OpenMetrics compatible) text format:
+    written to textfile for textfile collector of node_exporter and/or served by scrape endpoint. JSON summary of run is written as well.
+    Files are written by export method and at exit of interpreter, so metrics of failed runs aren't lost.
+
+    Arguments:
+        textfile_path :str or None - path of Prometheus textfile. Not written if None.
+        summary_path :str or None - path of JSON summary of run. Not written if None.
+
+    Constants:
+        PREFIX - str, prefix of names of all the metrics.
+        DURATION_BUCKETS - tuple of float, upper bounds (seconds) of buckets of duration histograms.
+        SIZE_BUCKETS - tuple of int, upper bounds (bytes) of buckets of size histograms.
+        METRICS - dict, names of metrics (without prefix) with their types, help texts and buckets (of histograms).
+        HOST - str, default host of scrape endpoint: local one, so metrics aren't exposed to network unless host is set explicitly (metrics_host parameter of global_config).
+
+    Properties:
+        started_at - datetime, time of registry creation (start of run).
+        _values - dict, values of metrics by name and by sorted tuple of labels. Histogram values are dicts with bucket counts, sum, count and max.
+        _lock - threading.Lock, lock to record values from several threads.
+        _server - ThreadingHTTPServer or None, scrape endpoint.
+
+    Methods:
+        inc(self, name, value=1, **labels) - adds value to counter. Returns self.
+        set(self, name, value, **labels) - sets value of gauge. Returns self.
+        observe(self, name, value, **labels) - records value in histogram. Returns self.
+        labeled(self, **labels) - returns LabeledMetrics, view of registry adding labels to every value (e.g. counter and source of flow).
+        render(self) - returns metrics in Prometheus text format.
+        summary(self) - returns dict with JSON summary of run.
+        export(self) - writes textfile and summary (if their paths are set). Returns self.
+        serve(self, port, host=None) - starts scrape endpoint (GET /metrics) in daemon thread, if it isn't started yet. Returns self.
+        stop(self) - stops scrape endpoint. Returns self.
+        export_all(cls) - class method, exports all the existing registries. Registered to run at exit of interpreter.
+    """
+
+    PREFIX = 'logs_api_'
+    DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+    SIZE_BUCKETS = (64*1024, 1024**2, 4*1024**2, 16*1024**2, 64*1024**2, 256*1024**2, 1024**3)
+    METRICS = {
+        'stage_seconds': ('histogram', 'Duration of flow stages (evaluation, create, status_wait, download, load, deletion etc.).', DURATION_BUCKETS),
+        'stage_runs_total': ('counter', 'Flow stages performed, by result (failure means stage raised error).', None),
+        'status_checks_total': ('counter', 'Status checks of Logs API requests, by returned status.', None),
+        'part_download_attempts_total': ('counter', 'Attempts to download parts of Logs API logs, by result.', None),
+        'part_download_retries_total': ('counter', 'Attempts to download parts, which were already attempted before.', None),
+        'part_download_seconds': ('histogram', 'Duration of attempts to download parts, by result.', DURATION_BUCKETS),
+        'part_download_bytes': ('histogram', 'Size of downloaded parts.', SIZE_BUCKETS),
+        'part_download_bytes_total': ('counter', 'Bytes of downloaded parts.', None),
+        'inserts_total': ('counter', 'Inserts of parts to ClickHouse, by result.', None),
+        'insert_seconds': ('histogram', 'Duration of successful inserts of parts.', DURATION_BUCKETS),
+        'insert_bytes_total': ('counter', 'Bytes of inserted parts (as sent to ClickHouse).', None),
+        'insert_rows_total': ('counter', 'Rows of inserted parts.', None),
+        'requests_deleted_total': ('counter', 'Deletions of Logs API requests, by result.', None),
+        'files_deleted_total': ('counter', 'Temporary data files deleted.', None),
+        'run_seconds': ('gauge', 'Duration of the last run of flow.', None),
+        'run_success': ('gauge', '1 if the last run of flow finished successfully, 0 otherwise.', None),
+        'run_finished_timestamp_seconds': ('gauge', 'Unix time of finish of the last run of flow.', None),
+    }
+    HOST = '127.0.0.1'
+
+    _instances = weakref.WeakSet()
+
+    def __init__(self, textfile_path=None, summary_path=None):
+        self.textfile_path = textfile_path
+        self.summary_path = summary_path
+        self.started_at = datetime.now().replace(microsecond=0)
+        self._values = {}
+        self._lock = threading.Lock()
+        self._server = None
+        MetricsRegistry._instances.add(self)
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Method to add value to counter."""
+        with self._lock:
+            values = self._values.setdefault(name, {})
+            key = MetricsRegistry._key(labels)
+            values[key] = values.get(key, 0) + value
+        return self
+
+    def set(self, name, value, **labels):
+        """Method to set value of gauge."""
+        with self._lock:
+            self._values.setdefault(name, {})[MetricsRegistry._key(labels)] = value
+        return self
+
+    def observe(self, name, value, **labels):
+        """Method to record value in histogram: value is counted in the first bucket it fits (cumulative counts are built on render)."""
+        buckets = MetricsRegistry.METRICS[name][2]
+        with self._lock:
+            histogram = self._values.setdefault(name, {}).setdefault(MetricsRegistry._key(labels), {'buckets': [0]*(len(buckets) + 1), 'sum': 0, 'count': 0, 'max': 0})
+            histogram['buckets'][next((number for number, bound in enumerate(buckets) if value <= bound), len(buckets))] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+            histogram['max'] = max(histogram['max'], value)
+        return self
+
+    def labeled(self, **labels):
+        """Method to get view of registry, which adds labels to every recorded value."""
+        return LabeledMetrics(self, labels)
+
+    @staticmethod
+    def _labels_text(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for name, value in pairs)
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self):
+        """Method to build text of metrics in Prometheus exposition format. Only recorded metrics are rendered."""
+        with self._lock:
+            values = copy.deepcopy(self._values)
+        lines = []
+        for name, (metric_type, help_text, buckets) in MetricsRegistry.METRICS.items():
+            if name not in values:
+                continue
+            full_name = MetricsRegistry.PREFIX + name
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for key, value in sorted(values[name].items()):
+                if metric_type != 'histogram':
+                    lines.append(f"{full_name}{MetricsRegistry._labels_text(key)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], value['buckets']):
+                    cumulative += count
+                    lines.append(f"{full_name}_bucket{MetricsRegistry._labels_text(key, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{full_name}_sum{MetricsRegistry._labels_text(key)} {value['sum']}")
+                lines.append(f"{full_name}_count{MetricsRegistry._labels_text(key)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Method to build JSON summary of run: values of counters and gauges, count, sum, average and max of histograms, by labels."""
+        with self._lock:
+            metrics = {}
+            for name, series in self._values.items():
+                metrics[name] = []
+                for key, value in sorted(series.items()):
+                    if isinstance(value, dict):
+                        value = {'count': value['count'], 'sum': round(value['sum'], 3), 'avg': round(value['sum']/value['count'], 3) if value['count'] else 0,
+                                 'max': round(value['max'], 3)}
+                    metrics[name].append({'labels': dict(key), 'value': value})
+        finished_at = datetime.now().replace(microsecond=0)
+        return {'started_at': str(self.started_at), 'finished_at': str(finished_at), 'seconds': (finished_at - self.started_at).total_seconds(), 'metrics': metrics}
+
+    @staticmethod
+    def _write_atomically(text, path):
+        """Method to write file through temporary one, so collectors never read partially written file."""
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    def export(self):
+        """Method to write Prometheus textfile and JSON summary of run."""
+        try:
+            if self.textfile_path:
+                MetricsRegistry._write_atomically(self.render(), self.textfile_path)
+            if self.summary_path:
+                MetricsRegistry._write_atomically(json.dumps(self.summary(), indent=4), self.summary_path)
+        except(OSError, IOError):
+            print(f"You probably don't have an access to {self.textfile_path} or {self.summary_path}. Metrics weren't written to disk.")
+        return self
+
+    def serve(self, port, host=None):
+        """Method to start scrape endpoint. Every path answers with metrics, so both /metrics and / can be scraped."""
+        if self._server is not None:
+            return self
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                data = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        try:
+            self._server = ThreadingHTTPServer((host or MetricsRegistry.HOST, port), Handler)
+        except OSError as error:
+            print(f"Scrape endpoint of metrics wasn't started on port {port}: {error}")
+            return self
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-endpoint', daemon=True).start()
+        print(f"Metrics are served on port {self._server.server_port}.")
+        return self
+
+    def stop(self):
+        """Method to stop scrape endpoint."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        return self
+
+    @classmethod
+    def export_all(cls):
+        """Method to export all the existing registries, so metrics of run are written even if it failed."""
+        for registry in list(cls._instances):
+            registry.export()
+
+
+atexit.register(MetricsRegistry.export_all)
+
+
+class LabeledMetrics:
+    """View of MetricsRegistry, which adds labels (e.g. counter and source of flow) to every recorded value. Several flows of batch run
+    share one registry with their own views.
+
+    Arguments:
+        registry :inst of class MetricsRegistry - registry to record values to.
+        labels :dict - labels to add.
+
+    Methods:
+        inc, set, observe - the same as methods of MetricsRegistry.
+        export(self) - exports registry. Returns self.
+    """
+
+    def __init__(self, registry, labels):
+        self.registry = registry
+        self.labels = labels
+
+    def inc(self, name, value=1, **labels):
+        self.registry.inc(name, value, **self.labels, **labels)
+        return self
+
+    def set(self, name, value, **labels):
+        self.registry.set(name, value, **self.labels, **labels)
+        return self
+
+    def observe(self, name, value, **labels):
+        self.registry.observe(name, value, **self.labels, **labels)
+        return self
+
+    def export(self):
+        self.registry.export()
+        return self
+
+
+class _StageSpan:
+    """Context manager to record duration and result of stage in metrics, unless the same stage is already being recorded in current context."""
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        active = _ACTIVE_STAGES.get()
+        self.token = None if self.stage in active else _ACTIVE_STAGES.set(active | {self.stage})
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.token is not None:
+            _ACTIVE_STAGES.reset(self.token)
+            self.metrics.observe('stage_seconds', time.monotonic() - self.started, stage=self.stage)
+            self.metrics.inc('stage_runs_total', stage=self.stage, result='failure' if exc_type is not None else 'success')
+        return False
+
+
+def stage_metrics(stage):
+    """Decorator of methods (both usual and coroutines) of flow to record duration and result of stage in metrics of instance (self.metrics)."""
+    def decorator(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def measured(self, *args, **kwargs):
+                with _StageSpan(self.metrics, stage):
+                    return await method(self, *args, **kwargs)
+        else:
+            @functools.wraps(method)
+            def measured(self, *args, **kwargs):
+                with _StageSpan(self.metrics, stage):
+                    return method(self, *args, **kwargs)
+        return measured
+    return decorator
@@ -0,0 +1,230 @@
+import asyncio
+import atexit
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from datetime import datetime
+try:
+    import resource
+except ImportError:
+    #There is no resource module on Windows, so max RSS isn't reported there.
+    resource = None
+
+
+#Profiled stages being performed in current thread or coroutine. Nested stages are timed, but only the outermost one is profiled by cProfile.
+_ACTIVE_SPANS = contextvars.ContextVar('active_spans', default=())
+
+
+class StageProfiler:
+    """Profiler of flow stages. Methods of flow instance are wrapped in timing spans: wall and CPU time, max RSS of process and (optionally)
+    cProfile dump and tracemalloc top allocations of each stage. Report (JSON) and cProfile dumps are written next to the last run log:
+    e.g. logs/last_run_profile.json and logs/last_run_profile-write_data_to_db-1.prof for log_last_run_path logs/last_run.log.
+    Report is written by write_report method and at exit of interpreter, so profile of failed run isn't lost.
+
+    cProfile profiles only thread which performs stage (workers of download scheduler and ClickHouse pool aren't profiled, their time is seen as waiting)
+    and only one stage at once (stages of concurrent jobs of batch run, which start while another stage is profiled, are only timed).
+
+    Arguments:
+        last_run_path :str or None - path of last run log (log_last_run_path parameter of global_config). DEFAULT_LAST_RUN_PATH if None.
+        cprofile :bool - flag to dump cProfile stats of each stage. False by default.
+        tracemalloc_top :int - amount of top allocations (by size difference since start of stage) to report for each stage. tracemalloc is off if 0 (default).
+
+    Constants:
+        DEFAULT_LAST_RUN_PATH - str, path of last run log to place files next to, if log_last_run_path isn't set.
+        REPORT_SUFFIX - str, suffix of name of report and dumps (added to name of last run log without extension).
+        TRACEMALLOC_FRAMES - int, frames of traceback stored by tracemalloc for each allocation.
+
+    Properties:
+        prefix - str, path of report and dumps without extension.
+        spans - list of dicts, finished spans: stage, start, wall and CPU seconds, max RSS, traced memory, top allocations and path of cProfile dump.
+        _counts - dict, amount of spans of each stage, to number dumps.
+        _profiling - bool, flag of cProfile profiler being enabled.
+        _lock - threading.Lock, lock to record spans from several threads.
+
+    Methods:
+        span(self, stage) - context manager of timing span of stage.
+        wrap(self, instance, stages) - replaces methods (names in stages) of instance, both usual and coroutine ones, with ones performed in spans. Returns instance.
+        report(self) - returns dict with spans and totals by stage.
+        write_report(self) - writes JSON report. Returns self.
+        write_all(cls) - class method, writes reports of all the existing profilers. Registered to run at exit of interpreter.
+    """
+
+    DEFAULT_LAST_RUN_PATH = 'logs/last_run.log'
+    REPORT_SUFFIX = '_profile'
+    TRACEMALLOC_FRAMES = 5
+
+    _instances = weakref.WeakSet()
+
+    def __init__(self, last_run_path=None, cprofile=False, tracemalloc_top=0):
+        self.prefix = os.path.splitext(last_run_path or self.__class__.DEFAULT_LAST_RUN_PATH)[0] + self.__class__.REPORT_SUFFIX
+        self.cprofile = cprofile
+        self.tracemalloc_top = tracemalloc_top or 0
+        self.started_at = datetime.now().replace(microsecond=0)
+        self.spans = []
+        self._counts = {}
+        self._profiling = False
+        self._lock = threading.Lock()
+        if self.tracemalloc_top and not tracemalloc.is_tracing():
+            tracemalloc.start(self.__class__.TRACEMALLOC_FRAMES)
+        StageProfiler._instances.add(self)
+
+    @staticmethod
+    def _max_rss_mb():
+        """Max RSS of process in MB (ru_maxrss is in KB on Linux)."""
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024, 1) if resource is not None else None
+
+    def _start_profiler(self):
+        """Method to enable cProfile for stage, if no other stage is being profiled. Returns Profile or None."""
+        with self._lock:
+            if not self.cprofile or self._profiling:
+                return None
+            self._profiling = True
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            #Another profiling tool (e.g. debugger or outer cProfile run) is active.
+            self._profiling = False
+            return None
+        return profiler
+
+    def _stop_profiler(self, profiler, stage, number):
+        """Method to disable cProfile of stage and to dump its stats. Returns path of dump."""
+        profiler.disable()
+        self._profiling = False
+        path = f"{self.prefix}-{stage}-{number}.prof"
+        try:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            profiler.dump_stats(path)
+        except(OSError, IOError):
+            print(f"You probably don't have an access to {path}. Profile of stage {stage} wasn't written.")
+            return None
+        return path
+
+    def _top_allocations(self, snapshot):
+        """Method to get top allocations made (and not freed) since start of stage. Returns list of str."""
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')]
+        current = tracemalloc.take_snapshot().filter_traces(filters)
+        return [str(statistic) for statistic in current.compare_to(snapshot.filter_traces(filters), 'lineno')[:self.tracemalloc_top]]
+
+    def span(self, stage):
+        """Method to create context manager of timing span of stage."""
+        return _Span(self, stage)
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def _number(self, stage):
+        with self._lock:
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+            return self._counts[stage]
+
+    def wrap(self, instance, stages):
+        """Method to wrap methods of instance in spans. Methods absent in instance are skipped."""
+        for stage in stages:
+            method = getattr(instance, stage, None)
+            if method is None:
+                continue
+            setattr(instance, stage, self._async_wrapper(stage, method) if asyncio.iscoroutinefunction(method) else self._wrapper(stage, method))
+        return instance
+
+    def _wrapper(self, stage, method):
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+            with self.span(stage):
+                return method(*args, **kwargs)
+        return profiled
+
+    def _async_wrapper(self, stage, method):
+        @functools.wraps(method)
+        async def profiled(*args, **kwargs):
+            with self.span(stage):
+                return await method(*args, **kwargs)
+        return profiled
+
+    def report(self):
+        """Method to build report: all the spans in order of finish and totals (calls, wall and CPU seconds) by stage."""
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for span in spans:
+            total = totals.setdefault(span['stage'], {'calls': 0, 'seconds': 0.0, 'cpu_seconds': 0.0})
+            total['calls'] += 1
+            total['seconds'] = round(total['seconds'] + span['seconds'], 3)
+            total['cpu_seconds'] = round(total['cpu_seconds'] + span['cpu_seconds'], 3)
+        return {'started_at': str(self.started_at), 'written_at': str(datetime.now().replace(microsecond=0)), 'cprofile': self.cprofile,
+                'tracemalloc_top': self.tracemalloc_top, 'max_rss_mb': StageProfiler._max_rss_mb(), 'totals': totals, 'spans': spans}
+
+    def write_report(self):
+        """Method to write JSON report next to the last run log."""
+        path = self.prefix + '.json'
+        try:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.report(), f, indent=4)
+        except(OSError, IOError):
+            print(f"You probably don't have an access to {path}. Profile report wasn't written.")
+        return self
+
+    @classmethod
+    def write_all(cls):
+        """Method to write reports of all the existing profilers."""
+        for profiler in list(cls._instances):
+            profiler.write_report()
+
+
+atexit.register(StageProfiler.write_all)
+
+
+class _Span:
+    """Context manager of timing span of stage. Recursive calls of the same stage (retries) are one span."""
+
+    def __init__(self, profiler, stage):
+        self.profiler = profiler
+        self.stage = stage
+
+    def __enter__(self):
+        active = _ACTIVE_SPANS.get()
+        self.token = None
+        if self.stage in active:
+            return self
+        self.token = _ACTIVE_SPANS.set(active + (self.stage,))
+        self.parent = active[-1] if active else None
+        self.number = self.profiler._number(self.stage)
+        self.snapshot = tracemalloc.take_snapshot() if self.profiler.tracemalloc_top and tracemalloc.is_tracing() else None
+        if self.snapshot is not None and self.parent is None:
+            tracemalloc.reset_peak()
+        self.cprofile = self.profiler._start_profiler() if self.parent is None else None
+        self.started_at = datetime.now()
+        self.started = time.monotonic()
+        self.cpu_started = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.token is None:
+            return False
+        seconds, cpu_seconds = time.monotonic() - self.started, time.thread_time() - self.cpu_started
+        _ACTIVE_SPANS.reset(self.token)
+        span = {'stage': self.stage, 'number': self.number, 'parent': self.parent, 'started_at': self.started_at.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                'seconds': round(seconds, 4), 'cpu_seconds': round(cpu_seconds, 4), 'failed': exc_type is not None, 'max_rss_mb': StageProfiler._max_rss_mb()}
+        if self.cprofile is not None:
+            span['cprofile_path'] = self.profiler._stop_profiler(self.cprofile, self.stage, self.number)
+        if self.snapshot is not None:
+            traced, peak = tracemalloc.get_traced_memory()
+            span['traced_mb'] = round(traced/1024/1024, 2)
+            if self.parent is None:
+                span['peak_traced_mb'] = round(peak/1024/1024, 2)
+            span['top_allocations'] = self.profiler._top_allocations(self.snapshot)
+        self.profiler._record(span)
+        return False
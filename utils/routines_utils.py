@@ -1,5 +1,6 @@
 import os 
 import json
+import hashlib
 
 
 class DatabaseException(Exception): 
@@ -18,12 +19,16 @@ class UtilsSet:
         create_folder(self,dirpath:str) - creates folder in set dirpath if doesn't exist.
         write_to_file(self,content:str,path:str) - writes (appends data) content to file. 
         rewrite_file(self,content:str,path:str) - rewrites file entirely. 
+        write_stream_to_file(self,chunks:iterable,path:str)->:int - writes binary chunks to temporary file and atomically renames it to path. 
         delete_file(self,path:str) - deleteres file if it exists (safely). 
+        file_sha256(self,path:str)->:str - returns hex sha256 checksum of file, read chunk by chunk. 
         read_file(self,path:str)->:blob,:str,:bin - reads file of any type. 
         read_sql_file(self,path:str)->:str - reads and properly formats sql file to use in queries.
         read_json_file(self,path:str)->:dict - reads, parses JSON file and then converts it into Python dict. 
     """
 
+    TEMP_FILE_SUFFIX = '.tmp'
+
     def __init__(self): 
         return None
     
@@ -84,8 +89,38 @@ class UtilsSet:
                         print(f"Directory {dirpath} wasn't created. Probably, you don't have proper permission. Trying to write file to the main directory." )
                         path = filename
             nested_writer()
-        return self 
-    
+        return self
+
+    def write_stream_to_file(self, chunks, path):
+        """Method that writes iterable of binary chunks to temporary file and then atomically renames it to path.
+        Creates directory (folder) if needed. Temporary file is removed if writing fails.
+
+        Arguments:
+            chunks :iterable of bytes - content of file, chunk by chunk.
+            path :str - path to file.
+
+        Returns:
+            written :int - amount of bytes written.
+        """
+        if len(path.split('/')) > 1:
+            dirpath = '/'.join(path.split('/')[:-1:])+'/'
+            if not os.path.isdir(dirpath):
+                self.create_folder(dirpath)
+        temp_path = path + UtilsSet.TEMP_FILE_SUFFIX
+        written = 0
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        written += len(chunk)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return written
+
     def delete_file(self, path):
         """Method that safely deletes file."""
         if os.path.exists(path):
@@ -94,6 +129,14 @@ class UtilsSet:
             print(f"File {path} doesn't exist.")
         return self 
     
+    def file_sha256(self, path, chunk_size=1024*1024): 
+        """Method to calculate sha256 checksum of file without reading it into memory entirely."""
+        checksum = hashlib.sha256()
+        with open(path, "rb") as f: 
+            for chunk in iter(lambda: f.read(chunk_size), b''): 
+                checksum.update(chunk)
+        return checksum.hexdigest()
+
     def read_file(self, path): 
         """Generic method to read file."""
         with open(path, "r") as f: 
@@ -0,0 +1,209 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter. Each request to Logs API takes one token, tokens are refilled with constant rate.
+
+    Arguments:
+        rate :float - amount of tokens refilled per second (requests per second).
+        capacity :int, None - maximum amount of tokens in bucket (burst size). By default equals to rate (but not less than 1).
+
+    Methods:
+        acquire(self) - blocks until token is available and takes it. Returns self.
+        acquire_async(self) - coroutine, waits (without blocking event loop) until token is available and takes it. Returns self.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(self.rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Takes token if available. Returns 0 on success or seconds to wait for the next token."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last)*self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens)/self.rate
+
+    def acquire(self):
+        """Method to take one token from bucket. Sleeps outside of the lock while bucket is empty."""
+        while True:
+            wait = self._take()
+            if not wait:
+                return self
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Coroutine to take one token from bucket. The same bucket can be shared by threads and coroutines."""
+        while True:
+            wait = self._take()
+            if not wait:
+                return self
+            await asyncio.sleep(wait)
+
+
+class QuotaAwareScheduler:
+    """Bounded pool of worker threads to perform Logs API requests concurrently within Metrica's quotas:
+    https://yandex.com/dev/metrika/en/intro/quotas. Every attempt of every task takes a token from the rate limiter,
+    failed tasks are retried inside the pool with exponential backoff and jitter.
+
+    Arguments:
+        workers :int - amount of concurrent workers (parallel requests). Clamped by MAX_PARALLEL_REQUESTS.
+        requests_per_sec :float - rate limit of requests. Clamped by MAX_REQUESTS_PER_SEC.
+        retries :int - amount of attempts for each task.
+        backoff_sec :float - base of exponential backoff between attempts of one task.
+        rate_limiter :inst of class TokenBucket, None - rate limiter to share between several schedulers. Created if None.
+
+    Constants:
+        MAX_PARALLEL_REQUESTS - int, quota of parallel requests to Logs API per user.
+        MAX_REQUESTS_PER_SEC - int, quota of requests per second to Metrica's API from one IP address.
+
+    Methods:
+        run(self, items, task) - performs task(item) for every item in the pool. task returns result (not None) on success,
+                None on failure and may raise OSError/IOError. Returns tuple: dict {item: result} of successful tasks and list of failed items.
+        run_async(self, items, task) - coroutine, the same as run, but task is a coroutine function and tasks are performed on event loop 
+                (not more than workers at once) instead of threads.
+    """
+
+    MAX_PARALLEL_REQUESTS = 3
+    MAX_REQUESTS_PER_SEC = 30
+
+    def __init__(self, workers=3, requests_per_sec=10, retries=3, backoff_sec=0.5, rate_limiter=None):
+        self.workers = max(1, min(int(workers), self.__class__.MAX_PARALLEL_REQUESTS))
+        self.requests_per_sec = max(0.1, min(float(requests_per_sec), self.__class__.MAX_REQUESTS_PER_SEC))
+        self.retries = max(1, int(retries))
+        self.backoff_sec = backoff_sec
+        self.rate_limiter = rate_limiter if rate_limiter is not None else TokenBucket(self.requests_per_sec)
+
+    def _attempt_with_retries(self, task, item):
+        """Performs task for one item up to retries times. Returns result or None."""
+        for attempt in range(self.retries):
+            if attempt > 0:
+                time.sleep(self.backoff_sec*(2**(attempt-1))*(1 + random.random()))
+            self.rate_limiter.acquire()
+            try:
+                result = task(item)
+            except(OSError, IOError) as error:
+                print(f"Attempt {attempt+1} of {self.retries} for {item} failed: {error}")
+                result = None
+            if result is not None:
+                return result
+        return None
+
+    def run(self, items, task):
+        """Method to perform task for all the items concurrently. Order of failed items is the same as in items."""
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {item: pool.submit(self._attempt_with_retries, task, item) for item in items}
+            for item, future in futures.items():
+                result = future.result()
+                if result is not None:
+                    results[item] = result
+        failed = [item for item in items if item not in results]
+        return results, failed
+
+    async def _attempt_with_retries_async(self, task, item, slots):
+        """Coroutine to perform task for one item up to retries times. Returns result or None."""
+        for attempt in range(self.retries):
+            if attempt > 0:
+                await asyncio.sleep(self.backoff_sec*(2**(attempt-1))*(1 + random.random()))
+            async with slots:
+                await self.rate_limiter.acquire_async()
+                try:
+                    result = await task(item)
+                except(OSError, IOError) as error:
+                    print(f"Attempt {attempt+1} of {self.retries} for {item} failed: {error}")
+                    result = None
+            if result is not None:
+                return result
+        return None
+
+    async def run_async(self, items, task):
+        """Coroutine to perform task for all the items concurrently on event loop. Order of failed items is the same as in items."""
+        slots = asyncio.Semaphore(self.workers)
+        outcomes = await asyncio.gather(*(self._attempt_with_retries_async(task, item, slots) for item in items))
+        results = {item: result for item, result in zip(items, outcomes) if result is not None}
+        failed = [item for item in items if item not in results]
+        return results, failed
+
+
+class PollingSchedule:
+    """Adaptive schedule of status checks of Logs API request in preparation. Checks are frequent at first (small logs are picked up
+    within seconds) and then intervals grow exponentially (with jitter) up to max_sec, so large logs take fewer status requests.
+    If expected preparation time is known, the first check is scheduled at it.
+
+    Arguments:
+        initial_sec :float - interval before the first check (and the first interval of backoff).
+        max_sec :float - maximum interval between checks.
+        factor :float - growth factor of intervals.
+        timeout_sec :float, None - total time to wait. No limit if None.
+        expected_sec :float, None - expected preparation time. Used as the first interval if it's more than initial_sec.
+
+    Constants:
+        JITTER - float, maximum relative deviation of interval, so checks of concurrent requests don't happen at once.
+
+    Properties:
+        polls - int, amount of intervals given.
+        elapsed - float, seconds since schedule creation.
+
+    Methods:
+        next_delay(self) - returns seconds to wait before the next check or None if timeout is exceeded.
+        wait(self) - sleeps next_delay seconds. Returns False if timeout is exceeded, otherwise True.
+        wait_async(self) - coroutine, the same as wait, but doesn't block event loop.
+    """
+
+    JITTER = 0.2
+
+    def __init__(self, initial_sec=2, max_sec=30, factor=1.5, timeout_sec=None, expected_sec=None):
+        self.initial_sec = max(0.1, float(initial_sec))
+        self.max_sec = max(self.initial_sec, float(max_sec))
+        self.factor = max(1.0, float(factor))
+        self.timeout_sec = timeout_sec
+        self.expected_sec = expected_sec
+        self.polls = 0
+        self._step = 0
+        self._started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self._started
+
+    def next_delay(self):
+        """Method to get interval before the next check. Interval never exceeds time left till timeout."""
+        remaining = self.timeout_sec - self.elapsed if self.timeout_sec is not None else None
+        if remaining is not None and remaining <= 0:
+            return None
+        if self.polls == 0 and self.expected_sec and self.expected_sec > self.initial_sec:
+            delay = float(self.expected_sec)
+        else:
+            delay = min(self.max_sec, self.initial_sec*self.factor**self._step)
+            self._step += 1
+        delay *= 1 + random.uniform(-self.__class__.JITTER, self.__class__.JITTER)
+        self.polls += 1
+        return min(delay, remaining) if remaining is not None else delay
+
+    def wait(self):
+        """Method to sleep until the next check."""
+        delay = self.next_delay()
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+
+    async def wait_async(self):
+        """Coroutine to sleep until the next check."""
+        delay = self.next_delay()
+        if delay is None:
+            return False
+        await asyncio.sleep(delay)
+        return True
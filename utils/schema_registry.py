@@ -0,0 +1,162 @@
+from clickhouse_connect.driver.binding import quote_identifier
+
+
+class FieldTypeRegistry:
+    """Registry of ClickHouse types and codecs of Logs API fields (ym:s:* of visits and ym:pv:* of hits). Generates DDL of data table for fields of request:
+    CREATE TABLE with sorting key, partition key and codecs, or ALTER TABLE queries to add missing columns to existing table.
+
+    Type of field is looked up in FIELD_TYPES by name without source prefix (and without <attribution> placeholder of attribution dependent fields). Fields of array families (goals, purchases, products etc.) get Array types
+    with element type by suffix of name. Rest of fields are String (LowCardinality(String) for fields with few distinct values).
+
+    Arguments:
+        source :str - source of Logs API, 'visits' or 'hits'.
+        strict_names :bool - True if columns are named as Logs API fields (api_strict_db_table_cols_names parameter of global_config),
+                        otherwise columns are named as fields without source prefix, e.g. visitID. False by default.
+        attribution :str or None - attribution of request (attribution parameter of api_credentials) to name columns of <attribution> fields, if names aren't strict.
+        overrides :dict or None - types of fields (keys are fields, values are ClickHouse types) to use instead of registry ones.
+        column_names :dict or None - names of columns of fields (keys are fields) to use instead of names built by registry, e.g. column_mapping parameter of global_config.
+        replacing :bool - True to create ReplacingMergeTree table (e.g. replacing_data_table parameter of global_config). Only allowed if unique id field 
+                        of source (UNIQUE_KEYS) is requested, so merges collapse only repeated rows of the same visit or hit. False by default (plain MergeTree).
+
+    Constants:
+        SOURCE_PREFIXES - dict, prefixes of fields of sources.
+        ATTRIBUTION_PLACEHOLDER - str, placeholder of attribution in names of attribution dependent fields.
+        FIELD_TYPES - dict, types of fields (names without prefix).
+        ARRAY_FAMILIES - tuple of str, prefixes of names of fields with array values.
+        ARRAY_ELEMENT_SUFFIXES - tuple of tuples (suffix, type), element types of array fields by suffix of name.
+        LOW_CARDINALITY_FIELDS - set of str, String fields with few distinct values.
+        CODECS - dict, codecs of types.
+        DEFAULT_TYPE - str, type of unknown fields.
+        SORTING_KEYS - dict, fields of sorting key of sources (only fields present in request are used).
+        UNIQUE_KEYS - dict, fields, which identify row of sources uniquely. Sorting key of ReplacingMergeTree table must contain it.
+        PARTITION_FIELD - str, date field to partition table by month.
+        ENGINE - str, table engine. Default one.
+        REPLACING_ENGINE - str, table engine, which collapses rows with the same sorting key on merges.
+        TABLE_SETTINGS - str, settings of table. Deduplication window lets insert_deduplication work on not replicated tables.
+
+    Methods:
+        field_name(self, field) - returns name of field without source prefix.
+        column_name(self, field) - returns name of column of field: mapped one (see column_names) or built by registry. Placeholder of attribution is replaced with attribution, if names aren't strict.
+        column_type(self, field) - returns ClickHouse type of field.
+        column_definition(self, field) - returns quoted column definition with type and codec.
+        create_table_query(self, db, table, fields) - returns CREATE TABLE query for list of fields. Raises ValueError if replacing is set, but unique id field isn't requested.
+        migrate_table_queries(self, db, table, fields, existing_columns) - returns list of ALTER TABLE queries to add columns of fields absent in existing_columns.
+    """
+
+    SOURCE_PREFIXES = {'visits': 'ym:s:', 'hits': 'ym:pv:'}
+    ATTRIBUTION_PLACEHOLDER = '<attribution>'
+
+    FIELD_TYPES = {
+        'counterID': 'UInt32', 'visitID': 'UInt64', 'watchID': 'UInt64', 'watchIDs': 'Array(UInt64)', 'clientID': 'UInt64',
+        'counterUserIDHash': 'UInt64', 'date': 'Date', 'dateTime': 'DateTime', 'dateTimeUTC': 'DateTime',
+        'isNewUser': 'UInt8', 'bounce': 'UInt8', 'pageViews': 'Int32', 'visitDuration': 'UInt32', 'clientTimeZone': 'Int16',
+        'regionCountryID': 'UInt32', 'regionCityID': 'UInt32', 'lastDirectClickOrder': 'UInt64', 'lastDirectBannerGroup': 'UInt64',
+        'hasGCLID': 'UInt8', 'cookieEnabled': 'UInt8', 'javascriptEnabled': 'UInt8', 'browserMajorVersion': 'UInt16', 'browserMinorVersion': 'UInt16',
+        'screenFormat': 'UInt16', 'screenColors': 'UInt8', 'screenOrientation': 'UInt8', 'screenWidth': 'UInt16', 'screenHeight': 'UInt16',
+        'physicalScreenWidth': 'UInt16', 'physicalScreenHeight': 'UInt16', 'windowClientWidth': 'UInt16', 'windowClientHeight': 'UInt16',
+        'isPageView': 'UInt8', 'isTurboPage': 'UInt8', 'isTurboApp': 'UInt8', 'iFrame': 'UInt8', 'link': 'UInt8', 'download': 'UInt8',
+        'notBounce': 'UInt8', 'artificial': 'UInt8', 'goalsID': 'Array(UInt32)', 'goalsSerialNumber': 'Array(UInt32)', 'goalsPrice': 'Array(Int64)',
+        'DirectClickOrder': 'UInt64', 'DirectBannerGroup': 'UInt64', 'DirectClickBanner': 'UInt64',
+    }
+
+    ARRAY_FAMILIES = ('goals', 'purchase', 'products', 'impressions', 'promotion', 'offlineCall', 'offlineVisit', 'parsedParamsKey', 'eventsProduct')
+
+    ARRAY_ELEMENT_SUFFIXES = (('DateTime', 'DateTime'), ('EventTime', 'DateTime'), ('Price', 'Float64'), ('Revenue', 'Float64'), ('Tax', 'Float64'),
+                              ('Shipping', 'Float64'), ('Discount', 'Float64'), ('Quantity', 'Int64'), ('Position', 'Int32'), ('Duration', 'UInt32'),
+                              ('Missed', 'UInt8'), ('FirstTimeCaller', 'UInt8'), ('Currency', 'LowCardinality(String)'))
+
+    LOW_CARDINALITY_FIELDS = {
+        'regionCountry', 'regionCity', 'regionArea', 'browser', 'browserEngine', 'browserEngineVersion1', 'browserLanguage', 'browserCountry',
+        'operatingSystem', 'operatingSystemRoot', 'deviceCategory', 'mobilePhone', 'mobilePhoneModel', 'networkType', 'httpError', 'from',
+        'screenOrientationName', 'TrafficSource', 'AdvEngine', 'ReferalSource', 'SearchEngine', 'SearchEngineRoot', 'SocialNetwork',
+        'DirectPlatformType', 'DirectConditionType', 'CurrencyID', 'UTMSource', 'UTMMedium', 'openstatService', 'RecommendationSystem', 'Messenger',
+    }
+
+    CODECS = {'Date': 'CODEC(Delta, ZSTD(1))', 'DateTime': 'CODEC(Delta, ZSTD(1))', 'UInt8': 'CODEC(T64, ZSTD(1))', 'UInt16': 'CODEC(T64, ZSTD(1))',
+              'UInt32': 'CODEC(T64, ZSTD(1))', 'Int16': 'CODEC(T64, ZSTD(1))', 'Int32': 'CODEC(T64, ZSTD(1))', 'UInt64': 'CODEC(ZSTD(1))', 'String': 'CODEC(ZSTD(1))'}
+
+    DEFAULT_TYPE = 'String'
+    SORTING_KEYS = {'visits': ['counterID', 'date', 'clientID', 'visitID'], 'hits': ['counterID', 'date', 'clientID', 'watchID']}
+    UNIQUE_KEYS = {'visits': 'visitID', 'hits': 'watchID'}
+    PARTITION_FIELD = 'date'
+    ENGINE = 'MergeTree()'
+    REPLACING_ENGINE = 'ReplacingMergeTree()'
+    TABLE_SETTINGS = 'non_replicated_deduplication_window = 1000'
+
+    def __init__(self, source, strict_names=False, attribution=None, overrides=None, column_names=None, replacing=False):
+        self.source = source
+        self.attribution = (attribution or '').lower()
+        self.prefix = self.__class__.SOURCE_PREFIXES.get(source, '')
+        self.strict_names = strict_names
+        self.overrides = overrides or {}
+        self.column_names = column_names or {}
+        self.replacing = replacing
+
+    def field_name(self, field):
+        """Method to get name of field without source prefix."""
+        return field[len(self.prefix):] if self.prefix and field.startswith(self.prefix) else field.split(':')[-1]
+
+    def column_name(self, field):
+        """Method to get name of column of field."""
+        if field in self.column_names:
+            return self.column_names[field]
+        if self.strict_names:
+            return field
+        return self.field_name(field).replace(self.__class__.ATTRIBUTION_PLACEHOLDER, self.attribution)
+
+    def column_type(self, field):
+        """Method to get ClickHouse type of field."""
+        if field in self.overrides:
+            return self.overrides[field]
+        name = self.field_name(field).replace(self.__class__.ATTRIBUTION_PLACEHOLDER, '')
+        if name in self.__class__.FIELD_TYPES:
+            return self.__class__.FIELD_TYPES[name]
+        if name.startswith(self.__class__.ARRAY_FAMILIES):
+            element = next((element for suffix, element in self.__class__.ARRAY_ELEMENT_SUFFIXES if name.endswith(suffix)), self.__class__.DEFAULT_TYPE)
+            return f"Array({element})"
+        if name.endswith('DateTime'):
+            return 'DateTime'
+        if name in self.__class__.LOW_CARDINALITY_FIELDS:
+            return f"LowCardinality({self.__class__.DEFAULT_TYPE})"
+        return self.__class__.DEFAULT_TYPE
+
+    def column_definition(self, field):
+        """Method to build column definition: quoted name, type and codec (if any)."""
+        column_type = self.column_type(field)
+        codec = self.__class__.CODECS.get(column_type)
+        if codec is None and column_type.startswith('Array('):
+            codec = self.__class__.CODECS[self.__class__.DEFAULT_TYPE]
+        return f"{quote_identifier(self.column_name(field))} {column_type}" + (f" {codec}" if codec else '')
+
+    def create_table_query(self, db, table, fields):
+        """Method to build CREATE TABLE query of data table for fields. Sorting key consists of SORTING_KEYS fields present in request,
+        table is partitioned by month of PARTITION_FIELD, if it's requested. Table is MergeTree, unless replacing is set. 
+        ReplacingMergeTree keeps one row per sorting key, so it's built only if sorting key contains unique id field (UNIQUE_KEYS) of source: 
+        otherwise merges would drop distinct rows with the same partial key (e.g. all the visits of one day)."""
+        names = {self.field_name(field): field for field in fields}
+        sorting_key = [quote_identifier(self.column_name(names[name])) for name in self.__class__.SORTING_KEYS.get(self.source, []) if name in names]
+        engine = self.__class__.ENGINE
+        if self.replacing: 
+            unique_key = self.__class__.UNIQUE_KEYS.get(self.source)
+            if unique_key not in names: 
+                raise ValueError(f"{self.__class__.REPLACING_ENGINE} table needs {unique_key or 'unique id'} field in request to be in sorting key, otherwise merges drop distinct rows. "
+                                 "Please, add the field to the request or create MergeTree table.")
+            engine = self.__class__.REPLACING_ENGINE
+        columns = ',\n\t'.join(self.column_definition(field) for field in fields)
+        query = f"CREATE TABLE IF NOT EXISTS {quote_identifier(db)}.{quote_identifier(table)}\n(\n\t{columns}\n) ENGINE = {engine}\n"
+        if self.__class__.PARTITION_FIELD in names:
+            query += f"PARTITION BY toYYYYMM({quote_identifier(self.column_name(names[self.__class__.PARTITION_FIELD]))})\n"
+        query += f"ORDER BY ({', '.join(sorting_key)})\n" if sorting_key else "ORDER BY tuple()\n"
+        return query + f"SETTINGS {self.__class__.TABLE_SETTINGS};"
+
+    def migrate_table_queries(self, db, table, fields, existing_columns):
+        """Method to build ALTER TABLE queries to add columns of fields, which are absent in existing_columns (list of column names).
+        Columns are added after the previous field's column to keep order of fields."""
+        queries = []
+        previous = None
+        for field in fields:
+            if self.column_name(field) not in existing_columns:
+                after = f" AFTER {quote_identifier(self.column_name(previous))}" if previous is not None else " FIRST"
+                queries.append(f"ALTER TABLE {quote_identifier(db)}.{quote_identifier(table)} ADD COLUMN IF NOT EXISTS {self.column_definition(field)}{after}")
+            previous = field
+        return queries
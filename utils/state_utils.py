@@ -0,0 +1,410 @@
+import json
+import os
+try:
+    import fcntl
+except ImportError:
+    #There is no fcntl module on Windows, so state files are locked only between threads of one process there.
+    fcntl = None
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from datetime import timedelta
+from .routines_utils import UtilsSet
+
+
+class JsonStateFile:
+    """Base class of local JSON state files. File is re-read before each update and rewritten atomically under the lock,
+    so several flows (threads or jobs of batch run) can share one file. Lock is held both between threads of process and, on POSIX,
+    between processes (exclusive flock of "<path>.lock" file next to the state file), so concurrent runs of main.py don't lose 
+    each other's changes. On Windows only threads of one process are locked. State file is auxiliary: if it cannot be read or written 
+    (e.g. on read-only host), it's reported and the run goes on as if state was empty or wasn't changed.
+
+    Arguments:
+        path :str - path to the state file. Created on the first update.
+        utilset :inst of class UtilsSet, None - utilities to write the file. Created if None.
+
+    Properties:
+        write_failed - bool, true if the file couldn't be written at least once, so it may be behind the changes of this instance.
+
+    Constants:
+        LOCK_SUFFIX - str, suffix of the lock file added to path of the state file.
+
+    Methods:
+        read(self) - returns state (dict). Empty dict if file doesn't exist or cannot be read.
+        update(self, change) - calls change(state) with the current state and writes changed state to the file (if it can be written). Returns result of change.
+    """
+
+    LOCK_SUFFIX = '.lock'
+
+    _lock = threading.RLock()
+    _held = set()
+
+    def __init__(self, path, utilset=None):
+        self.path = path
+        self.utils = utilset if utilset is not None else UtilsSet()
+        self.write_failed = False
+
+    def read(self):
+        """Method to read state."""
+        with JsonStateFile._lock:
+            if not os.path.exists(self.path):
+                return {}
+            try:
+                return self.utils.read_json_file(self.path)
+            except(OSError, IOError):
+                print(f"You probably don't have an access to {self.path}. State file wasn't read.")
+                return {}
+
+    def _lock_file(self):
+        """Method to open and flock the lock file of state. Returns file object (to unlock by closing) or None, if it cannot be locked."""
+        if fcntl is None:
+            return None
+        try:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            lock = open(self.path + self.__class__.LOCK_SUFFIX, 'a')
+        except(OSError, IOError):
+            return None
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        except(OSError, IOError):
+            lock.close()
+            return None
+        return lock
+
+    def update(self, change):
+        """Method to change state and write it to the file atomically."""
+        with JsonStateFile._lock:
+            #Let's lock the file for other processes too: read-modify-replace must not interleave with update of concurrent run.
+            #Nested update (in change) already holds the lock, second flock of the same process would wait for itself.
+            lock = self._lock_file() if self.path not in JsonStateFile._held else None
+            if lock is not None:
+                JsonStateFile._held.add(self.path)
+            try:
+                state = self.read()
+                result = change(state)
+                try:
+                    self.utils.write_stream_to_file([json.dumps(state, indent=4).encode('utf-8')], self.path)
+                except(OSError, IOError):
+                    print(f"You probably don't have an access to {self.path} or to create this file even in working directory. State file wasn't written.")
+                    self.write_failed = True
+                return result
+            finally:
+                if lock is not None:
+                    JsonStateFile._held.discard(self.path)
+                    lock.close()
+
+
+class SyncStateStore(JsonStateFile):
+    """Local JSON store of dates successfully loaded to database, per counter/source/table. Used by incremental sync to find out
+    missing date ranges: nothing is downloaded twice and gaps left by missed runs are filled on the next run.
+
+    State file is a JSON object: keys are sync keys (see sync_key method), values are sorted lists of loaded dates ("%Y-%m-%d").
+    Several jobs (e.g. of batch run) can share one state file. Arguments are the same as JsonStateFile has.
+
+    Constants:
+        DATE_FORMAT - str, format of dates in state file and in Logs API parameters.
+
+    Methods:
+        sync_key(counterId, source, table) - static, returns key of state for counter, source and table.
+        loaded_dates(self, key) - returns set of loaded dates (str) of key.
+        mark_loaded(self, key, date1, date2) - records all the dates since date1 till date2 as loaded. Returns self.
+        missing_ranges(self, key, date1, date2) - returns list of tuples (date1, date2) of contiguous not loaded date ranges within date1 - date2.
+    """
+
+    DATE_FORMAT = "%Y-%m-%d"
+
+    @staticmethod
+    def sync_key(counterId, source, table):
+        """Method to build key of state."""
+        return f"{counterId}/{source}/{table}"
+
+    def _dates(self, date1, date2):
+        start = datetime.strptime(date1, self.__class__.DATE_FORMAT).date()
+        end = datetime.strptime(date2, self.__class__.DATE_FORMAT).date()
+        return [(start + timedelta(days=day)).strftime(self.__class__.DATE_FORMAT) for day in range((end - start).days + 1)]
+
+    def loaded_dates(self, key):
+        """Method to get set of dates loaded for key."""
+        return set(self.read().get(key, []))
+
+    def mark_loaded(self, key, date1, date2):
+        """Method to record dates since date1 till date2 (inclusive) as loaded."""
+        dates = self._dates(date1, date2)
+        def change(state):
+            state[key] = sorted(set(state.get(key, [])) | set(dates))
+        self.update(change)
+        return self
+
+    def missing_ranges(self, key, date1, date2):
+        """Method to get contiguous ranges of not loaded dates since date1 till date2 (inclusive)."""
+        loaded = self.loaded_dates(key)
+        ranges = []
+        for date in self._dates(date1, date2):
+            if date in loaded:
+                continue
+            previous = (datetime.strptime(date, self.__class__.DATE_FORMAT) - timedelta(days=1)).strftime(self.__class__.DATE_FORMAT)
+            if ranges and ranges[-1][1] == previous:
+                ranges[-1] = (ranges[-1][0], date)
+            else:
+                ranges.append((date, date))
+        return ranges
+
+
+class CheckpointJournal(JsonStateFile):
+    """Local JSON journal of Logs API requests in progress, to resume crashed runs. For each request (see checkpoint_key method) 
+    it records request_id, parameters, parts downloaded (path and sha256 checksum of file) and parts inserted to database. 
+    Entry is removed when the request is completely loaded. Arguments are the same as JsonStateFile has.
+
+    Methods:
+        checkpoint_key(sync_key, date1, date2) - static, returns key of entry of request for dates of counter/source/table. 
+        entry(self, key) - returns entry (dict) or None. 
+        start(self, key, request_id, params) - creates entry of new request. Returns self. 
+        record_download(self, key, part, path) - records downloaded part with checksum of its file. Returns self. 
+        record_insert(self, key, part) - records part inserted to database. Returns self. 
+        downloaded_file(self, key, part) - returns path of downloaded file of part, if file exists and its checksum is the same. Otherwise None. 
+        inserted_parts(self, key) - returns set of parts inserted to database. 
+        finish(self, key) - removes entry. Returns self. 
+    """
+
+    @staticmethod
+    def checkpoint_key(sync_key, date1, date2):
+        """Method to build key of entry."""
+        return f"{sync_key}/{date1}/{date2}"
+
+    def entry(self, key):
+        """Method to get entry of request."""
+        return self.read().get(key)
+
+    def start(self, key, request_id, params):
+        """Method to create entry of new request."""
+        def change(state):
+            state[key] = {'request_id': request_id, 'params': params, 'downloaded': {}, 'inserted': []}
+        self.update(change)
+        return self
+
+    def record_download(self, key, part, path):
+        """Method to record downloaded part. Checksum is calculated outside of the lock."""
+        checksum = self.utils.file_sha256(path)
+        def change(state):
+            if key in state:
+                state[key]['downloaded'][str(part)] = {'path': path, 'sha256': checksum}
+        self.update(change)
+        return self
+
+    def record_insert(self, key, part):
+        """Method to record part inserted to database."""
+        def change(state):
+            if key in state and part not in state[key]['inserted']:
+                state[key]['inserted'].append(part)
+        self.update(change)
+        return self
+
+    def downloaded_file(self, key, part):
+        """Method to get valid downloaded file of part."""
+        entry = self.entry(key)
+        downloaded = entry.get('downloaded', {}).get(str(part)) if entry is not None else None
+        if downloaded is None or not os.path.exists(downloaded.get('path')):
+            return None
+        if self.utils.file_sha256(downloaded.get('path')) != downloaded.get('sha256'):
+            print(f"Checksum of {downloaded.get('path')} doesn't match the journal. Part {part} will be downloaded again.")
+            return None
+        return downloaded.get('path')
+
+    def inserted_parts(self, key):
+        """Method to get parts inserted to database."""
+        entry = self.entry(key)
+        return set(entry.get('inserted', [])) if entry is not None else set()
+
+    def finish(self, key):
+        """Method to remove entry of completely loaded (or abandoned) request."""
+        def change(state):
+            state.pop(key, None)
+        self.update(change)
+        return self
+
+
+class RequestRegistry(JsonStateFile):
+    """Local JSON registry of Logs API requests used by this tool, per counter. Each request has leases of runs (flows) using it: created request 
+    is leased by the run which created it, reused request by each run which reattached to it. Request leased by a live run isn't reused 
+    by other runs and is deleted only by the last run releasing it. Lease of run is live while its process is alive (on the same host) 
+    or for LEASE_TTL_SEC since it was acquired (on other host or OS without check of process). 
+    Used to clean Logs API queue selectively: only requests created by the tool are deleted, requests of other tools and people sharing 
+    the counter are kept. Requests absent in Logs API queue (deleted by anyone or cleaned automatically) are pruned. Leases are exclusive between 
+    concurrent runs only as far as updates of the file are locked between them: between processes on POSIX, within one process on Windows. Arguments are the same as JsonStateFile has.
+
+    State file is a JSON object: keys are counters (str), values are objects with request ids (str) in keys and request parameters, 
+    time of creation, flag of request created by the tool and leases (run id: pid, host and acquired_at unix time) in values.
+
+    Constants:
+        LEASE_TTL_SEC - int, seconds lease is live for, if process of run cannot be checked.
+
+    Methods:
+        run_id() - static, returns new unique id of run. 
+        add(self, counterId, request_id, params, run_id) - records request created by the tool and leased by run. Returns self. 
+        acquire(self, counterId, request_id, run_id, params=None) - leases request to run, unless other live run has it. Returns bool. 
+        release(self, counterId, request_id, run_id) - removes lease of run. Returns True if no other live run has request (so it may be deleted). 
+        release_run(self, run_id) - removes all the leases of run. Returns self. 
+        leased(self, counterId, run_id=None) - returns set of ids (int) of requests leased by live runs (other than run_id). 
+        remove(self, counterId, request_id) - removes request. Returns self. 
+        owned(self, counterId) - returns set of ids (int) of requests created by the tool. 
+        prune(self, counterId, request_ids) - keeps only requests with ids in request_ids (ids of requests in Logs API queue). Returns self. 
+    """
+
+    LEASE_TTL_SEC = 24*60*60
+
+    @staticmethod
+    def run_id():
+        """Method to build unique id of run."""
+        return f"{socket.gethostname()}/{os.getpid()}/{uuid.uuid4().hex[:8]}"
+
+    @staticmethod
+    def _lease():
+        return {'pid': os.getpid(), 'host': socket.gethostname(), 'acquired_at': time.time()}
+
+    @classmethod
+    def _is_live(cls, lease):
+        """Method to check if run holding lease is alive."""
+        if lease.get('host') == socket.gethostname() and os.name != 'nt':
+            #Signal 0 only checks process existence (on Windows os.kill terminates process, so TTL is used there).
+            try:
+                os.kill(lease.get('pid'), 0)
+            except ProcessLookupError:
+                return False
+            except (PermissionError, TypeError):
+                pass
+            return True
+        return time.time() - lease.get('acquired_at', 0) < cls.LEASE_TTL_SEC
+
+    def _live_leases(self, request):
+        return {run_id: lease for run_id, lease in request.get('leases', {}).items() if self._is_live(lease)}
+
+    def add(self, counterId, request_id, params, run_id):
+        """Method to record request created by the tool."""
+        def change(state):
+            request = state.setdefault(str(counterId), {}).setdefault(str(request_id), {'params': params, 'created_at': str(datetime.now().replace(microsecond=0))})
+            request['created'] = True
+            request.setdefault('leases', {})[run_id] = self._lease()
+        self.update(change)
+        return self
+
+    def acquire(self, counterId, request_id, run_id, params=None):
+        """Method to lease request (created by anyone) to run. Leases of dead runs are dropped."""
+        def change(state):
+            request = state.setdefault(str(counterId), {}).setdefault(str(request_id), {'params': params, 'created_at': None, 'created': False})
+            request['leases'] = self._live_leases(request)
+            if any(other != run_id for other in request['leases']):
+                return False
+            request['leases'][run_id] = self._lease()
+            return True
+        return self.update(change)
+
+    def release(self, counterId, request_id, run_id):
+        """Method to remove lease of run."""
+        def change(state):
+            request = state.get(str(counterId), {}).get(str(request_id))
+            if request is None:
+                return True
+            request.get('leases', {}).pop(run_id, None)
+            request['leases'] = self._live_leases(request)
+            return len(request['leases']) == 0
+        return self.update(change)
+
+    def release_run(self, run_id):
+        """Method to remove all the leases of run (e.g. when run is finished or failed)."""
+        if not any(run_id in request.get('leases', {}) for requests in self.read().values() for request in requests.values()):
+            return self
+        def change(state):
+            for requests in state.values():
+                for request in requests.values():
+                    request.get('leases', {}).pop(run_id, None)
+        self.update(change)
+        return self
+
+    def leased(self, counterId, run_id=None):
+        """Method to get ids of requests leased by live runs other than run_id."""
+        return {int(request_id) for request_id, request in self.read().get(str(counterId), {}).items() 
+                if any(other != run_id for other in self._live_leases(request))}
+
+    def remove(self, counterId, request_id):
+        """Method to remove request."""
+        def change(state):
+            state.get(str(counterId), {}).pop(str(request_id), None)
+        self.update(change)
+        return self
+
+    def owned(self, counterId):
+        """Method to get ids of requests created by the tool. Entries of previous versions have no created flag and all of them were created by the tool."""
+        return {int(request_id) for request_id, request in self.read().get(str(counterId), {}).items() if request.get('created', True)}
+
+    def prune(self, counterId, request_ids):
+        """Method to remove requests which aren't in Logs API queue anymore."""
+        existing = {str(request_id) for request_id in request_ids}
+        if not set(self.read().get(str(counterId), {})) - existing:
+            return self
+        def change(state):
+            requests = state.get(str(counterId), {})
+            for request_id in [request_id for request_id in requests if request_id not in existing]:
+                requests.pop(request_id)
+        self.update(change)
+        return self
+
+
+class SchemaCache(JsonStateFile):
+    """Local JSON cache of schemas (columns with types) of database tables, so tables are checked on start without full metadata query to database. 
+    Entry of table is fresh for ttl_sec seconds since it was cached and only while metadata_modification_time of table is the same as cached one 
+    (table wasn't dropped, altered or recreated). Then metadata is queried again and entry is replaced. Entries of tables changed by the tool itself 
+    should be removed by invalidate method. If the cache file cannot be written (e.g. on read-only host), no entry is fresh for the rest of the run:
+    removed entry could be still in the file, so schemas are queried from database as without the cache.
+
+    State file is a JSON object: keys are tables ("db.table", see table_key method), values are objects with metadata_modification_time of table, 
+    columns (lists [name, type] in order of columns) and cached_at (unix time).
+
+    Arguments:
+        path :str - path to the state file. Created on the first update.
+        ttl_sec :float - seconds entries are fresh for. 
+        utilset :inst of class UtilsSet, None - utilities to write the file. Created if None.
+
+    Methods:
+        table_key(db, table) - static, returns key of entry of table. 
+        fresh_entry(self, key) - returns entry (dict) cached less than ttl_sec seconds ago or None. Its metadata_modification_time should be compared with the current one. 
+        store(self, key, metadata_modification_time, columns) - caches columns (list of tuples (name, type)) of table. Returns self. 
+        invalidate(self, key) - removes entry of table. Returns self. 
+    """
+
+    def __init__(self, path, ttl_sec, utilset=None):
+        super().__init__(path, utilset)
+        self.ttl_sec = ttl_sec
+
+    @staticmethod
+    def table_key(db, table):
+        """Method to build key of entry."""
+        return f"{db}.{table}"
+
+    def fresh_entry(self, key):
+        """Method to get entry of table, if it isn't expired."""
+        if self.write_failed:
+            return None
+        entry = self.read().get(key)
+        if entry is None or time.time() - entry.get('cached_at', 0) > self.ttl_sec:
+            return None
+        return entry
+
+    def store(self, key, metadata_modification_time, columns):
+        """Method to cache schema of table. Change of metadata_modification_time since previous entry is reported."""
+        def change(state):
+            previous = state.get(key)
+            if previous is not None and previous.get('metadata_modification_time') != metadata_modification_time:
+                print(f"Metadata of table {key} was changed at {metadata_modification_time}. Cached schema was replaced.")
+            state[key] = {'metadata_modification_time': metadata_modification_time, 'columns': [list(column) for column in columns], 'cached_at': time.time()}
+        self.update(change)
+        return self
+
+    def invalidate(self, key):
+        """Method to remove entry of table changed by the tool."""
+        def change(state):
+            state.pop(key, None)
+        self.update(change)
+        return self
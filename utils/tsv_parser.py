@@ -0,0 +1,229 @@
+import ast
+import re
+from datetime import date, datetime
+from decimal import Decimal
+
+
+class TsvColumnParser:
+    """Client-side parser of TSVWithNames data of Logs API into typed columns of ClickHouse table. Data is read from iterable of bytes chunks
+    (local file or HTTP response), split into lines and parsed in batches, so a part is never held in memory entirely. Each batch is a list
+    of columns ready for columnar insert of clickhouse-connect. Rows which cannot be parsed are skipped and reported exactly (line number and reason).
+
+    Fields of header are bound to table columns either by names (if strict_names), by column_mapping or by positions. Fields without table column are dropped,
+    table columns without field get default values. The same binding is used to project TSV data itself (see project method): fields without column
+    are cut off before data is sent to database and header is renamed to column names, so data can be inserted into explicit column list.
+
+    Arguments:
+        table_columns :list of tuples (name, type) - columns of table and their ClickHouse types, e.g. result of query to system.columns.
+        strict_names :bool - True to bind header fields to columns by names, False - by positions. False by default.
+        batch_rows :int - rows in one batch. BATCH_ROWS by default.
+        column_mapping :dict or None - names of table columns (values) of header fields (keys). If set, fields are bound by names: 
+                        by mapping or, if field isn't mapped, by the same name. None by default.
+
+    Constants:
+        BATCH_ROWS - int, default amount of rows in one batch.
+        PROJECTED_CHUNK_SIZE - int, approximate size in bytes of chunks of projected data.
+        NULL - str, TSV representation of NULL.
+        ESCAPES - dict, TSV escape sequences and characters they stand for.
+        DATETIME_FORMAT - str, format of DateTime values.
+
+    Properties:
+        column_names - list of str, names of columns of batches. Set by bind_header.
+        column_types - list of str, ClickHouse types of columns of batches. Set by bind_header.
+        rows - int, amount of rows parsed successfully.
+        bad_rows - list of tuples (line_number, reason) of rows, which weren't parsed.
+
+    Methods:
+        bind_header(self, header) - binds fields of header (list of str) to table columns. Returns self.
+        raw_lines(chunks) - static, generator of lines (bytes, without line break) of iterable of bytes chunks.
+        lines(chunks) - static, generator of lines (str, without line break) of iterable of bytes chunks.
+        project(self, chunks) - binds header of TSVWithNames data of iterable of bytes chunks and returns generator of bytes chunks of data with bound fields only.
+        batches(self, chunks) - generator of batches (lists of columns) of iterable of bytes chunks of TSVWithNames data. Binds header of data.
+        converter(cls, type_name) - class method, returns function to convert TSV field into Python value of ClickHouse type.
+    """
+
+    BATCH_ROWS = 100000
+    PROJECTED_CHUNK_SIZE = 1024*1024
+    NULL = '\\N'
+    ESCAPES = {'b': '\b', 'f': '\f', 'r': '\r', 'n': '\n', 't': '\t', '0': '\0', "'": "'", '\\': '\\'}
+    DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    _ESCAPE_RE = re.compile(r'\\(.)')
+
+    def __init__(self, table_columns, strict_names=False, batch_rows=None, column_mapping=None):
+        self.table_columns = list(table_columns)
+        self.strict_names = strict_names
+        self.column_mapping = column_mapping
+        self.batch_rows = batch_rows or self.__class__.BATCH_ROWS
+        self.column_names = []
+        self.column_types = []
+        self.rows = 0
+        self.bad_rows = []
+        self._indices = []
+        self._converters = []
+        self._fields = 0
+
+    def bind_header(self, header):
+        """Method to bind fields of header to table columns. Fields without table column are dropped."""
+        types = dict(self.table_columns)
+        self._indices, self.column_names, self.column_types = [], [], []
+        for index, field in enumerate(header):
+            if self.column_mapping is not None:
+                name = self.column_mapping.get(field, field)
+                name = name if name in types else None
+            elif self.strict_names:
+                name = field if field in types else None
+            else:
+                name = self.table_columns[index][0] if index < len(self.table_columns) else None
+            if name is None:
+                print(f"Field {field} has no column in table and will be dropped.")
+                continue
+            self._indices.append(index)
+            self.column_names.append(name)
+            self.column_types.append(types[name])
+        self._converters = [self.__class__.converter(type_name) for type_name in self.column_types]
+        self._fields = len(header)
+        return self
+
+    @staticmethod
+    def raw_lines(chunks):
+        """Generator of lines of iterable of bytes chunks. Lines are split by line breaks only, as line breaks inside of TSV fields are escaped."""
+        tail = b''
+        for chunk in chunks:
+            data = tail + chunk
+            lines = data.split(b'\n')
+            tail = lines.pop()
+            yield from lines
+        if tail:
+            yield tail
+
+    @staticmethod
+    def lines(chunks):
+        """Generator of decoded lines of iterable of bytes chunks."""
+        for line in TsvColumnParser.raw_lines(chunks):
+            yield line.decode('utf-8')
+
+    def project(self, chunks):
+        """Method to project TSVWithNames data: header is read and bound right away (so column_names are known before data is sent), 
+        returned generator yields renamed header and rows with bound fields only. Rows with unexpected amount of fields are skipped and reported. 
+        If all the fields are bound in order, rows are passed as is."""
+        lines = self.__class__.raw_lines(chunks)
+        header = next(lines, None)
+        if header is None:
+            return iter(())
+        self.bind_header(header.decode('utf-8').split('\t'))
+        return self._projected(lines)
+
+    def _projected(self, lines):
+        """Generator of projected data of lines following header. Lines are joined into chunks of about PROJECTED_CHUNK_SIZE bytes."""
+        yield ('\t'.join(self.column_names) + '\n').encode('utf-8')
+        passthrough = self._indices == list(range(self._fields))
+        batch, batch_size = [], 0
+        for line_number, line in enumerate(lines, start=2):
+            fields = line.split(b'\t')
+            if len(fields) != self._fields:
+                self.bad_rows.append((line_number, f"Expected {self._fields} fields, got {len(fields)}."))
+                continue
+            line = line if passthrough else b'\t'.join([fields[index] for index in self._indices])
+            batch.append(line)
+            batch_size += len(line) + 1
+            self.rows += 1
+            if batch_size >= self.__class__.PROJECTED_CHUNK_SIZE:
+                yield b'\n'.join(batch) + b'\n'
+                batch, batch_size = [], 0
+        if batch:
+            yield b'\n'.join(batch) + b'\n'
+
+    def batches(self, chunks):
+        """Generator of batches of parsed rows. Each batch is a list of columns (lists of values), in order of column_names."""
+        columns = None
+        batch_size = 0
+        for line_number, line in enumerate(self.__class__.lines(chunks), start=1):
+            if line_number == 1:
+                self.bind_header(line.split('\t'))
+                columns = [[] for name in self.column_names]
+                continue
+            fields = line.split('\t')
+            if len(fields) != self._fields:
+                self.bad_rows.append((line_number, f"Expected {self._fields} fields, got {len(fields)}."))
+                continue
+            try:
+                values = [convert(fields[index]) for index, convert in zip(self._indices, self._converters)]
+            except (ValueError, SyntaxError, ArithmeticError, TypeError) as error:
+                self.bad_rows.append((line_number, f"{type(error).__name__}: {error}"))
+                continue
+            for column, value in zip(columns, values):
+                column.append(value)
+            batch_size += 1
+            self.rows += 1
+            if batch_size >= self.batch_rows:
+                yield columns
+                columns = [[] for name in self.column_names]
+                batch_size = 0
+        if batch_size > 0:
+            yield columns
+
+    @classmethod
+    def unescape(cls, field):
+        """Method to unescape TSV field."""
+        if '\\' not in field:
+            return field
+        return cls._ESCAPE_RE.sub(lambda match: cls.ESCAPES.get(match.group(1), match.group(1)), field)
+
+    @classmethod
+    def converter(cls, type_name):
+        """Method to build function to convert TSV field into Python value of ClickHouse type."""
+        inner = cls._unwrap(type_name, 'LowCardinality')
+        if inner is not None:
+            return cls.converter(inner)
+        inner = cls._unwrap(type_name, 'Nullable')
+        if inner is not None:
+            convert = cls.converter(inner)
+            return lambda field: None if field == cls.NULL else convert(field)
+        inner = cls._unwrap(type_name, 'Array')
+        if inner is not None:
+            convert = cls._literal_converter(inner)
+            #Array literal is TSV-escaped as a whole, so TSV escaping is removed before the literal itself is parsed.
+            return lambda field: [convert(value) for value in ast.literal_eval(cls.unescape(field))]
+        if type_name.startswith(('Int', 'UInt')):
+            return int
+        if type_name.startswith('Float'):
+            return float
+        if type_name.startswith('Decimal'):
+            return Decimal
+        if type_name == 'Bool':
+            return lambda field: field.lower() in ('1', 'true')
+        if type_name.startswith('Date32') or type_name == 'Date':
+            return date.fromisoformat
+        if type_name.startswith('DateTime64'):
+            return datetime.fromisoformat
+        if type_name.startswith('DateTime'):
+            return lambda field: datetime.strptime(field, cls.DATETIME_FORMAT)
+        return cls.unescape
+
+    @classmethod
+    def _literal_converter(cls, type_name):
+        """Method to build function to convert already parsed element of array into Python value of ClickHouse type."""
+        inner = cls._unwrap(type_name, 'LowCardinality') or cls._unwrap(type_name, 'Nullable')
+        if inner is not None:
+            convert = cls._literal_converter(inner)
+            return lambda value: None if value is None else convert(value)
+        inner = cls._unwrap(type_name, 'Array')
+        if inner is not None:
+            convert = cls._literal_converter(inner)
+            return lambda value: [convert(element) for element in value]
+        if type_name == 'Bool':
+            return bool
+        if type_name.startswith(('Int', 'UInt', 'Float', 'Decimal')):
+            return cls.converter(type_name)
+        if type_name.startswith('Date'):
+            convert = cls.converter(type_name)
+            return lambda value: convert(str(value))
+        return lambda value: value if isinstance(value, str) else str(value)
+
+    @staticmethod
+    def _unwrap(type_name, wrapper):
+        """Method to get inner type of wrapper type, e.g. String of Nullable(String). Returns None if type isn't wrapped."""
+        if type_name.startswith(wrapper + '(') and type_name.endswith(')'):
+            return type_name[len(wrapper) + 1:-1]
+        return None
@@ -4,11 +4,33 @@ from .routines_utils import *
 from .logger import Logger
 from .database_utils import ClickHouseConnector
 from .api_methods import * 
+from .scheduler import QuotaAwareScheduler, PollingSchedule
+from .compression_utils import Compressor
+from .state_utils import SyncStateStore, CheckpointJournal, RequestRegistry, SchemaCache
+from .tsv_parser import TsvColumnParser
+from .schema_registry import FieldTypeRegistry
+from .metrics import MetricsRegistry, stage_metrics
+from .profiling import StageProfiler
+from .flow_requests import RequestQueueMixin
+from .flow_checkpoints import CheckpointMixin
+from .flow_staging import StagingMixin
+from .flow_sharding import DateShardingMixin
+from .flow_concurrency import ConcurrentRequestsMixin
+from .async_api_methods import AsyncLogList, AsyncLogEvaluation, AsyncCreateLog, AsyncCleanProcessedLog, AsyncCleanPendingLog, AsyncStatusLog, AsyncDownloadLogPart
+import aiohttp
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
 import time
 
 
-class MainFlowWrapper: 
+class MainFlowWrapper(RequestQueueMixin, CheckpointMixin, StagingMixin, DateShardingMixin, ConcurrentRequestsMixin): 
     """The class to create a flow of the programm. 
+    Parts of the flow are mixed in by mixins of flow_*.py modules: handling of Logs API queue of counter (RequestQueueMixin of flow_requests.py), 
+    checkpoint journal of requests in progress (CheckpointMixin of flow_checkpoints.py), staging load (StagingMixin of flow_staging.py), 
+    sharding of date range (DateShardingMixin of flow_sharding.py), several requests in flight at once (ConcurrentRequestsMixin of flow_concurrency.py). 
 
     Arguments:
         ch_credentials - dict, contains credentials for clickhouse from file configs/ch_credentials.json
@@ -16,6 +38,10 @@ class MainFlowWrapper:
         global_settings - dict, contains global config from file configs/global_config.json
         queries - dict, containts query types in keys and queries in values. 
         utilset - instance of Utilset class, to use utilities via aggregation. 
+        ch - instance of ClickHouseConnector class or None. Connection to share between several jobs of one batch run (see batch.py). New connection is established if None. 
+        checked_tables - dict or None. Cache of table checks to share between several jobs of one batch run. 
+        rate_limiter - instance of TokenBucket class or None. Rate limiter of Logs API requests to share between several jobs of one batch run. 
+        metrics - instance of MetricsRegistry class or None. Registry of metrics to share between several jobs of one batch run. Created from global_config parameters if None. 
     
     Constants: 
         DEFAULT_SUCCESS_CODE - int, to write in log as default success code (used http codes even for non-networking operations). 
@@ -26,7 +52,13 @@ class MainFlowWrapper:
         LOG_TABLE_FIELDS - list of strings. List of strings of the log table headers, to create a log table. 
         DEFAULT_REQUEST_SLEEP - float, value to separate requests in time to meet quota of Logs API: https://yandex.com/dev/metrika/en/intro/quotas.
         DEFAULT_API_QUERY_RETRIES - int, value to re-try API queries and other operations to perform in case of not-successfull results. Log evaluation is exclusion and will be performed only once. 
+        SEQUENTIAL_LOAD_MODE - str, value of load_mode parameter of global_config to download all the parts first and only then load them to database. Default one. 
+        PIPELINE_LOAD_MODE - str, value of load_mode parameter of global_config to load each part to database as soon as it's downloaded. 
+        DIRECT_LOAD_MODE - str, value of load_mode parameter of global_config to pipe each part from Logs API response right to database insert, without local disk. 
+        REQUEST_ATTRIBUTES - list of str, names of properties with Logs API requests objects of current request, deleted with the request. 
         BAD_STATUS_CODES - list of str, statuses mean logs api data cannot be extracted. Source: https://yandex.com/dev/metrika/en/logs/openapi/getLogRequest#logrequest
+        TABLE_CHECK_LOCK - threading.Lock, lock to check tables of several concurrent jobs one by one (to check and create each shared table only once). 
+        PROFILED_STAGES - list of str, names of methods (stages) wrapped in timing spans of profiler, if profile parameter of global_config is true. 
 
     Properties: 
         ch_credentials - :dict with clickhouse credentials from ch_credentials.json config file. 
@@ -35,38 +67,116 @@ class MainFlowWrapper:
         utilset  - :inst of class UtilsSet. Associated utilset for the MainFlowWrapper class' instance. Aggregational alias of globally existing utilset instance. 
         logger - :inst of class Logger. Logger for script flow. Example of composition, as it's created as a part of MainFlowWrapper class' instance. 
         data_path - :str, parsed string of directory to store downloaded datafiles. By default - root directory of the script (where main.py is located). 
-        frequency - :int, seconds to check status of created log praparation process. Parsed from frequency_api_status_check_sec parameter of global_config.json. 
+        stream_download - :bool, if true - parts are streamed by chunks straight to the disk instead of being read into memory. Parsed from stream_download parameter of global_config.json. True by default. 
+        chunk_size - :int, bytes. Size of chunks to stream downloaded parts with. Parsed from download_chunk_size_kb parameter of global_config.json. 
+        api_encoding - :str or None. Encoding to request compressed parts from Logs API with. Set if api_compression parameter of global_config.json is true, reset to None on the first bad compressed response. 
+        data_compression - :str or None. Codec (gzip, lz4 or zstd) to store temporary data files with and to compress inserts to ClickHouse. Parsed from data_compression parameter of global_config.json. 
+        compressor - :inst of class Compressor or None. Compressor for data_compression codec. More in compression_utils.py module. 
+        load_mode - :str, one of SEQUENTIAL_LOAD_MODE, PIPELINE_LOAD_MODE or DIRECT_LOAD_MODE. Parsed from load_mode parameter of global_config.json. 
+        pipeline_max_parts - :int, maximum amount of parts downloaded but not loaded yet in pipeline load mode. Parsed from pipeline_max_parts_on_disk parameter of global_config.json. 
+        max_requests_in_flight - :int, maximum amount of Logs API requests prepared at once. Parsed from max_requests_in_flight parameter of global_config.json, capped by Logs API queue size. 
+        download_scheduler - :inst of class QuotaAwareScheduler. Bounded pool of workers with rate limiter to download parts concurrently. Configured by download_workers and api_requests_per_sec parameters of global_config.json. More in scheduler.py module.
+        api_session - :inst of class ApiSession. Pooled keep-alive HTTP session injected into all the Logs API requests objects. Configured by api_pool_size, api_connect_timeout_sec, 
+                        api_read_timeout_sec and api_http_retries parameters of global_config.json. More in api_methods.py module. 
+        frequency - :int, maximum interval (seconds) between status checks of created log praparation process. Parsed from frequency_api_status_check_sec parameter of global_config.json. 
+        status_initial_sec - :float, interval (seconds) before the first status check. Parsed from status_check_initial_sec parameter of global_config.json. 
+        status_backoff_factor - :float, growth factor of intervals between status checks. Parsed from status_check_backoff_factor parameter of global_config.json. 
+        status_expected_max_sec - :float, expected preparation time (seconds) of the largest log Logs API accepts. Parsed from status_check_expected_max_sec parameter of global_config.json. 
         status_timeout - :int, minutes to wait until timeout will be declared exceeded and script will be finished with an error. Taken from api_status_wait_timeout_min of global_config.json.
         queries - :dict. Dictionary with queries to perform database and tables checks. 
+        schema_cache - :inst of class SchemaCache or None. On-disk cache of schemas of data and log tables (schema_cache_path parameter of global_config.json), 
+                        fresh for schema_cache_ttl_sec seconds. None if schema_cache_ttl_sec is 0. More in state_utils.py module. 
+        metadata - :dict or None. Metadata of database and tables of ch_credentials: database - bool, tables - dict of existing tables with their 
+                        metadata_modification_time and columns (list of tuples (name, type)). Obtained once by table_metadata method. 
         counterId - :int. Id of counter of Yandex.Metrika. Parsed from api_settings dict. 
         token - :str. Parsed from api_settings dict. Authentication token.
         params - :dict. Params dictionary, copy of api_settings without token and counter. 
+        sync_state - :inst of class SyncStateStore or None. Store of loaded dates, set if incremental_sync parameter of global_config.json is true. More in state_utils.py module. 
+        sync_key - :str. Key of counter, source and table in sync state. 
+        checkpoints - :inst of class CheckpointJournal or None. Journal of requests in progress (request_id, downloaded and inserted parts), set if checkpoint_journal parameter 
+                        of global_config.json is true. Crashed run is resumed from it by the next run. More in state_utils.py module. 
+        resumed_request - :bool. Flag of current Logs API request reattached from checkpoint journal (or reused) instead of being created. 
+        reuse_requests - :bool. Flag of reuse of processed or created Logs API request with the same parameters instead of creation of new one. 
+                        Parsed from reuse_prepared_requests parameter of global_config.json. 
+        queue_scope - :str, one of OWN_QUEUE_SCOPE or ALL_QUEUE_SCOPE. Requests deleted by queue clearing. Parsed from clear_api_queue_scope parameter of global_config.json. 
+        request_registry - :inst of class RequestRegistry or None. Registry of Logs API requests created by this tool and of leases of runs using them (request_registry_path parameter 
+                        of global_config.json). Set only if reuse_requests is on or queue_scope is OWN_QUEUE_SCOPE, otherwise nothing is written to it. More in state_utils.py module. 
+        run_id - :str. Unique id of this flow, to lease Logs API requests in registry of requests: request leased by a live run isn't reused by other runs 
+                        and is deleted only by the last run using it. 
+        listed_requests - :list of dicts or None. Cached response_body of LogList (requests in Logs API queue of counter). 
+        listed_at - :float or None. Monotonic time of listed_requests. 
+        file_parts - :dict. Parts of downloaded files (keys are paths), to record inserted parts in checkpoint journal and to build insert deduplication tokens. 
+        partial_parts - :set of int. Parts, streamed inserts of which failed after data was sent to database (in direct load_mode). Such parts aren't retried, 
+                        unless retry is safe: inserts are deduplicated by data table. 
+        staging_load - :bool. Flag of staging load: parts are loaded to staging table, validated and moved to the target table by REPLACE PARTITION. Parsed from staging_load parameter of global_config.json. 
+        staging_table - :str. Name of staging table: table of ch_credentials with staging_table_suffix parameter of global_config.json, counter and source. 
+        staging_date_column - :str or None. Date column of data table, used to keep other dates of replaced partitions. Parsed from staging_date_column parameter of global_config.json 
+                        or taken from date field of Logs API fields, if api_strict_db_table_cols_names is true. 
+        load_table - :str. Table to insert data to: staging table during staging load, table of ch_credentials otherwise. 
+        insert_format - :str, one of TSV_INSERT_FORMAT (ClickHouse parses TSV) or COLUMNAR_INSERT_FORMAT (TSV is parsed into typed columns client-side and inserted in Native format). 
+                        Parsed from insert_format parameter of global_config.json. 
+        table_columns - :list of tuples (name, type) or None. Columns of data table. Obtained by check_db_tables or on the first columnar insert. 
+        column_projection - :bool. Flag of column projection: header of each part is mapped to columns of data table, fields without column are cut off before insert 
+                        and data is inserted into explicit list of columns. Parsed from column_projection parameter of global_config.json. 
+        column_mapping - :dict or None. Columns of Logs API fields for column projection (column_mapping parameter of global_config.json and names of schema registry). Built on first use. 
+        ch_pool_size - :int. Amount of ClickHouse clients in pool and of parts inserted at once. Parsed from ch_pool_size parameter of global_config.json. 
+        metrics_registry - :inst of class MetricsRegistry. Counters and histograms of stages, parts downloads and inserts, exported to Prometheus textfile (metrics_textfile_path), 
+                        JSON summary (metrics_summary_path) and scrape endpoint (metrics_port and metrics_host parameters of global_config.json). More in metrics.py module. 
+        metrics - :inst of class LabeledMetrics. View of metrics_registry, which labels all the values of this flow with counter, source and table. 
+        started - :float. Monotonic time of flow creation, to measure duration of run. 
+        attempted_parts - :set of tuples (request_id, part). Parts attempted to download, to count retries of downloads. 
+        profiler - :inst of class StageProfiler or None. Profiler of PROFILED_STAGES (timing spans, cProfile dumps and tracemalloc top allocations), set if profile parameter 
+                        of global_config.json is true. Configured by profile_cprofile and profile_tracemalloc_top parameters, writes report next to log_last_run_path. More in profiling.py module. 
+        loaded_rows - :int. Rows of parts inserted to staging table, to validate staging table by row count. 
+        insert_deduplication - :bool. Flag of idempotent inserts: each part is inserted with deterministic insert_deduplication_token, so retries and resumed runs 
+                        never duplicate data. Parsed from insert_deduplication parameter of global_config.json. 
+        deduplication_effective - :bool or None. Flag, that data table takes insert_deduplication_token into account (Replicated*MergeTree engine or 
+                        non_replicated_deduplication_window > 0). Set by check_db_tables if insert_deduplication is on, None if it wasn't checked. 
         is_log_table - :bool. Flag of successfull existance of log table (table to write a log of this script). 
         files - :list of str. List of files downloaded locally. 
-        ch - :inst of class ClickHouseConnector. Compositional instance of class. More in api_methods.py module. 
+        ch - :inst of class ClickHouseConnector. Compositional instance of class (or aggregational one, if passed to init). More in database_utils.py module. 
+        owns_connection - :bool. True if ch connection was established by this instance, so it's closed by close_and_finish. 
+        checked_tables - :dict. Keys are "db.table" strings of checked tables, values - results of checks. 
         log_evaluation :inst of class LogEvaluation. Compostitional instance of class. More in api_mehods.py module. 
         log_request :inst of class LogRequest. Composititonal instance of class. More in api_mehods.py module.
         deletion :inst of either class CleanPendingLog or CleanProcessedLog deletes other instances of other API Logs classes. Composititonal instance of class. More in api_mehods.py module.
         status_request :inst of class StatusLog. Composititonal instance of class. More in api_mehods.py module.
         parts - :list of ints. List of parts to download. Obtained from status_request. 
         parts_amount - :int. Parts to download. Obtained from status_request. 
-        download_log_part - :inst of class DownloadLogPart. Composititonal instance of class. More in api_mehods.py module.
 
     Methods: 
         dates_parameters_normalization(self) - creates or transforms start and end dates if abscent. Runs on init. 
         establish_db_connections(self)  - creates (if needed) ssh tunnel and db connection. Currently only login + password auth for ssh is working and only http protocol for db. Runs on init. Returns self.
-        check_db_tables(self) - if there is parameter run_db_table_test=true in global log - checks if db table from ch credentials exists. The same for log table and run_log_table_test param. Runs on init. Returns self.
-        check_log_evaluation(self) - safely creates, sends and then checks Logs API log evaluation possibility request. If fails: raises FlowException error. Returns self.
-        create_log_request(self,repeat=0) - safely creates and checks Logs API log creation request. If fails, will be repeated DEFAULT_API_QUERY_RETRIES times. Returns self.
-        delete_log(self,repeat=0) - safely deletes all the instances of Logs requests objects and deletes either Log in processing or processed Log.  If fails, will be repeated DEFAULT_API_QUERY_RETRIES times. Returns self.
-        log_status_check(self,repeat=0) - safely checks if Logs API log request is prepared or not. If yes, checks it's status and can either delete it or continue script execution. Returns self. 
-        log_downloader(self, repeat=0) - safely iterationally downloads and saves Logs API data to the local directory specified in temporary_data_path param of global_config. Repeats if fails. Returns self. 
+        check_db_tables(self) - if there is parameter run_db_table_test=true in global log - checks if db table from ch credentials exists. The same for log table and run_log_table_test param. 
+                        Tables found in checked_tables aren't checked again. Runs on init. Returns self.
+                        Creates data table (create_data_table_on_fail) or adds missing columns to it (migrate_data_table), if these global_config parameters are set. 
+        table_metadata(self, refresh=False) - returns metadata of database, data table and log table: from schema cache, if tables are cached there and 
+                        their metadata_modification_time (tables_modification_query) wasn't changed, otherwise by one query to system tables (metadata_query). None if query wasn't performed. 
+        schema_registry(self) - returns FieldTypeRegistry of source with types of field_types parameter of global_config. 
+        create_data_table(self, api_fields) - creates data table for fields with types, codecs, sorting and partition keys of schema registry. Returns True if created. 
+        migrate_data_table(self, api_fields, ch_cols_list) - adds columns of fields absent in data table. Returns list of columns of table after migration. 
+        check_log_evaluation(self) - reattaches to not finished request of checkpoint journal or to request with the same params in Logs API queue, if any. 
+                        Otherwise safely creates, sends and then checks Logs API log evaluation possibility request. If fails: raises FlowException error. Returns self.
+        create_log_request(self,repeat=0) - safely creates and checks Logs API log creation request (unless request was resumed) and records it in checkpoint journal. If fails, will be repeated DEFAULT_API_QUERY_RETRIES times. Returns self.
+        delete_log(self,repeat=0) - safely deletes all the instances of Logs requests objects, releases lease of request and deletes either Log in processing or processed Log 
+                        (unless another live run still uses it or it wasn't created by this tool and clear_api_queue_scope is own).  If fails, will be repeated DEFAULT_API_QUERY_RETRIES times. Returns self.
+        status_schedule(self, timeout_sec=None, expected_sec=None) - creates adaptive schedule of status checks (PollingSchedule of scheduler.py module). 
+        log_status_check(self) - safely checks if Logs API log request is prepared or not by adaptive schedule. If yes, checks it's status and can either delete it or continue script execution. Returns self. 
+        log_downloader(self) - safely concurrently downloads and saves Logs API data to the local directory specified in temporary_data_path param of global_config. Failed parts are retried with backoff inside of download scheduler. Returns self. 
+        download_and_write_data(self) - downloads Logs API data and loads it to database according to load_mode parameter of global_config. Marks dates as synced and finishes checkpoint. Returns self. 
+        mark_synced(self) - records dates of current request as loaded in sync state (if incremental sync is on and no parts were lost). Returns self. 
+        missing_date_ranges(self) - returns list of tuples (date1, date2) of not loaded yet date ranges of request according to sync state. 
+        run_incremental_sync(self) - evaluates, creates, waits for, downloads and loads Logs API logs only for missing date ranges. Returns self. 
+        pipeline_download_and_load(self) - downloads parts and loads each of them to database as soon as it's downloaded, in producer/consumer pipeline with bounded queue. Returns self. 
+        direct_download_and_load(self) - streams each part from Logs API right into database insert, without writing it to the local disk. Returns self. 
         write_data_to_db(self, repeat=0, file_list=None) - file_list: list of str, None - if not None, determines files to load. Safely iterationally loads localy saved tsv data files of Logs API to clickhouse table. 
                         Repeats with file_list to repeat if fails. Calls delete_files method to delete successfully loaded temporary data. Returns self. 
         delete_files(self, exclusion_list=None) - safely tries to delete all the downloaded data files. exclusion_list :list of str determines files to exclude from deletion. Returns self. 
         write_log_to_db(self) - safely tries to load service log (log of the script run) to the table determined by logTable parameter of ch_credentials. Returns self. 
         final_log_record(self, success=False) - sucess: bool, False by default. Creates the final log record with /finish endpoint, just to parse then easily to find out needed script run results. 
-        close_and_finish(self) - writes the last record of the service log(log of the script run), saves log to db and locally (last run log) and closes connections with successfull message. Returns self.  
+                        Sets duration and result of run in metrics and exports them (Prometheus textfile, JSON summary). Writes profile report, if profiler is on. 
+                        Releases leases of Logs API requests of run. 
+        close_and_finish(self) - writes the last record of the service log(log of the script run), saves log to db and locally (last run log) and closes Logs API session and connections (if owns them) with successfull message. Returns self.  
     """
 
     DEFAULT_SUCCESS_CODE = 200 
@@ -78,34 +188,122 @@ class MainFlowWrapper:
 
     LOG_TABLE_FIELDS = ['datetime', 'response', 'endpoint', 'description']
 
+    SEQUENTIAL_LOAD_MODE = 'sequential'
+    PIPELINE_LOAD_MODE = 'pipeline'
+    DIRECT_LOAD_MODE = 'direct'
+
+    TSV_INSERT_FORMAT = 'tsv'
+    COLUMNAR_INSERT_FORMAT = 'columnar'
+    BAD_ROWS_TO_LOG = 10
+
     DEFAULT_REQUEST_SLEEP = 0.5
     DEFAULT_API_QUERY_RETRIES = 3
+    REQUEST_ATTRIBUTES = ['log_evaluation', 'log_request', 'status_request']
     BAD_STATUS_CODES = ['canceled', 'cleaned_by_user', 'cleaned_automatically_as_too_old', 'processing_failed', 'awaiting_retry']
+    TABLE_CHECK_LOCK = threading.Lock()
+    PROFILED_STAGES = ['establish_db_connections', 'check_db_tables', 'check_log_evaluation', 'create_log_request', 'log_status_check', 'log_downloader', 
+                       'pipeline_download_and_load', 'direct_download_and_load', 'write_data_to_db', 'publish_staging', 'delete_log', 'write_log_to_db', 'close_and_finish', 
+                       'check_log_evaluation_async', 'create_log_request_async', 'log_status_check_async', 'log_downloader_async', 'delete_log_async']
     
-    def __init__(self, ch_credentials, api_settings, global_settings, queries, utilset):
+    def __init__(self, ch_credentials, api_settings, global_settings, queries, utilset, ch=None, checked_tables=None, rate_limiter=None, metrics=None):
         self.ch_credentials = ch_credentials
         self.api_settings = api_settings
         self.global_settings = global_settings
         self.utilset = utilset
-        self.logger = Logger(self.global_settings.get('log_continuous_path'), self.global_settings.get('log_last_run_path'))
+        self.logger = Logger(self.global_settings.get('log_continuous_path'), self.global_settings.get('log_last_run_path'), self.global_settings.get('log_flush_interval_sec'))
         self.data_path = self.global_settings.get('temporary_data_path', '')
+        self.stream_download = self.global_settings.get('stream_download', True)
+        self.chunk_size = self.global_settings.get('download_chunk_size_kb', DownloadLogPart.CHUNK_SIZE//1024)*1024
+        self.api_encoding = DownloadLogPart.ENCODING if self.global_settings.get('api_compression') else None
+        self.data_compression = self.global_settings.get('data_compression')
+        self.compressor = Compressor(self.data_compression) if self.data_compression else None
+        self.load_mode = self.global_settings.get('load_mode', self.__class__.SEQUENTIAL_LOAD_MODE)
+        self.pipeline_max_parts = max(1, self.global_settings.get('pipeline_max_parts_on_disk', 2))
+        self.max_requests_in_flight = min(self.global_settings.get('max_requests_in_flight', 1), LogList.MAX_REQUESTS_QUEUE)
+        self.download_scheduler = QuotaAwareScheduler(self.global_settings.get('download_workers', QuotaAwareScheduler.MAX_PARALLEL_REQUESTS), 
+                                                       self.global_settings.get('api_requests_per_sec', 1/self.__class__.DEFAULT_REQUEST_SLEEP), 
+                                                       self.__class__.DEFAULT_API_QUERY_RETRIES, self.__class__.DEFAULT_REQUEST_SLEEP, rate_limiter)
+        self.api_session = ApiSession(self.global_settings.get('api_pool_size', ApiSession.POOL_SIZE), 
+                                      self.global_settings.get('api_http_retries', self.__class__.DEFAULT_API_QUERY_RETRIES), self.__class__.DEFAULT_REQUEST_SLEEP, 
+                                      self.global_settings.get('api_connect_timeout_sec', ApiSession.CONNECT_TIMEOUT), 
+                                      self.global_settings.get('api_read_timeout_sec', ApiSession.READ_TIMEOUT))
         self.frequency = self.global_settings.get('frequency_api_status_check_sec')
+        self.status_initial_sec = self.global_settings.get('status_check_initial_sec', 2)
+        self.status_backoff_factor = self.global_settings.get('status_check_backoff_factor', 1.5)
+        self.status_expected_max_sec = self.global_settings.get('status_check_expected_max_sec', 120)
         self.status_timeout = self.global_settings.get('api_status_wait_timeout_min')*60
         self.queries = queries
+        self.schema_cache = SchemaCache(self.global_settings.get('schema_cache_path', 'state/schema_cache.json'), self.global_settings.get('schema_cache_ttl_sec'), 
+                                        self.utilset) if self.global_settings.get('schema_cache_ttl_sec') else None
+        self.metadata = None
         self.counterId = self.api_settings.get('counter')
         self.token = self.api_settings.get('token')
         self.params = api_settings.copy()
         self.params.pop('token', None)
         self.params.pop('counter', None)
-        #Let's call connection establishing from the start. 
-        self.establish_db_connections()
+        self.sync_state = SyncStateStore(self.global_settings.get('sync_state_path', 'state/sync_state.json'), self.utilset) if self.global_settings.get('incremental_sync') else None
+        self.sync_key = SyncStateStore.sync_key(self.counterId, self.api_settings.get('source'), f"{self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}")
+        self.checkpoints = CheckpointJournal(self.global_settings.get('checkpoint_path', 'state/checkpoint.json'), self.utilset) if self.global_settings.get('checkpoint_journal') else None
+        self.resumed_request = False
+        self.reuse_requests = self.global_settings.get('reuse_prepared_requests', False)
+        self.queue_scope = self.global_settings.get('clear_api_queue_scope', self.__class__.OWN_QUEUE_SCOPE)
+        self.request_registry = RequestRegistry(self.global_settings.get('request_registry_path', 'state/created_requests.json'), self.utilset) \
+            if self.reuse_requests or self.queue_scope == self.__class__.OWN_QUEUE_SCOPE else None
+        self.run_id = RequestRegistry.run_id()
+        self.listed_requests = None
+        self.listed_at = None
+        self.file_parts = {}
+        self.partial_parts = set()
+        self.insert_deduplication = self.global_settings.get('insert_deduplication', False)
+        self.deduplication_effective = None
+        self.staging_load = self.global_settings.get('staging_load', False)
+        self.staging_table = f"{self.ch_credentials.get('table')}{self.global_settings.get('staging_table_suffix', '_staging')}_{self.counterId}_{self.api_settings.get('source')}"
+        self.column_projection = self.global_settings.get('column_projection', False)
+        self.column_mapping = None
+        self.staging_date_column = self.global_settings.get('staging_date_column')
+        if self.staging_date_column is None and (self.global_settings.get('api_strict_db_table_cols_names') or self.column_projection): 
+            #With header names used, columns are named as Logs API fields (or mapped), so column of date field is the date column. 
+            date_field = next((field for field in self.api_settings.get('fields', '').split(',') if field.endswith(':date')), None)
+            self.staging_date_column = self._column_mapping().get(date_field) if date_field is not None else None
+        self.load_table = self.ch_credentials.get('table')
+        self.loaded_rows = 0
+        self.rows_lock = threading.Lock()
+        self.ch_pool_size = max(1, self.global_settings.get('ch_pool_size', 1))
+        self.insert_format = self.global_settings.get('insert_format', self.__class__.TSV_INSERT_FORMAT)
+        self.table_columns = None
+        self.metrics_registry = metrics if metrics is not None else MetricsRegistry(self.global_settings.get('metrics_textfile_path'), self.global_settings.get('metrics_summary_path'))
+        if self.global_settings.get('metrics_port'): 
+            self.metrics_registry.serve(self.global_settings.get('metrics_port'), self.global_settings.get('metrics_host'))
+        self.metrics = self.metrics_registry.labeled(counter=self.counterId, source=self.api_settings.get('source'), 
+                                                     table=f"{self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}")
+        self.started = time.monotonic()
+        self.attempted_parts = set()
+        self.profiler = None
+        if self.global_settings.get('profile'): 
+            #Let's wrap stages in spans before the first of them (connection and tables checks) is performed. 
+            self.profiler = StageProfiler(self.global_settings.get('log_last_run_path'), self.global_settings.get('profile_cprofile', False), 
+                                          self.global_settings.get('profile_tracemalloc_top', 0))
+            self.profiler.wrap(self, self.__class__.PROFILED_STAGES)
+        #Let's call connection establishing from the start, unless connection is shared by batch run. 
+        self.owns_connection = ch is None
+        if self.owns_connection: 
+            self.establish_db_connections()
+        else: 
+            self.ch = ch
+        self.checked_tables = checked_tables if checked_tables is not None else {}
         self.is_log_table = False
         self.check_db_tables()
         self.dates_parameters_normalization()
         self.files = []
 
     def dates_parameters_normalization(self): 
-        """Method to fill in dates in case of their abscence."""
+        """Method to fill in dates in case of their abscence. In incremental sync mode absent start date is incremental_start_date 
+        parameter of global_config or the earliest date loaded before, so gaps since then are found."""
+        if self.sync_state is not None and not self.params.get('date1'): 
+            loaded_dates = self.sync_state.loaded_dates(self.sync_key)
+            start_date = self.global_settings.get('incremental_start_date') or (min(loaded_dates) if loaded_dates else None)
+            if start_date: 
+                self.params['date1'] = start_date
         if not self.params.get('date1') and not self.params.get('date2'):
             start_date = datetime.date(datetime.now()) - timedelta(days = 1)
             start_date = start_date.strftime("%Y-%m-%d")
@@ -131,7 +329,8 @@ class MainFlowWrapper:
         table = self.ch_credentials.get('table')
         log_table = self.ch_credentials.get('logTable')
         ssh = self.ch_credentials.get('ssh')
-        self.ch = ClickHouseConnector(self.logger, login, password, host, port, db, table, log_table, ssh)
+        self.ch = ClickHouseConnector(self.logger, login, password, host, port, db, table, log_table, ssh, 
+                                      pool_size=self.ch_pool_size, compress=self.global_settings.get('ch_compression'))
         if not self.ch : 
             raise ConnectionError("Connection to database wasn't established. Please, check credentials and re-run the script.")
         return self
@@ -141,23 +340,62 @@ class MainFlowWrapper:
         log table (in case both logTable in ch_credentials and run_log_table_test in global_config are set).
 
         In case if continue_on_columns_test_fail set false in global_config and columns test will fail, script will throw an exception. 
-        The same will happen in case if continue_on_log_table_creation_fail is set false and log table wasn't created."""
+        The same will happen in case if continue_on_log_table_creation_fail is set false and log table wasn't created.
+        Results of passed checks are cached in checked_tables, so tables shared by several jobs of one batch run are checked only once."""
+        data_table_key = f"{self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}"
+        log_table_key = f"{self.ch_credentials.get('db')}.{self.ch_credentials.get('logTable')}"
+        with self.__class__.TABLE_CHECK_LOCK: 
+            if data_table_key in self.checked_tables: 
+                print(f"Table {data_table_key} was already checked in this run.")
+            else: 
+                self._check_data_table()
+                if self.global_settings.get('run_db_table_test'): 
+                    self.checked_tables[data_table_key] = True
+            if self.insert_deduplication: 
+                self._check_deduplication()
+            if log_table_key in self.checked_tables: 
+                self.is_log_table = self.checked_tables[log_table_key]
+                print(f"Log table {log_table_key} was already checked in this run.")
+            else: 
+                self._check_log_table()
+                if self.global_settings.get('run_log_table_test') and self.ch_credentials.get('logTable'): 
+                    self.checked_tables[log_table_key] = self.is_log_table
+        return self
+
+    def _check_deduplication(self): 
+        """Method to check, that data table takes insert_deduplication_token into account, and warn if it doesn't. Part of check_db_tables."""
+        #Let's check engine and settings of data table: token is ignored by plain MergeTree without non_replicated_deduplication_window.
+        self.deduplication_effective = self.ch.table_deduplicates()
+        if self.deduplication_effective is False: 
+            description = f"Table {self.ch_credentials.get('table')} is neither Replicated*MergeTree nor has non_replicated_deduplication_window > 0, so insert_deduplication_token is ignored."
+            self.logger.add_to_log(self.__class__.DEFAULT_ERROR_CODE, f"Database: {self.ch_credentials.get('db')}. Table: {self.ch_credentials.get('table')}", description)
+            self.logger.write_to_disk_incremental()
+            print(f"Warning: {description} \n Retried and resumed inserts may duplicate rows. Set non_replicated_deduplication_window for the table to make insert_deduplication effective.")
+        return self.deduplication_effective
+
+    def _check_data_table(self): 
+        """Method to check data table shallowly. Part of check_db_tables."""
         #Let's check data table shallowly if test parameter was set to true: 
         if self.global_settings.get('run_db_table_test'): 
             #Getting api fields from config
             api_fields = self.api_settings.get('fields').split(',')
-            #Let's perform some queries:
-            ch_dbs = self.ch.query_data(self.queries['db_query'], parameters = self.ch_credentials)
-            ch_table = self.ch.query_data(self.queries['table_query'], parameters = self.ch_credentials)
-            ch_columns = self.ch.query_data(self.queries['columns_query'], parameters = self.ch_credentials)
+            #Let's get metadata of database and tables by one query (or from schema cache):
+            metadata = self.table_metadata()
 
             #Check if there is data table and there are data columns and their amount is less or equal to fields in api config. 
-            if ch_dbs is not None: 
-                if len(ch_dbs) > 0:
-                    if len(ch_table) > 0:
+            if metadata is not None: 
+                if metadata.get('database'):
+                    if self.ch_credentials.get('table') in metadata.get('tables'):
+                        ch_columns = metadata.get('tables').get(self.ch_credentials.get('table')).get('columns')
                         if len(ch_columns) > 0:
                             ch_cols_list = [col[0] for col in ch_columns]
-                            if len(api_fields) != len(ch_cols_list):
+                            self.table_columns = list(ch_columns)
+                            #Let's add columns of new fields to the table, if migration is allowed:
+                            if (len(api_fields) != len(ch_cols_list) or self.column_projection) and self.global_settings.get('migrate_data_table'): 
+                                ch_cols_list = self.migrate_data_table(api_fields, ch_cols_list)
+                            #With column projection fields are matched to columns by names, so amounts of fields and columns may differ. 
+                            columns_mismatch = not self._projection_passed(api_fields, ch_cols_list) if self.column_projection else len(api_fields) != len(ch_cols_list)
+                            if columns_mismatch:
                                 if not self.global_settings.get('continue_on_columns_test_fail'): 
                                     self.logger.add_to_log(self.__class__.DEFAULT_ERROR_CODE, f"Database: {self.ch_credentials.get('db')}. Table: {self.ch_credentials.get('table')}", 
                                                     f"Table {self.ch_credentials.get('table')} has less columns, than API request.")
@@ -176,6 +414,10 @@ class MainFlowWrapper:
                                                     f"Table {self.ch_credentials.get('table')} passed shallow test successfully.")
                                 self.logger.write_to_disk_incremental()
                                 print(f"Table {self.ch_credentials.get('table')} of database: {self.ch_credentials.get('db')} passed shallow test successfully.")
+                    elif self.global_settings.get('create_data_table_on_fail') and self.create_data_table(api_fields): 
+                        self.logger.add_to_log(self.__class__.DEFAULT_SUCCESS_CODE, f"Database: {self.ch_credentials.get('db')}. Table: {self.ch_credentials.get('table')}", 
+                                                    f"Table didn't exist and was created by fields of API request.")
+                        self.logger.write_to_disk_incremental()
                     else:
                         self.logger.add_to_log(self.__class__.DEFAULT_ERROR_CODE, f"Database: {self.ch_credentials.get('db')}. Table: {self.ch_credentials.get('table')}", 
                                                     f"Table doesn't exist")
@@ -197,16 +439,144 @@ class MainFlowWrapper:
                 self.final_log_record()
                 self.logger.write_to_disk_last_run()
                 raise DatabaseException("Query wasn't performed. Probably, not enough rights to perform SELECT query.")
-            
+        return self
+
+    def _metadata_parameters(self): 
+        """Method to build parameters of metadata queries. Log table is optional, so empty name (no table has it) is used if it isn't set."""
+        log_table = self.ch_credentials.get('logTable')
+        return {'db': self.ch_credentials.get('db'), 'table': self.ch_credentials.get('table'), 'logTable': log_table if isinstance(log_table, str) else ''}
+
+    def _cached_metadata(self, tables): 
+        """Method to get metadata of tables from schema cache. Entries are used only if they aren't expired and metadata_modification_time 
+        of each table (checked by cheap query to system.tables) is the same as cached one. Returns dict or None."""
+        db = self.ch_credentials.get('db')
+        entries = {table: self.schema_cache.fresh_entry(SchemaCache.table_key(db, table)) for table in tables}
+        if any(entry is None for entry in entries.values()): 
+            return None
+        rows = self.ch.query_data(self.queries['tables_modification_query'], parameters = self._metadata_parameters())
+        modified = {table: modification_time for table, modification_time in rows or []}
+        changed = [table for table, entry in entries.items() if modified.get(table) != entry.get('metadata_modification_time')]
+        if rows is None or changed: 
+            print(f"Cached schemas of tables {', '.join(changed or tables)} of database {db} are outdated and will be queried again.")
+            return None
+        print(f"Schemas of tables {', '.join(tables)} of database {db} were taken from schema cache.")
+        return {'database': True, 'tables': {table: {'metadata_modification_time': entry.get('metadata_modification_time'), 
+                                                     'columns': [tuple(column) for column in entry.get('columns')]} for table, entry in entries.items()}}
+
+    def table_metadata(self, refresh=False): 
+        """Method to get metadata of database, data table and log table of ch_credentials. Schemas of tables are taken from schema cache, if all of them 
+        are cached less than schema_cache_ttl_sec seconds ago and weren't modified since then. Otherwise (or if refresh is true) they are obtained 
+        by one query to system tables and cached. Returns dict or None, if query wasn't performed."""
+        if self.metadata is not None and not refresh: 
+            return self.metadata
+        db = self.ch_credentials.get('db')
+        tables = [table for table in [self.ch_credentials.get('table'), self.ch_credentials.get('logTable')] if isinstance(table, str) and table]
+        if self.schema_cache is not None and not refresh: 
+            self.metadata = self._cached_metadata(tables)
+            if self.metadata is not None: 
+                return self.metadata
+        rows = self.ch.query_data(self.queries['metadata_query'], parameters = self._metadata_parameters())
+        if rows is None: 
+            return None
+        metadata = {'database': False, 'tables': {}}
+        for kind, table, modified, column, column_type in rows: 
+            if kind == 'database': 
+                metadata['database'] = True
+            elif kind == 'table': 
+                metadata['tables'].setdefault(table, {'columns': []})['metadata_modification_time'] = modified
+            else: 
+                metadata['tables'].setdefault(table, {'columns': []})['columns'].append((column, column_type))
+        if self.schema_cache is not None: 
+            for table, entry in metadata['tables'].items(): 
+                self.schema_cache.store(SchemaCache.table_key(db, table), entry.get('metadata_modification_time'), entry['columns'])
+        self.metadata = metadata
+        return self.metadata
+
+    def _invalidate_schema(self, table): 
+        """Method to forget metadata of table changed by this flow (created, replaced or migrated)."""
+        if self.schema_cache is not None: 
+            self.schema_cache.invalidate(SchemaCache.table_key(self.ch_credentials.get('db'), table))
+        self.metadata = None
+        return self
+
+    def schema_registry(self): 
+        """Method to get registry of ClickHouse types of Logs API fields of source. Types of field_types and column names of column_mapping parameters of global_config 
+        override registry ones."""
+        return FieldTypeRegistry(self.api_settings.get('source'), self.global_settings.get('api_strict_db_table_cols_names'), 
+                                 self.api_settings.get('attribution'), self.global_settings.get('field_types'), self.global_settings.get('column_mapping'), 
+                                 self.global_settings.get('replacing_data_table', False))
+
+    def create_data_table(self, api_fields): 
+        """Method to create data table for fields of API request with types, codecs, engine, sorting and partition keys of schema registry. 
+        Returns True if table was created."""
+        registry = self.schema_registry()
+        try: 
+            query = registry.create_table_query(self.ch_credentials.get('db'), self.ch_credentials.get('table'), api_fields)
+        except ValueError as error: 
+            print(f"Table {self.ch_credentials.get('table')} wasn't created: {error}")
+            self.logger.add_to_log(self.__class__.DEFAULT_ERROR_CODE, f"Database: {self.ch_credentials.get('db')}. Table: {self.ch_credentials.get('table')}", str(error))
+            self.logger.write_to_disk_incremental()
+            return False
+        created = self.ch.create_table(query, self.ch_credentials.get('table'))
+        if created: 
+            self.table_columns = [(registry.column_name(field), registry.column_type(field)) for field in api_fields]
+            self._invalidate_schema(self.ch_credentials.get('table'))
+        return created
+
+    def migrate_data_table(self, api_fields, ch_cols_list): 
+        """Method to add columns of fields of API request absent in data table (by names of schema registry). 
+        Returns list of columns of table after migration."""
+        registry = self.schema_registry()
+        queries = registry.migrate_table_queries(self.ch_credentials.get('db'), self.ch_credentials.get('table'), api_fields, ch_cols_list)
+        if not queries: 
+            return ch_cols_list
+        for query in queries: 
+            if not self.ch.run_command(query): 
+                break
+        self._invalidate_schema(self.ch_credentials.get('table'))
+        metadata = self.table_metadata(refresh=True) or {'tables': {}}
+        ch_columns = metadata.get('tables').get(self.ch_credentials.get('table'), {}).get('columns', [])
+        if ch_columns: 
+            self.table_columns = list(ch_columns)
+            print(f"Table {self.ch_credentials.get('table')} was migrated to {len(ch_columns)} columns.")
+        return [col[0] for col in ch_columns] or ch_cols_list
+
+    def _column_mapping(self): 
+        """Method to get columns of Logs API fields for column projection: column_mapping parameter of global_config or, for not mapped fields, 
+        names of schema registry. Keys are both fields of request and fields with <attribution> placeholder replaced, as they may come in header."""
+        if self.column_mapping is None: 
+            registry = self.schema_registry()
+            mapping = {}
+            for field in self.api_settings.get('fields', '').split(','): 
+                mapping[field] = registry.column_name(field)
+                mapping[field.replace(FieldTypeRegistry.ATTRIBUTION_PLACEHOLDER, registry.attribution)] = mapping[field]
+            self.column_mapping = mapping
+        return self.column_mapping
+
+    def _projection_passed(self, api_fields, ch_cols_list): 
+        """Method to check column projection: logs fields without column in data table (they are dropped on load) and columns without field 
+        (they get default values). Returns True if at least one field has column."""
+        mapping = self._column_mapping()
+        dropped = [field for field in api_fields if mapping.get(field) not in ch_cols_list]
+        unfilled = [column for column in ch_cols_list if column not in {mapping.get(field) for field in api_fields}]
+        description = f"Column projection: {len(api_fields) - len(dropped)} fields have columns. Fields dropped on load: {dropped}. Columns with default values: {unfilled}."
+        self.logger.add_to_log(self.__class__.DEFAULT_SUCCESS_CODE, f"Database: {self.ch_credentials.get('db')}. Table: {self.ch_credentials.get('table')}", 
+                               description).write_to_disk_incremental()
+        print(description)
+        return len(dropped) < len(api_fields)
+
+    def _check_log_table(self): 
+        """Method to check log table and to create it if needed. Part of check_db_tables."""
         #Checking logTable now:
         if self.global_settings.get('run_log_table_test') and self.ch_credentials.get('logTable') and isinstance(self.ch_credentials.get('logTable'), str):
             #Check if log table exists and if columns of log table are those should be. 
-            ch_log_table = self.ch.query_data(self.queries.get('log_table_query'), parameters = self.ch_credentials)
-            ch_log_table_columns = self.ch.query_data(self.queries['log_table_query_columns'], parameters = self.ch_credentials)
-            ch_log_columns = [col[0] for col in ch_log_table_columns] if ch_log_table_columns is not None else []
-            if not(ch_log_table is None or ch_log_columns is None): 
-                if (len(ch_log_table) == 0 or ch_log_columns != self.__class__.LOG_TABLE_FIELDS) and self.global_settings.get('create_log_table_on_fail'):
+            metadata = self.table_metadata()
+            if metadata is not None: 
+                ch_log_table = metadata.get('tables').get(self.ch_credentials.get('logTable'))
+                ch_log_columns = [col[0] for col in ch_log_table.get('columns')] if ch_log_table is not None else []
+                if (ch_log_table is None or ch_log_columns != self.__class__.LOG_TABLE_FIELDS) and self.global_settings.get('create_log_table_on_fail'):
                     self.is_log_table = self.ch.create_table(self.queries['log_table_create'], self.ch_credentials.get('logTable'))
+                    self._invalidate_schema(self.ch_credentials.get('logTable'))
                     if not(self.is_log_table or self.global_settings.get('continue_on_log_table_creation_fail')): 
                         self.logger.add_to_log(self.__class__.DEFAULT_ERROR_CODE, f"Database: {self.ch_credentials.get('db')}. Table: {self.ch_credentials.get('logTable')}", 
                                                 f"Table doesn't exist and couldn't be created.")
@@ -214,7 +584,7 @@ class MainFlowWrapper:
                         self.final_log_record()
                         self.logger.write_to_disk_last_run()
                         raise DatabaseException(f"Sorry. Log Table didn't pass a check and a new one called {self.ch_credentials.get('logTable')} couldn't be created.")
-                elif len(ch_log_table) > 0 and ch_log_columns == self.__class__.LOG_TABLE_FIELDS: 
+                elif ch_log_table is not None and ch_log_columns == self.__class__.LOG_TABLE_FIELDS: 
                     self.is_log_table = True
                     self.logger.add_to_log(self.__class__.DEFAULT_SUCCESS_CODE, f"Database: {self.ch_credentials.get('db')}. Table: {self.ch_credentials.get('logTable')}", 
                                             f"Table {self.ch_credentials.get('logTable')} successfully passed shallow check.")
@@ -229,9 +599,16 @@ class MainFlowWrapper:
                     self.final_log_record()
                     self.logger.write_to_disk_last_run()
                     raise DatabaseException(f"Table {self.ch_credentials.get('logTable')} or its columns weren't queried. Probably, not enough rights or other query issue")
-                
+        return self
+
+    @stage_metrics('evaluation')
     def check_log_evaluation(self): 
-        self.log_evaluation = LogEvaluation(self.counterId, self.token, self.logger, self.params)
+        #Let's reattach to request of crashed run first, if checkpoint journal has it. Or to request with the same params, if Logs API queue has it. 
+        self.request_id = self.resumable_request(self.params) or self.reusable_request(self.params)
+        self.resumed_request = self.request_id is not None
+        if self.resumed_request: 
+            return self
+        self.log_evaluation = LogEvaluation(self.counterId, self.token, self.logger, self.params, session=self.api_session)
         self.log_evaluation.send_request()
         if not self.log_evaluation.is_success:
             if not self.global_settings.get('clear_api_queue'):
@@ -240,24 +617,7 @@ class MainFlowWrapper:
                 self.write_log_to_db()
                 raise FlowException(f"Request cannot be performed and you didn't allow to clear requests queue.\n See: clear_api_queue parameter in global_config.json")
             else: 
-                time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
-                log_list = LogList(self.counterId, self.token, self.logger)
-                log_list.send_request()
-                if log_list.response_code == self.__class__.DEFAULT_SUCCESS_CODE and len(log_list.response_body) > 0: 
-                    requests_deleted = 0
-                    for request in log_list.response_body:
-                        time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
-                        request_status = request.get('status')
-                        request_id = request.get('request_id')
-                        if request_status == 'created':
-                            clear_old_request = CleanPendingLog(self.counterId, request_id, self.token, self.logger)
-                        else:
-                            clear_old_request = CleanProcessedLog(self.counterId, request_id, self.token, self.logger)
-                        clear_old_request.send_request()
-                        if clear_old_request.is_success: 
-                            requests_deleted += 1
-                        del clear_old_request
-                    print(f"Deleted {requests_deleted} requests in queue.")
+                if self.clear_api_queue() is not None: 
                     self.log_evaluation.send_request()
                     if not(self.log_evaluation.is_success): 
                         self.final_log_record()
@@ -274,17 +634,21 @@ class MainFlowWrapper:
         else: 
             print(f"Evaluation sucess: {self.log_evaluation.is_success}")
         return self
-    
+
+    @stage_metrics('create')
     def create_log_request(self, repeat = 0): 
         """Method to create request to download Logs API data for Logs API endpoint."""
+        if self.resumed_request: 
+            return self
         time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
         if self.log_evaluation.is_success: 
-            self.log_request = CreateLog(self.counterId, self.token, self.logger, params=self.params)
+            self.log_request = CreateLog(self.counterId, self.token, self.logger, params=self.params, session=self.api_session)
             self.log_request.send_request()
             if self.log_request.is_success: 
                 self.request_id = self.log_request.request_id
                 print(f"Log request with id: {self.request_id} was successfully created.")
-                return self
+                self._register_request(self.params, self.request_id)
+                return self._start_checkpoint(self.params, self.request_id)
             elif not(self.log_request.is_success) and repeat < (self.__class__.DEFAULT_API_QUERY_RETRIES - 1): 
                 repeat+=1
                 return self.create_log_request(repeat)
@@ -299,144 +663,557 @@ class MainFlowWrapper:
             self.write_log_to_db()
             raise FlowException("The request wasn't evaluated or cannot be evaluated. Please, check sequence of methods calls, reduce dates range or reduce params amount.")
         
+    @stage_metrics('deletion')
     def delete_log(self, repeat = 0):
         """Method to perform deletion of Logs API request_id and prepared or pending log."""
-        try: 
-            del self.log_evaluation
-            del self.log_request
-            del self.status_request
-            del self.download_log_part
-        finally:
-            if self.global_settings.get('clear_created_logs_request'):
-                time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
-                self.deletion = CleanPendingLog(self.counterId, self.request_id, self.token, self.logger)
+        for attribute in self.__class__.REQUEST_ATTRIBUTES: 
+            if hasattr(self, attribute): 
+                delattr(self, attribute)
+        released = self._release_request(self.request_id)
+        if self.global_settings.get('clear_created_logs_request') and not released: 
+            print(f"Request {self.request_id} is still used by another run and is kept in Logs API queue.")
+        elif self.global_settings.get('clear_created_logs_request') and not self._owned_request(self.request_id): 
+            print(f"Request {self.request_id} wasn't created by this tool and is kept in Logs API queue.")
+        elif self.global_settings.get('clear_created_logs_request'):
+            time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+            self.deletion = CleanPendingLog(self.counterId, self.request_id, self.token, self.logger, session=self.api_session)
+            self.deletion.send_request()
+            if not(self.deletion.is_success): 
+                self.deletion = CleanProcessedLog(self.counterId, self.request_id, self.token, self.logger, session=self.api_session)
                 self.deletion.send_request()
-                if not(self.deletion.is_success): 
-                    self.deletion = CleanProcessedLog(self.counterId, self.request_id, self.token, self.logger)
-                    self.deletion.send_request()
-                if self.deletion.is_success:
-                    print(f"Deletion of request {self.request_id} was {self.deletion.is_success}")
-                    del self.deletion
-                    return self 
-                elif not(self.deletion.is_success) and repeat < (self.__class__.DEFAULT_API_QUERY_RETRIES - 1): 
-                    repeat+=1
-                    return self.delete_log(repeat)
-                else: 
-                    print(f"Deletion of request {self.request_id} wasn't performed for unexpected reason.")
-            else:
-                print(f"Deletion of {self.request_id} wasn't performed according to global config.")
-        
-    def log_status_check(self, repeat=0):
-        """Method to check status of created Logs API data log."""
-        if self.log_request.is_success:
-            if self.frequency*(repeat+1) <= self.status_timeout: 
-                time.sleep(self.frequency)
-                self.status_request = StatusLog(self.counterId, self.request_id, self.token, self.logger)
-                self.status_request.send_request()
-                print(f"Status check  of request {self.request_id}. Done times: {repeat+1}. Time: {(repeat+1)*self.frequency} sec. Status: {self.status_request.status}. Response code: {self.status_request.response_code}.\
-                      \n Max wait time left: {(self.status_timeout - (repeat+1)*self.frequency)//60} mins.")
-                if self.status_request.is_success: 
-                    self.parts = self.status_request.parts
-                    self.parts_amount = self.status_request.parts_amount
-                    print(f"Status check of request {self.request_id} got posititve results. Status: {self.status_request.status}. Parts to download: {self.parts_amount}. Time spent on waiting: {(repeat+1)*self.frequency} secs.")
-                    return self
-                elif self.status_request.response_code == self.__class__.DEFAULT_SUCCESS_CODE: 
-                    if self.status_request.status in self.__class__.BAD_STATUS_CODES:
-                        self.delete_log()
-                        self.final_log_record()
-                        self.logger.write_to_disk_last_run()
-                        self.write_log_to_db()
-                        raise FlowException(f"Log wasn't processed well for some reason. It had status: {self.status_request.status}.")
-                    else:
-                        repeat+=1 
-                        return self.log_status_check(repeat)
-                elif self.status_request.response_code is not None:
-                    if repeat > self.__class__.DEFAULT_API_QUERY_RETRIES:
-                        self.delete_log()
-                        self.final_log_record()
-                        self.logger.write_to_disk_last_run()
-                        self.write_log_to_db()
-                        raise FlowException(f"Endpoint of status query {self.status_request.url} is unreachable.") #Well, just not to wait half an hour just for incorrect requests.
-                    repeat+=1
-                    return self.log_status_check(repeat)
-                else: 
+            if self.deletion.is_success:
+                print(f"Deletion of request {self.request_id} was {self.deletion.is_success}")
+                self.metrics.inc('requests_deleted_total', result='success')
+                self._forget_request(self.request_id)
+                del self.deletion
+                return self 
+            elif not(self.deletion.is_success) and repeat < (self.__class__.DEFAULT_API_QUERY_RETRIES - 1): 
+                repeat+=1
+                return self.delete_log(repeat)
+            else: 
+                print(f"Deletion of request {self.request_id} wasn't performed for unexpected reason.")
+                self.metrics.inc('requests_deleted_total', result='failure')
+        else:
+            print(f"Deletion of {self.request_id} wasn't performed according to global config.")
+        return self
+
+    def _expected_preparation_sec(self): 
+        """Method to estimate preparation time of current request. Logs API doesn't report size of log, so share of requested days 
+        in max_possible_day_quantity of log evaluation is used as relative size of log. Returns seconds or None if there is no estimate."""
+        evaluation = getattr(self, 'log_evaluation', None)
+        max_days = evaluation.max_possible_day_quantity if evaluation is not None else None
+        if not max_days or not self.status_expected_max_sec: 
+            return None
+        days = (datetime.strptime(self.params.get('date2'), "%Y-%m-%d") - datetime.strptime(self.params.get('date1'), "%Y-%m-%d")).days + 1
+        return self.status_expected_max_sec*min(1, days/max_days)
+
+    def status_schedule(self, timeout_sec=None, expected_sec=None): 
+        """Method to create adaptive schedule of status checks from global_config parameters."""
+        return PollingSchedule(self.status_initial_sec, self.frequency, self.status_backoff_factor, timeout_sec, expected_sec)
+
+    @stage_metrics('status_wait')
+    def log_status_check(self):
+        """Method to check status of created Logs API data log. Checks are performed by adaptive schedule: frequent at first, 
+        then with exponentially growing intervals up to frequency_api_status_check_sec, until api_status_wait_timeout_min."""
+        if not self.resumed_request and not self.log_request.is_success:
+            self.final_log_record()
+            self.logger.write_to_disk_last_run()
+            self.write_log_to_db()
+            raise FlowException("The request wasn't created. Please, check sequence of methods calls.")
+        schedule = self.status_schedule(self.status_timeout, self._expected_preparation_sec())
+        failed_checks = 0
+        while schedule.wait(): 
+            self.status_request = StatusLog(self.counterId, self.request_id, self.token, self.logger, session=self.api_session)
+            self.status_request.send_request()
+            self.metrics.inc('status_checks_total', status=self.status_request.status or self.status_request.response_code)
+            print(f"Status check  of request {self.request_id}. Done times: {schedule.polls}. Time: {round(schedule.elapsed)} sec. Status: {self.status_request.status}. Response code: {self.status_request.response_code}.\
+                  \n Max wait time left: {round(self.status_timeout - schedule.elapsed)//60} mins.")
+            if self.status_request.is_success: 
+                self.parts = self.status_request.parts
+                self.parts_amount = self.status_request.parts_amount
+                print(f"Status check of request {self.request_id} got posititve results. Status: {self.status_request.status}. Parts to download: {self.parts_amount}. Time spent on waiting: {round(schedule.elapsed)} secs.")
+                return self
+            elif self.status_request.response_code == self.__class__.DEFAULT_SUCCESS_CODE: 
+                if self.status_request.status in self.__class__.BAD_STATUS_CODES:
                     self.delete_log()
                     self.final_log_record()
                     self.logger.write_to_disk_last_run()
                     self.write_log_to_db()
-                    raise FlowException(f"Endpoint of status query {self.status_request.url} is unreachable.")
+                    raise FlowException(f"Log wasn't processed well for some reason. It had status: {self.status_request.status}.")
+            elif self.status_request.response_code is not None:
+                failed_checks += 1
+                if failed_checks > self.__class__.DEFAULT_API_QUERY_RETRIES:
+                    self.delete_log()
+                    self.final_log_record()
+                    self.logger.write_to_disk_last_run()
+                    self.write_log_to_db()
+                    raise FlowException(f"Endpoint of status query {self.status_request.url} is unreachable.") #Well, just not to wait half an hour just for incorrect requests.
             else: 
                 self.delete_log()
                 self.final_log_record()
                 self.logger.write_to_disk_last_run()
                 self.write_log_to_db()
-                raise FlowException(f"Log wasn't cooked for timeout time: {self.status_timeout/60} mins.")
-        else: 
-            self.final_log_record()
-            self.logger.write_to_disk_last_run()
-            self.write_log_to_db()
-            raise FlowException("The request wasn't created. Please, check sequence of methods calls.")
+                raise FlowException(f"Endpoint of status query {self.status_request.url} is unreachable.")
+        self.delete_log()
+        self.final_log_record()
+        self.logger.write_to_disk_last_run()
+        self.write_log_to_db()
+        raise FlowException(f"Log wasn't cooked for timeout time: {self.status_timeout/60} mins.")
         
-    def log_downloader(self, repeat=0):
-        """Method to download Logs API prepared data."""
+    def _part_file_path(self, part):
+        """Method to build path of local file for downloaded part."""
+        dt = datetime.now()
+        dt = dt.strftime("%Y-%m-%d-%H-%M-%S")
+        extension = self.compressor.extension() if self.compressor is not None else ''
+        #Request id keeps files of requests downloaded at once (see run_requests_concurrently) apart. 
+        return self.data_path + dt + '-'+ str(self.counterId) + '-' +str(self.api_settings.get('source')) + '-' + f"{self.request_id}-part{part}.tsv" + extension
+
+    def _download_part(self, part):
+        """Method to download one part to the local file. Performed inside of download scheduler's workers, 
+        so it creates its own DownloadLogPart instance. Part downloaded by crashed run is reused, if its file is intact. 
+        Returns path to the file or None if part wasn't downloaded."""
+        journaled_file = self._journaled_file(part)
+        if journaled_file is not None: 
+            return journaled_file
+        download_log_part = DownloadLogPart(self.counterId, self.request_id, self.token, self.logger, chunk_size=self.chunk_size, 
+                                            encoding=self.api_encoding, compressor=self.compressor, session=self.api_session)
+        full_file = self._part_file_path(part)
+        started = time.monotonic()
+        try: 
+            if self.stream_download: 
+                #Part is streamed chunk by chunk right to the file, so it's never held in memory entirely. 
+                download_log_part.send_request(part, full_file)
+            else: 
+                download_log_part.send_request(part)
+                if download_log_part.is_success and self.compressor is not None:
+                    self.utilset.write_stream_to_file(self.compressor.compress_chunks([download_log_part.response_body.encode('utf-8')]), full_file)
+                elif download_log_part.is_success:
+                    self.utilset.rewrite_file(download_log_part.response_body, full_file)
+        finally: 
+            if download_log_part.encoding_fallback: 
+                self.api_encoding = None
+            self._measure_download(part, download_log_part, time.monotonic() - started)
+        if download_log_part.is_success: 
+            return self._record_download(part, full_file)
+        return None
+
+    def _measure_download(self, part, download_log_part, seconds): 
+        """Method to record attempt of part download in metrics: result, duration and size. Attempt of part attempted before is counted as retry."""
+        with self.rows_lock: 
+            retry = (self.request_id, part) in self.attempted_parts
+            self.attempted_parts.add((self.request_id, part))
+        if retry: 
+            self.metrics.inc('part_download_retries_total')
+        result = 'success' if download_log_part.is_success else 'failure'
+        self.metrics.inc('part_download_attempts_total', result=result)
+        self.metrics.observe('part_download_seconds', seconds, result=result)
+        if download_log_part.is_success: 
+            #Streamed part is counted by bytes written to file, part read into memory - by length of body. 
+            size = download_log_part.bytes_written if getattr(download_log_part, 'path', None) else len(download_log_part.response_body or '')
+            self.metrics.inc('part_download_bytes_total', size)
+            self.metrics.observe('part_download_bytes', size)
+        return self
+
+    def _check_downloaded_parts(self):
+        """Method to check amount of not downloaded parts against data_loss_tolerance_perc parameter of global_config. 
+        Deletes Logs API request (if checkpoint journal is on, it's deleted by finish_checkpoint method after load). Raises FlowException if tolerance is exceeded."""
+        if self._downloaded_parts_tolerated(): 
+            if self.checkpoints is None: 
+                self.delete_log()
+            return self
+        self.delete_files()
+        self.delete_log()
+        self._raise_download_failure()
+
+    def _downloaded_parts_tolerated(self): 
+        """Method to log amount of not downloaded parts and to check it against data_loss_tolerance_perc parameter of global_config. Returns bool."""
+        description = f"Parts downloaded successfully: {self.parts_amount-len(self.parts)}. Parts not downloaded: {self.parts}."
+        endpoint = self.__class__.DOWNLOAD_API_OPERATION_DEFAULT_ENDPOINT
+        if len(self.parts) == 0 or len(self.parts)/self.parts_amount <= self.global_settings.get('data_loss_tolerance_perc',0)/100: 
+            self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE, endpoint=endpoint, description=description).write_to_disk_incremental()
+            print(description)
+            return True
+        self.logger.add_to_log(response=self.__class__.DEFAULT_ERROR_CODE, endpoint=endpoint, description=description).write_to_disk_incremental()
+        return False
+
+    def _raise_download_failure(self): 
+        """Method to write the last log records and raise FlowException when too many parts weren't downloaded."""
+        if self.load_table == self.staging_table: 
+            self._drop_staging()
+        self.final_log_record()
+        self.logger.write_to_disk_last_run()
+        self.write_log_to_db()
+        raise  FlowException(f"Error of downloading data. Request ID: {self.request_id}. Downloaded: {self.parts_amount - len(self.parts)} files.\n \
+                             That's {round(len(self.parts)/self.parts_amount*100, 2)} percent of total data.\n \
+                             Allowed tolerance is: {self.global_settings.get('data_loss_tolerance_perc',0)} percent.\n \
+                             All files were deleted. Re-run script instead")
+
+    @stage_metrics('download')
+    def log_downloader(self):
+        """Method to download Logs API prepared data. Parts are downloaded concurrently by download scheduler, 
+        which also retries failed parts with backoff."""
         if self.status_request.is_success: 
             if self.parts_amount > 0:
-                self.download_log_part = DownloadLogPart(self.counterId, self.request_id, self.token, self.logger)
-                re_download_list = []
-                for part in self.parts: 
-                    time.sleep(self.__class__.DEFAULT_REQUEST_SLEEP+repeat)
-                    self.download_log_part.send_request(part)
-                    if self.download_log_part.is_success:
-                        dt = datetime.now()
-                        dt = dt.strftime("%Y-%m-%d-%H-%M-%S")
-                        full_file = self.data_path + dt + '-'+ str(self.counterId) + '-' +str(self.api_settings.get('source')) + '-' + f"part{part}.tsv"
-                        try: 
-                            self.utilset.rewrite_file(self.download_log_part.response_body, full_file)
-                            self.files.append(full_file)
-                        except(OSError, IOError):
-                            re_download_list.append(part)
-                    else: 
-                        re_download_list.append(part)
-                
-                self.parts = re_download_list
-                description = f"Parts downloaded successfully: {self.parts_amount-len(self.parts)}. Parts not downloaded: {self.parts}."
-                endpoint = self.__class__.DOWNLOAD_API_OPERATION_DEFAULT_ENDPOINT
-                if len(self.parts) == 0 or (repeat == (self.__class__.DEFAULT_API_QUERY_RETRIES - 1) and (len(self.parts)/self.parts_amount <= self.global_settings.get('data_loss_tolerance_perc',0)/100)): 
-                    self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE, endpoint=endpoint, description=description).write_to_disk_incremental()
-                    print(description)
-                    self.delete_log()
-                    return self
-                elif repeat < (self.__class__.DEFAULT_API_QUERY_RETRIES - 1): 
-                    repeat += 1
-                    return self.log_downloader(repeat)
-                else:
-                    self.logger.add_to_log(response=self.__class__.DEFAULT_ERROR_CODE, endpoint=endpoint, description=description).write_to_disk_incremental()
-                    self.delete_files()
-                    self.delete_log()
-                    self.final_log_record()
-                    self.logger.write_to_disk_last_run()
-                    self.write_log_to_db()
-                    raise  FlowException(f"Error of downloading data. Request ID: {self.request_id}. Downloaded: {self.parts_amount - len(self.parts)} files.\n \
-                                         That's {round(len(self.parts)/self.parts_amount*100, 2)} percent of total data.\n \
-                                         Allowed tolerance is: {self.global_settings.get('data_loss_tolerance_perc',0)} percent.\n \
-                                         All files were deleted. Re-run script instead")
+                self._skip_inserted_parts()
+                downloaded, self.parts = self.download_scheduler.run(self.parts, self._download_part)
+                self.files.extend(downloaded.values())
+                return self._check_downloaded_parts()
             else: 
                 print("Nothing to download")
 
-    def write_data_to_db(self, repeat=0, file_list=None):
-        """Method to load previously downloaded data files to database. Deletes downloaded and successfully uploaded to db files."""
+    def _dedup_token(self, part, file=None): 
+        """Method to build deterministic insert_deduplication_token of part, if insert_deduplication is on. Token of downloaded file is built from 
+        counter/source/table, dates, part and sha256 of file, so re-run with new request is deduplicated too, as long as Logs API returns the same part. 
+        Content of streamed part (direct load_mode) isn't known before insert, so request_id is used instead of checksum: 
+        only retries and resumes of the same request (checkpoint_journal) are deduplicated. Returns str or None."""
+        if not self.insert_deduplication or part is None: 
+            return None
+        token = f"{self.sync_key}/{self.params.get('date1')}/{self.params.get('date2')}/{part}"
+        return f"{token}/{self.utilset.file_sha256(file)}" if file is not None else f"{token}/{self.request_id}"
+
+    def _insert_settings(self): 
+        """Method to build ClickHouse settings for inserts of data files from global_config parameters."""
         settings = {"input_format_allow_errors_ratio": self.global_settings.get('bad_data_tolerance_perc', 0)/100,
                     "input_format_allow_errors_num": self.global_settings.get('absolute_db_format_errors_tolerance', 0), 
                     "input_format_with_names_use_header": self.global_settings.get('api_strict_db_table_cols_names')
         }
+        #Let's add tuning settings of inserts, e.g. max_insert_block_size, min_insert_block_size_rows or async_insert. 
+        settings.update(self.global_settings.get('ch_insert_settings', {}))
+        if self.load_table == self.staging_table: 
+            #Staging table isn't read by anyone, so inserts to it may use more aggressive settings. 
+            settings.update(self.global_settings.get('staging_insert_settings', {}))
+        return settings
+
+    def download_and_write_data(self): 
+        """Method to download Logs API data and load it to database according to load_mode parameter of global_config: 
+        either stage by stage (all parts are downloaded first and only then loaded), in pipeline or directly without local disk. 
+        With staging_load on, data is loaded to staging table and then moved to the target table."""
+        self.prepare_staging()
+        if self.load_mode == self.__class__.PIPELINE_LOAD_MODE: 
+            self.pipeline_download_and_load()
+        elif self.load_mode == self.__class__.DIRECT_LOAD_MODE: 
+            self.direct_download_and_load()
+        else: 
+            self.log_downloader()
+            self.write_data_to_db()
+        self.publish_staging()
+        self.mark_synced()
+        return self.finish_checkpoint()
+
+    def _count_loaded_rows(self, rows): 
+        """Method to add rows of inserted part (to validate staging table) and to record them in metrics. Called from several threads."""
+        with self.rows_lock: 
+            self.loaded_rows += rows
+        self.metrics.inc('insert_rows_total', rows)
+        return self
+
+    def mark_synced(self): 
+        """Method to record dates of current request as loaded in sync state (in incremental sync mode). Dates aren't recorded 
+        if some parts were lost (within data_loss_tolerance_perc), so they are requested again by the next run."""
+        if self.sync_state is None: 
+            return self
+        if len(self.parts) > 0: 
+            print(f"Dates {self.params.get('date1')} - {self.params.get('date2')} weren't marked as synced, as parts {self.parts} weren't loaded.")
+            return self
+        self.sync_state.mark_loaded(self.sync_key, self.params.get('date1'), self.params.get('date2'))
+        print(f"Dates {self.params.get('date1')} - {self.params.get('date2')} were marked as synced for {self.sync_key}.")
+        return self
+
+    def missing_date_ranges(self): 
+        """Method to find out contiguous date ranges within date1 - date2 of request, which weren't loaded yet according to sync state."""
+        return self.sync_state.missing_ranges(self.sync_key, self.params.get('date1'), self.params.get('date2'))
+
+    def run_incremental_sync(self): 
+        """Method to load only dates, which weren't loaded before (according to sync state). Each missing date range is split into shards 
+        and processed by run_date_shards method. Returns self."""
+        date_ranges = self.missing_date_ranges()
+        description = f"Missing date ranges of {self.sync_key} since {self.params.get('date1')} till {self.params.get('date2')}: {date_ranges}."
+        self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE, endpoint=self.__class__.SHARDING_OPERATION_DEFAULT_ENDPOINT, 
+                               description=description).write_to_disk_incremental()
+        print(description)
+        for date1, date2 in date_ranges: 
+            self.params['date1'] = date1
+            self.params['date2'] = date2
+            self.run_date_shards()
+        return self
+
+    @stage_metrics('download_and_load')
+    def pipeline_download_and_load(self): 
+        """Method to download Logs API data and load it to database in producer/consumer pipeline. 
+        Parts downloaded by download scheduler are put to the bounded queue, which is drained by the loader thread, so downloads 
+        and inserts overlap in time. Backpressure: not more than pipeline_max_parts_on_disk parts are downloaded, but not yet loaded, at once. 
+        Queue is drained by ch_pool_size loaders."""
+        if not self.status_request.is_success: 
+            return self
+        if self.parts_amount == 0: 
+            print("Nothing to download")
+            return self
+        self._skip_inserted_parts()
+        settings = self._insert_settings()
+        parts_slots = threading.BoundedSemaphore(self.pipeline_max_parts)
+        downloaded_parts = queue.Queue(maxsize=self.pipeline_max_parts)
         failed_loads = []
+        loaded_files = []
+
+        def producer(part): 
+            """Downloads part, when there is a free slot on disk, and hands it over to the loader."""
+            parts_slots.acquire()
+            try: 
+                full_file = self._download_part(part)
+            except BaseException: 
+                parts_slots.release()
+                raise
+            if full_file is None: 
+                parts_slots.release()
+            else: 
+                downloaded_parts.put(full_file)
+            return full_file
+
+        def consumer(): 
+            """Loads downloaded parts to database one by one and frees their slots."""
+            while True: 
+                full_file = downloaded_parts.get()
+                if full_file is None: 
+                    break
+                try: 
+                    result = False
+                    for attempt in range(self.__class__.DEFAULT_API_QUERY_RETRIES): 
+                        result = self._insert_file(full_file, settings)
+                        if result: 
+                            break
+                except Exception: 
+                    result = False
+                if result: 
+                    loaded_files.append(full_file)
+                    try: 
+                        if self.global_settings.get('delete_temp_data'): 
+                            self.utilset.delete_file(full_file)
+                        else: 
+                            self.files.append(full_file)
+                    except(OSError, IOError): 
+                        self.files.append(full_file)
+                else: 
+                    failed_loads.append(full_file)
+                    self.files.append(full_file)
+                parts_slots.release()
+
+        #One loader per client of ClickHouse pool, so several parts are inserted at once. 
+        loaders = [threading.Thread(target=consumer, name=f'ch-loader-{number}', daemon=True) for number in range(self.ch_pool_size)]
+        for loader in loaders: 
+            loader.start()
+        try: 
+            downloaded, self.parts = self.download_scheduler.run(self.parts, producer)
+        finally: 
+            for loader in loaders: 
+                downloaded_parts.put(None)
+            for loader in loaders: 
+                loader.join()
+
+        self._check_downloaded_parts()
+        description = f"Parts loaded into db successfully: {len(loaded_files)}. Files not loaded: {failed_loads}."
+        if len(failed_loads) == 0: 
+            self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE, endpoint=self.__class__.LOAD_TO_DB_OPERATION_DEFAULT_ENDPOINT, description=description).write_to_disk_incremental()
+            self.delete_files()
+            print(f"All files were successfully written to the db table:{self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}.")
+            return self
+        self._raise_load_failure(failed_loads, description)
+
+    def _stream_part_to_db(self, part): 
+        """Method to pipe one part from Logs API response right to database insert. Performed inside of download scheduler's workers. 
+        Returns amount of streamed bytes or None if part wasn't either downloaded or inserted. Part, insert of which failed after data was sent, 
+        isn't retried unless retry is safe (see _stream_retry_safe), as rows of blocks committed before the failure stay in the table."""
+        if part in self.partial_parts: 
+            print(f"Part {part} was partially inserted and isn't retried to avoid duplicates.")
+            return None
+        download_log_part = DownloadLogPart(self.counterId, self.request_id, self.token, self.logger, chunk_size=self.chunk_size, encoding=self.api_encoding, session=self.api_session)
+        opened = time.monotonic()
+        result = None
+        try: 
+            download_log_part.open_stream(part)
+            if not download_log_part.is_success: 
+                return None
+            chunks = download_log_part.iter_chunks()
+            started = time.monotonic()
+            if self.insert_format == self.__class__.COLUMNAR_INSERT_FORMAT: 
+                result = self._insert_columnar(chunks, part, self._insert_settings(), f"Part {part}")
+            elif self.column_projection: 
+                result = self._insert_projected(chunks, part, self._insert_settings(), f"Part {part}")
+            else: 
+                rows = [0]
+                if self.staging_load: 
+                    chunks = self._counted_chunks(chunks, rows)
+                if self.compressor is not None: 
+                    chunks = self.compressor.compress_chunks(chunks)
+                result = self.ch.insert_stream(chunks, self._insert_settings(), compression=self.data_compression, table=self.load_table, 
+                                               dedup_token=self._dedup_token(part))
+                if result: 
+                    self._count_loaded_rows(max(0, rows[0] - 1) if self.staging_load else self.ch.last_written_rows() or 0)
+        finally: 
+            download_log_part.close_stream()
+            if download_log_part.encoding_fallback: 
+                self.api_encoding = None
+            #Part is downloaded as long as it's inserted, so duration of download includes insert. 
+            self._measure_download(part, download_log_part, time.monotonic() - opened)
+            #Let's refuse further retries of part (failed or interrupted by error of stream), if some of its data could be already committed and retry isn't safe:
+            if not result and download_log_part.bytes_written > 0 and not self._stream_retry_safe(): 
+                self._mark_partial_part(part, download_log_part.bytes_written)
+        if result: 
+            self._record_insert(part)
+            self._log_throughput(f"Part {part}", download_log_part.bytes_written, time.monotonic() - started)
+            return download_log_part.bytes_written
+        self.metrics.inc('inserts_total', result='failure')
+        return None
+
+    def _mark_partial_part(self, part, size): 
+        """Method to remember part, streamed insert of which failed after data was sent to database, so it's not retried."""
+        self.partial_parts.add(part)
+        description = f"Insert of part {part} failed after {size} bytes were streamed. Part isn't retried, rows committed before failure may stay in the table."
+        self.logger.add_to_log(response=self.__class__.DEFAULT_ERROR_CODE, endpoint=self.__class__.LOAD_TO_DB_OPERATION_DEFAULT_ENDPOINT, description=description).write_to_disk_incremental()
+        print(description)
+        return self
+
+    def _stream_retry_safe(self): 
+        """Method to check, if failed streamed insert may be retried without duplicates: insert_deduplication is on and data table takes the token into account. 
+        Staging load doesn't make retry safe, as extra rows pass row count validation of staging table. Returns bool."""
+        return bool(self.insert_deduplication and self.deduplication_effective)
+
+    def _counted_chunks(self, chunks, rows): 
+        """Generator to count lines of streamed chunks into rows[0] on the fly."""
+        for chunk in chunks: 
+            rows[0] += chunk.count(b'\n')
+            yield chunk
+
+    @stage_metrics('download_and_load')
+    def direct_download_and_load(self): 
+        """Method to stream Logs API data right to database: body of each part's response is piped to the insert 
+        chunk by chunk, so nothing is written to temporary_data_path. Parts are processed concurrently by download scheduler. 
+        Not loaded parts are checked against data_loss_tolerance_perc parameter of global_config. Partially inserted parts are retried only if it's safe 
+        (deduplicated inserts), otherwise they're counted as not loaded."""
+        if not self.status_request.is_success: 
+            return self
+        if self.parts_amount == 0: 
+            print("Nothing to download")
+            return self
+        self._skip_inserted_parts()
+        loaded, self.parts = self.download_scheduler.run(self.parts, self._stream_part_to_db)
+        description = f"Parts streamed into db successfully: {len(loaded)}. Bytes streamed: {sum(loaded.values())}. Parts not loaded: {self.parts}."
+        if self.partial_parts: 
+            description += f" Parts partially inserted: {sorted(self.partial_parts)}, perform FINAL deduplication or re-load of dates in ClickHouse."
+        self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE if len(self.parts) == 0 else self.__class__.DEFAULT_ERROR_CODE, 
+                               endpoint=self.__class__.LOAD_TO_DB_OPERATION_DEFAULT_ENDPOINT, description=description).write_to_disk_incremental()
+        print(description)
+        return self._check_downloaded_parts()
+
+    def _log_throughput(self, name, size, seconds): 
+        """Method to log and print throughput of insert of one part and to record insert in metrics."""
+        self.metrics.inc('inserts_total', result='success')
+        self.metrics.inc('insert_bytes_total', size)
+        self.metrics.observe('insert_seconds', seconds)
+        size_mb = size/1024/1024
+        description = f"{name} ({round(size_mb, 2)} MB) was loaded into db in {round(seconds, 2)} sec: {round(size_mb/max(seconds, 0.001), 2)} MB/s."
+        self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE, endpoint=self.__class__.LOAD_TO_DB_OPERATION_DEFAULT_ENDPOINT, description=description).write_to_disk_incremental()
+        print(description)
+        return self
+
+    def _insert_file(self, file, settings): 
+        """Method to insert one downloaded file to database with client borrowed from pool (as TSV or as typed columns, according to insert_format). 
+        With column_projection on, TSV is projected to columns of data table before insert. Records inserted part and logs throughput. Returns bool."""
+        started = time.monotonic()
+        if self.insert_format == self.__class__.COLUMNAR_INSERT_FORMAT: 
+            with open(file, "rb") as f: 
+                chunks = iter(lambda: f.read(self.chunk_size), b'')
+                if self.compressor is not None: 
+                    chunks = self.compressor.decompress_chunks(chunks)
+                result = self._insert_columnar(chunks, self.file_parts.get(file), settings, f"File {file}", file)
+        elif self.column_projection: 
+            with open(file, "rb") as f: 
+                chunks = iter(lambda: f.read(self.chunk_size), b'')
+                if self.compressor is not None: 
+                    chunks = self.compressor.decompress_chunks(chunks)
+                result = self._insert_projected(chunks, self.file_parts.get(file), settings, f"File {file}", file)
+        else: 
+            result = self.ch.insert_datafile(file, settings, compression=self.data_compression, table=self.load_table, 
+                                             dedup_token=self._dedup_token(self.file_parts.get(file), file))
+            if result: 
+                #Rows are counted in file for staging validation, otherwise they are taken from summary of insert. 
+                self._count_loaded_rows(self._file_rows(file) if self.staging_load else self.ch.last_written_rows() or 0)
+        if result: 
+            self._log_throughput(f"File {file}", os.path.getsize(file), time.monotonic() - started)
+            self._record_insert(self.file_parts.get(file))
+        else: 
+            self.metrics.inc('inserts_total', result='failure')
+        return result
+
+    def _projector(self): 
+        """Method to create parser bound to columns of data table by column mapping (if column_projection is on) or by strict names/positions."""
+        return TsvColumnParser(self._table_schema(), self.global_settings.get('api_strict_db_table_cols_names'), self.global_settings.get('columnar_batch_rows'), 
+                               column_mapping=self._column_mapping() if self.column_projection else None)
+
+    def _insert_projected(self, chunks, part, settings, name, file=None): 
+        """Method to insert TSV data of part (iterable of bytes chunks, read from file if it's set) into explicit list of columns: header of part is mapped to columns of data table, 
+        fields without column are cut off before data is sent. Returns bool: data was inserted and bad rows are within tolerance."""
+        projector = self._projector()
+        chunks = projector.project(chunks)
+        if not projector.column_names: 
+            print(f"{name}: no fields of header have columns in table {self.ch_credentials.get('table')}.")
+            return False
+        if self.compressor is not None: 
+            chunks = self.compressor.compress_chunks(chunks)
+        if not self.ch.insert_stream(chunks, settings, compression=self.data_compression, table=self.load_table, 
+                                     dedup_token=self._dedup_token(part, file), column_names=projector.column_names): 
+            return False
+        self._count_loaded_rows(projector.rows + len(projector.bad_rows))
+        return self._bad_rows_tolerated(projector, name)
+
+    def _table_schema(self): 
+        """Method to get columns of data table with their types. Taken from metadata (schema cache or one query), if check_db_tables didn't do it."""
+        if self.table_columns is None: 
+            metadata = self.table_metadata() or {'tables': {}}
+            columns = metadata.get('tables').get(self.ch_credentials.get('table'), {}).get('columns')
+            if not columns: 
+                self._raise_flow_failure(f"Columns of table {self.ch_credentials.get('db')}.{self.ch_credentials.get('table')} weren't obtained, so data cannot be parsed into columns.")
+            self.table_columns = list(columns)
+        return self.table_columns
+
+    def _insert_columnar(self, chunks, part, settings, name, file=None): 
+        """Method to parse TSV data of part (iterable of bytes chunks, read from file if it's set) into typed columns by batches and to insert them in Native format. 
+        Rows which cannot be parsed are skipped and reported exactly. Returns bool: all batches were inserted and bad rows are within tolerance."""
+        parser = self._projector()
+        #Server-side parsing settings are useless for Native format. 
+        settings = {key: value for key, value in settings.items() if not key.startswith('input_format_')}
+        dedup_token = self._dedup_token(part, file)
+        for number, columns in enumerate(parser.batches(chunks)): 
+            batch_token = f"{dedup_token}/{number}" if dedup_token is not None else None
+            if not self.ch.insert_columns(columns, parser.column_names, parser.column_types, settings, table=self.load_table, dedup_token=batch_token): 
+                return False
+        self._count_loaded_rows(parser.rows + len(parser.bad_rows))
+        return self._bad_rows_tolerated(parser, name)
+
+    def _bad_rows_tolerated(self, parser, name): 
+        """Method to log rows of part, which weren't parsed, and to check them against bad_data_tolerance_perc and absolute_db_format_errors_tolerance parameters of global_config."""
+        bad_rows = len(parser.bad_rows)
+        if bad_rows == 0: 
+            return True
+        tolerated = bad_rows <= self.global_settings.get('absolute_db_format_errors_tolerance', 0) \
+            or bad_rows <= (parser.rows + bad_rows)*self.global_settings.get('bad_data_tolerance_perc', 0)/100
+        description = f"{name}: {bad_rows} of {parser.rows + bad_rows} rows weren't parsed and were skipped. Tolerated: {tolerated}. \
+First of them (line, reason): {parser.bad_rows[:self.__class__.BAD_ROWS_TO_LOG]}."
+        self.logger.add_to_log(response=self.__class__.DEFAULT_SUCCESS_CODE if tolerated else self.__class__.DEFAULT_ERROR_CODE, 
+                               endpoint=self.__class__.LOAD_TO_DB_OPERATION_DEFAULT_ENDPOINT, description=description).write_to_disk_incremental()
+        print(description)
+        return tolerated
+
+    @stage_metrics('load')
+    def write_data_to_db(self, repeat=0, file_list=None):
+        """Method to load previously downloaded data files to database. Up to ch_pool_size files are inserted at once. 
+        Deletes downloaded and successfully uploaded to db files."""
+        settings = self._insert_settings()
         if file_list is None: 
             file_list = self.files
         
-        for file in file_list:
-                result = self.ch.insert_datafile(file, settings)
-                if not result: 
-                    failed_loads.append(file)
+        with ThreadPoolExecutor(max_workers=min(self.ch_pool_size, max(1, len(file_list))), thread_name_prefix='ch-insert') as pool: 
+            results = list(pool.map(lambda file: self._insert_file(file, settings), file_list))
+        failed_loads = [file for file, result in zip(file_list, results) if not result]
 
         description = f"Parts loaded into db successfully: {len(self.files) - len(failed_loads)}. Files not loaded: {failed_loads}."
         endpoint = self.__class__.LOAD_TO_DB_OPERATION_DEFAULT_ENDPOINT
@@ -449,17 +1226,34 @@ class MainFlowWrapper:
             repeat+= 1
             self.write_data_to_db(repeat, file_list = failed_loads)
         else: 
-            self.logger.add_to_log(response=self.__class__.DEFAULT_ERROR_CODE, endpoint=endpoint, description=description).write_to_disk_incremental()
-            self.delete_files(failed_loads)
-            self.final_log_record()
-            self.logger.write_to_disk_last_run()
-            self.write_log_to_db()
-            if not self.global_settings.get('delete_not_uploaded_to_db_temp_data'):
-                raise FlowException(f"Not all Logs API downloaded files were properly written to {self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}.\n \
-                                Please, re-upload leftover files from {self.data_path}. Rest of files were successfully uploaded.")
-            else: 
-                raise FlowException(f"Not all Logs API downloaded files were properly written to {self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}.\n \
-                                Please, re-run run the script and perform FINAL deduplication in ClickHouse.")
+            self._raise_load_failure(failed_loads, description)
+
+    def _raise_load_failure(self, failed_loads, description): 
+        """Method to log failed loads to database, delete files (according to global_config) and raise FlowException."""
+        endpoint = self.__class__.LOAD_TO_DB_OPERATION_DEFAULT_ENDPOINT
+        self.logger.add_to_log(response=self.__class__.DEFAULT_ERROR_CODE, endpoint=endpoint, description=description).write_to_disk_incremental()
+        self.delete_files(failed_loads)
+        self.final_log_record()
+        self.logger.write_to_disk_last_run()
+        self.write_log_to_db()
+        if self.load_table == self.staging_table: 
+            self._drop_staging()
+            raise FlowException(f"Not all Logs API downloaded files were properly written to staging table {self.ch_credentials.get('db')}.{self.staging_table}.\n \
+                            Staging table was dropped, table {self.ch_credentials.get('table')} wasn't changed. Please, re-run the script.")
+        elif self.insert_deduplication and self.deduplication_effective: 
+            raise FlowException(f"Not all Logs API downloaded files were properly written to {self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}.\n \
+                            Please, re-run the script (with checkpoint_journal on, the same request is resumed). Table is Replicated*MergeTree or has non_replicated_deduplication_window > 0, \
+                            so inserts are deduplicated and no FINAL deduplication is needed.")
+        elif self.insert_deduplication: 
+            raise FlowException(f"Not all Logs API downloaded files were properly written to {self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}.\n \
+                            Please, re-run the script (with checkpoint_journal on, the same request is resumed). Inserts are deduplicated only if table is Replicated*MergeTree \
+                            or has non_replicated_deduplication_window > 0, otherwise perform FINAL deduplication in ClickHouse after re-run.")
+        elif not self.global_settings.get('delete_not_uploaded_to_db_temp_data'):
+            raise FlowException(f"Not all Logs API downloaded files were properly written to {self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}.\n \
+                            Please, re-upload leftover files from {self.data_path}. Rest of files were successfully uploaded.")
+        else: 
+            raise FlowException(f"Not all Logs API downloaded files were properly written to {self.ch_credentials.get('db')}.{self.ch_credentials.get('table')}.\n \
+                            Please, re-run run the script and perform FINAL deduplication in ClickHouse.")
         
     def delete_files(self, exclusion_list=None): 
         """Method to delete downloaded datafiles. Not used distinctly."""
@@ -471,18 +1265,14 @@ class MainFlowWrapper:
                 if file not in exclusion_list: 
                     self.utilset.delete_file(file)
                     deleted_files+= 1
+            self.metrics.inc('files_deleted_total', deleted_files)
             print(f"Deleted {deleted_files} logs api datafiles. Left to re-upload manually {len(self.files) - deleted_files} files.")
         return self
     
     def write_log_to_db(self): 
-        """Method to write out last run log to database. Not used distinctly."""
-        format = "%Y-%m-%d %H:%M:%S"
+        """Method to write out last run log to database. Not used distinctly. Typed records of logger are inserted as columns, without parsing of log text."""
         if self.ch_credentials.get('logTable') and self.is_log_table:
-            rowed_log = self.logger.log.split('\n')[:-1]
-            rowed_log = [col.split('\t') for col in rowed_log]
-            for row in rowed_log: 
-                row[0] = datetime.strptime(row[0], format)
-            result = self.ch.insert_data(self.ch.logTable, rowed_log)
+            result = self.ch.insert_columns(self.logger.columns(), self.__class__.LOG_TABLE_FIELDS, Logger.LOG_TABLE_TYPES, table=self.ch.logTable)
             if result: 
                 print(f"Log was succesfully written to table: {self.ch_credentials.get('db')}.{self.ch_credentials.get('logTable')}.")
             else: 
@@ -491,6 +1281,13 @@ class MainFlowWrapper:
                 raise FlowException(f"Log wasn't written to {self.ch_credentials.get('db')}.{self.ch_credentials.get('logTable')} for some reason.")
         return self
     
+    def _raise_flow_failure(self, message): 
+        """Method to write the last log records and raise FlowException with message."""
+        self.final_log_record()
+        self.logger.write_to_disk_last_run()
+        self.write_log_to_db()
+        raise FlowException(message)
+
     def final_log_record(self, success=False):
         """Method to create last record in the log of script run."""
         if success: 
@@ -502,13 +1299,315 @@ class MainFlowWrapper:
         endpoint = self.__class__.FINISH_OPERATION_DEFAULT_ENDPOINT
         self.logger.add_to_log(response, endpoint, description)
         self.logger.write_to_disk_incremental()
+        #Requests of finished (or failed) run can be reused and deleted by other runs. 
+        if self.request_registry is not None: 
+            self.request_registry.release_run(self.run_id)
+        #Let's export metrics of run (they are exported at exit once again, with result of the failed stage). 
+        self.metrics.set('run_seconds', round(time.monotonic() - self.started, 3))
+        self.metrics.set('run_success', int(success))
+        self.metrics.set('run_finished_timestamp_seconds', int(time.time()))
+        self.metrics.export()
+        if self.profiler is not None: 
+            self.profiler.write_report()
         return self
 
     def close_and_finish(self):
         """Method to close connections and to write out last run log to db and disk."""
         self.final_log_record(True)
         self.write_log_to_db()
-        self.ch.close_connections()
+        self.api_session.close()
+        if self.owns_connection: 
+            self.ch.close_connections()
         self.logger.write_to_disk_last_run()
+        self.logger.close()
         print("Script finished successfully.") 
-        return self 
\ No newline at end of file
+        return self 
+
+
+class AsyncMainFlowWrapper(MainFlowWrapper): 
+    """Asyncio-native flow of the programm. All the Logs API requests (evaluation, creation, status checks, parts downloads, deletion) 
+    are performed by async counterparts of api_methods.py classes on event loop with one aiohttp session, so many flows 
+    (e.g. jobs of batch run) can share one thread. Blocking database operations (checks on init, inserts, log writes) are the same as 
+    in MainFlowWrapper, inserts are performed in worker thread not to block event loop. 
+
+    Parts are downloaded concurrently by download scheduler (run_async) and then loaded to database, as in SEQUENTIAL_LOAD_MODE. Other values of 
+    load_mode parameter of global_config (pipeline and direct) aren't supported and are rejected on init with FlowException. Staging load is supported. 
+    Arguments are the same as MainFlowWrapper has. 
+
+    Properties: 
+        async_session - :inst of aiohttp.ClientSession or None. Created by run_async and closed at the end of it. 
+                        Configured by api_pool_size, api_connect_timeout_sec and api_read_timeout_sec parameters of global_config.json. 
+
+    Methods: 
+        create_async_session(self) - creates aiohttp session for Logs API requests. Should be called inside of running event loop. Returns session. 
+        request_list_async(self, refresh=False) - coroutine, the same as request_list. 
+        clear_api_queue_async(self) - coroutine, the same as clear_api_queue. 
+        plan_date_shards_async(self) - coroutine, the same as plan_date_shards, with async evaluation. 
+        resumable_request_async(self, params) - coroutine, the same as resumable_request. 
+        reusable_request_async(self, params) - coroutine, the same as reusable_request. 
+        check_log_evaluation_async(self) - coroutine, the same as check_log_evaluation. 
+        create_log_request_async(self) - coroutine, the same as create_log_request. 
+        delete_log_async(self) - coroutine, the same as delete_log. 
+        log_status_check_async(self) - coroutine, the same as log_status_check. 
+        log_downloader_async(self) - coroutine, the same as log_downloader. 
+        download_and_write_data_async(self) - coroutine, downloads parts and then loads them to database in worker thread. 
+        run_async(self) - coroutine, performs the whole flow (for each date shard, if auto_date_sharding parameter of global_config is set, 
+                        and only for missing dates, if incremental_sync is set) and finishes. Returns self. 
+    """
+
+    def __init__(self, ch_credentials, api_settings, global_settings, *args, **kwargs): 
+        #Let's reject load modes, async engine doesn't support, before connections are established: 
+        load_mode = global_settings.get('load_mode', self.__class__.SEQUENTIAL_LOAD_MODE)
+        if load_mode != self.__class__.SEQUENTIAL_LOAD_MODE: 
+            raise FlowException(f"load_mode {load_mode} isn't supported by async engine. Please, set load_mode to {self.__class__.SEQUENTIAL_LOAD_MODE} or async_engine to false in global_config.json.")
+        super().__init__(ch_credentials, api_settings, global_settings, *args, **kwargs)
+        self.async_session = None
+
+    def create_async_session(self): 
+        """Method to create aiohttp session with connections pool and timeouts from global_config."""
+        connector = aiohttp.TCPConnector(limit=self.global_settings.get('api_pool_size', ApiSession.POOL_SIZE))
+        timeout = aiohttp.ClientTimeout(sock_connect=self.global_settings.get('api_connect_timeout_sec', ApiSession.CONNECT_TIMEOUT), 
+                                        sock_read=self.global_settings.get('api_read_timeout_sec', ApiSession.READ_TIMEOUT))
+        self.async_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self.async_session
+
+    async def _raise_flow_failure_async(self, message): 
+        """Coroutine to write the last log records in worker thread (not to block event loop by disk and database writes) and raise FlowException with message."""
+        await asyncio.to_thread(self._raise_flow_failure, message)
+
+    async def request_list_async(self, refresh=False): 
+        """Coroutine to get list of requests in Logs API queue of counter (cached the same way as by request_list). Returns list of dicts or None."""
+        requests = self._cached_request_list(refresh)
+        if requests is not None: 
+            return requests
+        await asyncio.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+        log_list = AsyncLogList(self.counterId, self.token, self.logger, session=self.async_session)
+        await log_list.send_request()
+        return self._cache_request_list(log_list)
+
+    async def clear_api_queue_async(self): 
+        """Coroutine to delete pending and processed requests in Logs API queue of counter (only ones created by this tool, unless clear_api_queue_scope is all). 
+        Returns amount of deleted requests or None if there was nothing to delete (or list of requests wasn't obtained)."""
+        requests = await self.request_list_async(refresh=True)
+        requests = self._requests_to_clear(requests) if requests is not None else []
+        if len(requests) > 0: 
+            requests_deleted = 0
+            for request in requests:
+                await asyncio.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+                if request.get('status') == 'created':
+                    clear_old_request = AsyncCleanPendingLog(self.counterId, request.get('request_id'), self.token, self.logger, session=self.async_session)
+                else:
+                    clear_old_request = AsyncCleanProcessedLog(self.counterId, request.get('request_id'), self.token, self.logger, session=self.async_session)
+                await clear_old_request.send_request()
+                if clear_old_request.is_success: 
+                    requests_deleted += 1
+                    self._forget_request(request.get('request_id'))
+            print(f"Deleted {requests_deleted} requests in queue.")
+            return requests_deleted
+        return None
+
+    async def resumable_request_async(self, params): 
+        """Coroutine to find not finished request with the same params in checkpoint journal and to check that Logs API still has it. Returns request_id or None."""
+        entry = self._journal_entry(params)
+        if entry is None: 
+            return None
+        await asyncio.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+        status_request = AsyncStatusLog(self.counterId, entry.get('request_id'), self.token, self.logger, session=self.async_session)
+        await status_request.send_request()
+        return self._reattach(params, entry, status_request)
+
+    async def reusable_request_async(self, params): 
+        """Coroutine to find processed (or created) request with the same params in Logs API queue of counter. Returns request_id or None."""
+        if not self.reuse_requests: 
+            return None
+        return self._reuse(params, LogList.matching_requests(await self.request_list_async(), params))
+
+    @stage_metrics('evaluation')
+    async def check_log_evaluation_async(self): 
+        """Coroutine to check if Logs API request can be created. Clears Logs API queue if needed and allowed by clear_api_queue parameter of global_config. 
+        Reattaches to not finished request of checkpoint journal or to request with the same params in Logs API queue instead, if any."""
+        self.request_id = await self.resumable_request_async(self.params) or await self.reusable_request_async(self.params)
+        self.resumed_request = self.request_id is not None
+        if self.resumed_request: 
+            return self
+        self.log_evaluation = AsyncLogEvaluation(self.counterId, self.token, self.logger, self.params, session=self.async_session)
+        await self.log_evaluation.send_request()
+        if not self.log_evaluation.is_success:
+            if not self.global_settings.get('clear_api_queue'):
+                await self._raise_flow_failure_async(f"Request cannot be performed and you didn't allow to clear requests queue.\n See: clear_api_queue parameter in global_config.json")
+            if await self.clear_api_queue_async() is None: 
+                await self._raise_flow_failure_async(f"The queue is empty, but your request cannot be performed anyway.\n Please, make date range smaller or reduce params amount.")
+            await self.log_evaluation.send_request()
+            if not self.log_evaluation.is_success: 
+                await self._raise_flow_failure_async("The queue was cleared, but your request cannot be performed anyway.\n Please, make date range smaller or reduce params amount.")
+        print(f"Evaluation success: {self.log_evaluation.is_success}")
+        return self
+
+    async def plan_date_shards_async(self): 
+        """Coroutine to split date range of request into the largest sub-ranges Logs API accepts, the same way plan_date_shards does, 
+        with async evaluation on event loop. Returns list of tuples of str (date1, date2)."""
+        evaluation = AsyncLogEvaluation(self.counterId, self.token, self.logger, self.params, session=self.async_session)
+        await evaluation.send_request()
+        if not evaluation.is_success and not evaluation.max_possible_day_quantity and self.global_settings.get('clear_api_queue'): 
+            if await self.clear_api_queue_async() is not None: 
+                await evaluation.send_request()
+        if not evaluation.is_success and not evaluation.max_possible_day_quantity: 
+            await self._raise_flow_failure_async(f"Request cannot be performed even for one day. Response code: {evaluation.response_code}. Please, reduce params amount.")
+        return await asyncio.to_thread(self._split_date_range, evaluation)
+
+    @stage_metrics('create')
+    async def create_log_request_async(self): 
+        """Coroutine to create request to download Logs API data."""
+        if self.resumed_request: 
+            return self
+        if not self.log_evaluation.is_success: 
+            await self._raise_flow_failure_async("The request wasn't evaluated or cannot be evaluated. Please, check sequence of methods calls, reduce dates range or reduce params amount.")
+        for repeat in range(self.__class__.DEFAULT_API_QUERY_RETRIES): 
+            await asyncio.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+            self.log_request = AsyncCreateLog(self.counterId, self.token, self.logger, params=self.params, session=self.async_session)
+            await self.log_request.send_request()
+            if self.log_request.is_success: 
+                self.request_id = self.log_request.request_id
+                print(f"Log request with id: {self.request_id} was successfully created.")
+                self._register_request(self.params, self.request_id)
+                return self._start_checkpoint(self.params, self.request_id)
+        await self._raise_flow_failure_async("Log creation request cannot be created for some reason. Please, try later.")
+
+    @stage_metrics('deletion')
+    async def delete_log_async(self):
+        """Coroutine to perform deletion of Logs API request_id and prepared or pending log."""
+        for attribute in self.__class__.REQUEST_ATTRIBUTES: 
+            if hasattr(self, attribute): 
+                delattr(self, attribute)
+        released = self._release_request(self.request_id)
+        if not self.global_settings.get('clear_created_logs_request'):
+            print(f"Deletion of {self.request_id} wasn't performed according to global config.")
+            return self
+        if not released: 
+            print(f"Request {self.request_id} is still used by another run and is kept in Logs API queue.")
+            return self
+        if not self._owned_request(self.request_id): 
+            print(f"Request {self.request_id} wasn't created by this tool and is kept in Logs API queue.")
+            return self
+        for repeat in range(self.__class__.DEFAULT_API_QUERY_RETRIES): 
+            await asyncio.sleep(self.__class__.DEFAULT_REQUEST_SLEEP)
+            deletion = await AsyncCleanPendingLog(self.counterId, self.request_id, self.token, self.logger, session=self.async_session).send_request()
+            if not deletion.is_success: 
+                deletion = await AsyncCleanProcessedLog(self.counterId, self.request_id, self.token, self.logger, session=self.async_session).send_request()
+            if deletion.is_success: 
+                print(f"Deletion of request {self.request_id} was {deletion.is_success}")
+                self.metrics.inc('requests_deleted_total', result='success')
+                self._forget_request(self.request_id)
+                return self
+        print(f"Deletion of request {self.request_id} wasn't performed for unexpected reason.")
+        self.metrics.inc('requests_deleted_total', result='failure')
+        return self
+
+    @stage_metrics('status_wait')
+    async def log_status_check_async(self):
+        """Coroutine to wait until created Logs API log is processed. Checks status by adaptive schedule until status_timeout."""
+        if not self.resumed_request and not self.log_request.is_success:
+            await self._raise_flow_failure_async("The request wasn't created. Please, check sequence of methods calls.")
+        schedule = self.status_schedule(self.status_timeout, self._expected_preparation_sec())
+        failed_checks = 0
+        while await schedule.wait_async(): 
+            self.status_request = AsyncStatusLog(self.counterId, self.request_id, self.token, self.logger, session=self.async_session)
+            await self.status_request.send_request()
+            self.metrics.inc('status_checks_total', status=self.status_request.status or self.status_request.response_code)
+            print(f"Status check  of request {self.request_id}. Done times: {schedule.polls}. Time: {round(schedule.elapsed)} sec. Status: {self.status_request.status}. Response code: {self.status_request.response_code}.")
+            if self.status_request.is_success: 
+                self.parts = self.status_request.parts
+                self.parts_amount = self.status_request.parts_amount
+                print(f"Status check of request {self.request_id} got posititve results. Status: {self.status_request.status}. Parts to download: {self.parts_amount}. Time spent on waiting: {round(schedule.elapsed)} secs.")
+                return self
+            elif self.status_request.response_code == self.__class__.DEFAULT_SUCCESS_CODE: 
+                if self.status_request.status in self.__class__.BAD_STATUS_CODES:
+                    await self.delete_log_async()
+                    await self._raise_flow_failure_async(f"Log wasn't processed well for some reason. It had status: {self.status_request.status}.")
+            else: 
+                failed_checks += 1
+                if failed_checks > self.__class__.DEFAULT_API_QUERY_RETRIES: 
+                    await self.delete_log_async()
+                    await self._raise_flow_failure_async(f"Endpoint of status query {self.status_request.url} is unreachable.")
+        await self.delete_log_async()
+        await self._raise_flow_failure_async(f"Log wasn't cooked for timeout time: {self.status_timeout/60} mins.")
+
+    async def _download_part_async(self, part):
+        """Coroutine to download one part to the local file (or to reuse file of crashed run). Returns path to the file or None if part wasn't downloaded."""
+        journaled_file = await asyncio.to_thread(self._journaled_file, part)
+        if journaled_file is not None: 
+            return journaled_file
+        download_log_part = AsyncDownloadLogPart(self.counterId, self.request_id, self.token, self.logger, chunk_size=self.chunk_size, 
+                                                 encoding=self.api_encoding, compressor=self.compressor, session=self.async_session)
+        full_file = self._part_file_path(part)
+        started = time.monotonic()
+        try: 
+            await download_log_part.send_request(part, full_file)
+        except aiohttp.ClientError as error: 
+            #Scheduler retries only OSError, so network errors of aiohttp are converted to it. 
+            raise OSError(f"Part {part} wasn't downloaded: {error}") from error
+        finally: 
+            if download_log_part.encoding_fallback: 
+                self.api_encoding = None
+            self._measure_download(part, download_log_part, time.monotonic() - started)
+        if download_log_part.is_success: 
+            return await asyncio.to_thread(self._record_download, part, full_file)
+        return None
+
+    @stage_metrics('download')
+    async def log_downloader_async(self):
+        """Coroutine to download Logs API prepared data concurrently on event loop. Failed parts are retried with backoff by download scheduler."""
+        if self.parts_amount == 0: 
+            print("Nothing to download")
+            return self
+        self._skip_inserted_parts()
+        downloaded, self.parts = await self.download_scheduler.run_async(self.parts, self._download_part_async)
+        self.files.extend(downloaded.values())
+        if self._downloaded_parts_tolerated(): 
+            if self.checkpoints is not None: 
+                return self
+            return await self.delete_log_async()
+        await asyncio.to_thread(self.delete_files)
+        await self.delete_log_async()
+        await asyncio.to_thread(self._raise_download_failure)
+
+    async def download_and_write_data_async(self): 
+        """Coroutine to download Logs API data and then to load it to database in worker thread."""
+        await asyncio.to_thread(self.prepare_staging)
+        await self.log_downloader_async()
+        await asyncio.to_thread(self.write_data_to_db)
+        await asyncio.to_thread(self.publish_staging)
+        await asyncio.to_thread(self.mark_synced)
+        if self.checkpoints is not None: 
+            await self.delete_log_async()
+            await asyncio.to_thread(self.checkpoints.finish, self._checkpoint_key())
+            self.file_parts = {}
+        return self
+
+    async def run_async(self): 
+        """Coroutine to perform the whole flow: evaluation, creation, status checks, download and load of Logs API data, for each date shard 
+        if auto_date_sharding parameter of global_config is set. Finishes with close_and_finish. Aiohttp session lives during this coroutine."""
+        self.create_async_session()
+        try: 
+            date_ranges = self.missing_date_ranges() if self.sync_state is not None else [(self.params.get('date1'), self.params.get('date2'))]
+            shards = []
+            for date1, date2 in date_ranges: 
+                self.params['date1'] = date1
+                self.params['date2'] = date2
+                if self.global_settings.get('auto_date_sharding') or self.sync_state is not None: 
+                    shards.extend(await self.plan_date_shards_async())
+                else: 
+                    shards.append((date1, date2))
+            for number, (date1, date2) in enumerate(shards): 
+                print(f"Shard {number+1} of {len(shards)}: since {date1} till {date2}.")
+                self.params['date1'] = date1
+                self.params['date2'] = date2
+                self.files = []
+                await self.check_log_evaluation_async()
+                await self.create_log_request_async()
+                await self.log_status_check_async()
+                await self.download_and_write_data_async()
+        finally: 
+            await self.async_session.close()
+        await asyncio.to_thread(self.close_and_finish)
+        return self